@@ -159,6 +159,10 @@ def create_app(config_class=Config):
 
         from .cotacoes_routes import register_cotacoes_routes
         register_cotacoes_routes(app)
+
+        # Registrar API da fila de jobs
+        from .jobs_routes import bp as jobs_bp
+        app.register_blueprint(jobs_bp)
         
         app.logger.info("OK Rotas registradas")
     except Exception as e:
@@ -265,6 +269,17 @@ def register_commands(app):
         db.init_db(app)
         print('OK Banco de dados inicializado!')
     
+    @app.cli.command('dashboard-rollups')
+    @click.option('--completo', is_flag=True, help='Recalcula todo o histórico, não só os dias pendentes.')
+    @click.option('--fonte', 'fontes', multiple=True, help='Fonte a atualizar (padrão: todas).')
+    def dashboard_rollups_command(completo, fontes):
+        """Atualiza os rollups diários do dashboard, os agregados do analytics e os fatos semanais"""
+        from .services import analytics_agregados  # noqa: F401 - registra as fontes do analytics
+        from .services import metricas_semanais  # noqa: F401 - registra a fonte 'semanal'
+        from .services.dashboard_rollups import FONTES, atualizar_rollups
+        for fonte, resultado in atualizar_rollups(fontes or tuple(FONTES), completo=completo).items():
+            print(f'{fonte}: {resultado}')
+
     @app.cli.command('check-db')
     def check_db_command():
         """Verifica conexao com banco de dados"""
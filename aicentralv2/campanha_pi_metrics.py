@@ -270,7 +270,7 @@ def calcular_periodo_progresso(
     }
 
 
-def anexar_preco_metrica_campanha(row: Any) -> dict[str, Any]:
+def anexar_preco_metrica_campanha(row: Any, hoje: Optional[date] = None) -> dict[str, Any]:
     """Anexa métricas de preço, custo de mídia, objetivo e período à campanha."""
     r = dict(row)
     valor_para_preco = investimento_para_preco_campanha(r) or 0
@@ -308,11 +308,18 @@ def anexar_preco_metrica_campanha(row: Any) -> dict[str, Any]:
         r.get("nome_campanha"),
     )
 
-    periodo = calcular_periodo_progresso(r.get("periodo_inicio"), r.get("periodo_fim"))
+    periodo = calcular_periodo_progresso(r.get("periodo_inicio"), r.get("periodo_fim"), hoje)
     r.update(periodo)
     return r
 
 
+def anexar_preco_metrica_campanhas(rows: Any, hoje: Optional[date] = None) -> list[dict[str, Any]]:
+    """anexar_preco_metrica_campanha para uma lista de campanhas, em lote (campanha_pi_metrics_lote)."""
+    from aicentralv2.campanha_pi_metrics_lote import anexar_preco_metrica_lote
+
+    return anexar_preco_metrica_lote(rows, hoje)
+
+
 def calc_progress_tier(pct: Any) -> str:
     """Tier visual da barra de progresso (espelha campanhas-ui.js)."""
     try:
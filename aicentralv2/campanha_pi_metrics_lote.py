@@ -0,0 +1,210 @@
+"""
+Métricas de campanhas PI em lote (listas, dashboard, e-mails, acompanhamento DV360).
+
+Mesmos resultados de campanha_pi_metrics.anexar_preco_metrica_campanha, calculados
+sobre colunas:
+- cada campo texto (valores R$, volumes, datas) é convertido uma única vez por linha
+  com os parsers de campanha_pi_metrics; ausente vira NaN;
+- a modalidade do KPI (cpm/unit) é memoizada por (objetivo_nome, nome_campanha);
+- investimento, volume, preços, custo de mídia, percentuais e período saem de
+  operações NumPy sobre os arrays.
+Arredondamentos com casas decimais usam o round() do Python elemento a elemento:
+np.round(x, 2) multiplica por 100 antes de arredondar e diverge em alguns empates.
+"""
+from __future__ import annotations
+
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from aicentralv2.campanha_pi_metrics import _modalidade_kpi, _to_date, parse_brl_float, volume_qty_campanha
+
+CAMPOS_BRL = (
+    "valor_total_plataforma",
+    "valor_plataforma",
+    "totalizador_gasto",
+    "custo_midia_orcado",
+    "preco_unitario_orcado",
+)
+CAMPOS_VOLUME = ("obj_contratados", "totalizador_atingido")
+
+
+def _float_ou_nan(valor: Optional[float]) -> float:
+    return float(valor) if valor is not None else np.nan
+
+
+def colunas_campanhas(rows: List[Any]) -> Dict[str, np.ndarray]:
+    """Campos das campanhas convertidos uma vez: valores/volumes (NaN = ausente),
+    modalidade unit (bool) e datas do período em ordinal (-1 = ausente)."""
+    n = len(rows)
+    colunas = {campo: np.full(n, np.nan) for campo in CAMPOS_BRL + CAMPOS_VOLUME}
+    unit = np.zeros(n, dtype=bool)
+    inicio = np.full(n, -1, dtype=np.int64)
+    fim = np.full(n, -1, dtype=np.int64)
+    modalidades: Dict[tuple, bool] = {}
+
+    for i, row in enumerate(rows):
+        for campo in CAMPOS_BRL:
+            colunas[campo][i] = _float_ou_nan(parse_brl_float(row.get(campo)))
+        for campo in CAMPOS_VOLUME:
+            colunas[campo][i] = _float_ou_nan(volume_qty_campanha(row.get(campo)))
+
+        chave = (row.get("objetivo_nome"), row.get("nome_campanha"))
+        modalidade = modalidades.get(chave)
+        if modalidade is None:
+            modalidade = modalidades[chave] = _modalidade_kpi(*chave) == "unit"
+        unit[i] = modalidade
+
+        d_ini = _to_date(row.get("periodo_inicio"))
+        d_fim = _to_date(row.get("periodo_fim"))
+        if d_ini:
+            inicio[i] = d_ini.toordinal()
+        if d_fim:
+            fim[i] = d_fim.toordinal()
+
+    colunas["unit"] = unit
+    colunas["periodo_inicio"] = inicio
+    colunas["periodo_fim"] = fim
+    return colunas
+
+
+def _ou_zero(arr: np.ndarray) -> np.ndarray:
+    """`parse(...) or 0` das funções escalares: ausente vira 0."""
+    return np.nan_to_num(arr, nan=0.0)
+
+
+def _dividir(num: np.ndarray, den: np.ndarray, ok: np.ndarray) -> np.ndarray:
+    out = np.full(num.shape, np.nan)
+    np.divide(num, den, out=out, where=ok)
+    return out
+
+
+def _por_metrica(valor: np.ndarray, volume: np.ndarray, unit: np.ndarray, ok: np.ndarray) -> np.ndarray:
+    """valor / volume (unit) ou valor / volume * 1000 (cpm) onde ok; NaN no resto."""
+    preco = _dividir(valor, volume, ok)
+    return np.where(unit, preco, preco * 1000)
+
+
+def _round2(arr: np.ndarray) -> np.ndarray:
+    return np.array([round(x, 2) if x == x else x for x in arr.tolist()], dtype=float)
+
+
+def _lista(arr: np.ndarray) -> List[Optional[float]]:
+    """Array float → lista Python com None no lugar de NaN."""
+    return [None if x != x else x for x in arr.tolist()]
+
+
+def calcular_metricas(rows: List[Any], hoje: Optional[date] = None,
+                      colunas: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, Any]:
+    """Métricas derivadas das campanhas, em arrays (NaN = None na versão escalar).
+
+    Inclui as colunas convertidas (colunas_campanhas), para quem agrega por cima
+    (ex.: services/campanhas_pi_painel) não converter os campos de novo.
+    """
+    col = colunas if colunas is not None else colunas_campanhas(rows)
+    unit = col["unit"]
+    v_total = _ou_zero(col["valor_total_plataforma"])
+    v_plat = _ou_zero(col["valor_plataforma"])
+    gasto = _ou_zero(col["totalizador_gasto"])
+    vol_obj = col["obj_contratados"]
+    vol_ating = col["totalizador_atingido"]
+    cmo = col["custo_midia_orcado"]
+    puo = col["preco_unitario_orcado"]
+
+    # investimento_para_preco_campanha / volume_para_preco_campanha
+    valor = np.where(v_total > 0, v_total, v_plat)
+    valor = np.where(valor <= 0, gasto, valor)
+    investimento = np.where(valor > 0, valor, np.nan)
+    volume_kpi = np.where(np.isnan(vol_obj), vol_ating, vol_obj)
+    tem_volume = ~np.isnan(volume_kpi)
+
+    # preco_unitario_por_metrica
+    ok_preco = tem_volume & (valor > 0)
+    preco_metrica = _round2(_por_metrica(valor, volume_kpi, unit, ok_preco))
+
+    # custo_midia_previsto_campanha (orçado > derivado do preço unitário > valor_plataforma)
+    bruto = puo * vol_obj
+    derivado = _round2(np.where((puo > 0) & ~np.isnan(vol_obj), np.where(unit, bruto, bruto / 1000), np.nan))
+    base = np.where(cmo > 0, cmo, np.where(derivado > 0, derivado, np.nan))
+    custo_prev = np.where(~np.isnan(base), base, np.where(col["valor_plataforma"] > 0, col["valor_plataforma"], np.nan))
+
+    tem_custo = ~np.isnan(custo_prev)
+    pct_custo = np.rint(_dividir(gasto, custo_prev, tem_custo & (gasto > 0)) * 100)
+    obj = _ou_zero(vol_obj)
+    pct_objetivo = np.rint(_dividir(_ou_zero(vol_ating), obj, obj > 0) * 100)
+
+    # preco_unitario_orcado_campanha / preco_unitario_realizado
+    orcado_derivado = _round2(_por_metrica(custo_prev, volume_kpi, unit, tem_custo & tem_volume & (volume_kpi > 0)))
+    preco_orcado = np.where(puo > 0, _round2(puo), orcado_derivado)
+    preco_realizado = _round2(_por_metrica(gasto, vol_ating, unit, (gasto > 0) & ~np.isnan(vol_ating)))
+
+    # calcular_periodo_progresso
+    ref = (hoje or date.today()).toordinal()
+    ini, fim = col["periodo_inicio"], col["periodo_fim"]
+    periodo_ok = (ini >= 0) & (fim >= 0) & (fim >= ini)
+    total = fim - ini
+    pct_periodo = np.where(
+        total > 0,
+        np.rint(np.clip(_dividir((ref - ini).astype(float), total.astype(float), total > 0) * 100, 0, 100)),
+        np.where(ref >= ini, 100, 0),
+    )
+
+    return {
+        "colunas": col,
+        "investimento_kpi_brl": investimento,
+        "volume_kpi": volume_kpi,
+        "preco_metrica_brl": preco_metrica,
+        "preco_metrica_modalidade": np.where(ok_preco, np.where(unit, "unit", "cpm"), None),
+        "custo_midia_previsto": custo_prev,
+        "custo_midia_realizado": np.where(gasto > 0, gasto, np.nan),
+        "pct_custo_midia": np.nan_to_num(pct_custo, nan=0.0).astype(np.int64),
+        "pct_objetivo": np.nan_to_num(pct_objetivo, nan=0.0).astype(np.int64),
+        "preco_unitario_orcado_brl": preco_orcado,
+        "preco_unitario_realizado_brl": preco_realizado,
+        "periodo_ok": periodo_ok,
+        "periodo_pct_elapsed": pct_periodo.astype(np.int64),
+        "periodo_dias_restantes": np.maximum(fim - ref, 0),
+        "periodo_dias_total": total,
+    }
+
+
+def anexar_preco_metrica_lote(rows: Iterable[Any], hoje: Optional[date] = None,
+                              metricas: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """anexar_preco_metrica_campanha para todas as linhas: cópias com as mesmas chaves e valores.
+
+    metricas: calcular_metricas já feito para estas linhas (evita converter os campos de novo).
+    """
+    rows = list(rows or [])
+    if not rows:
+        return []
+    m = metricas if metricas is not None else calcular_metricas(rows, hoje)
+    periodo_ok = m["periodo_ok"].tolist()
+    periodo = [m[k].tolist() for k in ("periodo_pct_elapsed", "periodo_dias_restantes", "periodo_dias_total")]
+    colunas = zip(
+        _lista(m["investimento_kpi_brl"]),
+        _lista(m["volume_kpi"]),
+        _lista(m["preco_metrica_brl"]),
+        m["preco_metrica_modalidade"].tolist(),
+        _lista(m["custo_midia_previsto"]),
+        _lista(m["custo_midia_realizado"]),
+        m["pct_custo_midia"].tolist(),
+        m["pct_objetivo"].tolist(),
+        _lista(m["preco_unitario_orcado_brl"]),
+        _lista(m["preco_unitario_realizado_brl"]),
+    )
+
+    saida = []
+    for i, (row, valores) in enumerate(zip(rows, colunas)):
+        r = dict(row)
+        (r["investimento_kpi_brl"], r["volume_kpi"], r["preco_metrica_brl"], r["preco_metrica_modalidade"],
+         r["custo_midia_previsto"], r["custo_midia_realizado"], r["pct_custo_midia"], r["pct_objetivo"],
+         r["preco_unitario_orcado_brl"], r["preco_unitario_realizado_brl"]) = valores
+        if periodo_ok[i]:
+            r["periodo_pct_elapsed"] = periodo[0][i]
+            r["periodo_dias_restantes"] = periodo[1][i]
+            r["periodo_dias_total"] = periodo[2][i]
+        else:
+            r["periodo_pct_elapsed"] = r["periodo_dias_restantes"] = r["periodo_dias_total"] = None
+        saida.append(r)
+    return saida
@@ -114,6 +114,8 @@ class Config:
 	SPEDY_SEND_EMAIL_TO_CUSTOMER = os.getenv('SPEDY_SEND_EMAIL_TO_CUSTOMER', 'False').lower() in (
 		'true', '1', 'yes',
 	)
+	# Secret do webhook de NFS-e (cadastrar na Spedy: /api/spedy/webhook?secret=...)
+	SPEDY_WEBHOOK_SECRET = os.getenv('SPEDY_WEBHOOK_SECRET', '')
 
 	# Multiplicador do desvio aceitável que define a fronteira da Ruptura (Zona 5).
 	# Ruptura = orçado × (1 + N × desvio). N=10 → desvio 5% gera ruptura a +50%.
@@ -172,6 +174,20 @@ PINECONE_CONFIG = {
 	'region': os.getenv('PINECONE_REGION', 'us-east-1'),
 }
 
+# ----------------------
+# Índice vetorial da Inteligência
+# ----------------------
+# backend: 'pinecone' (padrão), 'local' (intelligence_chunks + NumPy, sem rede) ou
+# 'memory' (apenas em memória; testes e benchmarks).
+# index_mode (local/memory): 'exact' (força bruta), 'ivf' (aproximado) ou 'auto'
+# (IVF a partir de ann_min_rows vetores).
+INTELLIGENCE_VECTOR_CONFIG = {
+	'backend': os.getenv('INTELLIGENCE_VECTOR_BACKEND', 'pinecone').strip().lower(),
+	'index_mode': os.getenv('INTELLIGENCE_LOCAL_INDEX_MODE', 'auto').strip().lower(),
+	'ann_min_rows': int(os.getenv('INTELLIGENCE_LOCAL_ANN_MIN_ROWS', '50000')),
+	'ivf_nprobe': int(os.getenv('INTELLIGENCE_LOCAL_IVF_NPROBE', '8')),
+}
+
 # ----------------------
 # Alertas e Limites
 # ----------------------
@@ -17,11 +17,11 @@ if _spec and _spec.loader:
 	_spec.loader.exec_module(_mod)  # type: ignore[attr-defined]
 
 	# Re-export important symbols so `from aicentralv2.config import X` works
-	for name in ['Config', 'DevelopmentConfig', 'ProductionConfig', 'TestingConfig', 'config', 'PINECONE_CONFIG']:
+	for name in ['Config', 'DevelopmentConfig', 'ProductionConfig', 'TestingConfig', 'config', 'PINECONE_CONFIG', 'INTELLIGENCE_VECTOR_CONFIG']:
 		if hasattr(_mod, name):
 			globals()[name] = getattr(_mod, name)
 else:
 	raise ImportError(f'Falha ao carregar módulo de configuração em {_module_path}')
 
-__all__ = ['Config', 'DevelopmentConfig', 'ProductionConfig', 'TestingConfig', 'config', 'PINECONE_CONFIG']
+__all__ = ['Config', 'DevelopmentConfig', 'ProductionConfig', 'TestingConfig', 'config', 'PINECONE_CONFIG', 'INTELLIGENCE_VECTOR_CONFIG']
 # Torna 'aicentralv2.config' um pacote explícito para permitir submódulos como pinecone_config.
@@ -1312,6 +1312,7 @@ def api_atualizar_cotacao_teste(cotacao_id):
             itens_recalculados = _recalcular_itens_cotacao_intermediario(cotacao_id)
 
         id_pi_gerado = None
+        job_producao_id = None
         status_anterior = cotacao.get('status')
         if update_data.get('status') == 'Aprovada' and status_anterior != 'Aprovada':
             try:
@@ -1320,18 +1321,19 @@ def api_atualizar_cotacao_teste(cotacao_id):
                     current_app.logger.info(
                         f"PI {id_pi_gerado} gerado automaticamente para cotação teste {cotacao_id}"
                     )
-                    from aicentralv2.services.pi_make_webhooks import (
-                        PiMakeWebhookError,
-                        executar_fluxo_producao_completo,
-                    )
+                    from aicentralv2.services.pi_make_webhooks import enfileirar_fluxo_producao
 
+                    # Pastas Drive + webhooks Make rodam no worker (job pi.fluxo_producao)
                     try:
-                        executar_fluxo_producao_completo(id_pi_gerado)
-                    except PiMakeWebhookError as wh_err:
+                        job_producao_id = enfileirar_fluxo_producao(
+                            id_pi_gerado, created_by=session.get('user_id')
+                        )
+                    except Exception as wh_err:
                         current_app.logger.error(
-                            f"Rollback PI teste {id_pi_gerado} após falha Make: {wh_err}",
+                            f"Rollback PI teste {id_pi_gerado} após falha ao agendar envio: {wh_err}",
                             exc_info=True,
                         )
+                        db.get_db().rollback()
                         try:
                             db.excluir_campanhas_pi_por_id_pi(id_pi_gerado)
                             db.excluir_cadu_pi(id_pi_gerado)
@@ -1382,8 +1384,9 @@ def api_atualizar_cotacao_teste(cotacao_id):
             )
         if id_pi_gerado:
             response_data['id_pi'] = id_pi_gerado
+            response_data['job_producao_id'] = job_producao_id
             response_data['message'] = (
-                f'Cotação aprovada, PI #{id_pi_gerado} gerado e enviado para operação'
+                f'Cotação aprovada, PI #{id_pi_gerado} gerado; envio para operação em andamento'
             )
         return jsonify(response_data)
 
@@ -1,36 +1,35 @@
-import os
-import requests as http_requests
+import json as json_mod
+
 from flask import request, jsonify, session, current_app
 from ..auth import login_required
 from ..db import get_db
+from ..services.openrouter_chat import chamar_openrouter, quer_stream, resposta_sse, stream_openrouter
 from . import bp
 
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 MODEL = "google/gemini-2.5-flash"
+TITULO = "CentralComm AI - CRM"
 
 
 def _call_openrouter(system_prompt, user_content, max_tokens=1000, temperature=0.7):
-    api_key = os.getenv('OPENROUTER_API_KEY')
-    if not api_key:
-        raise ValueError("OPENROUTER_API_KEY não configurada")
-
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "HTTP-Referer": "https://centralcomm.media",
-        "X-Title": "CentralComm AI - CRM"
-    }
-    payload = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_content}
-        ],
-        "max_tokens": max_tokens,
-        "temperature": temperature
-    }
-    resp = http_requests.post(OPENROUTER_URL, headers=headers, json=payload, timeout=60)
-    resp.raise_for_status()
-    return resp.json()['choices'][0]['message']['content']
+    return chamar_openrouter(system_prompt, user_content, modelo=MODEL, max_tokens=max_tokens,
+                             temperature=temperature, titulo=TITULO)
+
+
+def _responder_ia(system_prompt, user_content, montar_resposta, rotulo, max_tokens=1000, temperature=0.7):
+    """SSE se o cliente pediu streaming; senão a completion inteira em JSON."""
+    if quer_stream(request):
+        pedacos = stream_openrouter(system_prompt, user_content, modelo=MODEL, max_tokens=max_tokens,
+                                    temperature=temperature, titulo=TITULO)
+        return resposta_sse(pedacos, montar_resposta, rotulo=rotulo)
+    resultado = _call_openrouter(system_prompt, user_content, max_tokens=max_tokens, temperature=temperature)
+    return jsonify(montar_resposta(resultado))
+
+
+def _sem_cerca_markdown(texto):
+    texto = texto.strip()
+    if texto.startswith('```'):
+        texto = texto.split('\n', 1)[-1].rsplit('```', 1)[0].strip()
+    return texto
 
 
 # --------------- Melhorar Texto ---------------
@@ -54,8 +53,11 @@ def ia_melhorar_texto():
     )
 
     try:
-        resultado = _call_openrouter(system_prompt, texto)
-        return jsonify({'success': True, 'texto_melhorado': resultado})
+        return _responder_ia(
+            system_prompt, texto,
+            lambda resultado: {'success': True, 'texto_melhorado': resultado},
+            'crm.melhorar_texto',
+        )
     except Exception as e:
         current_app.logger.error(f"Erro ia_melhorar_texto: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -156,10 +158,14 @@ def ia_sugerir_objetivos():
             "Retorne apenas a lista de objetivos, um por linha, sem numeração."
         )
 
-        resultado = _call_openrouter(system_prompt, contexto)
-        objetivos = [o.strip() for o in resultado.strip().split('\n') if o.strip()]
-
-        return jsonify({'success': True, 'objetivos': objetivos})
+        return _responder_ia(
+            system_prompt, contexto,
+            lambda resultado: {
+                'success': True,
+                'objetivos': [o.strip() for o in resultado.strip().split('\n') if o.strip()],
+            },
+            'crm.sugerir_objetivos',
+        )
     except Exception as e:
         current_app.logger.error(f"Erro ia_sugerir_objetivos: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -238,14 +244,12 @@ def ia_sugerir_atividade():
             "Seja breve e prático."
         )
 
-        import json as json_mod
-        resultado = _call_openrouter(system_prompt, contexto, max_tokens=300, temperature=0.7)
-        resultado = resultado.strip()
-        if resultado.startswith('```'):
-            resultado = resultado.split('\n', 1)[-1].rsplit('```', 1)[0].strip()
-        sugestao = json_mod.loads(resultado)
-
-        return jsonify({'success': True, 'sugestao': sugestao})
+        return _responder_ia(
+            system_prompt, contexto,
+            lambda resultado: {'success': True, 'sugestao': json_mod.loads(_sem_cerca_markdown(resultado))},
+            'crm.sugerir_atividade',
+            max_tokens=300,
+        )
     except Exception as e:
         current_app.logger.error(f"Erro ia_sugerir_atividade: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -256,7 +260,6 @@ def ia_sugerir_atividade():
 @bp.route('/api/ia/extrair-contatos', methods=['POST'])
 @login_required
 def ia_extrair_contatos():
-    import json as json_mod
     data = request.get_json() or {}
     texto = (data.get('texto') or '').strip()
     if not texto:
@@ -278,10 +281,7 @@ def ia_extrair_contatos():
 
     try:
         resultado = _call_openrouter(system_prompt, texto, max_tokens=2000, temperature=0.1)
-        resultado = resultado.strip()
-        if resultado.startswith('```'):
-            resultado = resultado.split('\n', 1)[-1].rsplit('```', 1)[0].strip()
-        contatos = json_mod.loads(resultado)
+        contatos = json_mod.loads(_sem_cerca_markdown(resultado))
         if not isinstance(contatos, list):
             raise ValueError("Resposta da IA não é um array JSON")
         contatos_limpos = []
@@ -353,9 +353,12 @@ def ia_gerar_comunicacao():
             f"Assine como: {user_name}"
         )
 
-        resultado = _call_openrouter(system_prompt, objetivo, max_tokens=1500)
-
-        return jsonify({'success': True, 'mensagem': resultado, 'tipo': tipo})
+        return _responder_ia(
+            system_prompt, objetivo,
+            lambda resultado: {'success': True, 'mensagem': resultado, 'tipo': tipo},
+            'crm.gerar_comunicacao',
+            max_tokens=1500,
+        )
     except Exception as e:
         current_app.logger.error(f"Erro ia_gerar_comunicacao: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -6,6 +6,7 @@ from datetime import datetime
 from flask import render_template, request, jsonify, session, current_app, Response
 from ..auth import login_required
 from ..db import get_db
+from ..services.cliente_metricas import aplicar_pendencias as aplicar_pendencias_cliente_metricas
 from . import bp
 
 
@@ -91,36 +92,6 @@ def _webhook_secret_ok():
     return True
 
 
-def _wasender_message_from_payload(payload):
-    data = payload.get('data') if isinstance(payload, dict) else {}
-    messages = data.get('messages') if isinstance(data, dict) else None
-    if isinstance(messages, list):
-        return messages[0] if messages else None
-    if isinstance(messages, dict):
-        return messages
-    return None
-
-
-def _wasender_message_id(payload, message_data=None):
-    message_data = message_data or _wasender_message_from_payload(payload) or {}
-    key = message_data.get('key') if isinstance(message_data, dict) else {}
-    for source in (key, message_data, payload.get('data') if isinstance(payload, dict) else {}, payload):
-        if isinstance(source, dict):
-            for k in ('id', 'message_id', 'messageId', 'msgId'):
-                if source.get(k):
-                    return str(source[k])
-    return None
-
-
-def _wasender_provider_status(payload):
-    for source in (payload.get('data') if isinstance(payload, dict) else {}, payload):
-        if isinstance(source, dict):
-            for k in ('status', 'message_status', 'messageStatus'):
-                if source.get(k):
-                    return str(source[k])
-    return payload.get('event') if isinstance(payload, dict) else None
-
-
 @bp.route('/')
 @login_required
 def index():
@@ -161,6 +132,7 @@ def api_clientes():
     if not executivo_id:
         return jsonify({'success': False, 'error': 'executivo_id obrigatório'}), 400
 
+    aplicar_pendencias_cliente_metricas()
     conn = get_db()
     try:
         with conn.cursor() as cur:
@@ -179,21 +151,15 @@ def api_clientes():
                     tc.display AS tipo_cliente_display,
                     ag.key AS is_agencia,
                     ag.display AS agencia_display,
-                    (SELECT ca_p.id_agencia_cliente
-                     FROM tbl_cliente_agencia ca_p
-                     WHERE ca_p.id_cliente = cli.id_cliente AND ca_p.is_principal = TRUE
-                     LIMIT 1) AS agencia_principal_id,
-                    (SELECT COALESCE(ag_p.nome_fantasia, ag_p.razao_social)
-                     FROM tbl_cliente_agencia ca_p
-                     JOIN tbl_cliente ag_p ON ag_p.id_cliente = ca_p.id_agencia_cliente
-                     WHERE ca_p.id_cliente = cli.id_cliente AND ca_p.is_principal = TRUE
-                     LIMIT 1) AS agencia_principal_nome,
-                    COUNT(DISTINCT cont.id_contato_cliente) AS qtd_contatos,
-                    COUNT(DISTINCT sa.id) FILTER (WHERE sa.status = 'pendente') AS atividades_pendentes
+                    m.agencia_principal_id,
+                    COALESCE(ag_p.nome_fantasia, ag_p.razao_social) AS agencia_principal_nome,
+                    COALESCE(m.contatos_ativos, 0) AS qtd_contatos,
+                    COALESCE(m.atividades_pendentes, 0) AS atividades_pendentes
                 FROM tbl_cliente cli
                 LEFT JOIN tbl_agencia ag ON ag.id_agencia = cli.pk_id_tbl_agencia
-                LEFT JOIN tbl_contato_cliente cont ON cont.pk_id_tbl_cliente = cli.id_cliente AND cont.status = true
-                LEFT JOIN sales_atividades sa ON sa.cliente_id = cli.id_cliente
+                -- Contadores e agência principal mantidos por cliente (services/cliente_metricas.py)
+                LEFT JOIN cliente_metricas m ON m.id_cliente = cli.id_cliente
+                LEFT JOIN tbl_cliente ag_p ON ag_p.id_cliente = m.agencia_principal_id
                 LEFT JOIN tbl_tipo_cliente tc ON tc.id_tipo_cliente = cli.id_tipo_cliente
                 WHERE cli.vendas_central_comm = %s
                   AND COALESCE(cli.status, true) = true
@@ -214,15 +180,10 @@ def api_clientes():
                 query += " AND (cli.nome_fantasia ILIKE %s OR cli.razao_social ILIKE %s)"
                 params.extend([f'%{busca}%', f'%{busca}%'])
 
-            query += """
-                GROUP BY cli.id_cliente, cli.nome_fantasia, cli.razao_social,
-                         cli.classificacao_cliente, cli.pk_id_tbl_agencia, tc.display, ag.key, ag.display
-            """
-
             if com_pendencias == '1':
-                query += " HAVING COUNT(DISTINCT sa.id) FILTER (WHERE sa.status = 'pendente') > 0"
+                query += " AND COALESCE(m.atividades_pendentes, 0) > 0"
             elif com_pendencias == '0':
-                query += " HAVING COUNT(DISTINCT sa.id) FILTER (WHERE sa.status = 'pendente') = 0"
+                query += " AND COALESCE(m.atividades_pendentes, 0) = 0"
 
             query += """
                 ORDER BY
@@ -917,7 +878,7 @@ def api_comunicacao_mensagens(conversa_id):
 @login_required
 def api_criar_comunicacao_mensagem(conversa_id):
     from .. import db as db_mod
-    from ..services.wasender_service import WasenderApiError, enviar_mensagem_texto
+    from ..services.wasender_outbox import enfileirar_mensagem_whatsapp
     data = request.get_json() or {}
     texto = (data.get('texto') or '').strip()
     if not texto:
@@ -926,7 +887,6 @@ def api_criar_comunicacao_mensagem(conversa_id):
     status = (data.get('status') or 'enviado').strip() or 'enviado'
     gerado_por_ia = bool(data.get('gerado_por_ia'))
     try:
-        provider_meta = {}
         if direcao == 'outbound':
             conversa = db_mod.obter_sales_comunicacao_conversa(conversa_id)
             if not conversa:
@@ -945,34 +905,37 @@ def api_criar_comunicacao_mensagem(conversa_id):
             )
             if not destino:
                 return jsonify({'success': False, 'error': 'Conversa sem telefone de destino.'}), 400
+
+            # Envio pela fila da sessão (limite de taxa do Wasender): a resposta volta na hora
+            msg_id = db_mod.criar_sales_comunicacao_mensagem(
+                conversa_id,
+                texto,
+                direcao=direcao,
+                status='na_fila',
+                gerado_por_ia=gerado_por_ia,
+                created_by=session.get('user_id'),
+                provider='wasenderapi',
+                provider_status='queued',
+            )
             try:
-                provider_meta = enviar_mensagem_texto(credencial['wasender_api_key'], destino, texto)
-                status = 'enviado'
-                db_mod.atualizar_sales_comunicacao_conversa_wasender(
-                    conversa_id,
-                    responsavel_id=responsavel_id,
-                    telefone_remetente=remetente,
-                    provider_session_id=credencial.get('wasender_session_id'),
-                )
-            except WasenderApiError as exc:
-                msg_id = db_mod.criar_sales_comunicacao_mensagem(
-                    conversa_id,
-                    texto,
-                    direcao=direcao,
-                    status='erro',
-                    gerado_por_ia=gerado_por_ia,
-                    created_by=session.get('user_id'),
-                    provider='wasenderapi',
+                enfileirar_mensagem_whatsapp(msg_id, conversa_id, credencial, destino, texto)
+            except Exception as exc:
+                current_app.logger.error(f"Erro ao enfileirar WhatsApp da mensagem {msg_id}: {exc}", exc_info=True)
+                db_mod.atualizar_sales_comunicacao_mensagem_provider(
+                    mensagem_id=msg_id,
                     provider_status='failed',
                     provider_payload={'error': str(exc)},
+                    status='erro',
                 )
                 mensagens = db_mod.listar_sales_comunicacao_mensagens(conversa_id)
                 return jsonify({
                     'success': False,
                     'id': msg_id,
-                    'error': str(exc),
+                    'error': 'Não foi possível colocar a mensagem na fila de envio.',
                     'mensagens': _jsonify_rows(mensagens),
-                }), 502
+                }), 500
+            mensagens = db_mod.listar_sales_comunicacao_mensagens(conversa_id)
+            return jsonify({'success': True, 'id': msg_id, 'queued': True, 'mensagens': _jsonify_rows(mensagens)})
 
         msg_id = db_mod.criar_sales_comunicacao_mensagem(
             conversa_id,
@@ -981,10 +944,6 @@ def api_criar_comunicacao_mensagem(conversa_id):
             status=status,
             gerado_por_ia=gerado_por_ia,
             created_by=session.get('user_id'),
-            provider=provider_meta.get('provider') if provider_meta else None,
-            provider_message_id=provider_meta.get('provider_message_id') if provider_meta else None,
-            provider_status=provider_meta.get('provider_status') if provider_meta else None,
-            provider_payload=provider_meta.get('provider_payload') if provider_meta else None,
         )
         mensagens = db_mod.listar_sales_comunicacao_mensagens(conversa_id)
         return jsonify({'success': True, 'id': msg_id, 'mensagens': _jsonify_rows(mensagens)})
@@ -1053,103 +1012,28 @@ def api_salvar_comunicacao_automacao(cliente_id):
 
 @bp.route('/api/wasender/webhook', methods=['POST'])
 def api_wasender_webhook():
-    from .. import db as db_mod
+    """Grava o evento na inbox e confirma na hora; o worker processa (job wasender.processar_inbox)."""
+    from ..services.wasender_inbox import registrar_evento_wasender
     if not _webhook_secret_ok():
         return jsonify({'success': False, 'error': 'Webhook não autorizado.'}), 401
 
-    payload = request.get_json(silent=True) or {}
-    event = (payload.get('event') or '').strip()
-    current_app.logger.info('Wasender webhook recebido: event=%s', event or '(vazio)')
-    message_data = _wasender_message_from_payload(payload)
-    provider_message_id = _wasender_message_id(payload, message_data)
-
-    if event and event not in ('messages.received', 'messages.upsert', 'messages.update', 'message.status', 'messages.status'):
-        return jsonify({'success': True, 'ignored': True, 'reason': 'event_not_handled'})
-
-    if event in ('messages.update', 'message.status', 'messages.status'):
-        updated = db_mod.atualizar_sales_comunicacao_mensagem_provider(
-            provider_message_id=provider_message_id,
-            provider_status=_wasender_provider_status(payload),
-            provider_payload=payload,
-        )
-        return jsonify({'success': True, 'updated': updated})
-
-    if not message_data:
-        if provider_message_id:
-            updated = db_mod.atualizar_sales_comunicacao_mensagem_provider(
-                provider_message_id=provider_message_id,
-                provider_status=_wasender_provider_status(payload),
-                provider_payload=payload,
-            )
-            return jsonify({'success': True, 'updated': updated})
-        return jsonify({'success': True, 'ignored': True, 'reason': 'no_message'})
-
-    key = message_data.get('key') or {}
-    if key.get('fromMe') is True:
-        return jsonify({'success': True, 'ignored': True, 'reason': 'from_me'})
-
-    sender = key.get('cleanedSenderPn') or key.get('cleanedParticipantPn') or ''
-    if not sender:
-        remote = key.get('remoteJid') or ''
-        if isinstance(remote, str) and '@' in remote:
-            sender = remote.split('@')[0]
-        elif remote:
-            sender = remote
-    texto = (message_data.get('messageBody') or '').strip()
-    if not texto:
-        raw_msg = message_data.get('message') or {}
-        texto = (raw_msg.get('conversation') or '').strip() if isinstance(raw_msg, dict) else ''
-    if not sender or not texto:
-        return jsonify({'success': True, 'ignored': True, 'reason': 'missing_sender_or_text'})
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        payload = {}
+    current_app.logger.info('Wasender webhook recebido: event=%s', (payload.get('event') or '').strip() or '(vazio)')
 
     try:
-        if provider_message_id:
-            ja_existia = db_mod.atualizar_sales_comunicacao_mensagem_provider(
-                provider_message_id=provider_message_id,
-                provider_status='received',
-                provider_payload=payload,
-            )
-            if ja_existia:
-                return jsonify({'success': True, 'duplicate': True})
-
-        contato = db_mod.localizar_contato_por_telefone_wasender(sender)
-        if not contato or not contato.get('pk_id_tbl_cliente'):
-            return jsonify({'success': True, 'ignored': True, 'reason': 'phone_not_registered'})
-
-        cliente_id = contato['pk_id_tbl_cliente']
-        responsavel_id = contato.get('vendas_central_comm')
-        credencial = db_mod.obter_wasender_credencial_responsavel(responsavel_id) if responsavel_id else None
-        conversa_id = db_mod.criar_sales_comunicacao_conversa(
-            cliente_id,
-            contato_id=contato['id_contato_cliente'],
-            telefone=db_mod.normalizar_telefone_whatsapp(sender),
-            canal='whatsapp',
-            created_by=None,
-            responsavel_id=responsavel_id,
-            telefone_remetente=credencial.get('telefone_normalizado') if credencial else None,
-            provider_session_id=credencial.get('wasender_session_id') if credencial else None,
-        )
-        msg_id = db_mod.criar_sales_comunicacao_mensagem(
-            conversa_id,
-            texto,
-            direcao='inbound',
-            status='recebido',
-            gerado_por_ia=False,
-            created_by=None,
-            provider='wasenderapi',
-            provider_message_id=provider_message_id,
-            provider_status='received',
-            provider_payload=payload,
-        )
-        current_app.logger.info(
-            'Wasender inbound salvo: conversa=%s msg=%s contato=%s cliente=%s',
-            conversa_id, msg_id, contato.get('id_contato_cliente'), cliente_id,
-        )
-        return jsonify({'success': True, 'id': msg_id, 'conversa_id': conversa_id})
+        registro = registrar_evento_wasender(payload)
     except Exception as e:
         current_app.logger.error(f"Erro api_wasender_webhook: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+    if registro.get('ignorado'):
+        return jsonify({'success': True, 'ignored': True, 'reason': registro['ignorado']})
+    if registro.get('duplicado'):
+        return jsonify({'success': True, 'duplicate': True})
+    return jsonify({'success': True, 'queued': True, 'inbox_id': registro['id']})
+
 
 @bp.route('/api/cliente/<int:cliente_id>/cotacoes', methods=['POST'])
 @login_required
@@ -5,8 +5,12 @@ Gerenciamento de conexão com PostgreSQL
 =====================================================
 """
 
+import base64
+import copy
 import json
 import logging
+import threading
+import time
 import psycopg
 from psycopg.rows import dict_row
 from psycopg.types.json import Json
@@ -16,6 +20,7 @@ import hashlib
 import bcrypt
 from datetime import date, datetime, timedelta
 from decimal import Decimal
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional
 import re
 import secrets
@@ -378,6 +383,23 @@ def init_db(app):
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_com_msg_provider_id ON sales_comunicacao_mensagens(provider_message_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_com_conv_resp ON sales_comunicacao_conversas(responsavel_id)')
 
+            # Telefones canônicos (só dígitos, com DDI 55) para localizar contato/conversa do
+            # WhatsApp por igualdade indexada. Coluna gerada: o Postgres mantém em toda escrita
+            # e preenche as linhas existentes no ADD COLUMN.
+            for tabela, coluna in (
+                ('tbl_contato_cliente', 'telefone'),
+                ('tbl_contato_cliente', 'telefone_secundario'),
+                ('sales_comunicacao_conversas', 'telefone'),
+            ):
+                cursor.execute(
+                    f'ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS {coluna}_e164 TEXT '
+                    f'GENERATED ALWAYS AS ({_sql_telefone_e164(coluna)}) STORED'
+                )
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS idx_{tabela}_{coluna}_e164 '
+                    f"ON {tabela}({coluna}_e164) WHERE {coluna}_e164 <> ''"
+                )
+
             # Garantir coluna de vendas_central_comm em tbl_cliente (inteiro 0/1)
             cursor.execute('''
                 DO $$
@@ -897,6 +919,195 @@ def init_db(app):
                 END $$;
             ''')
 
+            # Fila de jobs em segundo plano (services/jobs.py + worker.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cadu_jobs (
+                    id BIGSERIAL PRIMARY KEY,
+                    tipo VARCHAR(100) NOT NULL,
+                    fila VARCHAR(50) NOT NULL DEFAULT 'default',
+                    payload JSONB NOT NULL DEFAULT '{}',
+                    status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+                    prioridade INTEGER NOT NULL DEFAULT 100,
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    max_tentativas INTEGER NOT NULL DEFAULT 5,
+                    idempotency_key VARCHAR(200),
+                    executar_em TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+                    bloqueado_por VARCHAR(200),
+                    bloqueado_em TIMESTAMP WITHOUT TIME ZONE,
+                    progresso JSONB,
+                    resultado JSONB,
+                    ultimo_erro TEXT,
+                    created_by INTEGER,
+                    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+                    iniciado_em TIMESTAMP WITHOUT TIME ZONE,
+                    concluido_em TIMESTAMP WITHOUT TIME ZONE,
+                    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
+                )
+            ''')
+            cursor.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS uq_cadu_jobs_idempotency '
+                'ON cadu_jobs(idempotency_key) WHERE idempotency_key IS NOT NULL'
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_cadu_jobs_pendentes '
+                "ON cadu_jobs(prioridade, executar_em, id) WHERE status = 'pendente'"
+            )
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cadu_jobs_status_tipo ON cadu_jobs(status, tipo)')
+
+            # Outbox de e-mails transacionais (services/email_outbox.py), entregue pelo worker
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS email_outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    dedup_key VARCHAR(255),
+                    to_email VARCHAR(255) NOT NULL,
+                    to_name VARCHAR(255),
+                    subject TEXT NOT NULL,
+                    html_content TEXT NOT NULL,
+                    text_content TEXT,
+                    sender JSONB,
+                    reply_to JSONB,
+                    params JSONB,
+                    attachments JSONB,
+                    conteudo_hash VARCHAR(64) NOT NULL,
+                    origem VARCHAR(100),
+                    status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    proxima_tentativa_em TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+                    message_id VARCHAR(255),
+                    ultimo_erro TEXT,
+                    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+                    enviado_em TIMESTAMP WITHOUT TIME ZONE,
+                    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
+                )
+            ''')
+            cursor.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS uq_email_outbox_dedup '
+                'ON email_outbox(dedup_key) WHERE dedup_key IS NOT NULL'
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_email_outbox_pendentes '
+                "ON email_outbox(proxima_tentativa_em, id) WHERE status = 'pendente'"
+            )
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_email_outbox_status ON email_outbox(status, updated_at)')
+
+            # Estado da sincronização de contatos com o Brevo (services/brevo_sync.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS brevo_sync_state (
+                    segmento VARCHAR(20) NOT NULL,
+                    email VARCHAR(255) NOT NULL,
+                    list_ids INTEGER[] NOT NULL DEFAULT '{}',
+                    atributos_hash VARCHAR(64),
+                    sincronizado_em TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+                    PRIMARY KEY (segmento, email)
+                )
+            ''')
+
+            # Estado por etapa do fluxo de produção do PI (pastas Drive + webhooks Make)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cadu_pi_fluxo_producao (
+                    id_pi INTEGER PRIMARY KEY,
+                    status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+                    etapas JSONB NOT NULL DEFAULT '{}',
+                    job_id BIGINT,
+                    geracao INTEGER NOT NULL DEFAULT 0,
+                    ultimo_erro TEXT,
+                    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+                    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
+                )
+            ''')
+            # geracao: conta os envios do PI; compõe a idempotency_key do job de cada envio
+            cursor.execute(
+                'ALTER TABLE cadu_pi_fluxo_producao ADD COLUMN IF NOT EXISTS geracao INTEGER NOT NULL DEFAULT 0'
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_cadu_pi_fluxo_producao_status '
+                'ON cadu_pi_fluxo_producao(status, updated_at)'
+            )
+
+            # Inbox dos webhooks Wasender (services/wasender_inbox.py): o webhook só grava o
+            # evento bruto; o worker processa em ordem por remetente
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS wasender_webhook_inbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    evento VARCHAR(60),
+                    tipo VARCHAR(20) NOT NULL,
+                    provider_message_id VARCHAR(255),
+                    chave_ordem VARCHAR(64) NOT NULL DEFAULT '',
+                    payload JSONB NOT NULL,
+                    status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    proxima_tentativa_em TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+                    resultado JSONB,
+                    ultimo_erro TEXT,
+                    recebido_em TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+                    processado_em TIMESTAMP WITHOUT TIME ZONE,
+                    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
+                )
+            ''')
+            cursor.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS uq_wasender_inbox_mensagem '
+                "ON wasender_webhook_inbox(provider_message_id) "
+                "WHERE tipo = 'mensagem' AND provider_message_id IS NOT NULL"
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_wasender_inbox_abertos '
+                "ON wasender_webhook_inbox(chave_ordem, id) WHERE status IN ('pendente', 'processando')"
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_wasender_inbox_status '
+                'ON wasender_webhook_inbox(status, recebido_em)'
+            )
+
+            # Fila de envio WhatsApp por sessão Wasender (services/wasender_outbox.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS wasender_outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    mensagem_id INTEGER NOT NULL REFERENCES sales_comunicacao_mensagens(id) ON DELETE CASCADE,
+                    conversa_id INTEGER NOT NULL,
+                    responsavel_id INTEGER NOT NULL,
+                    sessao VARCHAR(120) NOT NULL,
+                    destino VARCHAR(40) NOT NULL,
+                    texto TEXT NOT NULL,
+                    status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    proxima_tentativa_em TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+                    ultimo_erro TEXT,
+                    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+                    enviado_em TIMESTAMP WITHOUT TIME ZONE,
+                    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
+                )
+            ''')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_wasender_outbox_abertos '
+                "ON wasender_outbox(sessao, id) WHERE status IN ('pendente', 'enviando')"
+            )
+            # Token bucket por sessão, compartilhado entre workers
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS wasender_rate_limit (
+                    sessao VARCHAR(120) PRIMARY KEY,
+                    tokens DOUBLE PRECISION NOT NULL,
+                    atualizado_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT clock_timestamp()
+                )
+            ''')
+
+            # Rollups diários do dashboard (services/dashboard_rollups.py)
+            _criar_estrutura_rollups_dashboard(cursor)
+
+            # Agregados do analytics (services/analytics_agregados.py)
+            _criar_estrutura_analytics_agregados(cursor)
+
+            # Fatos das métricas semanais do comercial (services/metricas_semanais.py)
+            _criar_estrutura_metricas_semanais(cursor)
+
+            # Invalidação do cache da análise de leads (obter_leads_analise)
+            _criar_estrutura_leads_analise(cursor)
+
+            # Métricas mantidas por cliente (services/cliente_metricas.py)
+            _criar_estrutura_cliente_metricas(cursor)
+
+            # Índices das listagens paginadas por keyset (PIs, campanhas, logs)
+            _criar_indices_listagens(cursor)
+
         conn.commit()
     app.logger.info("OK Banco de dados inicializado")
 
@@ -961,6 +1172,118 @@ def verificar_senha_md5(senha, senha_md5):
     return gerar_senha_md5(senha) == senha_md5
 
 
+# ==================== PAGINAÇÃO KEYSET ====================
+
+# Listagens longas (PIs, campanhas, logs de auditoria) são lidas em páginas de
+# LISTAGENS_PAGINA linhas na ordem (data DESC NULLS LAST, id DESC). O cursor da página
+# seguinte é a chave da última linha entregue, opaco para o navegador. Totais e somas
+# de rodapé, que precisam da lista inteira, ficam em cache por LISTAGENS_CONTAGEM_TTL s.
+LISTAGENS_PAGINA = int(os.getenv('LISTAGENS_PAGINA', '100'))
+LISTAGENS_CONTAGEM_TTL = int(os.getenv('LISTAGENS_CONTAGEM_TTL', '60'))
+_LISTAGENS_CONTAGEM_MAX = 256
+_listagens_contagem_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_listagens_contagem_lock = threading.Lock()
+
+# Tabela -> (coluna de data, id) da ordenação keyset
+LISTAGENS_KEYSET = {
+    'cadu_pi': ('created_at', 'id_pi'),
+    'cadu_pi_campanha': ('created_at', 'id_campanha'),
+    'tbl_admin_audit_log': ('data_acao', 'id_log'),
+}
+
+
+def _criar_indices_listagens(cursor):
+    """Índices na ordem das listagens keyset (idempotente)."""
+    for tabela, (coluna, coluna_id) in LISTAGENS_KEYSET.items():
+        cursor.execute(f'''
+            DO $$
+            BEGIN
+                IF to_regclass('{tabela}') IS NOT NULL THEN
+                    CREATE INDEX IF NOT EXISTS idx_{tabela}_keyset
+                        ON {tabela} ({coluna} DESC NULLS LAST, {coluna_id} DESC);
+                END IF;
+            END
+            $$
+        ''')
+
+
+def codificar_cursor(valor, id_registro):
+    """Cursor opaco (base64url) com a chave (data, id) da última linha da página."""
+    chave = [valor.isoformat() if valor is not None else None, int(id_registro)]
+    return base64.urlsafe_b64encode(json.dumps(chave).encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """(datetime | None, id) do cursor; None sem cursor. ValueError se o cursor não for válido."""
+    if not cursor:
+        return None
+    try:
+        valor, id_registro = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return (datetime.fromisoformat(valor) if valor is not None else None, int(id_registro))
+    except (TypeError, ValueError) as e:
+        raise ValueError('Cursor de paginação inválido') from e
+
+
+def _keyset_pagina(select_sql, params, coluna, coluna_id, apos, limite):
+    """Página (SQL, params) de select_sql na ordem coluna DESC NULLS LAST, id DESC depois do cursor apos.
+
+    select_sql é um SELECT ... WHERE sem ORDER BY/LIMIT que devolve coluna e coluna_id.
+    Depois de um cursor com data, a página junta (UNION ALL) as linhas com data anterior,
+    por comparação de linha (Index Cond no índice keyset), e a cauda com data NULL; cada
+    ramo lê o índice já na ordem e tem o próprio LIMIT, e o Merge Append para na página
+    cheia. Um OR entre os dois ramos não vira condição de índice e refiltra tudo o que já
+    foi entregue.
+    """
+    ordem = f'{coluna} DESC NULLS LAST, {coluna_id} DESC'
+    chave = decodificar_cursor(apos)
+    if chave is None:
+        return f'{select_sql} ORDER BY {ordem} LIMIT %s', params + [limite]
+    valor, id_registro = chave
+    if valor is None:
+        return (f'{select_sql} AND {coluna} IS NULL AND {coluna_id} < %s ORDER BY {ordem} LIMIT %s',
+                params + [id_registro, limite])
+    nome, nome_id = coluna.split('.')[-1], coluna_id.split('.')[-1]
+    return (
+        f'''
+        SELECT * FROM (
+            ({select_sql} AND ({coluna}, {coluna_id}) < (%s, %s) ORDER BY {ordem} LIMIT %s)
+            UNION ALL
+            ({select_sql} AND {coluna} IS NULL ORDER BY {ordem} LIMIT %s)
+        ) keyset
+        ORDER BY {nome} DESC NULLS LAST, {nome_id} DESC
+        LIMIT %s
+        ''',
+        params + [valor, id_registro, limite] + params + [limite, limite],
+    )
+
+
+def proximo_cursor(linhas, limite, coluna, coluna_id):
+    """Cursor da página seguinte; None quando a página veio incompleta (fim da lista)."""
+    if not limite or not linhas or len(linhas) < limite:
+        return None
+    return codificar_cursor(linhas[-1][coluna], linhas[-1][coluna_id])
+
+
+def contagem_em_cache(escopo, filtros, calcular):
+    """Resultado de calcular() (total/somas de uma listagem) em cache por escopo e filtros."""
+    chave = (escopo, tuple(sorted((k, str(v)) for k, v in (filtros or {}).items())))
+    agora = time.monotonic()
+    with _listagens_contagem_lock:
+        entrada = _listagens_contagem_cache.get(chave)
+        if entrada and agora - entrada[0] < LISTAGENS_CONTAGEM_TTL:
+            _listagens_contagem_cache.move_to_end(chave)
+            return copy.deepcopy(entrada[1])
+
+    resultado = calcular()
+
+    with _listagens_contagem_lock:
+        _listagens_contagem_cache[chave] = (agora, copy.deepcopy(resultado))
+        _listagens_contagem_cache.move_to_end(chave)
+        while len(_listagens_contagem_cache) > _LISTAGENS_CONTAGEM_MAX:
+            _listagens_contagem_cache.popitem(last=False)
+    return resultado
+
+
 # ==================== IMAGEM/EXTRAÇÃO ====================
 
  
@@ -4727,17 +5050,19 @@ def gerar_numero_invoice():
 
 # ==================== ASSINATURAS / SUBSCRIPTION ====================
 
-def criar_invoice_assinatura(dados):
+def criar_invoice_assinatura(dados, conn=None):
     """
     Cria uma fatura do tipo subscription com billing_data JSON.
 
     Args:
         dados (dict): Deve conter id_cliente, plan_type, total, due_date, billing_data (dict),
                       opcionalmente invoice_number, id_plan, created_by.
+        conn: Com conexão informada, o INSERT fica na transação do chamador (que faz o commit)
     Returns:
         dict: {id_invoice, invoice_number}
     """
-    conn = get_db()
+    proprio_commit = conn is None
+    conn = conn or get_db()
     try:
         with conn.cursor() as cursor:
             invoice_number = dados.get('invoice_number')
@@ -4777,7 +5102,8 @@ def criar_invoice_assinatura(dados):
             ))
 
             row = cursor.fetchone()
-            conn.commit()
+            if proprio_commit:
+                conn.commit()
             return {'id_invoice': row['id_invoice'], 'invoice_number': row['invoice_number']}
     except Exception as e:
         conn.rollback()
@@ -4940,14 +5266,46 @@ def registrar_audit_log(fk_id_usuario, acao, modulo, descricao=None, registro_id
         raise e
 
 
-def obter_audit_logs(filtros=None, limit=100, offset=0):
+def _filtros_audit_logs(filtros):
+    """Cláusulas (SQL, params) dos filtros de obter_audit_logs/contar_audit_logs."""
+    sql = ''
+    params = []
+    if filtros:
+        if filtros.get('modulo'):
+            sql += ' AND l.modulo = %s'
+            params.append(filtros['modulo'])
+
+        if filtros.get('acao'):
+            sql += ' AND l.acao = %s'
+            params.append(filtros['acao'])
+
+        if filtros.get('usuario_id'):
+            sql += ' AND l.fk_id_usuario = %s'
+            params.append(filtros['usuario_id'])
+
+        if filtros.get('data_inicio'):
+            sql += ' AND l.data_acao >= %s'
+            params.append(filtros['data_inicio'])
+
+        if filtros.get('data_fim'):
+            sql += ' AND l.data_acao <= %s'
+            params.append(filtros['data_fim'])
+
+        if filtros.get('registro_id') and filtros.get('registro_tipo'):
+            sql += ' AND l.registro_id = %s AND l.registro_tipo = %s'
+            params.append(filtros['registro_id'])
+            params.append(filtros['registro_tipo'])
+    return sql, params
+
+
+def obter_audit_logs(filtros=None, limit=100, apos=None):
     """
-    Retorna logs de auditoria com filtros opcionais
+    Retorna logs de auditoria com filtros opcionais, em páginas keyset (data_acao, id_log)
     
     Args:
         filtros (dict, optional): Filtros (modulo, acao, usuario_id, data_inicio, data_fim)
         limit (int): Número máximo de registros
-        offset (int): Offset para paginação
+        apos (str, optional): Cursor da página anterior (proximo_cursor(logs, limit, 'data_acao', 'id_log'))
     
     Returns:
         list: Lista de logs de auditoria
@@ -4955,53 +5313,51 @@ def obter_audit_logs(filtros=None, limit=100, offset=0):
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            query = '''
+            filtros_sql, params = _filtros_audit_logs(filtros)
+            pagina_sql, params = _keyset_pagina(
+                '''
+                SELECT l.id_log, l.data_acao
+                FROM tbl_admin_audit_log l
+                INNER JOIN tbl_contato_cliente u ON l.fk_id_usuario = u.id_contato_cliente
+                WHERE 1=1
+                ''' + filtros_sql,
+                params, 'l.data_acao', 'l.id_log', apos, limit,
+            )
+            query = f'''
+                WITH pagina AS ({pagina_sql})
                 SELECT 
                     l.*,
                     u.nome_completo as usuario_nome,
                     u.email as usuario_email
-                FROM tbl_admin_audit_log l
+                FROM pagina pg
+                JOIN tbl_admin_audit_log l ON l.id_log = pg.id_log
                 INNER JOIN tbl_contato_cliente u ON l.fk_id_usuario = u.id_contato_cliente
-                WHERE 1=1
+                ORDER BY l.data_acao DESC NULLS LAST, l.id_log DESC
             '''
             
-            params = []
-            
-            if filtros:
-                if filtros.get('modulo'):
-                    query += ' AND l.modulo = %s'
-                    params.append(filtros['modulo'])
-                
-                if filtros.get('acao'):
-                    query += ' AND l.acao = %s'
-                    params.append(filtros['acao'])
-                
-                if filtros.get('usuario_id'):
-                    query += ' AND l.fk_id_usuario = %s'
-                    params.append(filtros['usuario_id'])
-                
-                if filtros.get('data_inicio'):
-                    query += ' AND l.data_acao >= %s'
-                    params.append(filtros['data_inicio'])
-                
-                if filtros.get('data_fim'):
-                    query += ' AND l.data_acao <= %s'
-                    params.append(filtros['data_fim'])
-                
-                if filtros.get('registro_id') and filtros.get('registro_tipo'):
-                    query += ' AND l.registro_id = %s AND l.registro_tipo = %s'
-                    params.append(filtros['registro_id'])
-                    params.append(filtros['registro_tipo'])
-            
-            query += ' ORDER BY l.data_acao DESC LIMIT %s OFFSET %s'
-            params.extend([limit, offset])
-            
             cursor.execute(query, params)
             return cursor.fetchall()
     except Exception as e:
         raise e
 
 
+def contar_audit_logs(filtros=None):
+    """Total de logs de auditoria para os filtros (em cache por LISTAGENS_CONTAGEM_TTL)."""
+    def _contar():
+        conn = get_db()
+        with conn.cursor() as cursor:
+            filtros_sql, params = _filtros_audit_logs(filtros)
+            cursor.execute('''
+                SELECT COUNT(*) AS total
+                FROM tbl_admin_audit_log l
+                INNER JOIN tbl_contato_cliente u ON l.fk_id_usuario = u.id_contato_cliente
+                WHERE 1=1
+            ''' + filtros_sql, params)
+            return cursor.fetchone()['total']
+
+    return contagem_em_cache('audit_logs', filtros, _contar)
+
+
 def obter_audit_log_por_id(log_id):
     """
     Retorna um log de auditoria específico
@@ -5279,8 +5635,8 @@ def aceitar_invite(invite_id, contato_id):
         return cursor.rowcount > 0
 
 
-def criar_invite(id_cliente, invited_by, email, role='member'):
-    """Cria um novo convite"""
+def criar_invite(id_cliente, invited_by, email, role='member', conn=None):
+    """Cria um novo convite (com `conn`, fica na transação do chamador, que faz o commit)"""
     import secrets
     from datetime import datetime, timedelta
     import logging
@@ -5288,7 +5644,8 @@ def criar_invite(id_cliente, invited_by, email, role='member'):
     logger = logging.getLogger(__name__)
     logger.info(f"criar_invite: id_cliente={id_cliente}, invited_by={invited_by}, email={email}, role={role}")
     
-    conn = get_db()
+    proprio_commit = conn is None
+    conn = conn or get_db()
     
     try:
         # Gerar token único (64 caracteres hex)
@@ -5316,7 +5673,8 @@ def criar_invite(id_cliente, invited_by, email, role='member'):
             invite_id = cursor.fetchone()['id']
             logger.info(f"criar_invite: invite_id={invite_id}")
         
-        conn.commit()
+        if proprio_commit:
+            conn.commit()
         return invite_id
         
     except Exception as e:
@@ -5325,11 +5683,12 @@ def criar_invite(id_cliente, invited_by, email, role='member'):
         raise e
 
 
-def reenviar_invite(invite_id):
-    """Atualiza a data de expiração de um convite pendente"""
+def reenviar_invite(invite_id, conn=None):
+    """Atualiza a data de expiração de um convite pendente (com `conn`, o chamador faz o commit)"""
     from datetime import datetime, timedelta
     
-    conn = get_db()
+    proprio_commit = conn is None
+    conn = conn or get_db()
     
     try:
         # Nova data de expiração: 7 dias a partir de agora
@@ -5347,7 +5706,8 @@ def reenviar_invite(invite_id):
             
             result = cursor.fetchone()
         
-        conn.commit()
+        if proprio_commit:
+            conn.commit()
         return result is not None
         
     except Exception as e:
@@ -7615,84 +7975,181 @@ def listar_projetos(filtros=None):
 
 # ==================== ANALYTICS - MÉTRICAS E DASHBOARD ====================
 
+# Agregados de cadu_analytics_* (services/analytics_agregados.py): contadores por hora
+# de evento, por dia de página/sessão/usuário e bitmap diário dos usuários ativos
+# (bit n = user_id n) para DAU/WAU/MAU. As métricas do admin leem só essas tabelas.
+
+def _criar_estrutura_analytics_agregados(cursor):
+    """Tabelas de agregados do analytics, função de bitmap e índices de tempo (idempotente)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_eventos_hora (
+            dia DATE NOT NULL,
+            hora SMALLINT NOT NULL,
+            event_type VARCHAR(100),
+            event_category VARCHAR(100),
+            total INTEGER NOT NULL,
+            valor_total NUMERIC(18,2) NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_paginas_dia (
+            dia DATE NOT NULL,
+            page_path TEXT,
+            page_type VARCHAR(100) NOT NULL,
+            views INTEGER NOT NULL,
+            tempo_total NUMERIC(18,2) NOT NULL DEFAULT 0,
+            tempo_amostras INTEGER NOT NULL DEFAULT 0,
+            usuarios INTEGER[] NOT NULL DEFAULT '{}'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_sessoes_dia (
+            dia DATE PRIMARY KEY,
+            total_sessions INTEGER NOT NULL DEFAULT 0,
+            unique_users INTEGER NOT NULL DEFAULT 0,
+            avg_duration NUMERIC(12,2) NOT NULL DEFAULT 0,
+            total_pageviews INTEGER NOT NULL DEFAULT 0,
+            mobile_sessions INTEGER NOT NULL DEFAULT 0,
+            desktop_sessions INTEGER NOT NULL DEFAULT 0,
+            usuarios_bitmap BYTEA NOT NULL DEFAULT ''::bytea
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_usuarios_dia (
+            dia DATE NOT NULL,
+            user_id INTEGER,
+            sessoes INTEGER NOT NULL,
+            duracao_total BIGINT NOT NULL DEFAULT 0,
+            duracao_amostras INTEGER NOT NULL DEFAULT 0,
+            paginas BIGINT NOT NULL DEFAULT 0,
+            ultima_sessao TIMESTAMP
+        )
+    ''')
+    for tabela in ('analytics_eventos_hora', 'analytics_paginas_dia', 'analytics_usuarios_dia'):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabela}_dia ON {tabela} (dia)')
+
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION analytics_bitmap(ids INTEGER[]) RETURNS BYTEA
+        LANGUAGE plpgsql IMMUTABLE AS $$
+        DECLARE
+            mapa BYTEA;
+            id INTEGER;
+        BEGIN
+            SELECT decode(repeat('00', COALESCE(MAX(u), 0) / 8 + 1), 'hex') INTO mapa
+            FROM unnest(ids) AS u WHERE u >= 0;
+            IF ids IS NOT NULL THEN
+                FOREACH id IN ARRAY ids LOOP
+                    IF id IS NOT NULL AND id >= 0 THEN
+                        mapa := set_bit(mapa, id, 1);
+                    END IF;
+                END LOOP;
+            END IF;
+            RETURN mapa;
+        END;
+        $$
+    ''')
+
+    for tabela, coluna in (('cadu_analytics_events', 'created_at'),
+                           ('cadu_analytics_pageviews', 'viewed_at'),
+                           ('cadu_analytics_sessions', 'started_at')):
+        cursor.execute(f'''
+            DO $$
+            BEGIN
+                IF to_regclass('{tabela}') IS NOT NULL THEN
+                    CREATE INDEX IF NOT EXISTS idx_{tabela}_{coluna} ON {tabela} ({coluna});
+                END IF;
+            END
+            $$
+        ''')
+
+
+def _contar_bitmaps(bitmaps):
+    """Usuários distintos na união (OR) dos bitmaps diários."""
+    uniao = 0
+    for mapa in bitmaps:
+        if mapa:
+            uniao |= int.from_bytes(bytes(mapa), 'little')
+    return bin(uniao).count('1')
+
+
+def _usuarios_ativos(cursor):
+    """DAU (hoje e ontem), WAU e MAU pela união dos bitmaps diários de analytics_sessoes_dia."""
+    cursor.execute('''
+        SELECT
+            usuarios_bitmap,
+            dia = CURRENT_DATE AS hoje,
+            dia = CURRENT_DATE - 1 AS ontem,
+            dia > CURRENT_DATE - 7 AS semana
+        FROM analytics_sessoes_dia
+        WHERE dia > CURRENT_DATE - 30
+          AND dia <= CURRENT_DATE
+    ''')
+    linhas = cursor.fetchall()
+    return {
+        'dau_today': _contar_bitmaps(r['usuarios_bitmap'] for r in linhas if r['hoje']),
+        'dau_yesterday': _contar_bitmaps(r['usuarios_bitmap'] for r in linhas if r['ontem']),
+        'wau': _contar_bitmaps(r['usuarios_bitmap'] for r in linhas if r['semana']),
+        'mau': _contar_bitmaps(r['usuarios_bitmap'] for r in linhas)
+    }
+
+
 def get_dashboard_active_users_metrics():
-    """Retorna DAU, WAU e MAU a partir da view v_analytics_dau_mau."""
+    """Retorna DAU, WAU e MAU a partir dos bitmaps diários de usuários ativos."""
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            cursor.execute('SELECT dau_today, wau, mau FROM v_analytics_dau_mau')
-            row = cursor.fetchone()
-            if row:
-                return {
-                    'dau': row.get('dau_today', 0) or 0,
-                    'wau': row.get('wau', 0) or 0,
-                    'mau': row.get('mau', 0) or 0
-                }
-            return {'dau': 0, 'wau': 0, 'mau': 0}
+            ativos = _usuarios_ativos(cursor)
+            return {
+                'dau': ativos['dau_today'],
+                'wau': ativos['wau'],
+                'mau': ativos['mau']
+            }
     except Exception as e:
-        conn.rollback()
-        raise e
+        current_app.logger.error(f"Erro dashboard active users: {e}")
+        raise
 
 
 def get_analytics_overview():
     """
     Obtém métricas principais do dashboard: DAU, MAU, Sessões, etc.
-    Usa a view v_analytics_dau_mau
+    Lê os agregados de analytics (analytics_sessoes_dia, analytics_eventos_hora, analytics_paginas_dia)
     """
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            # DAU/MAU da view
-            cursor.execute('''
-                SELECT 
-                    dau_today,
-                    dau_yesterday,
-                    wau,
-                    mau,
-                    sessions_today,
-                    avg_session_duration_today,
-                    avg_pages_per_session_today
-                FROM v_analytics_dau_mau
-            ''')
-            dau_mau = cursor.fetchone()
-            
-            # Métricas de hoje - Briefings
+            dau_mau = _usuarios_ativos(cursor)
+
             cursor.execute('''
-                SELECT 
-                    COUNT(*) FILTER (WHERE event_type = 'briefing_created' AND DATE(created_at) = CURRENT_DATE) AS criados_hoje,
-                    COUNT(*) FILTER (WHERE event_type = 'briefing_submitted' AND DATE(created_at) = CURRENT_DATE) AS enviados_hoje,
-                    COUNT(*) FILTER (WHERE event_type = 'briefing_viewed' AND DATE(created_at) = CURRENT_DATE) AS visualizados_hoje
-                FROM cadu_analytics_events
-                WHERE event_category = 'briefing'
+                SELECT
+                    total_sessions AS sessions_today,
+                    avg_duration AS avg_session_duration_today,
+                    ROUND(total_pageviews::DECIMAL / NULLIF(total_sessions, 0), 1) AS avg_pages_per_session_today
+                FROM analytics_sessoes_dia
+                WHERE dia = CURRENT_DATE
             ''')
-            briefings = cursor.fetchone()
-            
-            # Métricas de hoje - Cotações
+            dau_mau.update(cursor.fetchone() or {})
+
+            # Contadores de hoje (briefings, cotações, audiências) a partir dos agregados por hora
             cursor.execute('''
-                SELECT 
-                    COUNT(*) FILTER (WHERE event_type = 'cotacao_created' AND DATE(created_at) = CURRENT_DATE) AS criadas_hoje,
-                    COALESCE(SUM((metadata->>'valor_total')::DECIMAL) FILTER (WHERE DATE(created_at) = CURRENT_DATE), 0) AS valor_total_hoje
-                FROM cadu_analytics_events
-                WHERE event_category = 'cotacao'
+                SELECT
+                    COALESCE(SUM(total) FILTER (WHERE event_category = 'briefing' AND event_type = 'briefing_created'), 0) AS criados_hoje,
+                    COALESCE(SUM(total) FILTER (WHERE event_category = 'briefing' AND event_type = 'briefing_submitted'), 0) AS enviados_hoje,
+                    COALESCE(SUM(total) FILTER (WHERE event_category = 'briefing' AND event_type = 'briefing_viewed'), 0) AS visualizados_hoje,
+                    COALESCE(SUM(total) FILTER (WHERE event_category = 'cotacao' AND event_type = 'cotacao_created'), 0) AS criadas_hoje,
+                    COALESCE(SUM(valor_total) FILTER (WHERE event_category = 'cotacao'), 0) AS valor_total_hoje,
+                    COALESCE(SUM(total) FILTER (WHERE event_type = 'audiencia_viewed'), 0) AS audiencias_hoje
+                FROM analytics_eventos_hora
+                WHERE dia = CURRENT_DATE
             ''')
-            cotacoes = cursor.fetchone()
-            
-            # Pageviews hoje
+            eventos = cursor.fetchone()
+
             cursor.execute('''
-                SELECT COUNT(*) as pageviews_hoje
-                FROM cadu_analytics_pageviews
-                WHERE DATE(viewed_at) = CURRENT_DATE
+                SELECT COALESCE(SUM(views), 0) AS pageviews_hoje
+                FROM analytics_paginas_dia
+                WHERE dia = CURRENT_DATE
             ''')
             pageviews = cursor.fetchone()
-            
-            # Audiências visualizadas hoje
-            cursor.execute('''
-                SELECT COUNT(*) as audiencias_hoje
-                FROM cadu_analytics_events
-                WHERE event_type = 'audiencia_viewed' AND DATE(created_at) = CURRENT_DATE
-            ''')
-            audiencias = cursor.fetchone()
-            
+
             def _num(val, default=0):
                 """Converte Decimal/None para float seguro para JSON."""
                 if val is None:
@@ -7717,12 +8174,12 @@ def get_analytics_overview():
                 'sessions_today': int(_num(dau_mau.get('sessions_today')) if dau_mau else 0),
                 'avg_session_duration': _num(dau_mau.get('avg_session_duration_today')) if dau_mau else 0,
                 'avg_pages_per_session': _num(dau_mau.get('avg_pages_per_session_today')) if dau_mau else 0,
-                'briefings_criados_hoje': int(_num(briefings.get('criados_hoje')) if briefings else 0),
-                'briefings_enviados_hoje': int(_num(briefings.get('enviados_hoje')) if briefings else 0),
-                'cotacoes_criadas_hoje': int(_num(cotacoes.get('criadas_hoje')) if cotacoes else 0),
-                'cotacoes_valor_hoje': _num(cotacoes.get('valor_total_hoje')) if cotacoes else 0,
+                'briefings_criados_hoje': int(_num(eventos.get('criados_hoje')) if eventos else 0),
+                'briefings_enviados_hoje': int(_num(eventos.get('enviados_hoje')) if eventos else 0),
+                'cotacoes_criadas_hoje': int(_num(eventos.get('criadas_hoje')) if eventos else 0),
+                'cotacoes_valor_hoje': _num(eventos.get('valor_total_hoje')) if eventos else 0,
                 'pageviews_hoje': int(_num(pageviews.get('pageviews_hoje')) if pageviews else 0),
-                'audiencias_hoje': int(_num(audiencias.get('audiencias_hoje')) if audiencias else 0)
+                'audiencias_hoje': int(_num(eventos.get('audiencias_hoje')) if eventos else 0)
             }
     except Exception as e:
         # Se as tabelas não existem, retornar dados zerados
@@ -7750,20 +8207,21 @@ def get_analytics_sessions_daily(days=30):
     try:
         with conn.cursor() as cursor:
             cursor.execute('''
-                SELECT 
-                    date,
+                SELECT
+                    dia AS date,
                     total_sessions,
                     unique_users,
                     avg_duration,
                     total_pageviews,
                     mobile_sessions,
                     desktop_sessions
-                FROM v_analytics_sessions_daily
-                WHERE date >= CURRENT_DATE - INTERVAL '%s days'
-                ORDER BY date ASC
+                FROM analytics_sessoes_dia
+                WHERE dia >= CURRENT_DATE - %s
+                ORDER BY dia ASC
             ''', (days,))
             return cursor.fetchall()
     except Exception:
+        conn.rollback()
         return []
 
 
@@ -7808,20 +8266,38 @@ def get_analytics_top_pages(limit=20, days=30):
     try:
         with conn.cursor() as cursor:
             cursor.execute('''
-                SELECT 
-                    p.page_path,
-                    COALESCE(p.page_type, '-') AS page_type,
-                    COUNT(*) AS total_views,
-                    COUNT(DISTINCT p.user_id) AS unique_users,
-                    COALESCE(AVG(p.time_on_page_seconds), 0) AS avg_time_on_page
-                FROM cadu_analytics_pageviews p
-                WHERE p.viewed_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                GROUP BY p.page_path, COALESCE(p.page_type, '-')
-                ORDER BY total_views DESC
-                LIMIT %s
+                WITH base AS (
+                    SELECT page_path, page_type, views, tempo_total, tempo_amostras, usuarios
+                    FROM analytics_paginas_dia
+                    WHERE dia >= CURRENT_DATE - %s
+                ),
+                top AS (
+                    SELECT
+                        page_path,
+                        page_type,
+                        SUM(views)::int AS total_views,
+                        SUM(tempo_total) AS tempo_total,
+                        SUM(tempo_amostras) AS tempo_amostras
+                    FROM base
+                    GROUP BY page_path, page_type
+                    ORDER BY total_views DESC
+                    LIMIT %s
+                )
+                SELECT
+                    t.page_path,
+                    t.page_type,
+                    t.total_views,
+                    (SELECT COUNT(DISTINCT u)
+                     FROM base b, unnest(b.usuarios) AS u
+                     WHERE b.page_path IS NOT DISTINCT FROM t.page_path
+                       AND b.page_type = t.page_type) AS unique_users,
+                    COALESCE(t.tempo_total / NULLIF(t.tempo_amostras, 0), 0) AS avg_time_on_page
+                FROM top t
+                ORDER BY t.total_views DESC
             ''', (days, limit,))
             return cursor.fetchall()
     except Exception:
+        conn.rollback()
         return []
 
 
@@ -7852,16 +8328,16 @@ def get_analytics_user_engagement(limit=50, segment='all', days=30):
                 f'''
                 WITH user_sessions AS (
                     SELECT
-                        s.user_id,
-                        COUNT(*) AS total_sessions,
-                        COALESCE(SUM(s.duration_seconds), 0) AS total_time_seconds,
-                        COALESCE(AVG(s.duration_seconds), 0) AS avg_session_duration,
-                        COALESCE(SUM(s.pages_viewed), 0) AS total_pageviews,
-                        COUNT(DISTINCT DATE(s.started_at)) AS active_days,
-                        MAX(s.started_at) AS last_session
-                    FROM cadu_analytics_sessions s
-                    WHERE s.started_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                    GROUP BY s.user_id
+                        u.user_id,
+                        SUM(u.sessoes)::int AS total_sessions,
+                        SUM(u.duracao_total) AS total_time_seconds,
+                        COALESCE(SUM(u.duracao_total)::DECIMAL / NULLIF(SUM(u.duracao_amostras), 0), 0) AS avg_session_duration,
+                        SUM(u.paginas) AS total_pageviews,
+                        COUNT(*) AS active_days,
+                        MAX(u.ultima_sessao) AS last_session
+                    FROM analytics_usuarios_dia u
+                    WHERE u.dia >= CURRENT_DATE - %s
+                    GROUP BY u.user_id
                 )
                 SELECT
                     us.user_id,
@@ -7993,26 +8469,26 @@ def get_analytics_audiencias_funnel(days=30):
     try:
         with conn.cursor() as cursor:
             cursor.execute('''
-                SELECT 
-                    COUNT(*) FILTER (WHERE event_type = 'audiencia_viewed') AS visualizadas,
-                    COUNT(*) FILTER (WHERE event_type = 'audiencia_added_to_cart') AS adicionadas_carrinho,
-                    COUNT(*) FILTER (WHERE event_type = 'audiencia_quoted') AS cotadas,
-                    ROUND(
-                        COUNT(*) FILTER (WHERE event_type = 'audiencia_added_to_cart')::DECIMAL / 
-                        NULLIF(COUNT(*) FILTER (WHERE event_type = 'audiencia_viewed'), 0) * 100, 
-                        1
-                    ) AS taxa_carrinho,
-                    ROUND(
-                        COUNT(*) FILTER (WHERE event_type = 'audiencia_quoted')::DECIMAL / 
-                        NULLIF(COUNT(*) FILTER (WHERE event_type = 'audiencia_viewed'), 0) * 100, 
-                        1
-                    ) AS taxa_cotacao
-                FROM cadu_analytics_events
-                WHERE event_category = 'audiencia'
-                  AND created_at >= CURRENT_DATE - INTERVAL '%s days'
+                WITH f AS (
+                    SELECT
+                        COALESCE(SUM(total) FILTER (WHERE event_type = 'audiencia_viewed'), 0)::int AS visualizadas,
+                        COALESCE(SUM(total) FILTER (WHERE event_type = 'audiencia_added_to_cart'), 0)::int AS adicionadas_carrinho,
+                        COALESCE(SUM(total) FILTER (WHERE event_type = 'audiencia_quoted'), 0)::int AS cotadas
+                    FROM analytics_eventos_hora
+                    WHERE event_category = 'audiencia'
+                      AND dia >= CURRENT_DATE - %s
+                )
+                SELECT
+                    visualizadas,
+                    adicionadas_carrinho,
+                    cotadas,
+                    ROUND(adicionadas_carrinho::DECIMAL / NULLIF(visualizadas, 0) * 100, 1) AS taxa_carrinho,
+                    ROUND(cotadas::DECIMAL / NULLIF(visualizadas, 0) * 100, 1) AS taxa_cotacao
+                FROM f
             ''', (days,))
             return cursor.fetchone()
     except Exception:
+        conn.rollback()
         return {
             'visualizadas': 0,
             'adicionadas_carrinho': 0,
@@ -8024,9 +8500,114 @@ def get_analytics_audiencias_funnel(days=30):
 
 # ==================== CLIENTES - LISTAGEM OTIMIZADA ====================
 
+# Tabela de origem -> coluna com o id do cliente. INSERT/UPDATE/DELETE nessas tabelas
+# marcam os clientes afetados em cliente_metricas_pendencias (triggers por statement);
+# o job 'clientes.atualizar_metricas' recalcula só esses clientes em cliente_metricas
+# (services/cliente_metricas.py).
+CLIENTE_METRICAS_TABELAS = {
+    'cadu_cotacoes': 'client_id',
+    'cadu_briefings': 'id_cliente',
+    'tbl_contato_cliente': 'pk_id_tbl_cliente',
+    'sales_atividades': 'cliente_id',
+    'tbl_cliente_agencia': 'id_cliente',
+}
+
+
+def _criar_estrutura_cliente_metricas(cursor):
+    """Métricas mantidas por cliente, pendências e triggers de marcação (idempotente)."""
+    # mes: mês a que os contadores *_mes se referem (linha de mês anterior lê como zero)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cliente_metricas (
+            id_cliente INTEGER PRIMARY KEY,
+            mes DATE NOT NULL,
+            cotacoes_mes INTEGER NOT NULL DEFAULT 0,
+            cotacoes_aprovadas_mes INTEGER NOT NULL DEFAULT 0,
+            valor_aprovado_mes NUMERIC(18,2) NOT NULL DEFAULT 0,
+            briefings_mes INTEGER NOT NULL DEFAULT 0,
+            briefings_aceitos_mes INTEGER NOT NULL DEFAULT 0,
+            total_contatos INTEGER NOT NULL DEFAULT 0,
+            contatos_ativos INTEGER NOT NULL DEFAULT 0,
+            atividades_pendentes INTEGER NOT NULL DEFAULT 0,
+            agencia_principal_id INTEGER,
+            atualizado_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cliente_metricas_pendencias (
+            id_cliente INTEGER PRIMARY KEY,
+            marcado_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT clock_timestamp()
+        )
+    ''')
+
+    # Mesmo esquema de dashboard_rollup_marcar_dias: o DO UPDATE trava a pendência até o
+    # commit de quem escreveu. TG_ARGV[0] é a coluna do id do cliente na tabela de origem.
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION cliente_metricas_marcar() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                EXECUTE format(
+                    'INSERT INTO cliente_metricas_pendencias (id_cliente)
+                     SELECT DISTINCT %1$I::integer FROM novos WHERE %1$I IS NOT NULL
+                     ON CONFLICT (id_cliente) DO UPDATE SET marcado_em = EXCLUDED.marcado_em',
+                    TG_ARGV[0]);
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                EXECUTE format(
+                    'INSERT INTO cliente_metricas_pendencias (id_cliente)
+                     SELECT DISTINCT %1$I::integer FROM antigos WHERE %1$I IS NOT NULL
+                     ON CONFLICT (id_cliente) DO UPDATE SET marcado_em = EXCLUDED.marcado_em',
+                    TG_ARGV[0]);
+            END IF;
+            RETURN NULL;
+        END;
+        $$
+    ''')
+
+    for tabela, coluna in CLIENTE_METRICAS_TABELAS.items():
+        prefixo = f'trg_{tabela}_cli_metricas'
+        # Recálculo por cliente busca pelo id em cada origem (tbl_cliente_agencia já tem o UNIQUE)
+        indice = '' if tabela == 'tbl_cliente_agencia' else \
+            f'CREATE INDEX IF NOT EXISTS idx_{tabela}_{coluna} ON {tabela} ({coluna});'
+        cursor.execute(f'''
+            DO $$
+            BEGIN
+                IF to_regclass('{tabela}') IS NULL THEN
+                    RETURN;
+                END IF;
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = '{tabela}'::regclass AND tgname = '{prefixo}_ins') THEN
+                    CREATE TRIGGER {prefixo}_ins AFTER INSERT ON {tabela}
+                        REFERENCING NEW TABLE AS novos
+                        FOR EACH STATEMENT EXECUTE FUNCTION cliente_metricas_marcar('{coluna}');
+                END IF;
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = '{tabela}'::regclass AND tgname = '{prefixo}_upd') THEN
+                    CREATE TRIGGER {prefixo}_upd AFTER UPDATE ON {tabela}
+                        REFERENCING OLD TABLE AS antigos NEW TABLE AS novos
+                        FOR EACH STATEMENT EXECUTE FUNCTION cliente_metricas_marcar('{coluna}');
+                END IF;
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = '{tabela}'::regclass AND tgname = '{prefixo}_del') THEN
+                    CREATE TRIGGER {prefixo}_del AFTER DELETE ON {tabela}
+                        REFERENCING OLD TABLE AS antigos
+                        FOR EACH STATEMENT EXECUTE FUNCTION cliente_metricas_marcar('{coluna}');
+                END IF;
+                {indice}
+            END
+            $$
+        ''')
+
+
+def _metrica_mes(coluna, alias='m'):
+    """Contador mensal de cliente_metricas; linha ainda do mês anterior (ou ausente) vale zero."""
+    return f"(CASE WHEN {alias}.mes = DATE_TRUNC('month', CURRENT_DATE)::date THEN {alias}.{coluna} ELSE 0 END)"
+
+
 def obter_clientes_paginado(page=1, per_page=25, filtros=None):
     """
     Retorna clientes com paginação server-side e métricas mensais agregadas.
+
+    A página é escolhida antes de qualquer junção; as métricas vêm de cliente_metricas
+    (mantida por services/cliente_metricas.py), não de agregações sobre cotações,
+    briefings e contatos.
     
     Args:
         page (int): Número da página (1-indexed)
@@ -8051,72 +8632,6 @@ def obter_clientes_paginado(page=1, per_page=25, filtros=None):
     offset = (page - 1) * per_page
     
     try:
-        # Query base com métricas agregadas do mês atual
-        base_query = '''
-            WITH metricas_mes AS (
-                SELECT 
-                    cli.id_cliente,
-                    -- Cotações do mês
-                    COUNT(DISTINCT cot.id) FILTER (
-                        WHERE cot.created_at >= DATE_TRUNC('month', CURRENT_DATE)
-                    ) AS cotacoes_mes,
-                    -- Cotações aprovadas do mês
-                    COUNT(DISTINCT cot.id) FILTER (
-                        WHERE cot.created_at >= DATE_TRUNC('month', CURRENT_DATE)
-                        AND cot.status = 'Aprovada'
-                    ) AS cotacoes_aprovadas_mes,
-                    -- Valor total aprovado no mês
-                    COALESCE(SUM(cot.valor_total_proposta) FILTER (
-                        WHERE cot.created_at >= DATE_TRUNC('month', CURRENT_DATE)
-                        AND cot.status = 'Aprovada'
-                    ), 0) AS valor_aprovado_mes,
-                    -- Briefings do mês
-                    COUNT(DISTINCT b.id) FILTER (
-                        WHERE b.created_at >= DATE_TRUNC('month', CURRENT_DATE)
-                    ) AS briefings_mes,
-                    -- Briefings aceitos do mês (status = 'accepted' ou similar)
-                    COUNT(DISTINCT b.id) FILTER (
-                        WHERE b.created_at >= DATE_TRUNC('month', CURRENT_DATE)
-                        AND b.status IN ('accepted', 'aprovado', 'aceito')
-                    ) AS briefings_aceitos_mes
-                FROM tbl_cliente cli
-                LEFT JOIN cadu_cotacoes cot ON cot.client_id = cli.id_cliente
-                LEFT JOIN cadu_briefings b ON b.cliente = cli.nome_fantasia
-                GROUP BY cli.id_cliente
-            )
-            SELECT 
-                cli.id_cliente,
-                cli.nome_fantasia,
-                cli.razao_social,
-                cli.cnpj,
-                cli.status,
-                cli.categoria_abc,
-                COALESCE(cli.classificacao_cliente, 'Prospecção') AS classificacao_cliente,
-                COALESCE(cli.opera_midia, FALSE) AS opera_midia,
-                COALESCE(cli.demanda_dados, FALSE) AS demanda_dados,
-                COALESCE(cli.demanda_programatica_canais, FALSE) AS demanda_programatica_canais,
-                cli.observacoes_comerciais_adicionais,
-                cli.vendas_central_comm,
-                cli.pk_id_tbl_agencia,
-                cli.id_tipo_cliente,
-                tc.display AS tipo_cliente_display,
-                ag.key AS agencia_key,
-                vend.nome_completo AS executivo_nome,
-                COUNT(DISTINCT cont.id_contato_cliente) AS total_usuarios,
-                COALESCE(m.cotacoes_mes, 0) AS cotacoes_mes,
-                COALESCE(m.cotacoes_aprovadas_mes, 0) AS cotacoes_aprovadas_mes,
-                COALESCE(m.valor_aprovado_mes, 0) AS valor_aprovado_mes,
-                COALESCE(m.briefings_mes, 0) AS briefings_mes,
-                COALESCE(m.briefings_aceitos_mes, 0) AS briefings_aceitos_mes
-            FROM tbl_cliente cli
-            LEFT JOIN tbl_contato_cliente vend ON vend.id_contato_cliente = cli.vendas_central_comm
-            LEFT JOIN tbl_contato_cliente cont ON cont.pk_id_tbl_cliente = cli.id_cliente
-            LEFT JOIN metricas_mes m ON m.id_cliente = cli.id_cliente
-            LEFT JOIN tbl_agencia ag ON ag.id_agencia = cli.pk_id_tbl_agencia
-            LEFT JOIN tbl_tipo_cliente tc ON tc.id_tipo_cliente = cli.id_tipo_cliente
-            WHERE 1=1
-        '''
-        
         params = []
         count_params = []
         
@@ -8158,23 +8673,53 @@ def obter_clientes_paginado(page=1, per_page=25, filtros=None):
         if where_clauses:
             where_sql = ' AND ' + ' AND '.join(where_clauses)
         
-        # Query principal com paginação
-        query = base_query + where_sql + '''
-            GROUP BY cli.id_cliente, cli.nome_fantasia, cli.razao_social, cli.cnpj, 
-                     cli.status, cli.categoria_abc, cli.classificacao_cliente, cli.opera_midia,
-                     cli.demanda_dados, cli.demanda_programatica_canais,
-                     cli.observacoes_comerciais_adicionais, cli.vendas_central_comm, cli.pk_id_tbl_agencia,
-                     cli.id_tipo_cliente, tc.display,
-                     ag.key, vend.nome_completo, m.cotacoes_mes, m.cotacoes_aprovadas_mes,
-                     m.valor_aprovado_mes, m.briefings_mes, m.briefings_aceitos_mes
-            ORDER BY cli.nome_fantasia ASC
-            LIMIT %s OFFSET %s
-        '''
-        params.extend([per_page, offset])
-        
-        # Query de contagem
-        count_query = f'''
-            SELECT COUNT(*) FROM tbl_cliente cli 
+        # Página primeiro (só tbl_cliente + filtro de agência), depois as junções
+        query = f'''
+            WITH pagina AS (
+                SELECT cli.id_cliente
+                FROM tbl_cliente cli
+                LEFT JOIN tbl_agencia ag ON ag.id_agencia = cli.pk_id_tbl_agencia
+                WHERE 1=1 {where_sql}
+                ORDER BY cli.nome_fantasia ASC, cli.id_cliente
+                LIMIT %s OFFSET %s
+            )
+            SELECT 
+                cli.id_cliente,
+                cli.nome_fantasia,
+                cli.razao_social,
+                cli.cnpj,
+                cli.status,
+                cli.categoria_abc,
+                COALESCE(cli.classificacao_cliente, 'Prospecção') AS classificacao_cliente,
+                COALESCE(cli.opera_midia, FALSE) AS opera_midia,
+                COALESCE(cli.demanda_dados, FALSE) AS demanda_dados,
+                COALESCE(cli.demanda_programatica_canais, FALSE) AS demanda_programatica_canais,
+                cli.observacoes_comerciais_adicionais,
+                cli.vendas_central_comm,
+                cli.pk_id_tbl_agencia,
+                cli.id_tipo_cliente,
+                tc.display AS tipo_cliente_display,
+                ag.key AS agencia_key,
+                vend.nome_completo AS executivo_nome,
+                COALESCE(m.total_contatos, 0) AS total_usuarios,
+                {_metrica_mes('cotacoes_mes')} AS cotacoes_mes,
+                {_metrica_mes('cotacoes_aprovadas_mes')} AS cotacoes_aprovadas_mes,
+                {_metrica_mes('valor_aprovado_mes')} AS valor_aprovado_mes,
+                {_metrica_mes('briefings_mes')} AS briefings_mes,
+                {_metrica_mes('briefings_aceitos_mes')} AS briefings_aceitos_mes
+            FROM pagina p
+            JOIN tbl_cliente cli ON cli.id_cliente = p.id_cliente
+            LEFT JOIN tbl_contato_cliente vend ON vend.id_contato_cliente = cli.vendas_central_comm
+            LEFT JOIN cliente_metricas m ON m.id_cliente = cli.id_cliente
+            LEFT JOIN tbl_agencia ag ON ag.id_agencia = cli.pk_id_tbl_agencia
+            LEFT JOIN tbl_tipo_cliente tc ON tc.id_tipo_cliente = cli.id_tipo_cliente
+            ORDER BY cli.nome_fantasia ASC, cli.id_cliente
+        '''
+        params.extend([per_page, offset])
+        
+        # Query de contagem
+        count_query = f'''
+            SELECT COUNT(*) FROM tbl_cliente cli 
             LEFT JOIN tbl_agencia ag ON ag.id_agencia = cli.pk_id_tbl_agencia
             WHERE 1=1 {where_sql}
         '''
@@ -8209,44 +8754,58 @@ def recategorizar_clientes_abc():
     - A: aprovações >= R$200.000/mês
     - B: ativo (tem briefings/cotações), < R$200k
     - C: sem briefings/cotações no mês
+
+    As métricas do mês vêm dos rollups diários por cliente (dashboard_rollup_cotacao_dia
+    e dashboard_rollup_briefing_dia, mantidos pelas triggers de cadu_cotacoes e
+    cadu_briefings); só os clientes cuja categoria muda são atualizados. Quem chama
+    garante os rollups em dia (services/clientes_abc.py).
     
     Returns:
-        dict: Resumo da recategorização {a: count, b: count, c: count}
+        dict: Resumo da recategorização {A: count, B: count, C: count, alterados: count}
     """
     conn = get_db()
     LIMITE_A = 200000  # R$ 200.000,00
     
     try:
         with conn.cursor() as cursor:
-            # 1. Calcular métricas do mês para cada cliente
+            # 1. Métricas do mês por cliente, a partir dos rollups
             cursor.execute('''
-                WITH metricas AS (
-                    SELECT 
+                WITH cotacoes AS (
+                    SELECT
+                        client_id,
+                        SUM(total) AS cotacoes_mes,
+                        COALESCE(SUM(valor_total) FILTER (WHERE status = 'Aprovada'), 0) AS valor_aprovado_mes
+                    FROM dashboard_rollup_cotacao_dia
+                    WHERE dia >= DATE_TRUNC('month', CURRENT_DATE)
+                      AND client_id IS NOT NULL
+                    GROUP BY client_id
+                ),
+                briefings AS (
+                    SELECT id_cliente, SUM(total) AS briefings_mes
+                    FROM dashboard_rollup_briefing_dia
+                    WHERE dia >= DATE_TRUNC('month', CURRENT_DATE)
+                      AND id_cliente IS NOT NULL
+                    GROUP BY id_cliente
+                ),
+                novas AS (
+                    SELECT
                         cli.id_cliente,
-                        COALESCE(SUM(cot.valor_total_proposta) FILTER (
-                            WHERE cot.created_at >= DATE_TRUNC('month', CURRENT_DATE)
-                            AND cot.status = '3'
-                        ), 0) AS valor_aprovado_mes,
-                        COUNT(DISTINCT cot.id) FILTER (
-                            WHERE cot.created_at >= DATE_TRUNC('month', CURRENT_DATE)
-                        ) AS cotacoes_mes,
-                        COUNT(DISTINCT b.id) FILTER (
-                            WHERE b.created_at >= DATE_TRUNC('month', CURRENT_DATE)
-                        ) AS briefings_mes
+                        CASE
+                            WHEN COALESCE(cot.valor_aprovado_mes, 0) >= %s THEN 'A'
+                            WHEN COALESCE(cot.cotacoes_mes, 0) > 0 OR COALESCE(b.briefings_mes, 0) > 0 THEN 'B'
+                            ELSE 'C'
+                        END AS categoria
                     FROM tbl_cliente cli
-                    LEFT JOIN cadu_cotacoes cot ON cot.client_id = cli.id_cliente
-                    LEFT JOIN cadu_briefings b ON b.cliente = cli.nome_fantasia
-                    GROUP BY cli.id_cliente
+                    LEFT JOIN cotacoes cot ON cot.client_id = cli.id_cliente
+                    LEFT JOIN briefings b ON b.id_cliente = cli.id_cliente
                 )
                 UPDATE tbl_cliente cli
-                SET categoria_abc = CASE
-                    WHEN m.valor_aprovado_mes >= %s THEN 'A'
-                    WHEN m.cotacoes_mes > 0 OR m.briefings_mes > 0 THEN 'B'
-                    ELSE 'C'
-                END
-                FROM metricas m
-                WHERE cli.id_cliente = m.id_cliente
+                SET categoria_abc = n.categoria
+                FROM novas n
+                WHERE cli.id_cliente = n.id_cliente
+                  AND cli.categoria_abc IS DISTINCT FROM n.categoria
             ''', (LIMITE_A,))
+            alterados = cursor.rowcount
             
             conn.commit()
             
@@ -8264,7 +8823,8 @@ def recategorizar_clientes_abc():
             resumo = {'A': 0, 'B': 0, 'C': 0}
             for r in resultados:
                 cat = r.get('categoria_abc') or 'C'
-                resumo[cat] = r.get('total', 0)
+                resumo[cat] = resumo.get(cat, 0) + r.get('total', 0)
+            resumo['alterados'] = alterados
             
             return resumo
             
@@ -8551,6 +9111,58 @@ def obter_clientes_para_filtro():
 
 # ==================== MÉTRICAS SEMANAIS ====================
 
+# Fatos de cadu_cotacoes por dia de criação, semana (segunda-feira), executivo, cliente
+# e status (services/metricas_semanais.py). As somas em dias (envio, negociação, ciclo)
+# são divididas pelas contagens correspondentes na leitura, então qualquer janela
+# (semana, mês, ano, all-time) sai das mesmas linhas. Os dias são recalculados pelo
+# mecanismo de services/dashboard_rollups.py (fonte 'semanal', triggers em cadu_cotacoes):
+# semanas fechadas não são reprocessadas, a menos que uma cotação delas mude.
+ROLLUP_METRICAS_SEMANAIS_TABELAS = {
+    'semanal': 'cadu_cotacoes',
+}
+
+
+def _criar_estrutura_metricas_semanais(cursor):
+    """Tabela de fatos semanais e triggers de marcação (idempotente)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metricas_semanais_fatos (
+            dia DATE NOT NULL,
+            semana DATE NOT NULL,
+            responsavel_comercial INTEGER,
+            client_id INTEGER,
+            status VARCHAR(100),
+            cotacoes INTEGER NOT NULL,
+            valor_total NUMERIC(18,2) NOT NULL DEFAULT 0,
+            com_envio INTEGER NOT NULL DEFAULT 0,
+            com_aprovacao INTEGER NOT NULL DEFAULT 0,
+            com_envio_aprovacao INTEGER NOT NULL DEFAULT 0,
+            dias_ate_envio NUMERIC NOT NULL DEFAULT 0,
+            dias_negociacao NUMERIC NOT NULL DEFAULT 0,
+            dias_ciclo NUMERIC NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_metricas_semanais_fatos_dia ON metricas_semanais_fatos (dia)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_metricas_semanais_fatos_exec
+        ON metricas_semanais_fatos (responsavel_comercial, dia)
+    ''')
+    for fonte, tabela in ROLLUP_METRICAS_SEMANAIS_TABELAS.items():
+        _criar_triggers_rollup(cursor, fonte, tabela, f'trg_{tabela}_{fonte}')
+
+
+def _filtros_fatos_semanais(executivo_id=None, cliente_id=None):
+    """Trecho AND ... e parâmetros dos filtros opcionais sobre metricas_semanais_fatos."""
+    filtros_sql = ''
+    params = []
+    if executivo_id:
+        filtros_sql += ' AND f.responsavel_comercial = %s'
+        params.append(int(executivo_id))
+    if cliente_id:
+        filtros_sql += ' AND f.client_id = %s'
+        params.append(int(cliente_id))
+    return filtros_sql, params
+
+
 def obter_kpis_semanais(semana_inicio, semana_fim, executivo_id=None, cliente_id=None):
     """
     Retorna KPIs agregados para uma semana específica.
@@ -8567,45 +9179,36 @@ def obter_kpis_semanais(semana_inicio, semana_fim, executivo_id=None, cliente_id
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            params = [semana_inicio, semana_fim]
-            filtros_sql = ''
-            
-            if executivo_id:
-                filtros_sql += ' AND responsavel_comercial = %s'
-                params.append(int(executivo_id))
-            
-            if cliente_id:
-                filtros_sql += ' AND client_id = %s'
-                params.append(int(cliente_id))
+            filtros_sql, params_filtro = _filtros_fatos_semanais(executivo_id, cliente_id)
             
             cursor.execute(f'''
                 SELECT 
-                    COUNT(*) as cotacoes_criadas,
-                    COALESCE(SUM(valor_total_proposta), 0) as valor_total,
-                    COALESCE(SUM(valor_total_proposta) FILTER (WHERE status = 'Aprovada'), 0) as valor_aprovado,
-                    COUNT(*) FILTER (WHERE status = 'Aprovada') as aprovadas,
-                    COUNT(*) FILTER (WHERE status = 'Rejeitada') as rejeitadas,
-                    COUNT(*) FILTER (WHERE status IN ('Enviada', 'Negociação')) as enviadas,
+                    COALESCE(SUM(f.cotacoes), 0) as cotacoes_criadas,
+                    COALESCE(SUM(f.valor_total), 0) as valor_total,
+                    COALESCE(SUM(f.valor_total) FILTER (WHERE f.status = 'Aprovada'), 0) as valor_aprovado,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada'), 0) as aprovadas,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Rejeitada'), 0) as rejeitadas,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status IN ('Enviada', 'Negociação')), 0) as enviadas,
                     ROUND(
-                        COUNT(*) FILTER (WHERE status = 'Aprovada')::DECIMAL / 
-                        NULLIF(COUNT(*) FILTER (WHERE status IN ('Aprovada', 'Rejeitada')), 0) * 100, 
+                        SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada')::DECIMAL / 
+                        NULLIF(SUM(f.cotacoes) FILTER (WHERE f.status IN ('Aprovada', 'Rejeitada')), 0) * 100, 
                         1
                     ) as taxa_conversao,
                     ROUND(
-                        COALESCE(SUM(valor_total_proposta) FILTER (WHERE status = 'Aprovada'), 0) / 
-                        NULLIF(COUNT(*) FILTER (WHERE status = 'Aprovada'), 0),
+                        COALESCE(SUM(f.valor_total) FILTER (WHERE f.status = 'Aprovada'), 0) / 
+                        NULLIF(SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada'), 0),
                         2
                     ) as ticket_medio,
                     ROUND(
-                        AVG(EXTRACT(EPOCH FROM (aprovada_em - created_at)) / 86400) FILTER (WHERE status = 'Aprovada' AND aprovada_em IS NOT NULL),
+                        SUM(f.dias_ciclo) FILTER (WHERE f.status = 'Aprovada') /
+                        NULLIF(SUM(f.com_aprovacao) FILTER (WHERE f.status = 'Aprovada'), 0),
                         1
                     ) as ciclo_medio_dias
-                FROM cadu_cotacoes
-                WHERE deleted_at IS NULL
-                  AND created_at >= %s
-                  AND created_at < %s + INTERVAL '1 day'
+                FROM metricas_semanais_fatos f
+                WHERE f.dia >= %s
+                  AND f.dia <= %s
                   {filtros_sql}
-            ''', params)
+            ''', [semana_inicio, semana_fim] + params_filtro)
             
             result = cursor.fetchone()
             if result:
@@ -8634,39 +9237,29 @@ def obter_cotacoes_por_executivo_semana(semana_inicio, semana_fim, executivo_id=
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            params = [semana_inicio, semana_fim]
-            filtros_sql = ''
-            
-            if executivo_id:
-                filtros_sql += ' AND c.responsavel_comercial = %s'
-                params.append(int(executivo_id))
-            
-            if cliente_id:
-                filtros_sql += ' AND c.client_id = %s'
-                params.append(int(cliente_id))
+            filtros_sql, params_filtro = _filtros_fatos_semanais(executivo_id, cliente_id)
             
             cursor.execute(f'''
                 SELECT 
-                    c.responsavel_comercial as executivo_id,
+                    f.responsavel_comercial as executivo_id,
                     COALESCE(e.nome_completo, 'Não atribuído') as executivo_nome,
-                    COUNT(*) as total_cotacoes,
-                    COALESCE(SUM(c.valor_total_proposta), 0) as valor_total,
-                    COUNT(*) FILTER (WHERE c.status = 'Aprovada') as aprovadas,
-                    COUNT(*) FILTER (WHERE c.status = 'Rejeitada') as rejeitadas,
+                    SUM(f.cotacoes) as total_cotacoes,
+                    COALESCE(SUM(f.valor_total), 0) as valor_total,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada'), 0) as aprovadas,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Rejeitada'), 0) as rejeitadas,
                     ROUND(
-                        COUNT(*) FILTER (WHERE c.status = 'Aprovada')::DECIMAL / 
-                        NULLIF(COUNT(*), 0) * 100, 
+                        COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada'), 0)::DECIMAL / 
+                        NULLIF(SUM(f.cotacoes), 0) * 100, 
                         1
                     ) as taxa_conversao
-                FROM cadu_cotacoes c
-                LEFT JOIN tbl_contato_cliente e ON e.id_contato_cliente = c.responsavel_comercial
-                WHERE c.deleted_at IS NULL
-                  AND c.created_at >= %s
-                  AND c.created_at < %s + INTERVAL '1 day'
+                FROM metricas_semanais_fatos f
+                LEFT JOIN tbl_contato_cliente e ON e.id_contato_cliente = f.responsavel_comercial
+                WHERE f.dia >= %s
+                  AND f.dia <= %s
                   {filtros_sql}
-                GROUP BY c.responsavel_comercial, e.nome_completo
+                GROUP BY f.responsavel_comercial, e.nome_completo
                 ORDER BY total_cotacoes DESC
-            ''', params)
+            ''', [semana_inicio, semana_fim] + params_filtro)
             
             return cursor.fetchall()
     except Exception as e:
@@ -8684,32 +9277,22 @@ def obter_evolucao_diaria_semana(semana_inicio, semana_fim, executivo_id=None, c
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            params = [semana_inicio, semana_fim]
-            filtros_sql = ''
-            
-            if executivo_id:
-                filtros_sql += ' AND responsavel_comercial = %s'
-                params.append(int(executivo_id))
-            
-            if cliente_id:
-                filtros_sql += ' AND client_id = %s'
-                params.append(int(cliente_id))
+            filtros_sql, params_filtro = _filtros_fatos_semanais(executivo_id, cliente_id)
             
             cursor.execute(f'''
                 SELECT 
-                    DATE(created_at) as data,
-                    COUNT(*) as total_cotacoes,
-                    COALESCE(SUM(valor_total_proposta), 0) as valor_total,
-                    COUNT(*) FILTER (WHERE status = 'Aprovada') as aprovadas,
-                    COUNT(*) FILTER (WHERE status = 'Enviada' OR status = 'Negociação') as em_andamento
-                FROM cadu_cotacoes
-                WHERE deleted_at IS NULL
-                  AND created_at >= %s
-                  AND created_at < %s + INTERVAL '1 day'
+                    f.dia as data,
+                    SUM(f.cotacoes) as total_cotacoes,
+                    COALESCE(SUM(f.valor_total), 0) as valor_total,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada'), 0) as aprovadas,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status IN ('Enviada', 'Negociação')), 0) as em_andamento
+                FROM metricas_semanais_fatos f
+                WHERE f.dia >= %s
+                  AND f.dia <= %s
                   {filtros_sql}
-                GROUP BY DATE(created_at)
-                ORDER BY DATE(created_at)
-            ''', params)
+                GROUP BY f.dia
+                ORDER BY f.dia
+            ''', [semana_inicio, semana_fim] + params_filtro)
             
             return cursor.fetchall()
     except Exception as e:
@@ -8727,30 +9310,20 @@ def obter_distribuicao_status_semana(semana_inicio, semana_fim, executivo_id=Non
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            params = [semana_inicio, semana_fim]
-            filtros_sql = ''
-            
-            if executivo_id:
-                filtros_sql += ' AND responsavel_comercial = %s'
-                params.append(int(executivo_id))
-            
-            if cliente_id:
-                filtros_sql += ' AND client_id = %s'
-                params.append(int(cliente_id))
+            filtros_sql, params_filtro = _filtros_fatos_semanais(executivo_id, cliente_id)
             
             cursor.execute(f'''
                 SELECT 
-                    COALESCE(status, 'Rascunho') as status,
-                    COUNT(*) as total,
-                    COALESCE(SUM(valor_total_proposta), 0) as valor
-                FROM cadu_cotacoes
-                WHERE deleted_at IS NULL
-                  AND created_at >= %s
-                  AND created_at < %s + INTERVAL '1 day'
+                    COALESCE(f.status, 'Rascunho') as status,
+                    SUM(f.cotacoes) as total,
+                    COALESCE(SUM(f.valor_total), 0) as valor
+                FROM metricas_semanais_fatos f
+                WHERE f.dia >= %s
+                  AND f.dia <= %s
                   {filtros_sql}
-                GROUP BY status
+                GROUP BY f.status
                 ORDER BY total DESC
-            ''', params)
+            ''', [semana_inicio, semana_fim] + params_filtro)
             
             return cursor.fetchall()
     except Exception as e:
@@ -8769,51 +9342,26 @@ def obter_comparativo_semanal(semana_inicio, semana_fim, executivo_id=None, clie
     try:
         with conn.cursor() as cursor:
             # Calcula semana anterior
-            from datetime import timedelta
             semana_ant_inicio = semana_inicio - timedelta(days=7)
             semana_ant_fim = semana_fim - timedelta(days=7)
+            filtros_sql, params_filtro = _filtros_fatos_semanais(executivo_id, cliente_id)
             
-            params_atual = [semana_inicio, semana_fim]
-            params_anterior = [semana_ant_inicio, semana_ant_fim]
-            filtros_sql = ''
-            
-            if executivo_id:
-                filtros_sql += ' AND responsavel_comercial = %s'
-                params_atual.append(int(executivo_id))
-                params_anterior.append(int(executivo_id))
-            
-            if cliente_id:
-                filtros_sql += ' AND client_id = %s'
-                params_atual.append(int(cliente_id))
-                params_anterior.append(int(cliente_id))
-            
-            # Semana atual
-            cursor.execute(f'''
-                SELECT 
-                    COUNT(*) as total,
-                    COALESCE(SUM(valor_total_proposta), 0) as valor,
-                    COUNT(*) FILTER (WHERE status = 'Aprovada') as aprovadas
-                FROM cadu_cotacoes
-                WHERE deleted_at IS NULL
-                  AND created_at >= %s
-                  AND created_at < %s + INTERVAL '1 day'
-                  {filtros_sql}
-            ''', params_atual)
-            atual = cursor.fetchone()
-            
-            # Semana anterior
+            # As duas semanas na mesma leitura
             cursor.execute(f'''
-                SELECT 
-                    COUNT(*) as total,
-                    COALESCE(SUM(valor_total_proposta), 0) as valor,
-                    COUNT(*) FILTER (WHERE status = 'Aprovada') as aprovadas
-                FROM cadu_cotacoes
-                WHERE deleted_at IS NULL
-                  AND created_at >= %s
-                  AND created_at < %s + INTERVAL '1 day'
+                SELECT
+                    p.periodo,
+                    COALESCE(SUM(f.cotacoes), 0) as total,
+                    COALESCE(SUM(f.valor_total), 0) as valor,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada'), 0) as aprovadas
+                FROM (VALUES ('atual', %s::date, %s::date), ('anterior', %s::date, %s::date)) AS p(periodo, inicio, fim)
+                LEFT JOIN metricas_semanais_fatos f
+                  ON f.dia >= p.inicio AND f.dia <= p.fim
                   {filtros_sql}
-            ''', params_anterior)
-            anterior = cursor.fetchone()
+                GROUP BY p.periodo
+            ''', [semana_inicio, semana_fim, semana_ant_inicio, semana_ant_fim] + params_filtro)
+            periodos = {r['periodo']: {k: v for k, v in r.items() if k != 'periodo'} for r in cursor.fetchall()}
+            atual = periodos['atual']
+            anterior = periodos['anterior']
             
             # Calcular variações
             def calc_var(atual_val, anterior_val):
@@ -8828,8 +9376,8 @@ def obter_comparativo_semanal(semana_inicio, semana_fim, executivo_id=None, clie
             }
             
             return {
-                'atual': dict(atual),
-                'anterior': dict(anterior),
+                'atual': atual,
+                'anterior': anterior,
                 'variacao': variacao
             }
     except Exception as e:
@@ -8906,48 +9454,32 @@ def obter_kpis_mensais_por_semana(mes_inicio, mes_fim, executivo_id=None, client
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            params = [mes_inicio, mes_fim]
-            filtros_sql = ''
-            
-            if executivo_id:
-                filtros_sql += ' AND responsavel_comercial = %s'
-                params.append(int(executivo_id))
-            
-            if cliente_id:
-                filtros_sql += ' AND client_id = %s'
-                params.append(int(cliente_id))
+            filtros_sql, params_filtro = _filtros_fatos_semanais(executivo_id, cliente_id)
             
             cursor.execute(f'''
                 SELECT 
                     CASE 
-                        WHEN EXTRACT(DAY FROM created_at) <= 7 THEN 'Semana 1'
-                        WHEN EXTRACT(DAY FROM created_at) <= 14 THEN 'Semana 2'
-                        WHEN EXTRACT(DAY FROM created_at) <= 21 THEN 'Semana 3'
+                        WHEN EXTRACT(DAY FROM f.dia) <= 7 THEN 'Semana 1'
+                        WHEN EXTRACT(DAY FROM f.dia) <= 14 THEN 'Semana 2'
+                        WHEN EXTRACT(DAY FROM f.dia) <= 21 THEN 'Semana 3'
                         ELSE 'Semana 4'
                     END as semana,
-                    COUNT(*) as cotacoes_criadas,
-                    COALESCE(SUM(valor_total_proposta), 0) as valor_total,
-                    COUNT(*) FILTER (WHERE status = 'Aprovada') as aprovadas,
-                    COUNT(*) FILTER (WHERE status = 'Rejeitada') as rejeitadas,
+                    SUM(f.cotacoes) as cotacoes_criadas,
+                    COALESCE(SUM(f.valor_total), 0) as valor_total,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada'), 0) as aprovadas,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Rejeitada'), 0) as rejeitadas,
                     ROUND(
-                        COUNT(*) FILTER (WHERE status = 'Aprovada')::DECIMAL / 
-                        NULLIF(COUNT(*) FILTER (WHERE status IN ('Aprovada', 'Rejeitada')), 0) * 100, 
+                        SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada')::DECIMAL / 
+                        NULLIF(SUM(f.cotacoes) FILTER (WHERE f.status IN ('Aprovada', 'Rejeitada')), 0) * 100, 
                         1
                     ) as taxa_conversao
-                FROM cadu_cotacoes
-                WHERE deleted_at IS NULL
-                  AND created_at >= %s
-                  AND created_at < %s + INTERVAL '1 day'
+                FROM metricas_semanais_fatos f
+                WHERE f.dia >= %s
+                  AND f.dia <= %s
                   {filtros_sql}
-                GROUP BY 
-                    CASE 
-                        WHEN EXTRACT(DAY FROM created_at) <= 7 THEN 'Semana 1'
-                        WHEN EXTRACT(DAY FROM created_at) <= 14 THEN 'Semana 2'
-                        WHEN EXTRACT(DAY FROM created_at) <= 21 THEN 'Semana 3'
-                        ELSE 'Semana 4'
-                    END
+                GROUP BY 1
                 ORDER BY semana
-            ''', params)
+            ''', [mes_inicio, mes_fim] + params_filtro)
             
             return cursor.fetchall()
     except Exception as e:
@@ -9245,6 +9777,12 @@ def garantir_colunas_spedy_nota_fiscal():
                     END IF;
                 END $$;
             ''')
+            # Webhook e poller localizam a nota pelo id da NFS-e na Spedy
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_cadu_pi_nota_fiscal_spedy_invoice
+                ON cadu_pi_nota_fiscal (spedy_invoice_id)
+                WHERE spedy_invoice_id IS NOT NULL
+            ''')
             conn.commit()
             return True
     except Exception as e:
@@ -9252,6 +9790,45 @@ def garantir_colunas_spedy_nota_fiscal():
         raise e
 
 
+def listar_notas_fiscais_spedy_pendentes(status_pendentes, recente_minutos=10, limite=200):
+    """Notas com NFS-e enviada à Spedy e status ainda não terminal (mais antigas primeiro).
+
+    `recente` indica alteração nos últimos `recente_minutos` minutos.
+    """
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                SELECT id, id_pi, numero_nota, spedy_invoice_id, spedy_status, updated_at,
+                       COALESCE(updated_at >= CURRENT_TIMESTAMP - make_interval(mins => %s), FALSE) AS recente
+                FROM cadu_pi_nota_fiscal
+                WHERE spedy_invoice_id IS NOT NULL
+                  AND LOWER(COALESCE(spedy_status, '')) = ANY(%s)
+                ORDER BY updated_at NULLS FIRST, id
+                LIMIT %s
+            ''', (int(recente_minutos), [s.lower() for s in status_pendentes], limite))
+            return cursor.fetchall()
+    except Exception as e:
+        conn.rollback()
+        raise e
+
+
+def obter_nota_fiscal_por_spedy_invoice_id(spedy_invoice_id):
+    """Retorna a nota fiscal vinculada a uma NFS-e Spedy (ou None)."""
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                'SELECT id FROM cadu_pi_nota_fiscal WHERE spedy_invoice_id = %s ORDER BY id DESC LIMIT 1',
+                (str(spedy_invoice_id),),
+            )
+            row = cursor.fetchone()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    return obter_nota_fiscal_por_id(row['id']) if row else None
+
+
 def garantir_colunas_importacao_nota_fiscal():
     """Aplica migração idempotente dos campos de importação PDF em cadu_pi_nota_fiscal."""
     conn = get_db()
@@ -9957,12 +10534,84 @@ def obter_meses_ref_pi(id_sub_status_pi=None):
         raise e
 
 
-def obter_cadu_pi_lista(filtros=None):
-    """Retorna PIs com filtros opcionais e JOINs para nomes relacionados"""
+def _filtros_cadu_pi_lista(filtros):
+    """Cláusulas (SQL, params) dos filtros da lista de PIs (aliases p, cli, cli_ag)."""
+    query = ''
+    params = []
+
+    if filtros:
+        if filtros.get('id_cliente'):
+            query += ' AND p.id_cliente = %s'
+            params.append(filtros['id_cliente'])
+
+        if filtros.get('id_status_pi'):
+            query += ' AND p.id_status_pi = %s'
+            params.append(filtros['id_status_pi'])
+
+        if filtros.get('id_sub_status_pi'):
+            query += ' AND p.id_sub_status_pi = %s'
+            params.append(filtros['id_sub_status_pi'])
+
+        if filtros.get('id_agencia'):
+            query += ' AND p.id_agencia = %s'
+            params.append(filtros['id_agencia'])
+
+        if filtros.get('mes_ref_comp'):
+            query += ' AND p.mes_ref_comp = %s'
+            params.append(filtros['mes_ref_comp'])
+
+        if filtros.get('resp_comercial'):
+            query += ' AND p.id_resp_comercial = %s'
+            params.append(filtros['resp_comercial'])
+
+        if filtros.get('id_pi'):
+            query += ' AND p.id_pi = %s'
+            params.append(filtros['id_pi'])
+
+        if filtros.get('search'):
+            query += ' AND (unaccent(p.titulo_pi) ILIKE unaccent(%s) OR p.codigo_pi_cc ILIKE %s OR p.codigo_pi_ag ILIKE %s OR unaccent(cli.nome_fantasia) ILIKE unaccent(%s) OR unaccent(cli_ag.nome_fantasia) ILIKE unaccent(%s))'
+            search_term = f"%{filtros['search']}%"
+            params.extend([search_term, search_term, search_term, search_term, search_term])
+
+        # Status da última NF do PI (a mesma que a lista exibe)
+        if filtros.get('nf_status'):
+            query += '''
+                AND (
+                    SELECT nf.status FROM cadu_pi_nota_fiscal nf
+                    WHERE nf.id_pi = p.id_pi
+                    ORDER BY nf.created_at DESC
+                    LIMIT 1
+                ) = %s
+            '''
+            params.append(filtros['nf_status'])
+
+    return query, params
+
+
+def obter_cadu_pi_lista(filtros=None, limite=None, apos=None):
+    """Retorna PIs com filtros opcionais e JOINs para nomes relacionados.
+
+    Com limite, devolve uma página keyset (created_at, id_pi) depois do cursor apos;
+    a página seguinte sai de proximo_cursor(pis, limite, 'created_at', 'id_pi'). Os PIs
+    são escolhidos antes das contagens de links/campanhas e da última NF, que só rodam
+    para as linhas devolvidas.
+    """
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            query = '''
+            filtros_sql, params = _filtros_cadu_pi_lista(filtros)
+            pagina_sql = f'''
+                SELECT p.id_pi, p.created_at
+                FROM cadu_pi p
+                LEFT JOIN tbl_cliente cli ON p.id_cliente = cli.id_cliente
+                LEFT JOIN tbl_cliente cli_ag ON p.id_agencia = cli_ag.id_cliente
+                WHERE 1=1 {filtros_sql}
+            '''
+            if limite:
+                pagina_sql, params = _keyset_pagina(pagina_sql, params, 'p.created_at', 'p.id_pi', apos, limite)
+
+            query = f'''
+                WITH pagina AS ({pagina_sql})
                 SELECT 
                     p.*,
                     p.vr_bruto_pi as valor_bruto,
@@ -9986,7 +10635,8 @@ def obter_cadu_pi_lista(filtros=None):
                     nf_sub.nf_valor,
                     nf_sub.nf_status,
                     nf_sub.nf_status_descricao
-                FROM cadu_pi p
+                FROM pagina pg
+                JOIN cadu_pi p ON p.id_pi = pg.id_pi
                 LEFT JOIN tbl_cliente cli ON p.id_cliente = cli.id_cliente
                 LEFT JOIN tbl_cliente cli_ag ON p.id_agencia = cli_ag.id_cliente
                 LEFT JOIN tbl_cliente cli_parc ON p."Id_parc_reg" = cli_parc.id_cliente
@@ -10007,47 +10657,36 @@ def obter_cadu_pi_lista(filtros=None):
                     ORDER BY nf.created_at DESC
                     LIMIT 1
                 ) nf_sub ON true
-                WHERE 1=1
+                ORDER BY p.created_at DESC NULLS LAST, p.id_pi DESC
             '''
-            params = []
-
-            if filtros:
-                if filtros.get('id_cliente'):
-                    query += ' AND p.id_cliente = %s'
-                    params.append(filtros['id_cliente'])
-
-                if filtros.get('id_status_pi'):
-                    query += ' AND p.id_status_pi = %s'
-                    params.append(filtros['id_status_pi'])
-
-                if filtros.get('id_sub_status_pi'):
-                    query += ' AND p.id_sub_status_pi = %s'
-                    params.append(filtros['id_sub_status_pi'])
-
-                if filtros.get('id_agencia'):
-                    query += ' AND p.id_agencia = %s'
-                    params.append(filtros['id_agencia'])
 
-                if filtros.get('mes_ref_comp'):
-                    query += ' AND p.mes_ref_comp = %s'
-                    params.append(filtros['mes_ref_comp'])
-
-                if filtros.get('resp_comercial'):
-                    query += ' AND p.id_resp_comercial = %s'
-                    params.append(filtros['resp_comercial'])
-
-                if filtros.get('id_pi'):
-                    query += ' AND p.id_pi = %s'
-                    params.append(filtros['id_pi'])
-
-                if filtros.get('search'):
-                    query += ' AND (unaccent(p.titulo_pi) ILIKE unaccent(%s) OR p.codigo_pi_cc ILIKE %s OR p.codigo_pi_ag ILIKE %s OR unaccent(cli.nome_fantasia) ILIKE unaccent(%s) OR unaccent(cli_ag.nome_fantasia) ILIKE unaccent(%s))'
-                    search_term = f"%{filtros['search']}%"
-                    params.extend([search_term, search_term, search_term, search_term, search_term])
+            cursor.execute(query, params)
+            return cursor.fetchall()
+    except Exception as e:
+        conn.rollback()
+        raise e
 
-            query += ' ORDER BY p.created_at DESC'
 
-            cursor.execute(query, params)
+def obter_cadu_pi_lista_valores(filtros=None):
+    """Valores de todos os PIs dos filtros, para o rodapé da lista (sem NF nem nomes)."""
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            filtros_sql, params = _filtros_cadu_pi_lista(filtros)
+            cursor.execute(f'''
+                SELECT
+                    p.id_pi,
+                    p.vr_platafor_max_pi as valor_plataformas,
+                    p.vr_liquido_pi as valor_liquido,
+                    p.vr_bruto_pi as valor_bruto,
+                    COUNT(ca.id_campanha) as total_campanhas
+                FROM cadu_pi p
+                LEFT JOIN tbl_cliente cli ON p.id_cliente = cli.id_cliente
+                LEFT JOIN tbl_cliente cli_ag ON p.id_agencia = cli_ag.id_cliente
+                LEFT JOIN cadu_pi_campanha ca ON ca.id_pi = p.id_pi
+                WHERE 1=1 {filtros_sql}
+                GROUP BY p.id_pi
+            ''', params)
             return cursor.fetchall()
     except Exception as e:
         conn.rollback()
@@ -12773,17 +13412,88 @@ def excluir_status_campanha(id_status):
 
 # ==================== CAMPANHA PI - CRUD ====================
 
-def obter_campanhas_pi(filtros=None, somente_pi_em_andamento=False):
+def _filtros_campanhas_pi(filtros, somente_pi_em_andamento=False):
+    """Cláusulas (SQL, params) dos filtros de campanhas PI (aliases c, cli, pi)."""
+    query = ''
+    params = []
+
+    if somente_pi_em_andamento:
+        query += '''
+            AND pi.id_sub_status_pi = (
+                SELECT key FROM cadu_pi_sub_status
+                WHERE LOWER(TRIM(display)) = 'em andamento'
+                LIMIT 1
+            )
+        '''
+
+    if filtros:
+        if filtros.get('id_cliente'):
+            query += ' AND c.id_cliente = %s'
+            params.append(filtros['id_cliente'])
+        if not somente_pi_em_andamento and filtros.get('id_status'):
+            query += ' AND c.id_status = %s'
+            params.append(filtros['id_status'])
+        if filtros.get('id_plataforma'):
+            query += ' AND c.id_plataforma = %s'
+            params.append(filtros['id_plataforma'])
+        if filtros.get('id_pi'):
+            query += ' AND c.id_pi = %s'
+            params.append(filtros['id_pi'])
+        if filtros.get('mes_ref_comp'):
+            query += ' AND c.mes_ref_comp = %s'
+            params.append(filtros['mes_ref_comp'])
+            if somente_pi_em_andamento:
+                query += ' AND pi.mes_ref_comp = %s'
+                params.append(filtros['mes_ref_comp'])
+        if filtros.get('resp_comercial'):
+            query += ' AND cli.vendas_central_comm = %s'
+            params.append(filtros['resp_comercial'])
+        if not somente_pi_em_andamento and filtros.get('id_sub_status_pi'):
+            query += ' AND pi.id_sub_status_pi = %s'
+            params.append(filtros['id_sub_status_pi'])
+        if filtros.get('busca'):
+            query += '''
+                AND (unaccent(c.nome_campanha) ILIKE unaccent(%s)
+                     OR unaccent(cli.nome_fantasia) ILIKE unaccent(%s)
+                     OR pi.codigo_pi_cc ILIKE %s
+                     OR unaccent(pi.titulo_pi) ILIKE unaccent(%s))
+            '''
+            termo = f"%{filtros['busca']}%"
+            params.extend([termo, termo, termo, termo])
+
+    return query, params
+
+
+def obter_campanhas_pi(filtros=None, somente_pi_em_andamento=False, limite=None, apos=None):
     """Retorna campanhas PI com JOINs para nomes relacionados.
 
     somente_pi_em_andamento: quando True (tela Acompanhamento), retorna apenas
     campanhas cujo PI pai está com sub-status «Em andamento».
+
+    Sem limite, a lista inteira em ordem de mês de referência. Com limite, uma página
+    keyset (created_at, id_campanha) depois do cursor apos; a contagem de diários só
+    roda para as campanhas da página.
     """
     conn = get_db()
     try:
         with conn.cursor() as cursor:
             pi_join = 'INNER JOIN' if somente_pi_em_andamento else 'LEFT JOIN'
+            filtros_sql, params = _filtros_campanhas_pi(filtros, somente_pi_em_andamento)
+            pagina_sql = f'''
+                SELECT c.id_campanha, c.created_at
+                FROM cadu_pi_campanha c
+                LEFT JOIN tbl_cliente cli ON c.id_cliente = cli.id_cliente
+                {pi_join} cadu_pi pi ON c.id_pi = pi.id_pi
+                WHERE 1=1 {filtros_sql}
+            '''
+            if limite:
+                pagina_sql, params = _keyset_pagina(pagina_sql, params, 'c.created_at', 'c.id_campanha', apos, limite)
+                ordem = 'c.created_at DESC NULLS LAST, c.id_campanha DESC'
+            else:
+                ordem = 'c.mes_ref_comp DESC, c.id_campanha DESC'
+
             query = f'''
+                WITH pagina AS ({pagina_sql})
                 SELECT
                     c.id_campanha,
                     c.id_pi,
@@ -12831,77 +13541,135 @@ def obter_campanhas_pi(filtros=None, somente_pi_em_andamento=False):
                     pi.vr_liquido_pi AS valor_liquido_pi,
                     pi.vr_platafor_max_pi AS valor_plataformas_pi,
                     (SELECT COUNT(*) FROM cadu_pi_camp_diarios d WHERE d.id_campanha = c.id_campanha) AS qtd_diarios
-                FROM cadu_pi_campanha c
+                FROM pagina pg
+                JOIN cadu_pi_campanha c ON c.id_campanha = pg.id_campanha
                 LEFT JOIN tbl_cliente cli ON c.id_cliente = cli.id_cliente
                 LEFT JOIN cadu_pi_camp_objetivos obj ON c.id_objetivos_campanha = obj.id_objetivos_campanha
                 LEFT JOIN cadu_pi_camp_status st ON c.id_status = st.id
                 LEFT JOIN cadu_pi_camp_plataforma plt ON c.id_plataforma = plt.id_plataforma
-                {pi_join} cadu_pi pi ON c.id_pi = pi.id_pi
+                LEFT JOIN cadu_pi pi ON c.id_pi = pi.id_pi
                 LEFT JOIN tbl_contato_cliente vend ON cli.vendas_central_comm = vend.id_contato_cliente
-                WHERE 1=1
+                ORDER BY {ordem}
             '''
-            params = []
+            cursor.execute(query, params)
+            return cursor.fetchall()
+    except Exception as e:
+        conn.rollback()
+        raise e
 
-            if somente_pi_em_andamento:
-                query += '''
-                    AND pi.id_sub_status_pi = (
-                        SELECT key FROM cadu_pi_sub_status
-                        WHERE LOWER(TRIM(display)) = 'em andamento'
-                        LIMIT 1
-                    )
-                '''
 
-            if filtros:
-                if filtros.get('id_cliente'):
-                    query += ' AND c.id_cliente = %s'
-                    params.append(filtros['id_cliente'])
-                if not somente_pi_em_andamento and filtros.get('id_status'):
-                    query += ' AND c.id_status = %s'
-                    params.append(filtros['id_status'])
-                if filtros.get('id_plataforma'):
-                    query += ' AND c.id_plataforma = %s'
-                    params.append(filtros['id_plataforma'])
-                if filtros.get('id_pi'):
-                    query += ' AND c.id_pi = %s'
-                    params.append(filtros['id_pi'])
-                if filtros.get('mes_ref_comp'):
-                    query += ' AND c.mes_ref_comp = %s'
-                    params.append(filtros['mes_ref_comp'])
-                    if somente_pi_em_andamento:
-                        query += ' AND pi.mes_ref_comp = %s'
-                        params.append(filtros['mes_ref_comp'])
-                if filtros.get('resp_comercial'):
-                    query += ' AND cli.vendas_central_comm = %s'
-                    params.append(filtros['resp_comercial'])
-                if not somente_pi_em_andamento and filtros.get('id_sub_status_pi'):
-                    query += ' AND pi.id_sub_status_pi = %s'
-                    params.append(filtros['id_sub_status_pi'])
+def contar_campanhas_pi(filtros=None, somente_pi_em_andamento=False):
+    """Total de campanhas PI para os filtros (em cache por LISTAGENS_CONTAGEM_TTL)."""
+    def _contar():
+        conn = get_db()
+        pi_join = 'INNER JOIN' if somente_pi_em_andamento else 'LEFT JOIN'
+        with conn.cursor() as cursor:
+            filtros_sql, params = _filtros_campanhas_pi(filtros, somente_pi_em_andamento)
+            cursor.execute(f'''
+                SELECT COUNT(*) AS total
+                FROM cadu_pi_campanha c
+                LEFT JOIN tbl_cliente cli ON c.id_cliente = cli.id_cliente
+                {pi_join} cadu_pi pi ON c.id_pi = pi.id_pi
+                WHERE 1=1 {filtros_sql}
+            ''', params)
+            return cursor.fetchone()['total']
 
-            query += ' ORDER BY c.mes_ref_comp DESC, c.id_campanha DESC'
-            cursor.execute(query, params)
-            return cursor.fetchall()
-    except Exception as e:
-        conn.rollback()
-        raise e
+    escopo = 'campanhas_pi_acompanhamento' if somente_pi_em_andamento else 'campanhas_pi'
+    return contagem_em_cache(escopo, filtros, _contar)
 
 
-def obter_campanhas_pi_acompanhamento(filtros=None):
-    """Campanhas da tela Acompanhamento: somente PI Em andamento."""
+def _filtros_campanhas_pi_acompanhamento(filtros):
     filtros = {k: v for k, v in (filtros or {}).items() if v is not None}
     filtros.pop('id_status', None)
     filtros.pop('id_sub_status_pi', None)
-    return obter_campanhas_pi(filtros, somente_pi_em_andamento=True)
+    return filtros
+
+
+def obter_campanhas_pi_acompanhamento(filtros=None, limite=None, apos=None):
+    """Campanhas da tela Acompanhamento: somente PI Em andamento."""
+    return obter_campanhas_pi(_filtros_campanhas_pi_acompanhamento(filtros), somente_pi_em_andamento=True,
+                              limite=limite, apos=apos)
+
+
+def contar_campanhas_pi_acompanhamento(filtros=None):
+    return contar_campanhas_pi(_filtros_campanhas_pi_acompanhamento(filtros), somente_pi_em_andamento=True)
+
+
+def _filtros_campanhas_pi_old_kpi(filtros):
+    """Cláusulas (SQL, params) da lista OLD KPI (aliases c, cli, pi, cli_ag)."""
+    query = ' AND COALESCE(pi.id_sub_status_pi, 0) <> 1'
+    params = []
 
+    if filtros:
+        if filtros.get('id_cliente'):
+            query += ' AND c.id_cliente = %s'
+            params.append(filtros['id_cliente'])
+        if filtros.get('id_status'):
+            query += ' AND c.id_status = %s'
+            params.append(filtros['id_status'])
+        if filtros.get('id_plataforma'):
+            query += ' AND c.id_plataforma = %s'
+            params.append(filtros['id_plataforma'])
+        if filtros.get('id_pi'):
+            query += ' AND c.id_pi = %s'
+            params.append(filtros['id_pi'])
+        if filtros.get('mes_ref_comp'):
+            query += ' AND c.mes_ref_comp = %s'
+            params.append(filtros['mes_ref_comp'])
+        if filtros.get('resp_comercial'):
+            query += ' AND pi.id_resp_comercial = %s'
+            params.append(filtros['resp_comercial'])
+        if filtros.get('id_sub_status_pi'):
+            query += ' AND pi.id_sub_status_pi = %s'
+            params.append(filtros['id_sub_status_pi'])
+        if filtros.get('busca'):
+            query += '''
+                AND (unaccent(c.nome_campanha) ILIKE unaccent(%s)
+                     OR unaccent(cli.nome_fantasia) ILIKE unaccent(%s)
+                     OR unaccent(cli_ag.nome_fantasia) ILIKE unaccent(%s)
+                     OR pi.codigo_pi_cc ILIKE %s)
+            '''
+            termo = f"%{filtros['busca']}%"
+            params.extend([termo, termo, termo, termo])
+
+    return query, params
+
+
+def obter_campanhas_pi_lista_old_kpi(filtros=None, limite=None, apos=None):
+    """Lista campanhas PI para relatório legado (OLD KPI), com formato/praça da cotação.
 
-def obter_campanhas_pi_lista_old_kpi(filtros=None):
-    """Lista campanhas PI para relatório legado (OLD KPI): ordenado por PI, com formato/praça da cotação."""
+    Sem limite (exportação), a lista inteira ordenada por PI. Com limite, uma página
+    keyset (created_at, id_campanha) depois do cursor apos; formato, praça e KPI da
+    cotação só são buscados para as campanhas da página.
+    """
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            query = '''
+            filtros_sql, params = _filtros_campanhas_pi_old_kpi(filtros)
+            pagina_sql = f'''
+                SELECT c.id_campanha, c.created_at
+                FROM cadu_pi_campanha c
+                LEFT JOIN tbl_cliente cli ON c.id_cliente = cli.id_cliente
+                LEFT JOIN cadu_pi pi ON c.id_pi = pi.id_pi
+                LEFT JOIN tbl_cliente cli_ag ON pi.id_agencia = cli_ag.id_cliente
+                WHERE 1=1 {filtros_sql}
+            '''
+            if limite:
+                pagina_sql, params = _keyset_pagina(pagina_sql, params, 'c.created_at', 'c.id_campanha', apos, limite)
+                ordem = 'c.created_at DESC NULLS LAST, c.id_campanha DESC'
+            else:
+                ordem = '''
+                    pi.codigo_pi_cc NULLS LAST,
+                    pi.id_pi ASC,
+                    c.id_campanha ASC
+                '''
+
+            query = f'''
+                WITH pagina AS ({pagina_sql})
                 SELECT
                     c.id_campanha,
                     c.id_pi,
+                    c.created_at,
                     c.nome_campanha,
                     c.obj_contratados,
                     c.mes_ref_comp,
@@ -12927,7 +13695,8 @@ def obter_campanhas_pi_lista_old_kpi(filtros=None):
                         aud_cot.kpi_nome
                     ) AS kpi_nome,
                     COALESCE(NULLIF(TRIM(cot.objetivo_campanha), ''), pi.titulo_pi) AS objetivo_texto
-                FROM cadu_pi_campanha c
+                FROM pagina pg
+                JOIN cadu_pi_campanha c ON c.id_campanha = pg.id_campanha
                 LEFT JOIN tbl_cliente cli ON c.id_cliente = cli.id_cliente
                 LEFT JOIN cadu_pi_camp_objetivos obj ON c.id_objetivos_campanha = obj.id_objetivos_campanha
                 LEFT JOIN cadu_pi_camp_plataforma plt ON c.id_plataforma = plt.id_plataforma
@@ -12976,41 +13745,34 @@ def obter_campanhas_pi_lista_old_kpi(filtros=None):
                       AND TRIM(COALESCE(a.audiencia_nome, '')) = TRIM(COALESCE(c.nome_campanha, ''))
                     LIMIT 1
                 ) aud_cot ON true
-                WHERE 1=1
-                  AND COALESCE(pi.id_sub_status_pi, 0) <> 1
+                ORDER BY {ordem}
             '''
-            params = []
+            cursor.execute(query, params)
+            return cursor.fetchall()
+    except Exception as e:
+        conn.rollback()
+        raise e
 
-            if filtros:
-                if filtros.get('id_cliente'):
-                    query += ' AND c.id_cliente = %s'
-                    params.append(filtros['id_cliente'])
-                if filtros.get('id_status'):
-                    query += ' AND c.id_status = %s'
-                    params.append(filtros['id_status'])
-                if filtros.get('id_plataforma'):
-                    query += ' AND c.id_plataforma = %s'
-                    params.append(filtros['id_plataforma'])
-                if filtros.get('id_pi'):
-                    query += ' AND c.id_pi = %s'
-                    params.append(filtros['id_pi'])
-                if filtros.get('mes_ref_comp'):
-                    query += ' AND c.mes_ref_comp = %s'
-                    params.append(filtros['mes_ref_comp'])
-                if filtros.get('resp_comercial'):
-                    query += ' AND pi.id_resp_comercial = %s'
-                    params.append(filtros['resp_comercial'])
-                if filtros.get('id_sub_status_pi'):
-                    query += ' AND pi.id_sub_status_pi = %s'
-                    params.append(filtros['id_sub_status_pi'])
 
-            query += '''
-                ORDER BY
-                    pi.codigo_pi_cc NULLS LAST,
-                    pi.id_pi ASC,
-                    c.id_campanha ASC
-            '''
-            cursor.execute(query, params)
+def obter_campanhas_pi_lista_old_kpi_valores(filtros=None):
+    """Volumes e valores de todas as campanhas da lista OLD KPI, para o rodapé (sem cotação)."""
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            filtros_sql, params = _filtros_campanhas_pi_old_kpi(filtros)
+            cursor.execute(f'''
+                SELECT
+                    c.obj_contratados,
+                    c.totalizador_atingido,
+                    c.valor_plataforma,
+                    c.valor_total_plataforma,
+                    c.totalizador_gasto
+                FROM cadu_pi_campanha c
+                LEFT JOIN tbl_cliente cli ON c.id_cliente = cli.id_cliente
+                LEFT JOIN cadu_pi pi ON c.id_pi = pi.id_pi
+                LEFT JOIN tbl_cliente cli_ag ON pi.id_agencia = cli_ag.id_cliente
+                WHERE 1=1 {filtros_sql}
+            ''', params)
             return cursor.fetchall()
     except Exception as e:
         conn.rollback()
@@ -13602,16 +14364,8 @@ def get_dashboard_carteira_clientes(days=90):
                 'classificacoes': classificacoes
             }
     except Exception as e:
-        conn.rollback()
         current_app.logger.error(f"Erro dashboard carteira clientes: {e}")
-        return {
-            'por_executivo': [],
-            'por_executivo_perfil': [],
-            'por_executivo_clientes': [],
-            'por_executivo_agencias': [],
-            'resumo': {},
-            'classificacoes': []
-        }
+        raise
 
 
 def get_dashboard_cotacoes_status(days=90):
@@ -13620,79 +14374,65 @@ def get_dashboard_cotacoes_status(days=90):
         with conn.cursor() as cursor:
             cursor.execute('''
                 SELECT
-                    COALESCE(c.status, 'Sem Status') AS status_nome,
-                    COUNT(*) AS total,
-                    COALESCE(SUM(c.valor_total_proposta), 0) AS valor_total
-                FROM cadu_cotacoes c
-                WHERE c.deleted_at IS NULL
-                  AND c.created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                GROUP BY COALESCE(c.status, 'Sem Status')
+                    r.status AS status_nome,
+                    SUM(r.total)::int AS total,
+                    COALESCE(SUM(r.valor_total), 0) AS valor_total
+                FROM dashboard_rollup_cotacao_dia r
+                WHERE r.dia >= CURRENT_DATE - %s
+                GROUP BY r.status
                 ORDER BY total DESC
             ''', (days,))
             por_status = cursor.fetchall()
 
             cursor.execute('''
                 SELECT
-                    DATE_TRUNC('week', c.created_at)::date AS semana,
-                    COALESCE(c.status, 'Sem Status') AS status_nome,
-                    COUNT(*) AS total
-                FROM cadu_cotacoes c
-                WHERE c.deleted_at IS NULL
-                  AND c.created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                GROUP BY DATE_TRUNC('week', c.created_at), COALESCE(c.status, 'Sem Status')
+                    DATE_TRUNC('week', r.dia)::date AS semana,
+                    r.status AS status_nome,
+                    SUM(r.total)::int AS total
+                FROM dashboard_rollup_cotacao_dia r
+                WHERE r.dia >= CURRENT_DATE - %s
+                GROUP BY DATE_TRUNC('week', r.dia), r.status
                 ORDER BY semana
             ''', (days,))
             evolucao = cursor.fetchall()
 
-            cursor.execute('''
-                SELECT COUNT(*) AS total
-                FROM cadu_cotacoes
-                WHERE deleted_at IS NULL
-                  AND created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-            ''', (days,))
-            resumo = cursor.fetchone()
-
             return {
                 'por_status': por_status,
                 'evolucao': evolucao,
-                'total': resumo.get('total', 0) if resumo else 0
+                'total': sum(r['total'] for r in por_status)
             }
     except Exception as e:
-        conn.rollback()
         current_app.logger.error(f"Erro dashboard cotacoes: {e}")
-        return {'por_status': [], 'evolucao': [], 'total': 0}
+        raise
 
 
 def get_dashboard_acessos_cadu(days=90):
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            sessoes_diarias = []
-            try:
-                cursor.execute('''
-                    SELECT * FROM v_analytics_sessions_daily
-                    WHERE date >= CURRENT_DATE - %s * INTERVAL '1 day'
-                    ORDER BY date
-                ''', (days,))
-                sessoes_diarias = cursor.fetchall()
-            except Exception:
-                pass
+            cursor.execute('''
+                SELECT
+                    dia AS date,
+                    total_sessions,
+                    unique_users,
+                    avg_duration,
+                    total_pageviews,
+                    mobile_sessions,
+                    desktop_sessions,
+                    usuarios_bitmap
+                FROM analytics_sessoes_dia
+                WHERE dia >= CURRENT_DATE - %s
+                ORDER BY dia
+            ''', (days,))
+            sessoes_diarias = cursor.fetchall()
+            bitmaps = [r.pop('usuarios_bitmap') for r in sessoes_diarias]
 
             total_sessoes = sum(r.get('total_sessions', 0) or 0 for r in sessoes_diarias)
             total_dias = len(sessoes_diarias) or 1
             media_dia = round(total_sessoes / total_dias, 1)
             total_pageviews = sum(r.get('total_pageviews', 0) or 0 for r in sessoes_diarias)
 
-            usuarios_periodo = 0
-            try:
-                cursor.execute('''
-                    SELECT COUNT(DISTINCT user_id) AS total
-                    FROM cadu_analytics_sessions
-                    WHERE created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                ''', (days,))
-                usuarios_periodo = cursor.fetchone()['total'] or 0
-            except Exception:
-                pass
+            usuarios_periodo = _contar_bitmaps(bitmaps)
 
             return {
                 'sessoes': total_sessoes,
@@ -13702,61 +14442,36 @@ def get_dashboard_acessos_cadu(days=90):
                 'sessoes_diarias': sessoes_diarias
             }
     except Exception as e:
-        conn.rollback()
         current_app.logger.error(f"Erro dashboard acessos: {e}")
-        return {'dau': 0, 'wau': 0, 'mau': 0, 'sessions_today': 0, 'avg_duration': 0, 'sessoes_diarias': []}
+        raise
 
 
 def get_dashboard_pis_por_mes(days=90):
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            liq_expr = _parse_varchar_to_numeric('p.vr_liquido_pi')
-            bruto_expr = _parse_varchar_to_numeric('p.vr_bruto_pi')
-            mes_ref_fallback = "(EXTRACT(MONTH FROM p.created_at)::int || '/' || TO_CHAR(p.created_at, 'YY'))"
-            cursor.execute(f'''
+            cursor.execute('''
                 SELECT
-                    COALESCE(p.mes_ref_comp, {mes_ref_fallback}) AS mes,
+                    r.mes_ref AS mes,
                     COALESCE(sp.descricao, 'Sem Status') AS status_nome,
-                    COUNT(*) AS total,
-                    COALESCE(SUM({liq_expr}), 0) AS valor_liquido,
-                    COALESCE(SUM({bruto_expr}), 0) AS valor_bruto
-                FROM cadu_pi p
-                LEFT JOIN cadu_pi_aux_status sp ON p.id_status_pi = sp.id
-                WHERE p.created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                GROUP BY COALESCE(p.mes_ref_comp, {mes_ref_fallback}),
-                         COALESCE(sp.descricao, 'Sem Status')
+                    SUM(r.total)::int AS total,
+                    COALESCE(SUM(r.valor_liquido), 0) AS valor_liquido,
+                    COALESCE(SUM(r.valor_bruto), 0) AS valor_bruto
+                FROM dashboard_rollup_pi_dia r
+                LEFT JOIN cadu_pi_aux_status sp ON r.id_status_pi = sp.id
+                WHERE r.dia >= CURRENT_DATE - %s
+                GROUP BY r.mes_ref, COALESCE(sp.descricao, 'Sem Status')
                 ORDER BY mes
             ''', (days,))
             por_mes = cursor.fetchall()
 
             cursor.execute('''
-                WITH parsed AS (
-                    SELECT
-                        NULLIF(REGEXP_REPLACE(vr_liquido_pi, '[^0-9.,]', '', 'g'), '') AS liq_raw,
-                        NULLIF(REGEXP_REPLACE(vr_bruto_pi, '[^0-9.,]', '', 'g'), '') AS bruto_raw
-                    FROM cadu_pi
-                    WHERE created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                )
                 SELECT
-                    COUNT(*) AS total,
-                    COALESCE(SUM(
-                        CASE
-                            WHEN liq_raw ~ '^[0-9]+,[0-9]+$' THEN REPLACE(liq_raw, ',', '.')::numeric
-                            WHEN liq_raw ~ '^[0-9.]+,[0-9]+$' THEN REPLACE(REPLACE(liq_raw, '.', ''), ',', '.')::numeric
-                            WHEN liq_raw ~ '^[0-9.]+$' THEN liq_raw::numeric
-                            ELSE 0
-                        END
-                    ), 0) AS valor_total,
-                    COALESCE(SUM(
-                        CASE
-                            WHEN bruto_raw ~ '^[0-9]+,[0-9]+$' THEN REPLACE(bruto_raw, ',', '.')::numeric
-                            WHEN bruto_raw ~ '^[0-9.]+,[0-9]+$' THEN REPLACE(REPLACE(bruto_raw, '.', ''), ',', '.')::numeric
-                            WHEN bruto_raw ~ '^[0-9.]+$' THEN bruto_raw::numeric
-                            ELSE 0
-                        END
-                    ), 0) AS valor_bruto
-                FROM parsed
+                    COALESCE(SUM(total), 0)::int AS total,
+                    COALESCE(SUM(valor_liquido), 0) AS valor_total,
+                    COALESCE(SUM(valor_bruto), 0) AS valor_bruto
+                FROM dashboard_rollup_pi_dia
+                WHERE dia >= CURRENT_DATE - %s
             ''', (days,))
             resumo = cursor.fetchone()
 
@@ -13765,9 +14480,8 @@ def get_dashboard_pis_por_mes(days=90):
                 'resumo': resumo or {'total': 0, 'valor_total': 0, 'valor_bruto': 0}
             }
     except Exception as e:
-        conn.rollback()
         current_app.logger.error(f"Erro dashboard PIs: {e}")
-        return {'por_mes': [], 'resumo': {'total': 0, 'valor_total': 0, 'valor_bruto': 0}}
+        raise
 
 
 def _parse_varchar_to_numeric(col):
@@ -13793,34 +14507,31 @@ def _parse_varchar_to_numeric(col):
 
 def get_dashboard_campanhas(days=90):
     conn = get_db()
-    vp = _parse_varchar_to_numeric('c.valor_plataforma')
-    tg = _parse_varchar_to_numeric('c.totalizador_gasto')
-    ta = _parse_varchar_to_numeric('c.totalizador_atingido')
     try:
         with conn.cursor() as cursor:
-            cursor.execute(f'''
+            cursor.execute('''
                 SELECT
                     COALESCE(st.descricao, 'Sem Status') AS status_nome,
-                    COUNT(*) AS total,
-                    COALESCE(SUM({vp}), 0) AS valor_plataforma,
-                    COALESCE(SUM({tg}), 0) AS gasto_total,
-                    COALESCE(SUM({ta}), 0) AS atingido_total
-                FROM cadu_pi_campanha c
-                LEFT JOIN cadu_pi_camp_status st ON c.id_status = st.id
-                WHERE c.created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
+                    SUM(r.total)::int AS total,
+                    COALESCE(SUM(r.valor_plataforma), 0) AS valor_plataforma,
+                    COALESCE(SUM(r.gasto_total), 0) AS gasto_total,
+                    COALESCE(SUM(r.atingido_total), 0) AS atingido_total
+                FROM dashboard_rollup_campanha_dia r
+                LEFT JOIN cadu_pi_camp_status st ON r.id_status = st.id
+                WHERE r.dia >= CURRENT_DATE - %s
                 GROUP BY COALESCE(st.descricao, 'Sem Status')
                 ORDER BY total DESC
             ''', (days,))
             por_status = cursor.fetchall()
 
-            cursor.execute(f'''
+            cursor.execute('''
                 SELECT
-                    COUNT(*) AS total_campanhas,
-                    COALESCE(SUM({vp}), 0) AS faturamento,
-                    COALESCE(SUM({tg}), 0) AS gasto,
-                    COALESCE(SUM({ta}), 0) AS atingido
-                FROM cadu_pi_campanha c
-                WHERE c.created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
+                    COALESCE(SUM(total), 0)::int AS total_campanhas,
+                    COALESCE(SUM(valor_plataforma), 0) AS faturamento,
+                    COALESCE(SUM(gasto_total), 0) AS gasto,
+                    COALESCE(SUM(atingido_total), 0) AS atingido
+                FROM dashboard_rollup_campanha_dia
+                WHERE dia >= CURRENT_DATE - %s
             ''', (days,))
             resumo = cursor.fetchone()
 
@@ -13829,74 +14540,65 @@ def get_dashboard_campanhas(days=90):
                 'resumo': resumo or {'total_campanhas': 0, 'faturamento': 0, 'gasto': 0, 'atingido': 0}
             }
     except Exception as e:
-        conn.rollback()
         current_app.logger.error(f"Erro dashboard campanhas: {e}")
-        return {'por_status': [], 'resumo': {'total_campanhas': 0, 'faturamento': 0, 'gasto': 0, 'atingido': 0}}
+        raise
 
 
 def get_dashboard_audiencias(days=90):
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            top_audiencias = []
-            evolucao = []
-            total_acessos = 0
-            try:
-                cursor.execute('''
-                    SELECT
-                        COALESCE(a.nome, e.metadata->>'audiencia_nome') AS audiencia_nome,
-                        COUNT(*) AS total_views,
-                        COUNT(DISTINCT e.user_id) AS unique_users
-                    FROM cadu_analytics_events e
-                    LEFT JOIN cadu_audiencias a ON (e.metadata->>'audiencia_id')::int = a.id
-                    WHERE e.event_type = 'audiencia_viewed'
-                      AND e.created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                    GROUP BY COALESCE(a.nome, e.metadata->>'audiencia_nome')
+            # Únicos por audiência no período = ids distintos somando os arrays diários
+            cursor.execute('''
+                WITH base AS (
+                    SELECT COALESCE(a.nome, r.audiencia_nome) AS audiencia_nome, r.views, r.usuarios
+                    FROM dashboard_rollup_audiencia_dia r
+                    LEFT JOIN cadu_audiencias a ON r.audiencia_id = a.id
+                    WHERE r.dia >= CURRENT_DATE - %s
+                ),
+                top AS (
+                    SELECT audiencia_nome, SUM(views)::int AS total_views
+                    FROM base
+                    GROUP BY audiencia_nome
                     ORDER BY total_views DESC
                     LIMIT 10
-                ''', (days,))
-                top_audiencias = cursor.fetchall()
-
-                cursor.execute('''
-                    SELECT
-                        DATE_TRUNC('week', e.created_at)::date AS semana,
-                        COUNT(*) AS total_views
-                    FROM cadu_analytics_events e
-                    WHERE e.event_type = 'audiencia_viewed'
-                      AND e.created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                    GROUP BY DATE_TRUNC('week', e.created_at)
-                    ORDER BY semana
-                ''', (days,))
-                evolucao = cursor.fetchall()
+                )
+                SELECT
+                    t.audiencia_nome,
+                    t.total_views,
+                    (SELECT COUNT(DISTINCT u)
+                     FROM base b, unnest(b.usuarios) AS u
+                     WHERE b.audiencia_nome IS NOT DISTINCT FROM t.audiencia_nome) AS unique_users
+                FROM top t
+                ORDER BY t.total_views DESC
+            ''', (days,))
+            top_audiencias = cursor.fetchall()
 
-                cursor.execute('''
-                    SELECT COUNT(*) AS total
-                    FROM cadu_analytics_events
-                    WHERE event_type = 'audiencia_viewed'
-                      AND created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                ''', (days,))
-                r = cursor.fetchone()
-                total_acessos = r.get('total', 0) if r else 0
-            except Exception:
-                pass
+            cursor.execute('''
+                SELECT
+                    DATE_TRUNC('week', r.dia)::date AS semana,
+                    SUM(r.views)::int AS total_views
+                FROM dashboard_rollup_audiencia_dia r
+                WHERE r.dia >= CURRENT_DATE - %s
+                GROUP BY DATE_TRUNC('week', r.dia)
+                ORDER BY semana
+            ''', (days,))
+            evolucao = cursor.fetchall()
+            total_acessos = sum(r['total_views'] for r in evolucao)
 
-            top_canais = []
-            try:
-                cursor.execute('''
-                    SELECT
-                        COALESCE(p.nome, 'Desconhecido') AS canal,
-                        COUNT(a.id) AS total_audiencias,
-                        COALESCE(SUM(a.cpm_venda), 0) AS cpm_total
-                    FROM cadu_audiencias a
-                    LEFT JOIN cadu_audiencias_plataformas p ON a.plataforma_id = p.id
-                    WHERE a.is_active = true
-                    GROUP BY COALESCE(p.nome, 'Desconhecido')
-                    ORDER BY total_audiencias DESC
-                    LIMIT 10
-                ''')
-                top_canais = cursor.fetchall()
-            except Exception:
-                pass
+            cursor.execute('''
+                SELECT
+                    COALESCE(p.nome, 'Desconhecido') AS canal,
+                    COUNT(a.id) AS total_audiencias,
+                    COALESCE(SUM(a.cpm_venda), 0) AS cpm_total
+                FROM cadu_audiencias a
+                LEFT JOIN cadu_audiencias_plataformas p ON a.plataforma_id = p.id
+                WHERE a.is_active = true
+                GROUP BY COALESCE(p.nome, 'Desconhecido')
+                ORDER BY total_audiencias DESC
+                LIMIT 10
+            ''')
+            top_canais = cursor.fetchall()
 
             return {
                 'top_audiencias': top_audiencias,
@@ -13905,9 +14607,8 @@ def get_dashboard_audiencias(days=90):
                 'total_acessos': total_acessos
             }
     except Exception as e:
-        conn.rollback()
         current_app.logger.error(f"Erro dashboard audiencias: {e}")
-        return {'top_audiencias': [], 'top_canais': [], 'evolucao': [], 'total_acessos': 0}
+        raise
 
 
 def get_dashboard_briefings_por_cliente(days=90):
@@ -13917,13 +14618,12 @@ def get_dashboard_briefings_por_cliente(days=90):
             cursor.execute('''
                 SELECT
                     cli.nome_fantasia AS cliente,
-                    COUNT(b.id) AS total_briefings,
-                    COUNT(b.id) FILTER (WHERE b.status = 'enviado') AS enviados,
-                    COUNT(b.id) FILTER (WHERE b.status = 'rascunho') AS rascunhos
-                FROM cadu_briefings b
-                INNER JOIN tbl_cliente cli ON b.id_cliente = cli.id_cliente
-                WHERE b.deleted_at IS NULL
-                  AND b.created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
+                    SUM(r.total)::int AS total_briefings,
+                    COALESCE(SUM(r.total) FILTER (WHERE r.status = 'enviado'), 0)::int AS enviados,
+                    COALESCE(SUM(r.total) FILTER (WHERE r.status = 'rascunho'), 0)::int AS rascunhos
+                FROM dashboard_rollup_briefing_dia r
+                INNER JOIN tbl_cliente cli ON r.id_cliente = cli.id_cliente
+                WHERE r.dia >= CURRENT_DATE - %s
                 GROUP BY cli.nome_fantasia
                 ORDER BY total_briefings DESC
                 LIMIT 10
@@ -13932,13 +14632,12 @@ def get_dashboard_briefings_por_cliente(days=90):
 
             cursor.execute('''
                 SELECT
-                    COUNT(*) AS total,
-                    COUNT(*) FILTER (WHERE status = 'enviado') AS enviados,
-                    COUNT(*) FILTER (WHERE status = 'rascunho') AS rascunhos,
-                    COUNT(*) FILTER (WHERE enviado_para_centralcomm = true) AS enviados_centralcomm
-                FROM cadu_briefings
-                WHERE deleted_at IS NULL
-                  AND created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
+                    COALESCE(SUM(total), 0)::int AS total,
+                    COALESCE(SUM(total) FILTER (WHERE status = 'enviado'), 0)::int AS enviados,
+                    COALESCE(SUM(total) FILTER (WHERE status = 'rascunho'), 0)::int AS rascunhos,
+                    COALESCE(SUM(total) FILTER (WHERE enviado_para_centralcomm), 0)::int AS enviados_centralcomm
+                FROM dashboard_rollup_briefing_dia
+                WHERE dia >= CURRENT_DATE - %s
             ''', (days,))
             resumo = cursor.fetchone()
 
@@ -13947,9 +14646,8 @@ def get_dashboard_briefings_por_cliente(days=90):
                 'resumo': resumo or {'total': 0, 'enviados': 0, 'rascunhos': 0, 'enviados_centralcomm': 0}
             }
     except Exception as e:
-        conn.rollback()
         current_app.logger.error(f"Erro dashboard briefings: {e}")
-        return {'top_clientes': [], 'resumo': {'total': 0, 'enviados': 0, 'rascunhos': 0, 'enviados_centralcomm': 0}}
+        raise
 
 
 def get_dashboard_leads(days=90):
@@ -13959,12 +14657,12 @@ def get_dashboard_leads(days=90):
             cursor.execute('''
                 SELECT
                     COALESCE(e.nome_completo, 'Sem Executivo') AS executivo,
-                    COUNT(*) AS total_leads,
-                    COUNT(*) FILTER (WHERE l.id_executivo IS NOT NULL) AS notificados,
-                    COUNT(*) FILTER (WHERE l.id_executivo IS NULL) AS pendentes
-                FROM cadu_leads l
-                LEFT JOIN tbl_contato_cliente e ON l.id_executivo = e.id_contato_cliente
-                WHERE l.created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
+                    SUM(r.total)::int AS total_leads,
+                    COALESCE(SUM(r.total) FILTER (WHERE r.id_executivo IS NOT NULL), 0)::int AS notificados,
+                    COALESCE(SUM(r.total) FILTER (WHERE r.id_executivo IS NULL), 0)::int AS pendentes
+                FROM dashboard_rollup_lead_dia r
+                LEFT JOIN tbl_contato_cliente e ON r.id_executivo = e.id_contato_cliente
+                WHERE r.dia >= CURRENT_DATE - %s
                 GROUP BY COALESCE(e.nome_completo, 'Sem Executivo')
                 ORDER BY total_leads DESC
             ''', (days,))
@@ -13972,66 +14670,209 @@ def get_dashboard_leads(days=90):
 
             cursor.execute('''
                 SELECT
-                    COALESCE(fonte, 'N/A') AS tipo_produto,
-                    COUNT(*) AS total
-                FROM cadu_leads
-                WHERE created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                GROUP BY COALESCE(fonte, 'N/A')
+                    fonte AS tipo_produto,
+                    SUM(total)::int AS total
+                FROM dashboard_rollup_lead_dia
+                WHERE dia >= CURRENT_DATE - %s
+                GROUP BY fonte
                 ORDER BY total DESC
             ''', (days,))
             por_origem = cursor.fetchall()
 
             cursor.execute('''
                 SELECT
-                    DATE_TRUNC('week', created_at)::date AS semana,
-                    COUNT(*) AS total
-                FROM cadu_leads
-                WHERE created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-                GROUP BY DATE_TRUNC('week', created_at)
+                    DATE_TRUNC('week', dia)::date AS semana,
+                    SUM(total)::int AS total
+                FROM dashboard_rollup_lead_dia
+                WHERE dia >= CURRENT_DATE - %s
+                GROUP BY DATE_TRUNC('week', dia)
                 ORDER BY semana
             ''', (days,))
             evolucao = cursor.fetchall()
 
-            cursor.execute('''
-                SELECT
-                    COUNT(*) AS total,
-                    COUNT(*) FILTER (WHERE id_executivo IS NOT NULL) AS notificados,
-                    COUNT(*) FILTER (WHERE id_executivo IS NULL) AS pendentes
-                FROM cadu_leads
-                WHERE created_at >= CURRENT_DATE - %s * INTERVAL '1 day'
-            ''', (days,))
-            resumo = cursor.fetchone()
-
+            notificados = sum(r['notificados'] for r in por_executivo)
+            pendentes = sum(r['pendentes'] for r in por_executivo)
             return {
                 'por_executivo': por_executivo,
                 'por_origem': por_origem,
                 'evolucao': evolucao,
-                'resumo': resumo or {'total': 0, 'notificados': 0, 'pendentes': 0}
+                'resumo': {'total': notificados + pendentes, 'notificados': notificados, 'pendentes': pendentes}
             }
     except Exception as e:
-        conn.rollback()
         current_app.logger.error(f"Erro dashboard leads: {e}")
-        return {'por_executivo': [], 'por_origem': [], 'evolucao': [], 'resumo': {'total': 0, 'notificados': 0, 'pendentes': 0}}
+        raise
 
 
-# ==================== DASHBOARD GERENCIAL COMERCIAL ====================
+# ==================== DASHBOARD ROLLUPS ====================
+
+# Fonte do rollup -> tabela de origem. INSERT/UPDATE/DELETE nessas tabelas marcam os dias
+# afetados em dashboard_rollup_pendencias (triggers por statement); o job
+# 'dashboard.atualizar_rollups' recalcula só esses dias. A fonte 'audiencia'
+# (cadu_analytics_events: só INSERT, alto volume, gravada pelo CADU) não tem trigger:
+# o job recalcula os dias desde a última execução.
+ROLLUP_DASHBOARD_TABELAS = {
+    'pi': 'cadu_pi',
+    'campanha': 'cadu_pi_campanha',
+    'cotacao': 'cadu_cotacoes',
+    'lead': 'cadu_leads',
+    'briefing': 'cadu_briefings',
+}
+
+
+def _criar_triggers_rollup(cursor, fonte, tabela, prefixo):
+    """Triggers ins/upd/del que marcam em dashboard_rollup_pendencias os dias da fonte."""
+    cursor.execute(f'''
+        DO $$
+        BEGIN
+            IF to_regclass('{tabela}') IS NULL THEN
+                RETURN;
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = '{tabela}'::regclass AND tgname = '{prefixo}_ins') THEN
+                CREATE TRIGGER {prefixo}_ins AFTER INSERT ON {tabela}
+                    REFERENCING NEW TABLE AS novos
+                    FOR EACH STATEMENT EXECUTE FUNCTION dashboard_rollup_marcar_dias('{fonte}');
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = '{tabela}'::regclass AND tgname = '{prefixo}_upd') THEN
+                CREATE TRIGGER {prefixo}_upd AFTER UPDATE ON {tabela}
+                    REFERENCING OLD TABLE AS antigos NEW TABLE AS novos
+                    FOR EACH STATEMENT EXECUTE FUNCTION dashboard_rollup_marcar_dias('{fonte}');
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = '{tabela}'::regclass AND tgname = '{prefixo}_del') THEN
+                CREATE TRIGGER {prefixo}_del AFTER DELETE ON {tabela}
+                    REFERENCING OLD TABLE AS antigos
+                    FOR EACH STATEMENT EXECUTE FUNCTION dashboard_rollup_marcar_dias('{fonte}');
+            END IF;
+            CREATE INDEX IF NOT EXISTS idx_{tabela}_created_at ON {tabela} (created_at);
+        END
+        $$
+    ''')
 
-META_VENDAS_MENSAL = 200000
 
+def _criar_estrutura_rollups_dashboard(cursor):
+    """Tabelas de rollup diário, pendências, estado e triggers de marcação (idempotente)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_rollup_pendencias (
+            fonte VARCHAR(30) NOT NULL,
+            dia DATE NOT NULL,
+            marcado_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT clock_timestamp(),
+            PRIMARY KEY (fonte, dia)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_rollup_estado (
+            fonte VARCHAR(30) PRIMARY KEY,
+            inicializado_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            atualizado_em TIMESTAMP WITH TIME ZONE,
+            dias_recalculados INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
 
-def _parse_valor_sql():
-    """Retorna expressão SQL para converter vr_liquido_pi (texto) em numeric."""
-    return """
-        CASE
-            WHEN NULLIF(REGEXP_REPLACE(vr_liquido_pi, '[^0-9.,]', '', 'g'), '') ~ '^[0-9]+,[0-9]+$'
-                THEN REPLACE(NULLIF(REGEXP_REPLACE(vr_liquido_pi, '[^0-9.,]', '', 'g'), ''), ',', '.')::numeric
-            WHEN NULLIF(REGEXP_REPLACE(vr_liquido_pi, '[^0-9.,]', '', 'g'), '') ~ '^[0-9.]+,[0-9]+$'
-                THEN REPLACE(REPLACE(NULLIF(REGEXP_REPLACE(vr_liquido_pi, '[^0-9.,]', '', 'g'), ''), '.', ''), ',', '.')::numeric
-            WHEN NULLIF(REGEXP_REPLACE(vr_liquido_pi, '[^0-9.,]', '', 'g'), '') ~ '^[0-9.]+$'
-                THEN NULLIF(REGEXP_REPLACE(vr_liquido_pi, '[^0-9.,]', '', 'g'), '')::numeric
-            ELSE 0
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_rollup_pi_dia (
+            dia DATE NOT NULL,
+            mes_ref VARCHAR(50),
+            id_status_pi INTEGER,
+            id_resp_comercial INTEGER,
+            id_cliente INTEGER,
+            total INTEGER NOT NULL,
+            valor_liquido NUMERIC(18,2) NOT NULL DEFAULT 0,
+            valor_bruto NUMERIC(18,2) NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_rollup_campanha_dia (
+            dia DATE NOT NULL,
+            id_status INTEGER,
+            id_plataforma INTEGER,
+            id_cliente INTEGER,
+            total INTEGER NOT NULL,
+            valor_plataforma NUMERIC(18,2) NOT NULL DEFAULT 0,
+            gasto_total NUMERIC(18,2) NOT NULL DEFAULT 0,
+            atingido_total NUMERIC(18,2) NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_rollup_cotacao_dia (
+            dia DATE NOT NULL,
+            status VARCHAR(100) NOT NULL,
+            responsavel_comercial INTEGER,
+            client_id INTEGER,
+            total INTEGER NOT NULL,
+            valor_total NUMERIC(18,2) NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_rollup_lead_dia (
+            dia DATE NOT NULL,
+            id_executivo INTEGER,
+            fonte VARCHAR(255) NOT NULL,
+            total INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_rollup_briefing_dia (
+            dia DATE NOT NULL,
+            id_cliente INTEGER,
+            status VARCHAR(50),
+            enviado_para_centralcomm BOOLEAN NOT NULL DEFAULT FALSE,
+            total INTEGER NOT NULL
+        )
+    ''')
+    # usuarios: ids distintos do dia (texto), para contar únicos em qualquer janela
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_rollup_audiencia_dia (
+            dia DATE NOT NULL,
+            audiencia_id INTEGER,
+            audiencia_nome TEXT,
+            views INTEGER NOT NULL,
+            usuarios TEXT[] NOT NULL DEFAULT '{}'
+        )
+    ''')
+    for tabela in ('pi', 'campanha', 'cotacao', 'lead', 'briefing', 'audiencia'):
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_dashboard_rollup_{tabela}_dia
+            ON dashboard_rollup_{tabela}_dia (dia)
+        ''')
+
+    # ON CONFLICT DO UPDATE (e não DO NOTHING): a linha de pendência fica travada até o
+    # commit de quem escreveu, então o job nunca consome a marca antes de enxergar a escrita
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION dashboard_rollup_marcar_dias() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO dashboard_rollup_pendencias (fonte, dia)
+                SELECT DISTINCT TG_ARGV[0], created_at::date FROM novos WHERE created_at IS NOT NULL
+                ON CONFLICT (fonte, dia) DO UPDATE SET marcado_em = EXCLUDED.marcado_em;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                INSERT INTO dashboard_rollup_pendencias (fonte, dia)
+                SELECT DISTINCT TG_ARGV[0], created_at::date FROM antigos WHERE created_at IS NOT NULL
+                ON CONFLICT (fonte, dia) DO UPDATE SET marcado_em = EXCLUDED.marcado_em;
+            END IF;
+            RETURN NULL;
+        END;
+        $$
+    ''')
+
+    for fonte, tabela in ROLLUP_DASHBOARD_TABELAS.items():
+        _criar_triggers_rollup(cursor, fonte, tabela, f'trg_{tabela}_rollup')
+
+    cursor.execute('''
+        DO $$
+        BEGIN
+            IF to_regclass('cadu_analytics_events') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS idx_cadu_analytics_events_tipo_created
+                ON cadu_analytics_events (event_type, created_at);
+            END IF;
         END
-    """
+        $$
+    ''')
+
+
+# ==================== DASHBOARD GERENCIAL COMERCIAL ====================
+
+META_VENDAS_MENSAL = 200000
 
 
 def obter_kpis_base_total():
@@ -14041,27 +14882,26 @@ def obter_kpis_base_total():
         with conn.cursor() as cursor:
             cursor.execute('''
                 SELECT
-                    COUNT(*) as total_cotacoes,
-                    COALESCE(SUM(valor_total_proposta), 0) as valor_total,
-                    COUNT(*) FILTER (WHERE status = 'Aprovada') as total_aprovadas,
-                    COUNT(*) FILTER (WHERE status = 'Rejeitada') as total_rejeitadas,
+                    COALESCE(SUM(cotacoes), 0) as total_cotacoes,
+                    COALESCE(SUM(valor_total), 0) as valor_total,
+                    COALESCE(SUM(cotacoes) FILTER (WHERE status = 'Aprovada'), 0) as total_aprovadas,
+                    COALESCE(SUM(cotacoes) FILTER (WHERE status = 'Rejeitada'), 0) as total_rejeitadas,
                     ROUND(
-                        COUNT(*) FILTER (WHERE status = 'Aprovada')::DECIMAL /
-                        NULLIF(COUNT(*) FILTER (WHERE status IN ('Aprovada', 'Rejeitada')), 0) * 100, 1
+                        SUM(cotacoes) FILTER (WHERE status = 'Aprovada')::DECIMAL /
+                        NULLIF(SUM(cotacoes) FILTER (WHERE status IN ('Aprovada', 'Rejeitada')), 0) * 100, 1
                     ) as taxa_conversao_geral,
                     ROUND(
-                        COALESCE(SUM(valor_total_proposta) FILTER (WHERE status = 'Aprovada'), 0) /
-                        NULLIF(COUNT(*) FILTER (WHERE status = 'Aprovada'), 0), 2
+                        COALESCE(SUM(valor_total) FILTER (WHERE status = 'Aprovada'), 0) /
+                        NULLIF(SUM(cotacoes) FILTER (WHERE status = 'Aprovada'), 0), 2
                     ) as ticket_medio_geral,
                     ROUND(
-                        AVG(EXTRACT(EPOCH FROM (aprovada_em - created_at)) / 86400)
-                        FILTER (WHERE status = 'Aprovada' AND aprovada_em IS NOT NULL), 1
+                        SUM(dias_ciclo) FILTER (WHERE status = 'Aprovada') /
+                        NULLIF(SUM(com_aprovacao) FILTER (WHERE status = 'Aprovada'), 0), 1
                     ) as ciclo_medio_geral,
-                    MIN(created_at) as primeira_cotacao,
-                    EXTRACT(MONTH FROM AGE(CURRENT_DATE, MIN(created_at)::date)) +
-                    EXTRACT(YEAR FROM AGE(CURRENT_DATE, MIN(created_at)::date)) * 12 as meses_operacao
-                FROM cadu_cotacoes
-                WHERE deleted_at IS NULL
+                    MIN(dia) as primeira_cotacao,
+                    EXTRACT(MONTH FROM AGE(CURRENT_DATE, MIN(dia))) +
+                    EXTRACT(YEAR FROM AGE(CURRENT_DATE, MIN(dia))) * 12 as meses_operacao
+                FROM metricas_semanais_fatos
             ''')
             cot = cursor.fetchone()
 
@@ -14097,40 +14937,36 @@ def obter_funil_comercial(inicio, fim, executivo_id=None):
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            params_cot = [inicio, fim]
             params_pi = [inicio, fim]
-            filtro_exec_cot = ''
             filtro_exec_pi = ''
+            filtro_exec_cot, params_cot = _filtros_fatos_semanais(executivo_id)
 
             if executivo_id:
-                eid = int(executivo_id)
-                filtro_exec_cot = ' AND c.responsavel_comercial = %s'
-                params_cot.append(eid)
-                filtro_exec_pi = ' AND p.id_resp_comercial = %s'
-                params_pi.append(eid)
+                filtro_exec_pi = ' AND r.id_resp_comercial = %s'
+                params_pi.append(int(executivo_id))
 
             leads = obter_leads_count(inicio, fim, executivo_id)
 
             cursor.execute(f'''
                 SELECT
-                    COUNT(*) as total,
-                    COUNT(*) FILTER (WHERE c.status IN ('Enviada', 'Negociação')) as enviadas,
-                    COUNT(*) FILTER (WHERE c.status = 'Aprovada') as aprovadas,
-                    COUNT(*) FILTER (WHERE c.status = 'Rejeitada') as rejeitadas,
-                    COALESCE(SUM(c.valor_total_proposta) FILTER (WHERE c.status = 'Aprovada'), 0) as valor_aprovado,
-                    COALESCE(SUM(c.valor_total_proposta), 0) as valor_total
-                FROM cadu_cotacoes c
-                WHERE c.deleted_at IS NULL
-                  AND c.created_at >= %s AND c.created_at < %s + INTERVAL '1 day'
+                    COALESCE(SUM(f.cotacoes), 0) as total,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status IN ('Enviada', 'Negociação')), 0) as enviadas,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada'), 0) as aprovadas,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Rejeitada'), 0) as rejeitadas,
+                    COALESCE(SUM(f.valor_total) FILTER (WHERE f.status = 'Aprovada'), 0) as valor_aprovado,
+                    COALESCE(SUM(f.valor_total), 0) as valor_total
+                FROM metricas_semanais_fatos f
+                WHERE f.dia >= %s AND f.dia <= %s
                   {filtro_exec_cot}
-            ''', params_cot)
+            ''', [inicio, fim] + params_cot)
             cot = cursor.fetchone()
 
+            # Rollup diário de PIs da home (mesma conversão de vr_liquido_pi do dashboard)
             cursor.execute(f'''
-                SELECT COUNT(*) as total,
-                       COALESCE(SUM({_parse_valor_sql()}), 0) as valor_liquido
-                FROM cadu_pi p
-                WHERE p.created_at >= %s AND p.created_at < %s + INTERVAL '1 day'
+                SELECT COALESCE(SUM(r.total), 0) as total,
+                       COALESCE(SUM(r.valor_liquido), 0) as valor_liquido
+                FROM dashboard_rollup_pi_dia r
+                WHERE r.dia >= %s AND r.dia <= %s
                   {filtro_exec_pi}
             ''', params_pi)
             pis = cursor.fetchone()
@@ -14221,45 +15057,34 @@ def obter_estagios_cotacoes(inicio, fim, executivo_id=None):
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            params = [inicio, fim]
-            filtro = ''
-            if executivo_id:
-                filtro = ' AND responsavel_comercial = %s'
-                params.append(int(executivo_id))
+            filtro, params_filtro = _filtros_fatos_semanais(executivo_id)
 
             cursor.execute(f'''
                 SELECT
-                    COUNT(*) as total_cotacoes,
-                    ROUND(AVG(
-                        EXTRACT(EPOCH FROM (proposta_enviada_em - created_at)) / 86400
-                    ) FILTER (WHERE proposta_enviada_em IS NOT NULL), 1) as tempo_medio_envio,
-                    ROUND(AVG(
-                        EXTRACT(EPOCH FROM (aprovada_em - proposta_enviada_em)) / 86400
-                    ) FILTER (WHERE aprovada_em IS NOT NULL AND proposta_enviada_em IS NOT NULL), 1) as tempo_medio_negociacao,
-                    ROUND(AVG(
-                        EXTRACT(EPOCH FROM (aprovada_em - created_at)) / 86400
-                    ) FILTER (WHERE aprovada_em IS NOT NULL), 1) as tempo_medio_ciclo_total,
-                    COUNT(*) FILTER (WHERE proposta_enviada_em IS NOT NULL) as total_enviadas,
-                    COUNT(*) FILTER (WHERE aprovada_em IS NOT NULL) as total_com_aprovacao,
-                    COUNT(*) FILTER (WHERE status = 'Aprovada') as aprovadas,
-                    COUNT(*) FILTER (WHERE status = 'Rejeitada') as rejeitadas,
+                    COALESCE(SUM(f.cotacoes), 0) as total_cotacoes,
+                    ROUND(SUM(f.dias_ate_envio) / NULLIF(SUM(f.com_envio), 0), 1) as tempo_medio_envio,
+                    ROUND(SUM(f.dias_negociacao) / NULLIF(SUM(f.com_envio_aprovacao), 0), 1) as tempo_medio_negociacao,
+                    ROUND(SUM(f.dias_ciclo) / NULLIF(SUM(f.com_aprovacao), 0), 1) as tempo_medio_ciclo_total,
+                    COALESCE(SUM(f.com_envio), 0) as total_enviadas,
+                    COALESCE(SUM(f.com_aprovacao), 0) as total_com_aprovacao,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada'), 0) as aprovadas,
+                    COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Rejeitada'), 0) as rejeitadas,
                     ROUND(
-                        COUNT(*) FILTER (WHERE status = 'Aprovada')::DECIMAL /
-                        NULLIF(COUNT(*) FILTER (WHERE status IN ('Aprovada', 'Rejeitada')), 0) * 100, 1
+                        SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada')::DECIMAL /
+                        NULLIF(SUM(f.cotacoes) FILTER (WHERE f.status IN ('Aprovada', 'Rejeitada')), 0) * 100, 1
                     ) as taxa_conversao,
                     ROUND(
-                        COUNT(*) FILTER (WHERE proposta_enviada_em IS NOT NULL)::DECIMAL /
-                        NULLIF(COUNT(*), 0) * 100, 1
+                        SUM(f.com_envio)::DECIMAL /
+                        NULLIF(SUM(f.cotacoes), 0) * 100, 1
                     ) as taxa_envio,
                     ROUND(
-                        COUNT(*) FILTER (WHERE status = 'Aprovada')::DECIMAL /
-                        NULLIF(COUNT(*) FILTER (WHERE proposta_enviada_em IS NOT NULL), 0) * 100, 1
+                        COALESCE(SUM(f.cotacoes) FILTER (WHERE f.status = 'Aprovada'), 0)::DECIMAL /
+                        NULLIF(SUM(f.com_envio), 0) * 100, 1
                     ) as taxa_aprovacao_pos_envio
-                FROM cadu_cotacoes
-                WHERE deleted_at IS NULL
-                  AND created_at >= %s AND created_at < %s + INTERVAL '1 day'
+                FROM metricas_semanais_fatos f
+                WHERE f.dia >= %s AND f.dia <= %s
                   {filtro}
-            ''', params)
+            ''', [inicio, fim] + params_filtro)
             result = cursor.fetchone()
             if result:
                 data = dict(result)
@@ -14386,19 +15211,19 @@ def obter_pis_por_executivo_anual(ano):
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            parse_valor = _parse_valor_sql()
-            cursor.execute(f'''
+            # Rollup diário de PIs da home: 365 dias x executivo em vez de varrer cadu_pi
+            cursor.execute('''
                 SELECT
                     COALESCE(rc.nome_completo, 'Sem Executivo') as executivo,
-                    EXTRACT(MONTH FROM p.created_at)::int as mes,
-                    COUNT(*) as total_pis,
-                    COALESCE(SUM({parse_valor}), 0) as valor_liquido
-                FROM cadu_pi p
-                LEFT JOIN tbl_contato_cliente rc ON p.id_resp_comercial = rc.id_contato_cliente
-                WHERE EXTRACT(YEAR FROM p.created_at) = %s
-                GROUP BY COALESCE(rc.nome_completo, 'Sem Executivo'), EXTRACT(MONTH FROM p.created_at)
+                    EXTRACT(MONTH FROM r.dia)::int as mes,
+                    SUM(r.total) as total_pis,
+                    COALESCE(SUM(r.valor_liquido), 0) as valor_liquido
+                FROM dashboard_rollup_pi_dia r
+                LEFT JOIN tbl_contato_cliente rc ON r.id_resp_comercial = rc.id_contato_cliente
+                WHERE r.dia >= make_date(%s, 1, 1) AND r.dia < make_date(%s + 1, 1, 1)
+                GROUP BY COALESCE(rc.nome_completo, 'Sem Executivo'), EXTRACT(MONTH FROM r.dia)
                 ORDER BY executivo, mes
-            ''', (ano,))
+            ''', (ano, ano))
             rows = cursor.fetchall()
 
             executivos = {}
@@ -15195,12 +16020,10 @@ def normalizar_telefone_whatsapp(telefone):
     return digits
 
 
-def variantes_telefone_whatsapp(telefone):
-    normalizado = normalizar_telefone_whatsapp(telefone)
-    variantes = {normalizado}
-    if normalizado.startswith('55') and len(normalizado) > 11:
-        variantes.add(normalizado[2:])
-    return [v for v in variantes if v]
+def _sql_telefone_e164(coluna):
+    """Mesma regra de normalizar_telefone_whatsapp em SQL (colunas *_e164)."""
+    digitos = f"ltrim(regexp_replace(COALESCE({coluna}, ''), '\\D', '', 'g'), '0')"
+    return f"CASE WHEN length({digitos}) IN (10, 11) THEN '55' || {digitos} ELSE {digitos} END"
 
 
 def obter_wasender_credencial_responsavel(responsavel_id):
@@ -15259,8 +16082,8 @@ def atualizar_wasender_contato(contato_id, api_key=None, session_id=None, ativo=
 
 def localizar_contato_por_telefone_wasender(telefone):
     """Localiza contato cujo telefone principal/secundário corresponda ao inbound."""
-    variantes = variantes_telefone_whatsapp(telefone)
-    if not variantes:
+    telefone_e164 = normalizar_telefone_whatsapp(telefone)
+    if not telefone_e164:
         return None
     conn = get_db()
     with conn.cursor() as cursor:
@@ -15272,15 +16095,10 @@ def localizar_contato_por_telefone_wasender(telefone):
             FROM tbl_contato_cliente c
             LEFT JOIN tbl_cliente cli ON cli.id_cliente = c.pk_id_tbl_cliente
             WHERE c.status = TRUE
-              AND (
-                    regexp_replace(COALESCE(c.telefone, ''), '\\D', '', 'g') = ANY(%s::text[])
-                 OR regexp_replace(COALESCE(c.telefone_secundario, ''), '\\D', '', 'g') = ANY(%s::text[])
-                 OR CONCAT('55', regexp_replace(COALESCE(c.telefone, ''), '\\D', '', 'g')) = ANY(%s::text[])
-                 OR CONCAT('55', regexp_replace(COALESCE(c.telefone_secundario, ''), '\\D', '', 'g')) = ANY(%s::text[])
-              )
+              AND (c.telefone_e164 = %s OR c.telefone_secundario_e164 = %s)
             ORDER BY c.id_contato_cliente
             LIMIT 1
-        ''', (variantes, variantes, variantes, variantes))
+        ''', (telefone_e164, telefone_e164))
         return cursor.fetchone()
 
 
@@ -15335,10 +16153,10 @@ def listar_sales_comunicacao_conversas(cliente_id, contato_id=None, telefone=Non
             filtro_contato = ' AND cv.contato_id = %s'
             params.append(contato_id)
         if telefone:
-            variantes_tel = variantes_telefone_whatsapp(telefone)
-            if variantes_tel:
-                filtro_telefone = " AND regexp_replace(COALESCE(cv.telefone, ''), '\\\\D', '', 'g') = ANY(%s::text[])"
-                params.append(variantes_tel)
+            telefone_e164 = normalizar_telefone_whatsapp(telefone)
+            if telefone_e164:
+                filtro_telefone = ' AND cv.telefone_e164 = %s'
+                params.append(telefone_e164)
         cursor.execute(f'''
             SELECT
                 cv.id, cv.cliente_id, cv.contato_id, cv.telefone, cv.canal, cv.status,
@@ -15363,22 +16181,22 @@ def criar_sales_comunicacao_conversa(cliente_id, contato_id=None, telefone=None,
     """Cria uma conversa comercial ou retorna conversa existente para contato/telefone."""
     if telefone:
         telefone = normalizar_telefone_whatsapp(telefone) or str(telefone).strip()
-    variantes_tel = variantes_telefone_whatsapp(telefone) if telefone else []
+    telefone_e164 = normalizar_telefone_whatsapp(telefone) if telefone else ''
     conn = get_db()
     try:
         with conn.cursor() as cursor:
-            if variantes_tel:
+            if telefone_e164:
                 cursor.execute('''
                     SELECT id
                     FROM sales_comunicacao_conversas
-                    WHERE cliente_id = %s
+                    WHERE telefone_e164 = %s
+                      AND cliente_id = %s
                       AND COALESCE(contato_id, 0) = COALESCE(%s, 0)
-                      AND regexp_replace(COALESCE(telefone, ''), '\\D', '', 'g') = ANY(%s::text[])
                       AND canal = %s
                       AND COALESCE(responsavel_id, 0) = COALESCE(%s, 0)
                     ORDER BY created_at DESC
                     LIMIT 1
-                ''', (cliente_id, contato_id, variantes_tel, canal, responsavel_id))
+                ''', (telefone_e164, cliente_id, contato_id, canal, responsavel_id))
             else:
                 cursor.execute('''
                     SELECT id
@@ -15465,8 +16283,12 @@ def criar_sales_comunicacao_mensagem(conversa_id, texto, direcao='outbound', sta
         raise
 
 
-def atualizar_sales_comunicacao_mensagem_provider(mensagem_id=None, provider_message_id=None, provider_status=None, provider_payload=None):
-    """Atualiza metadados/status do provedor de uma mensagem."""
+def atualizar_sales_comunicacao_mensagem_provider(mensagem_id=None, provider_message_id=None, provider_status=None, provider_payload=None, status=None):
+    """Atualiza metadados/status do provedor de uma mensagem.
+
+    Com `mensagem_id`, `provider_message_id` é gravado na mensagem (envio pela fila);
+    sem ele, localiza a mensagem pelo `provider_message_id` (webhook).
+    """
     if not mensagem_id and not provider_message_id:
         return False
     conn = get_db()
@@ -15477,10 +16299,12 @@ def atualizar_sales_comunicacao_mensagem_provider(mensagem_id=None, provider_mes
                 cursor.execute('''
                     UPDATE sales_comunicacao_mensagens
                     SET provider_status = COALESCE(%s, provider_status),
-                        provider_payload = COALESCE(%s, provider_payload)
+                        provider_payload = COALESCE(%s, provider_payload),
+                        provider_message_id = COALESCE(%s, provider_message_id),
+                        status = COALESCE(%s, status)
                     WHERE id = %s
                     RETURNING id
-                ''', (provider_status, payload_json, mensagem_id))
+                ''', (provider_status, payload_json, provider_message_id, status, mensagem_id))
             else:
                 cursor.execute('''
                     UPDATE sales_comunicacao_mensagens
@@ -16128,79 +16952,142 @@ def obter_leads_engajamento(id_executivo=None):
         raise
 
 
-def obter_leads_analise(data_inicio=None, data_fim=None, id_executivo=None):
-    """Dados consolidados para a página de análise de leads."""
-    conn = get_db()
-    try:
-        base_params = []
-        base_clauses = []
-        if data_inicio:
-            base_clauses.append('l.created_at >= %s')
-            base_params.append(data_inicio)
-        if data_fim:
-            base_clauses.append('l.created_at < %s::date + 1')
-            base_params.append(data_fim)
-        if id_executivo:
-            base_clauses.append('l.id_executivo = %s')
-            base_params.append(id_executivo)
+# Cache de obter_leads_analise por (período, executivo). A versão é a sequence
+# leads_analise_versao_seq: triggers DEFERRABLE INITIALLY DEFERRED em cadu_leads e
+# cadu_lead_atividades chamam nextval no commit da escrita; entrada com versão diferente
+# é descartada. nextval não trava linha nem espera outra transação, então as escritas
+# de leads/atividades não se serializam por causa do cache. Vale entre workers: cada
+# processo tem o próprio cache, mas todos leem a mesma sequence. O TTL cobre a janela
+# entre o nextval e o commit ficar visível.
+LEADS_ANALISE_CACHE_TTL = int(os.getenv('LEADS_ANALISE_CACHE_TTL', '600'))
+_LEADS_ANALISE_CACHE_MAX = 64
+_leads_analise_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_leads_analise_cache_lock = threading.Lock()
+
 
-        where_sql = f"WHERE {' AND '.join(base_clauses)}" if base_clauses else ''
+def _criar_estrutura_leads_analise(cursor):
+    """Versão de invalidação do cache da análise de leads e índices das atividades (idempotente)."""
+    cursor.execute('CREATE SEQUENCE IF NOT EXISTS leads_analise_versao_seq')
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION leads_analise_invalidar() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM nextval('leads_analise_versao_seq');
+            RETURN NULL;
+        END;
+        $$
+    ''')
+    for tabela in ('cadu_leads', 'cadu_lead_atividades'):
+        cursor.execute(f'''
+            DO $$
+            BEGIN
+                IF to_regclass('{tabela}') IS NULL THEN
+                    RETURN;
+                END IF;
+                -- Trigger por statement da versão anterior (UPDATE numa linha única de versão)
+                IF EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = '{tabela}'::regclass AND tgname = 'trg_{tabela}_analise_cache') THEN
+                    DROP TRIGGER trg_{tabela}_analise_cache ON {tabela};
+                END IF;
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = '{tabela}'::regclass AND tgname = 'trg_{tabela}_analise_versao') THEN
+                    CREATE CONSTRAINT TRIGGER trg_{tabela}_analise_versao AFTER INSERT OR UPDATE OR DELETE ON {tabela}
+                        DEFERRABLE INITIALLY DEFERRED
+                        FOR EACH ROW EXECUTE FUNCTION leads_analise_invalidar();
+                END IF;
+            END
+            $$
+        ''')
+    cursor.execute('DROP TABLE IF EXISTS leads_analise_versao')
+    cursor.execute('''
+        DO $$
+        BEGIN
+            IF to_regclass('cadu_lead_atividades') IS NOT NULL THEN
+                CREATE INDEX IF NOT EXISTS idx_cadu_lead_atividades_lead ON cadu_lead_atividades (id_lead);
+                CREATE INDEX IF NOT EXISTS idx_cadu_lead_atividades_tipo_created
+                ON cadu_lead_atividades (tipo, created_at);
+            END IF;
+        END
+        $$
+    ''')
 
-        result = {}
 
+def _versao_leads_analise(conn):
+    """Versão atual dos dados de leads (None sem a sequence: a análise roda sem cache)."""
+    try:
         with conn.cursor() as cursor:
-            # KPIs gerais
-            cursor.execute(f'''
+            cursor.execute('SELECT last_value FROM leads_analise_versao_seq')
+            row = cursor.fetchone()
+            return row['last_value'] if row else None
+    except psycopg.Error:
+        conn.rollback()
+        return None
+
+
+def _consultar_leads_analise(conn, data_inicio, data_fim, id_executivo):
+    """Todos os blocos da análise numa consulta: o conjunto filtrado de leads é
+    materializado uma vez (CTE base) e cada bloco sai dele."""
+    base_params = []
+    base_clauses = []
+    if data_inicio:
+        base_clauses.append('l.created_at >= %s')
+        base_params.append(data_inicio)
+    if data_fim:
+        base_clauses.append('l.created_at < %s::date + 1')
+        base_params.append(data_fim)
+    if id_executivo:
+        base_clauses.append('l.id_executivo = %s')
+        base_params.append(id_executivo)
+
+    where_sql = f"WHERE {' AND '.join(base_clauses)}" if base_clauses else ''
+
+    # Tempo por status filtra as atividades (não os leads) pelo período
+    status_params = list(base_params)
+    status_clauses = []
+    if data_inicio:
+        status_clauses.append('a.created_at >= %s')
+    if data_fim:
+        status_clauses.append('a.created_at < %s::date + 1')
+    if id_executivo:
+        status_clauses.append('l.id_executivo = %s')
+    status_clauses.append("a.tipo = 'status_change'")
+    status_where = f"WHERE {' AND '.join(status_clauses)}"
+
+    with conn.cursor() as cursor:
+        cursor.execute(f'''
+            WITH base AS MATERIALIZED (
+                SELECT
+                    l.id, l.id_executivo, l.status, l.valor_fechado, l.created_at, l.updated_at,
+                    l.fechado_em, l.contatado_em, l.empresa, l.nome, l.email,
+                    l.motivo_desqualificacao, l.fonte, l.valor_estimado
+                FROM cadu_leads l
+                {where_sql}
+            ),
+            kpis AS (
                 SELECT
                     COUNT(*) as total_leads,
-                    SUM(CASE WHEN l.status = 'fechado_ganho' THEN 1 ELSE 0 END) as convertidos,
-                    SUM(CASE WHEN l.status = 'nao_qualificado' THEN 1 ELSE 0 END) as desqualificados,
-                    SUM(CASE WHEN l.status = 'fechado_perdido' THEN 1 ELSE 0 END) as perdidos,
+                    SUM(CASE WHEN status = 'fechado_ganho' THEN 1 ELSE 0 END) as convertidos,
+                    SUM(CASE WHEN status = 'nao_qualificado' THEN 1 ELSE 0 END) as desqualificados,
+                    SUM(CASE WHEN status = 'fechado_perdido' THEN 1 ELSE 0 END) as perdidos,
                     ROUND(
                         CASE WHEN COUNT(*) > 0
-                            THEN SUM(CASE WHEN l.status = 'fechado_ganho' THEN 1 ELSE 0 END) * 100.0 / COUNT(*)
+                            THEN SUM(CASE WHEN status = 'fechado_ganho' THEN 1 ELSE 0 END) * 100.0 / COUNT(*)
                             ELSE 0
                         END, 1
                     ) as taxa_conversao,
-                    COALESCE(SUM(l.valor_fechado), 0) as receita_total
-                FROM cadu_leads l
-                {where_sql}
-            ''', base_params)
-            row = cursor.fetchone()
-            result['kpis'] = dict(row) if row else {}
-
-            # Tempo médio de conversão (inbox -> fechado_ganho)
-            conv_params = list(base_params)
-            conv_clauses = list(base_clauses)
-            conv_clauses.append("l.status = 'fechado_ganho'")
-            conv_clauses.append("l.fechado_em IS NOT NULL")
-            conv_where = f"WHERE {' AND '.join(conv_clauses)}" if conv_clauses else ''
-
-            cursor.execute(f'''
+                    COALESCE(SUM(valor_fechado), 0) as receita_total
+                FROM base
+            ),
+            -- Tempo médio de conversão (inbox -> fechado_ganho)
+            tempo_conversao AS (
                 SELECT
-                    ROUND(AVG(EXTRACT(EPOCH FROM (l.fechado_em - l.created_at)) / 86400), 1) as avg_dias_conversao,
-                    MIN(EXTRACT(EPOCH FROM (l.fechado_em - l.created_at)) / 86400) as min_dias,
-                    MAX(EXTRACT(EPOCH FROM (l.fechado_em - l.created_at)) / 86400) as max_dias,
+                    ROUND(AVG(EXTRACT(EPOCH FROM (fechado_em - created_at)) / 86400), 1) as avg_dias_conversao,
+                    MIN(EXTRACT(EPOCH FROM (fechado_em - created_at)) / 86400) as min_dias,
+                    MAX(EXTRACT(EPOCH FROM (fechado_em - created_at)) / 86400) as max_dias,
                     COUNT(*) as total_convertidos
-                FROM cadu_leads l
-                {conv_where}
-            ''', conv_params)
-            row = cursor.fetchone()
-            result['tempo_conversao'] = dict(row) if row else {}
-
-            # Tempo médio por status (baseado em atividades de status_change)
-            status_params = list(base_params)
-            status_clauses = []
-            if data_inicio:
-                status_clauses.append('a.created_at >= %s')
-            if data_fim:
-                status_clauses.append('a.created_at < %s::date + 1')
-            if id_executivo:
-                status_clauses.append('l.id_executivo = %s')
-            status_clauses.append("a.tipo = 'status_change'")
-            status_where = f"WHERE {' AND '.join(status_clauses)}" if status_clauses else ''
-
-            cursor.execute(f'''
+                FROM base
+                WHERE status = 'fechado_ganho' AND fechado_em IS NOT NULL
+            ),
+            -- Tempo médio por status (baseado em atividades de status_change)
+            tempo_por_status AS (
                 SELECT
                     a.descricao as status_destino,
                     COUNT(*) as transicoes,
@@ -16209,54 +17096,11 @@ def obter_leads_analise(data_inicio=None, data_fim=None, id_executivo=None):
                 JOIN cadu_leads l ON l.id = a.id_lead
                 {status_where}
                 GROUP BY a.descricao
-                ORDER BY avg_dias_desde_criacao
-            ''', status_params)
-            result['tempo_por_status'] = [dict(r) for r in cursor.fetchall()]
-
-            # Produtividade por executivo
-            cursor.execute(f'''
-                SELECT
-                    l.id_executivo,
-                    COUNT(*) as total_leads,
-                    SUM(CASE WHEN l.status = 'fechado_ganho' THEN 1 ELSE 0 END) as convertidos,
-                    SUM(CASE WHEN l.status = 'nao_qualificado' THEN 1 ELSE 0 END) as desqualificados,
-                    ROUND(
-                        CASE WHEN COUNT(*) > 0
-                            THEN SUM(CASE WHEN l.status = 'fechado_ganho' THEN 1 ELSE 0 END) * 100.0 / COUNT(*)
-                            ELSE 0
-                        END, 1
-                    ) as taxa_conversao,
-                    COALESCE(SUM(l.valor_fechado), 0) as receita,
-                    ROUND(AVG(
-                        CASE WHEN l.status = 'fechado_ganho' AND l.fechado_em IS NOT NULL
-                            THEN EXTRACT(EPOCH FROM (l.fechado_em - l.created_at)) / 86400
-                            ELSE NULL
-                        END
-                    ), 1) as avg_dias_conversao,
-                    ROUND(AVG(
-                        CASE WHEN l.contatado_em IS NOT NULL
-                            THEN EXTRACT(EPOCH FROM (l.contatado_em - l.created_at)) / 3600
-                            ELSE NULL
-                        END
-                    ), 1) as avg_horas_primeiro_contato,
-                    (SELECT COUNT(*) FROM cadu_lead_atividades a2
-                     WHERE a2.id_lead = ANY(ARRAY_AGG(l.id))
-                    ) as total_atividades
-                FROM cadu_leads l
-                {where_sql}
-                GROUP BY l.id_executivo
-                ORDER BY convertidos DESC, total_leads DESC
-            ''', base_params)
-            result['produtividade_executivo'] = [dict(r) for r in cursor.fetchall()]
-
-            # Atividades por executivo (query separada para evitar subquery correlacionada)
-            ativ_params = list(base_params)
-            ativ_clauses = list(base_clauses)
-            ativ_where = f"WHERE {' AND '.join(ativ_clauses)}" if ativ_clauses else ''
-
-            cursor.execute(f'''
+            ),
+            -- Atividades dos leads do período, por executivo (base da produtividade também)
+            atividades_executivo AS (
                 SELECT
-                    l.id_executivo,
+                    b.id_executivo,
                     COUNT(a.id) as total_atividades,
                     SUM(CASE WHEN a.tipo = 'ligacao' THEN 1 ELSE 0 END) as ligacoes,
                     SUM(CASE WHEN a.tipo = 'whatsapp' THEN 1 ELSE 0 END) as whatsapp,
@@ -16264,39 +17108,107 @@ def obter_leads_analise(data_inicio=None, data_fim=None, id_executivo=None):
                     SUM(CASE WHEN a.tipo = 'reuniao' THEN 1 ELSE 0 END) as reunioes,
                     SUM(CASE WHEN a.tipo = 'tentativa_contato' THEN 1 ELSE 0 END) as tentativas_contato,
                     COUNT(DISTINCT a.id_lead) as leads_trabalhados
-                FROM cadu_leads l
-                LEFT JOIN cadu_lead_atividades a ON a.id_lead = l.id
-                {ativ_where}
-                GROUP BY l.id_executivo
-                ORDER BY total_atividades DESC
-            ''', ativ_params)
-            result['atividades_executivo'] = [dict(r) for r in cursor.fetchall()]
-
-            # Leads desqualificados no período
-            desq_params = list(base_params)
-            desq_clauses = list(base_clauses)
-            desq_clauses.append("l.status = 'nao_qualificado'")
-            desq_where = f"WHERE {' AND '.join(desq_clauses)}"
-
-            cursor.execute(f'''
+                FROM base b
+                LEFT JOIN cadu_lead_atividades a ON a.id_lead = b.id
+                GROUP BY b.id_executivo
+            ),
+            produtividade_executivo AS (
                 SELECT
-                    l.id,
-                    l.empresa,
-                    l.nome,
-                    l.email,
-                    l.motivo_desqualificacao,
-                    l.id_executivo,
-                    l.created_at,
-                    l.updated_at,
-                    l.fonte,
-                    l.valor_estimado
-                FROM cadu_leads l
-                {desq_where}
-                ORDER BY l.updated_at DESC
+                    p.*,
+                    COALESCE(ae.total_atividades, 0) as total_atividades
+                FROM (
+                    SELECT
+                        id_executivo,
+                        COUNT(*) as total_leads,
+                        SUM(CASE WHEN status = 'fechado_ganho' THEN 1 ELSE 0 END) as convertidos,
+                        SUM(CASE WHEN status = 'nao_qualificado' THEN 1 ELSE 0 END) as desqualificados,
+                        ROUND(
+                            CASE WHEN COUNT(*) > 0
+                                THEN SUM(CASE WHEN status = 'fechado_ganho' THEN 1 ELSE 0 END) * 100.0 / COUNT(*)
+                                ELSE 0
+                            END, 1
+                        ) as taxa_conversao,
+                        COALESCE(SUM(valor_fechado), 0) as receita,
+                        ROUND(AVG(
+                            CASE WHEN status = 'fechado_ganho' AND fechado_em IS NOT NULL
+                                THEN EXTRACT(EPOCH FROM (fechado_em - created_at)) / 86400
+                                ELSE NULL
+                            END
+                        ), 1) as avg_dias_conversao,
+                        ROUND(AVG(
+                            CASE WHEN contatado_em IS NOT NULL
+                                THEN EXTRACT(EPOCH FROM (contatado_em - created_at)) / 3600
+                                ELSE NULL
+                            END
+                        ), 1) as avg_horas_primeiro_contato
+                    FROM base
+                    GROUP BY id_executivo
+                ) p
+                LEFT JOIN atividades_executivo ae ON ae.id_executivo IS NOT DISTINCT FROM p.id_executivo
+            ),
+            -- Leads desqualificados no período
+            desqualificados AS (
+                SELECT
+                    id, empresa, nome, email, motivo_desqualificacao, id_executivo,
+                    created_at, updated_at, fonte, valor_estimado
+                FROM base
+                WHERE status = 'nao_qualificado'
+                ORDER BY updated_at DESC
                 LIMIT 200
-            ''', desq_params)
-            result['desqualificados'] = [dict(r) for r in cursor.fetchall()]
+            )
+            SELECT
+                (SELECT row_to_json(k) FROM kpis k) as kpis,
+                (SELECT row_to_json(t) FROM tempo_conversao t) as tempo_conversao,
+                (SELECT COALESCE(json_agg(t ORDER BY t.avg_dias_desde_criacao), '[]')
+                 FROM tempo_por_status t) as tempo_por_status,
+                (SELECT COALESCE(json_agg(p ORDER BY p.convertidos DESC, p.total_leads DESC), '[]')
+                 FROM produtividade_executivo p) as produtividade_executivo,
+                (SELECT COALESCE(json_agg(a ORDER BY a.total_atividades DESC), '[]')
+                 FROM atividades_executivo a) as atividades_executivo,
+                (SELECT COALESCE(json_agg(d ORDER BY d.updated_at DESC), '[]')
+                 FROM desqualificados d) as desqualificados
+        ''', base_params + status_params)
+        row = cursor.fetchone()
+
+    result = {
+        'kpis': row['kpis'] or {},
+        'tempo_conversao': row['tempo_conversao'] or {},
+        'tempo_por_status': row['tempo_por_status'],
+        'produtividade_executivo': row['produtividade_executivo'],
+        'atividades_executivo': row['atividades_executivo'],
+        'desqualificados': row['desqualificados'],
+    }
+    # O JSON traz datas como texto; quem consome espera datetime, como nas demais consultas
+    for lead in result['desqualificados']:
+        for campo in ('created_at', 'updated_at'):
+            if lead.get(campo):
+                lead[campo] = datetime.fromisoformat(lead[campo])
+    return result
+
+
+def obter_leads_analise(data_inicio=None, data_fim=None, id_executivo=None):
+    """Dados consolidados para a página de análise de leads (com cache por período/executivo)."""
+    conn = get_db()
+    try:
+        chave = (str(data_inicio or ''), str(data_fim or ''), int(id_executivo or 0))
+        versao = _versao_leads_analise(conn)
+        agora = time.monotonic()
+
+        if versao is not None:
+            with _leads_analise_cache_lock:
+                entrada = _leads_analise_cache.get(chave)
+                if entrada and entrada[0] == versao and agora - entrada[1] < LEADS_ANALISE_CACHE_TTL:
+                    _leads_analise_cache.move_to_end(chave)
+                    return copy.deepcopy(entrada[2])
+
+        result = _consultar_leads_analise(conn, data_inicio, data_fim, id_executivo)
 
+        if versao is not None:
+            with _leads_analise_cache_lock:
+                _leads_analise_cache[chave] = (versao, agora, copy.deepcopy(result))
+                _leads_analise_cache.move_to_end(chave)
+                while len(_leads_analise_cache) > _LEADS_ANALISE_CACHE_MAX:
+                    _leads_analise_cache.popitem(last=False)
         return result
     except Exception as e:
         current_app.logger.error(f"Erro obter_leads_analise: {e}")
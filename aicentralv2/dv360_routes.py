@@ -21,11 +21,13 @@ from psycopg.errors import UniqueViolation
 
 from aicentralv2 import db
 from aicentralv2.campanha_pi_metrics import (
-    anexar_preco_metrica_campanha,
+    anexar_preco_metrica_campanhas,
+    investimento_para_preco_campanha,
     meses_ref_pi_seguros,
     parse_brl_float,
     parse_volume_float,
     sigla_metrica_preco,
+    volume_para_preco_campanha,
 )
 from aicentralv2.auth import get_current_user, login_required, login_required_api
 from aicentralv2.services.dv360_client import DV360_ENDPOINTS, DV360API, get_dv360_client
@@ -2183,11 +2185,11 @@ def campanha_pi_id_api():
 
 
 def _serialize_campanha_acompanhamento_dv360_row(
-    c: dict[str, Any],
+    er: dict[str, Any],
     agora: datetime,
     dv360_mappings: Optional[List[Dict[str, Any]]] = None,
 ) -> dict[str, Any]:
-    er = anexar_preco_metrica_campanha(c)
+    """er: campanha já com as métricas de anexar_preco_metrica_campanhas."""
     obj_val = parse_volume_float(er.get("obj_contratados"))
     ating_val = parse_volume_float(er.get("totalizador_atingido"))
     pct_obj = int(round((ating_val / obj_val) * 100)) if obj_val > 0 else 0
@@ -2327,9 +2329,9 @@ def campanhas_pi_acompanhamento_dv360():
     agora = datetime.now()
     data = [
         _serialize_campanha_acompanhamento_dv360_row(
-            dict(r), agora, grouped.get(int(r["id_campanha"]), [])
+            er, agora, grouped.get(int(er["id_campanha"]), [])
         )
-        for r in rows_raw
+        for er in anexar_preco_metrica_campanhas(rows_raw, agora.date())
     ]
     out: dict[str, Any] = {
         "success": True,
@@ -2374,38 +2376,55 @@ def testes_dv():
 
 def _lista_old_kpi_filtros_from_request():
     mes_ref_comp = (request.args.get('mes_ref_comp') or '').strip()
+    busca = (request.args.get('busca') or '').strip()
     filtros = {}
     if mes_ref_comp:
         filtros['mes_ref_comp'] = mes_ref_comp
+    if busca:
+        filtros['busca'] = busca
     return filtros
 
 
-def _lista_old_kpi_carregar(filtros):
-    campanhas_raw = db.obter_campanhas_pi_lista_old_kpi(filtros or None)
-    campanhas = [anexar_preco_metrica_campanha(c) for c in (campanhas_raw or [])]
-
+def _lista_old_kpi_somar(campanhas):
+    """Rodapé da lista: mesmos volume/investimento KPI de anexar_preco_metrica_campanhas."""
     total_meta = 0.0
     total_atingido = 0.0
     total_volume_kpi = 0.0
     total_investimento_kpi = 0.0
+    total_campanhas = 0
     for row in campanhas:
+        total_campanhas += 1
         total_meta += parse_volume_float(row.get('obj_contratados'))
         total_atingido += parse_volume_float(row.get('totalizador_atingido'))
-        vol_kpi = row.get('volume_kpi')
+        vol_kpi = volume_para_preco_campanha(row.get('obj_contratados'), row.get('totalizador_atingido'))
         if vol_kpi is not None and float(vol_kpi) > 0:
             total_volume_kpi += float(vol_kpi)
-        inv_kpi = row.get('investimento_kpi_brl')
+        inv_kpi = investimento_para_preco_campanha(row)
         if inv_kpi is not None and float(inv_kpi) > 0:
             total_investimento_kpi += float(inv_kpi)
 
-    footer_totais = {
-        'total_campanhas': len(campanhas),
+    return {
+        'total_campanhas': total_campanhas,
         'total_meta': total_meta,
         'total_atingido': total_atingido,
         'total_volume_kpi': total_volume_kpi,
         'total_investimento_kpi': total_investimento_kpi,
     }
-    return campanhas, footer_totais
+
+
+def _lista_old_kpi_carregar(filtros):
+    """Lista inteira ordenada por PI (exportação) e o rodapé."""
+    campanhas_raw = db.obter_campanhas_pi_lista_old_kpi(filtros or None)
+    campanhas = anexar_preco_metrica_campanhas(campanhas_raw)
+    return campanhas, _lista_old_kpi_somar(campanhas)
+
+
+def _lista_old_kpi_pagina(filtros, apos=None):
+    """Uma página keyset da lista OLD KPI: (campanhas, proximo_cursor)."""
+    limite = db.LISTAGENS_PAGINA
+    campanhas_raw = db.obter_campanhas_pi_lista_old_kpi(filtros or None, limite=limite, apos=apos) or []
+    campanhas = anexar_preco_metrica_campanhas(campanhas_raw)
+    return campanhas, db.proximo_cursor(campanhas_raw, limite, 'created_at', 'id_campanha')
 
 
 def _lista_old_kpi_fmt_num_br(value, decimals=2):
@@ -2523,10 +2542,17 @@ def _lista_old_kpi_export_rows(campanhas, footer_totais):
 @parametros_bp.route("/listaOLDKPI", methods=["GET"])
 @login_required
 def lista_old_kpi():
-    """Lista legada de campanhas PI ordenada por PI (formato, praça, KPI, meta, objetivo)."""
+    """Lista legada de campanhas PI (formato, praça, KPI, meta, objetivo), paginada por keyset."""
     try:
         filtros = _lista_old_kpi_filtros_from_request()
-        campanhas, footer_totais = _lista_old_kpi_carregar(filtros)
+        campanhas, proximo_cursor = _lista_old_kpi_pagina(filtros)
+        # Rodapé de toda a lista: a própria página quando ela é a única, senão em cache
+        if proximo_cursor:
+            footer_totais = db.contagem_em_cache(
+                'old_kpi', filtros,
+                lambda: _lista_old_kpi_somar(db.obter_campanhas_pi_lista_old_kpi_valores(filtros or None)))
+        else:
+            footer_totais = _lista_old_kpi_somar(campanhas)
 
         try:
             meses_ref = db.obter_meses_ref_campanha_pi()
@@ -2540,6 +2566,7 @@ def lista_old_kpi():
             filtros=filtros,
             meses_ref=meses_ref or [],
             footer_totais=footer_totais,
+            proximo_cursor=proximo_cursor,
         )
     except Exception as e:
         current_app.logger.error("Erro listaOLDKPI: %s", e, exc_info=True)
@@ -2547,6 +2574,22 @@ def lista_old_kpi():
         return redirect(url_for('parametros.lista_old_kpi'))
 
 
+@parametros_bp.route("/listaOLDKPI/linhas", methods=["GET"])
+@login_required
+def lista_old_kpi_linhas():
+    """Página seguinte da lista OLD KPI (HTML das linhas + cursor)."""
+    try:
+        filtros = _lista_old_kpi_filtros_from_request()
+        campanhas, proximo_cursor = _lista_old_kpi_pagina(filtros, apos=request.args.get('cursor'))
+        html = render_template("partials/lista_old_kpi_linhas.html", campanhas=campanhas)
+        return jsonify({'success': True, 'html': html, 'proximo_cursor': proximo_cursor})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error("Erro listaOLDKPI (página seguinte): %s", e, exc_info=True)
+        return jsonify({'success': False, 'message': 'Erro ao carregar campanhas.'}), 500
+
+
 @parametros_bp.route("/listaOLDKPI/export", methods=["GET"])
 @login_required
 def lista_old_kpi_export():
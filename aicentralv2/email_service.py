@@ -14,14 +14,15 @@ from aicentralv2.services.brevo_service import (
     enviar_email_reset_senha,
     enviar_email_senha_alterada
 )
+from aicentralv2.services.email_outbox import enfileirar_emails
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def send_email(subject, recipients, text_body=None, html_body=None, sender=None):
+def send_email(subject, recipients, text_body=None, html_body=None, sender=None, dedup_key=None, conn=None):
     """
-    Envia email via Brevo API
+    Enfileira email no outbox (email_outbox); o worker entrega via Brevo
     
     Args:
         subject: Assunto do email
@@ -29,9 +30,12 @@ def send_email(subject, recipients, text_body=None, html_body=None, sender=None)
         text_body: Corpo em texto plano (opcional)
         html_body: Corpo em HTML (opcional)
         sender: Remetente (opcional, usa padrão da config)
+        dedup_key: Chave de deduplicação (opcional)
+        conn: Conexão da alteração de negócio; o email entra na mesma transação e
+              só é enviado após o commit do chamador (opcional)
     
     Returns:
-        bool: True se enviado com sucesso
+        bool: True se registrado para envio
     """
     app = current_app._get_current_object()
     
@@ -52,28 +56,25 @@ def send_email(subject, recipients, text_body=None, html_body=None, sender=None)
         print("="*60 + "\n")
         return True
     
-    # Enviar via Brevo
+    # Gravar no outbox (entrega em lote pelo worker)
     try:
-        service = get_brevo_service()
-        
-        for recipient in recipients:
-            result = service.enviar_email(
-                to_email=recipient,
-                to_name=recipient.split('@')[0],  # Nome básico do email
-                subject=subject,
-                html_content=html_body or f"<p>{text_body}</p>",
-                text_content=text_body
-            )
-            
-            if not result.get('success'):
-                logger.error(f"Falha ao enviar email para {recipient}: {result.get('error')}")
-                return False
-        
-        logger.info(f"Email enviado com sucesso para {recipients}")
+        if isinstance(sender, str):
+            sender = {"name": app.config.get('BREVO_SENDER_NAME', 'Cadu'), "email": sender}
+        enfileirar_emails(
+            recipients,
+            subject=subject,
+            html_content=html_body or f"<p>{text_body}</p>",
+            text_content=text_body,
+            sender=sender or get_brevo_service()._sender,
+            dedup_key=dedup_key,
+            origem='send_email',
+            conn=conn
+        )
+        logger.info(f"Email enfileirado para {recipients}")
         return True
         
     except Exception as e:
-        logger.error(f"FALHA ao enviar email: {e}")
+        logger.error(f"FALHA ao enfileirar email: {e}")
         import traceback
         logger.error(traceback.format_exc())
         return False
@@ -137,9 +138,9 @@ def send_welcome_email(user_email, user_name):
     return result.get('success', False)
 
 
-def send_invite_email(to_email, invite_token, cliente_nome, invited_by_name, expires_at):
+def send_invite_email(to_email, invite_token, cliente_nome, invited_by_name, expires_at, conn=None, dedup_key=None):
     """
-    Envia email de convite para novo usuário via Brevo
+    Enfileira email de convite para novo usuário (outbox; o worker entrega via Brevo)
     
     Args:
         to_email: Email do convidado
@@ -147,6 +148,8 @@ def send_invite_email(to_email, invite_token, cliente_nome, invited_by_name, exp
         cliente_nome: Nome do cliente/empresa
         invited_by_name: Nome de quem convidou
         expires_at: Data de expiração do convite
+        conn: Conexão da transação do convite (opcional)
+        dedup_key: Chave de deduplicação do outbox (opcional)
     
     Returns:
         dict: {"success": bool, opcional "error", "user_message" para exibir ao usuário}
@@ -167,7 +170,9 @@ def send_invite_email(to_email, invite_token, cliente_nome, invited_by_name, exp
         invite_link=invite_link,
         invited_by=invited_by_name,
         cliente_nome=cliente_nome,
-        expires_at=expires_str
+        expires_at=expires_str,
+        dedup_key=dedup_key,
+        conn=conn
     )
     if result.get("success"):
         return {"success": True}
@@ -180,7 +185,7 @@ def send_invite_email(to_email, invite_token, cliente_nome, invited_by_name, exp
 
 # ==================== ASSINATURAS ====================
 
-def send_subscription_confirmation_email(email_faturamento, dados):
+def send_subscription_confirmation_email(email_faturamento, dados, conn=None, dedup_key=None):
     """
     Envia email de confirmacao de assinatura ao cliente.
 
@@ -188,6 +193,8 @@ def send_subscription_confirmation_email(email_faturamento, dados):
         email_faturamento (str): Email de faturamento do cliente
         dados (dict): responsavel_nome, nome_fantasia, razao_social, cnpj,
                       plan_type, valor, invoice_number, due_date, email_faturamento
+        conn: Conexão da transação da assinatura (opcional)
+        dedup_key: Chave de deduplicação do outbox (opcional)
     Returns:
         bool
     """
@@ -197,14 +204,16 @@ def send_subscription_confirmation_email(email_faturamento, dados):
         return send_email(
             subject=f'Cadu - Plano {plan} Ativado!',
             recipients=[email_faturamento],
-            html_body=html
+            html_body=html,
+            dedup_key=dedup_key,
+            conn=conn
         )
     except Exception as e:
         logger.error(f"Erro ao enviar email de confirmacao de assinatura: {e}")
         return False
 
 
-def send_new_subscription_internal_email(dados):
+def send_new_subscription_internal_email(dados, conn=None, dedup_key=None):
     """
     Envia notificacao interna (Centralcomm) sobre nova assinatura.
 
@@ -212,6 +221,8 @@ def send_new_subscription_internal_email(dados):
         dados (dict): nome_fantasia, razao_social, cnpj, plan_type, valor,
                       invoice_number, due_date, responsavel_nome,
                       email_faturamento, telefone
+        conn: Conexão da transação da assinatura (opcional)
+        dedup_key: Chave de deduplicação do outbox (opcional)
     Returns:
         bool
     """
@@ -226,7 +237,9 @@ def send_new_subscription_internal_email(dados):
         return send_email(
             subject=f'Nova Assinatura - {nome_fantasia} - Plano {plan}',
             recipients=[financeiro_email],
-            html_body=html
+            html_body=html,
+            dedup_key=dedup_key,
+            conn=conn
         )
     except Exception as e:
         logger.error(f"Erro ao enviar email interno de nova assinatura: {e}")
@@ -1,7 +1,9 @@
-from flask import Blueprint, render_template, request, jsonify, abort
+from flask import Blueprint, render_template, request, jsonify, abort, session
+from werkzeug.utils import secure_filename
 from aicentralv2.auth import login_required
 import os
-from ..services.intelligence.service import process_document, delete_document, get_document_stats
+import uuid
+from ..services.intelligence.service import UPLOAD_DIR, enqueue_document, delete_document, get_document_stats
 from ..db import get_db
 
 bp = Blueprint('intelligence', __name__, url_prefix='/intelligence')
@@ -62,32 +64,33 @@ def process():
         return jsonify({'success': False, 'message': 'Nenhum arquivo selecionado'})
         
     if file:
-        # Salvar arquivo temporariamente
-        temp_path = os.path.join('/tmp', file.filename)
-        file.save(temp_path)
+        # O arquivo fica em UPLOAD_DIR até o worker de jobs terminar a ingestão
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        nome = f"{uuid.uuid4().hex}_{secure_filename(file.filename) or 'documento'}"
+        upload_path = os.path.join(UPLOAD_DIR, nome)
+        file.save(upload_path)
         
         try:
-            # Iniciar processamento
-            document = process_document(
-                file_path=temp_path,
+            document = enqueue_document(
+                file_path=upload_path,
                 title=request.form.get('title'),
-                requires_cadu_format=request.form.get('requires_cadu_format') == 'on'
+                requires_cadu_format=request.form.get('requires_cadu_format') == 'on',
+                created_by=session.get('user_id')
             )
             
             return jsonify({
                 'success': True,
-                'document_id': document['id']
+                'document_id': document['id'],
+                'job_id': document['job_id']
             })
             
         except Exception as e:
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
             return jsonify({
                 'success': False,
                 'message': str(e)
             })
-        finally:
-            # Limpar arquivo temporário
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
                 
     return jsonify({'success': False, 'message': 'Erro ao processar arquivo'})
 
@@ -0,0 +1,74 @@
+"""
+API JSON da fila de jobs (cadu_jobs).
+
+- GET  /api/jobs/<id>               status/progresso de um job (dono ou admin)
+- GET  /api/jobs?status=falhou      listagem para admin (status=falhou = dead-letter)
+- POST /api/jobs/<id>/reenfileirar  devolve à fila um job falho/cancelado (admin)
+- POST /api/jobs/<id>/cancelar      cancela um job pendente (admin)
+"""
+from __future__ import annotations
+
+from flask import Blueprint, jsonify, request, session
+
+from aicentralv2.auth import admin_required_api, is_admin, login_required_api
+from aicentralv2.services import jobs
+
+bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+_CAMPOS_PUBLICOS = (
+    'id', 'tipo', 'fila', 'status', 'prioridade', 'tentativas', 'max_tentativas',
+    'progresso', 'resultado', 'ultimo_erro', 'created_by', 'created_at',
+    'executar_em', 'iniciado_em', 'concluido_em', 'updated_at',
+)
+
+
+def _serializar(job):
+    dados = {campo: job.get(campo) for campo in _CAMPOS_PUBLICOS}
+    for campo in ('created_at', 'executar_em', 'iniciado_em', 'concluido_em', 'updated_at'):
+        if dados[campo] is not None:
+            dados[campo] = dados[campo].isoformat()
+    return dados
+
+
+@bp.route('/<int:job_id>', methods=['GET'])
+@login_required_api
+def api_job_status(job_id):
+    job = jobs.obter_job(job_id)
+    if not job or (not is_admin() and job.get('created_by') != session.get('user_id')):
+        return jsonify({'success': False, 'error': 'Job não encontrado.'}), 404
+    return jsonify({'success': True, 'job': _serializar(job)})
+
+
+@bp.route('', methods=['GET'])
+@admin_required_api
+def api_jobs_listar():
+    try:
+        limit = min(max(int(request.args.get('limit', 100)), 1), 500)
+    except (TypeError, ValueError):
+        limit = 100
+    lista = jobs.listar_jobs(
+        status=request.args.get('status') or None,
+        tipo=request.args.get('tipo') or None,
+        limit=limit,
+    )
+    return jsonify({
+        'success': True,
+        'jobs': [_serializar(j) for j in lista],
+        'totais': jobs.contar_jobs_por_status(),
+    })
+
+
+@bp.route('/<int:job_id>/reenfileirar', methods=['POST'])
+@admin_required_api
+def api_job_reenfileirar(job_id):
+    if not jobs.reenfileirar_job(job_id):
+        return jsonify({'success': False, 'error': 'Só jobs com falha ou cancelados podem ser reenfileirados.'}), 409
+    return jsonify({'success': True})
+
+
+@bp.route('/<int:job_id>/cancelar', methods=['POST'])
+@admin_required_api
+def api_job_cancelar(job_id):
+    if not jobs.cancelar_job(job_id):
+        return jsonify({'success': False, 'error': 'Só jobs pendentes podem ser cancelados.'}), 409
+    return jsonify({'success': True})
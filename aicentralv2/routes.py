@@ -16,7 +16,15 @@ from aicentralv2.email_service import (
     send_password_reset_email, send_password_changed_email, send_invite_email,
     send_subscription_confirmation_email, send_new_subscription_internal_email
 )
+from aicentralv2.services.jobs import executar_jobs_inline_pendentes
 from aicentralv2.services.openrouter_image_extract import extract_fields_from_image_bytes, get_available_models
+from aicentralv2.services.dashboard_inicio import WIDGETS as DASHBOARD_WIDGETS, calcular_dashboard_inicio
+from aicentralv2.services.metricas_semanais import montar_pagina as montar_pagina_metricas_semanais
+from aicentralv2.services.clientes_abc import RollupsIndisponiveis, recategorizar as recategorizar_clientes_abc
+from aicentralv2.services.cliente_metricas import aplicar_pendencias as aplicar_pendencias_cliente_metricas
+from aicentralv2.services.campanhas_pi_painel import montar_painel as montar_painel_campanhas_pi
+from aicentralv2.campanha_pi_metrics_lote import anexar_preco_metrica_lote, calcular_metricas as calcular_metricas_campanhas
+from aicentralv2.services.openrouter_chat import chamar_openrouter, quer_stream, resposta_sse, stream_openrouter
 from aicentralv2.services.cotacao_linhas_image_import import (
     extrair_itens_linhas_de_upload,
     normalizar_itens_para_cotacao,
@@ -25,11 +33,9 @@ from aicentralv2.services.spedy_service import (
     SpedyAPIError,
     SpedyService,
     SPEDY_PENDING_STATUSES,
-    SPEDY_TERMINAL_STATUSES,
     build_spedy_customer_from_pi,
     build_spedy_transaction_id,
     extract_invoice_from_order,
-    map_spedy_invoice_to_nf_update,
     parse_pi_amount,
 )
 from aicentralv2.services.nf_pdf_extraction import (
@@ -465,7 +471,7 @@ def client_accessible_api(f):
 
 def init_routes(app):
     from aicentralv2.campanha_pi_metrics import (
-        anexar_preco_metrica_campanha as _anexar_preco_metrica_campanha,
+        anexar_preco_metrica_campanhas as _anexar_preco_metrica_campanhas,
         calc_progress_tier,
         format_brl_ptbr as _format_brl_ptbr,
         format_volume_ptbr as _format_volume_ptbr,
@@ -563,38 +569,40 @@ def init_routes(app):
             flash(f'Erro ao carregar formulário de contrato: {str(e)}', 'error')
             return redirect(url_for('index'))
 
+    def _filtros_logs_auditoria():
+        """Filtros de /logs a partir da query string: (filtros, dias)."""
+        from datetime import datetime, timedelta
+        filtros = {}
+        dias = int(request.args.get('dias', 30))
+
+        if request.args.get('modulo'):
+            filtros['modulo'] = request.args.get('modulo')
+
+        if request.args.get('acao'):
+            filtros['acao'] = request.args.get('acao')
+
+        if request.args.get('usuario_id'):
+            filtros['usuario_id'] = int(request.args.get('usuario_id'))
+
+        # Data de início baseada em dias; no minuto, para a contagem em cache valer entre páginas
+        data_inicio = datetime.now() - timedelta(days=dias)
+        filtros['data_inicio'] = data_inicio.replace(second=0, microsecond=0)
+        return filtros, dias
+
     @app.route('/logs')
     @login_required
     def logs_auditoria():
         """Visualizar logs de auditoria"""
-        from datetime import datetime, timedelta
         try:
-            # Filtros
-            filtros = {}
-            dias = int(request.args.get('dias', 30))
-            
-            if request.args.get('modulo'):
-                filtros['modulo'] = request.args.get('modulo')
+            filtros, dias = _filtros_logs_auditoria()
             
-            if request.args.get('acao'):
-                filtros['acao'] = request.args.get('acao')
-            
-            if request.args.get('usuario_id'):
-                filtros['usuario_id'] = int(request.args.get('usuario_id'))
-            
-            # Calcular data de início baseado em dias
-            data_inicio = datetime.now() - timedelta(days=dias)
-            filtros['data_inicio'] = data_inicio
-            
-            # Paginação
+            # Paginação keyset: primeira página aqui, as seguintes via /logs/linhas
             limit = 50
-            offset = int(request.args.get('offset', 0))
+            logs = db.obter_audit_logs(filtros=filtros, limit=limit)
+            proximo_cursor = db.proximo_cursor(logs, limit, 'data_acao', 'id_log')
             
-            # Buscar logs
-            logs = db.obter_audit_logs(filtros=filtros, limit=limit, offset=offset)
-            
-            # Contar total (para paginação)
-            total_logs = len(db.obter_audit_logs(filtros=filtros, limit=10000, offset=0))
+            # Total: a própria página quando ela é a única, senão a contagem em cache
+            total_logs = db.contar_audit_logs(filtros) if proximo_cursor else len(logs)
             
             # Estatísticas
             stats = db.obter_estatisticas_audit_log(dias=dias)
@@ -611,7 +619,7 @@ def init_routes(app):
                                          'dias': str(dias)},
                                  usuarios_filtro=usuarios_filtro,
                                  limit=limit,
-                                 offset=offset,
+                                 proximo_cursor=proximo_cursor,
                                  total_logs=total_logs)
         except Exception as e:
             import traceback
@@ -620,6 +628,25 @@ def init_routes(app):
             flash(f'Erro ao carregar logs: {str(e)}', 'error')
             return redirect(url_for('index'))
 
+    @app.route('/logs/linhas')
+    @login_required
+    def logs_auditoria_linhas():
+        """Página seguinte dos logs de auditoria (HTML das linhas + cursor)."""
+        try:
+            filtros, _ = _filtros_logs_auditoria()
+            limit = 50
+            logs = db.obter_audit_logs(filtros=filtros, limit=limit, apos=request.args.get('cursor'))
+            return jsonify({
+                'success': True,
+                'html': render_template('partials/audit_logs_linhas.html', logs=logs),
+                'proximo_cursor': db.proximo_cursor(logs, limit, 'data_acao', 'id_log'),
+            })
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except Exception as e:
+            app.logger.error(f"Erro ao carregar logs: {str(e)}")
+            return jsonify({'success': False, 'message': 'Erro ao carregar logs'}), 500
+
     @app.route('/cadu_categorias')
     @login_required
     def cadu_categorias():
@@ -1489,8 +1516,7 @@ def init_routes(app):
         try:
             campanhas_raw = db.obter_campanhas_pi(filtros={'id_pi': id_pi})
             campanhas = []
-            for c in (campanhas_raw or []):
-                er = _anexar_preco_metrica_campanha(c)
+            for er in _anexar_preco_metrica_campanhas(campanhas_raw):
                 _ini = er.get('periodo_inicio')
                 _fim = er.get('periodo_fim')
                 periodo_dias = None
@@ -2424,22 +2450,13 @@ def init_routes(app):
             if not invited_by:
                 return jsonify({'success': False, 'message': 'Usuário não identificado. Faça login novamente.'}), 401
             
-            # Criar convite
-            invite_id = db.criar_invite(cliente_id, invited_by, email, role)
+            # Criar convite: convite e e-mail (outbox) são confirmados juntos
+            conn = db.get_db()
+            invite_id = db.criar_invite(cliente_id, invited_by, email, role, conn=conn)
             app.logger.info(f"DEBUG criar_invite: invite_id={invite_id}")
             
             if invite_id:
-                # Registro de auditoria
-                registrar_auditoria(
-                    acao='criar',
-                    modulo='invites',
-                    descricao=f'Convite enviado para {email} (role: {role})',
-                    registro_id=invite_id,
-                    registro_tipo='invite',
-                    dados_novos={'email': email, 'role': role, 'cliente_id': cliente_id}
-                )
-                
-                # Enviar email com link de convite
+                # Enfileirar email com link de convite
                 try:
                     # Buscar dados para o email
                     cliente = db.obter_cliente_por_id(cliente_id)
@@ -2458,13 +2475,15 @@ def init_routes(app):
                                 invite_token=invite_token,
                                 cliente_nome=cliente_nome,
                                 invited_by_name=convidante_nome,
-                                expires_at=expires_at
+                                expires_at=expires_at,
+                                conn=conn,
+                                dedup_key=f'convite:{invite_id}:{expires_at}'
                             )
                         except Exception as send_exc:
                             app.logger.error(
                                 f"Exceção ao enviar convite para {email}: {send_exc}", exc_info=True
                             )
-                            db.cancelar_invite(invite_id)
+                            conn.rollback()
                             return jsonify({
                                 'success': False,
                                 'message': (
@@ -2473,18 +2492,32 @@ def init_routes(app):
                                 ),
                             }), 502
                         if not envio.get('success'):
-                            db.cancelar_invite(invite_id)
+                            conn.rollback()
                             msg = envio.get('user_message') or envio.get('error') or 'Erro ao enviar o e-mail de convite.'
                             app.logger.error(f"Falha ao enviar convite para {email}: {envio.get('error')}")
                             return jsonify({'success': False, 'message': msg}), 502
-                        app.logger.info(f"Email de convite enviado para {email}")
+                        app.logger.info(f"Email de convite enfileirado para {email}")
                 except Exception as email_error:
                     app.logger.error(f"Erro ao preparar email de convite: {email_error}", exc_info=True)
+                    conn.rollback()
                     return jsonify({
                         'success': False,
                         'message': 'Não foi possível concluir o envio. Tente novamente em instantes.',
                     }), 500
                 
+                conn.commit()
+                executar_jobs_inline_pendentes()
+                
+                # Registro de auditoria
+                registrar_auditoria(
+                    acao='criar',
+                    modulo='invites',
+                    descricao=f'Convite enviado para {email} (role: {role})',
+                    registro_id=invite_id,
+                    registro_tipo='invite',
+                    dados_novos={'email': email, 'role': role, 'cliente_id': cliente_id}
+                )
+                
                 return jsonify({
                     'success': True, 
                     'message': f'Convite enviado para {email}!',
@@ -2502,17 +2535,10 @@ def init_routes(app):
     def api_reenviar_invite(invite_id):
         """API para reenviar convite"""
         try:
-            if db.reenviar_invite(invite_id):
-                # Registro de auditoria
-                registrar_auditoria(
-                    acao='reenviar',
-                    modulo='invites',
-                    descricao=f'Convite reenviado (ID: {invite_id})',
-                    registro_id=invite_id,
-                    registro_tipo='invite'
-                )
-                
-                # Enviar email
+            # Nova validade e e-mail (outbox) são confirmados juntos
+            conn = db.get_db()
+            if db.reenviar_invite(invite_id, conn=conn):
+                # Enfileirar email
                 try:
                     invite = db.obter_invite_por_id(invite_id)
                     if invite:
@@ -2525,20 +2551,36 @@ def init_routes(app):
                             invite_token=invite['invite_token'],
                             cliente_nome=cliente_nome,
                             invited_by_name=convidante_nome,
-                            expires_at=invite.get('expires_at')
+                            expires_at=invite.get('expires_at'),
+                            conn=conn,
+                            dedup_key=f"convite:{invite_id}:{invite.get('expires_at')}"
                         )
                         if not envio.get('success'):
+                            conn.rollback()
                             msg = envio.get('user_message') or envio.get('error') or 'Erro ao reenviar o e-mail.'
                             app.logger.error(f"Falha ao reenviar convite: {envio.get('error')}")
                             return jsonify({'success': False, 'message': msg}), 502
-                        app.logger.info(f"Email de convite reenviado para {invite['email']}")
+                        app.logger.info(f"Email de convite enfileirado para {invite['email']}")
                 except Exception as email_error:
                     app.logger.error(f"Erro ao enviar email de convite: {email_error}")
+                    conn.rollback()
                     return jsonify({
                         'success': False,
                         'message': 'Não foi possível reenviar o e-mail. Verifique o endereço e tente novamente.',
                     }), 502
                 
+                conn.commit()
+                executar_jobs_inline_pendentes()
+                
+                # Registro de auditoria
+                registrar_auditoria(
+                    acao='reenviar',
+                    modulo='invites',
+                    descricao=f'Convite reenviado (ID: {invite_id})',
+                    registro_id=invite_id,
+                    registro_tipo='invite'
+                )
+                
                 return jsonify({'success': True, 'message': 'Convite reenviado com sucesso!'})
             else:
                 return jsonify({'success': False, 'message': 'Convite não encontrado ou já foi aceito!'}), 404
@@ -2799,6 +2841,7 @@ def init_routes(app):
             # Se vazio ou outro valor, não aplica filtro (mostra todos)
             
             # Obter dados paginados com métricas
+            aplicar_pendencias_cliente_metricas()
             resultado = db.obter_clientes_paginado(
                 page=page,
                 per_page=per_page,
@@ -3300,42 +3343,31 @@ def init_routes(app):
     @app.route('/api/webhook-proxy', methods=['POST'])
     @login_required
     def webhook_proxy():
-        """Proxy para enviar dados ao webhook n8n de forma assíncrona (contorna CORS)"""
+        """Proxy para enviar dados ao webhook n8n de forma assíncrona (contorna CORS)
+
+        O envio fica persistido na fila de jobs (webhook.enviar) e é feito pelo worker.
+        """
+        from aicentralv2.services.webhook_dispatcher import WebhookFilaCheia, enfileirar_webhook
+
         try:
-            import requests
-            import threading
-            
-            # URL do webhook n8n (PRODUÇÃO)
-            webhook_url = 'https://n8n.centralcomm.media/webhook/f8702380-85c1-4a1d-8b6b-1996a9c6d822'
-            
-            # Obter dados do request
             payload = request.get_json()
             
             if not payload:
                 return jsonify({'success': False, 'error': 'Payload vazio'}), 400
-            
-            # Função para enviar webhook em background
-            def send_webhook_async():
-                try:
-                    response = requests.post(
-                        webhook_url,
-                        json=payload,
-                        headers={'Content-Type': 'application/json'},
-                        timeout=60
-                    )
-                    app.logger.info(f'Webhook enviado com sucesso: {response.status_code}')
-                except Exception as e:
-                    app.logger.error(f'Erro ao enviar webhook: {str(e)}')
-            
-            # Iniciar thread para envio assíncrono
-            thread = threading.Thread(target=send_webhook_async)
-            thread.daemon = True
-            thread.start()
+
+            try:
+                job_id = enfileirar_webhook('n8n_proxy', payload, created_by=session.get('user_id'))
+            except WebhookFilaCheia as e:
+                app.logger.warning(f'Webhook proxy recusado: {e}')
+                resp = jsonify({'success': False, 'error': 'Muitos envios pendentes, tente novamente em instantes'})
+                resp.headers['Retry-After'] = str(e.retry_after)
+                return resp, 429
             
             # Retornar resposta imediata
             return jsonify({
                 'success': True,
-                'message': 'Webhook enviado para processamento assíncrono'
+                'message': 'Webhook enviado para processamento assíncrono',
+                'job_id': job_id,
             }), 202
             
         except Exception as e:
@@ -6526,7 +6558,8 @@ def init_routes(app):
             data_envio = datetime.now().strftime('%d/%m/%Y às %H:%M')
             
             try:
-                # Usar o serviço Brevo com template
+                # E-mail (outbox) e status "Enviada" são confirmados juntos pelo atualizar_cotacao.
+                # dedup por versão da cotação: clique duplo não duplica; reenvio posterior sai
                 resultado = enviar_email_cotacao_enviada_cliente(
                     to_email=destinatario,
                     to_name=nome_destinatario or cliente_nome,
@@ -6539,12 +6572,15 @@ def init_routes(app):
                     executivo_email=cotacao.get('responsavel_email', ''),
                     tem_agencia=email_tem_agencia,
                     agencia_nome=email_agencia_nome,
-                    cliente_nome=cliente_nome_param or cotacao.get('cliente_nome', '')
+                    cliente_nome=cliente_nome_param or cotacao.get('cliente_nome', ''),
+                    conn=db.get_db(),
+                    dedup_key=f"cotacao:{cotacao_id}:enviada:{destinatario.lower()}:{cotacao.get('updated_at')}"
                 )
                 
                 if resultado.get('success'):
                     # Atualizar status da cotação para "Enviada"
                     db.atualizar_cotacao(cotacao_id, status='Enviada', proposta_enviada_em=datetime.now())
+                    executar_jobs_inline_pendentes()
                     
                     # Registrar auditoria
                     registrar_auditoria(
@@ -6659,6 +6695,10 @@ def init_routes(app):
             
             resultado_externo = None
             resultado_interno = None
+            # E-mails vão para o outbox na mesma transação; os internos só valem se o
+            # externo for registrado: commit no fim. dedup por versão da cotação
+            conn = db.get_db()
+            versao = cotacao.get('updated_at')
             
             # Para templates de email: tratar parceiro como intermediário (mesmo conceito de agência)
             email_tem_agencia = tem_agencia or tem_parceiro
@@ -6678,7 +6718,9 @@ def init_routes(app):
                         executivo_email=responsavel_email,
                         tem_agencia=email_tem_agencia,
                         agencia_nome=email_agencia_nome,
-                        cliente_nome=cliente_nome
+                        cliente_nome=cliente_nome,
+                        conn=conn,
+                        dedup_key=f'cotacao:{cotacao_id}:enviada:{destinatario.lower()}:{versao}'
                     )
                     
                     # Emails internos: responsável comercial + apolo
@@ -6695,6 +6737,8 @@ def init_routes(app):
                         try:
                             # Usar o mesmo template de email enviado para cliente, mas para equipe interna
                             enviar_email_cotacao_enviada_cliente(
+                                conn=conn,
+                                dedup_key=f'cotacao:{cotacao_id}:enviada:interno:{email_interno.lower()}:{versao}',
                                 to_email=email_interno,
                                 to_name=nome_interno,
                                 numero_cotacao=numero_cotacao,
@@ -6719,6 +6763,8 @@ def init_routes(app):
                 elif tipo == 'cotacao_aprovada':
                     # Email externo para cliente/agência/parceiro
                     resultado_externo = enviar_email_cotacao_aprovada_cliente(
+                        conn=conn,
+                        dedup_key=f'cotacao:{cotacao_id}:aprovada_cliente:{destinatario.lower()}',
                         to_email=destinatario,
                         to_name=nome_destinatario,
                         numero_cotacao=numero_cotacao,
@@ -6744,6 +6790,8 @@ def init_routes(app):
                     for email_interno, nome_interno in destinatarios_internos:
                         try:
                             enviar_email_cotacao_aprovada(
+                                conn=conn,
+                                dedup_key=f'cotacao:{cotacao_id}:aprovada:{email_interno.lower()}',
                                 to_email=email_interno,
                                 to_name=nome_interno,
                                 numero_cotacao=numero_cotacao,
@@ -6766,6 +6814,8 @@ def init_routes(app):
                 elif tipo == 'cotacao_rejeitada':
                     # Email externo para cliente/agência/parceiro
                     resultado_externo = enviar_email_cotacao_rejeitada_cliente(
+                        conn=conn,
+                        dedup_key=f'cotacao:{cotacao_id}:rejeitada_cliente:{destinatario.lower()}',
                         to_email=destinatario,
                         to_name=nome_destinatario,
                         numero_cotacao=numero_cotacao,
@@ -6792,6 +6842,8 @@ def init_routes(app):
                     for email_interno, nome_interno in destinatarios_internos:
                         try:
                             enviar_email_cotacao_rejeitada(
+                                conn=conn,
+                                dedup_key=f'cotacao:{cotacao_id}:rejeitada:{email_interno.lower()}',
                                 to_email=email_interno,
                                 to_name=nome_interno,
                                 numero_cotacao=numero_cotacao,
@@ -6814,6 +6866,8 @@ def init_routes(app):
                 
                 # Verificar resultado do email externo
                 if resultado_externo and resultado_externo.get('success'):
+                    conn.commit()
+                    executar_jobs_inline_pendentes()
                     # Registrar auditoria
                     registrar_auditoria(
                         acao='EMAIL_SENT',
@@ -6834,6 +6888,7 @@ def init_routes(app):
                     
                     return jsonify({'success': True, 'message': 'Email enviado com sucesso'})
                 else:
+                    conn.rollback()
                     erro = resultado_externo.get('error', 'Falha ao enviar email') if resultado_externo else 'Nenhum email enviado'
                     return jsonify({'success': False, 'message': erro}), 500
                     
@@ -8413,21 +8468,24 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
 
     # ==================== DASHBOARD INÍCIO APIs ====================
 
+    @app.route('/api/dashboard/inicio', methods=['GET'])
+    @login_required
+    def api_dashboard_inicio():
+        """Todos os widgets da home em uma chamada (mesmo snapshot, tempo por widget)."""
+        try:
+            days = request.args.get('days', 90, type=int)
+            return jsonify(calcular_dashboard_inicio(days))
+        except Exception as e:
+            current_app.logger.error(f"Erro dashboard inicio: {e}", exc_info=True)
+            return jsonify({'success': False, 'message': str(e)}), 500
+
     @app.route('/api/dashboard/carteira-clientes', methods=['GET'])
     @login_required
     def api_dashboard_carteira_clientes():
         try:
             days = request.args.get('days', 90, type=int)
-            data = db.get_dashboard_carteira_clientes(days)
-            result = {
-                'por_executivo': [dict(r) for r in (data.get('por_executivo') or [])],
-                'por_executivo_perfil': [dict(r) for r in (data.get('por_executivo_perfil') or [])],
-                'por_executivo_clientes': [dict(r) for r in (data.get('por_executivo_clientes') or [])],
-                'por_executivo_agencias': [dict(r) for r in (data.get('por_executivo_agencias') or [])],
-                'resumo': dict(data.get('resumo') or {}),
-                'classificacoes': data.get('classificacoes') or []
-            }
-            return jsonify({'success': True, 'data': result})
+            consulta, serializar = DASHBOARD_WIDGETS['carteira_clientes']
+            return jsonify({'success': True, 'data': serializar(consulta(days))})
         except Exception as e:
             current_app.logger.error(f"Erro dashboard carteira: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -8437,13 +8495,8 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
     def api_dashboard_cotacoes_status():
         try:
             days = request.args.get('days', 90, type=int)
-            data = db.get_dashboard_cotacoes_status(days)
-            result = {
-                'por_status': [dict(r) for r in (data.get('por_status') or [])],
-                'evolucao': [{'semana': r['semana'].isoformat() if r.get('semana') else None, 'status_nome': r.get('status_nome', ''), 'total': r.get('total', 0)} for r in (data.get('evolucao') or [])],
-                'total': data.get('total', 0)
-            }
-            return jsonify({'success': True, 'data': result})
+            consulta, serializar = DASHBOARD_WIDGETS['cotacoes_status']
+            return jsonify({'success': True, 'data': serializar(consulta(days))})
         except Exception as e:
             current_app.logger.error(f"Erro dashboard cotacoes: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -8452,8 +8505,8 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
     @login_required
     def api_dashboard_active_users_metrics():
         try:
-            data = db.get_dashboard_active_users_metrics()
-            return jsonify({'success': True, 'data': data})
+            consulta, serializar = DASHBOARD_WIDGETS['active_users_metrics']
+            return jsonify({'success': True, 'data': serializar(consulta(None))})
         except Exception as e:
             current_app.logger.error(f"Erro dashboard active-users-metrics: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -8463,22 +8516,8 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
     def api_dashboard_acessos_cadu():
         try:
             days = request.args.get('days', 90, type=int)
-            data = db.get_dashboard_acessos_cadu(days)
-            sessoes = []
-            for s in (data.get('sessoes_diarias') or []):
-                sessoes.append({
-                    'date': s['date'].isoformat() if s.get('date') else None,
-                    'total_sessions': s.get('total_sessions', 0),
-                    'unique_users': s.get('unique_users', 0)
-                })
-            result = {
-                'sessoes': data.get('sessoes', 0),
-                'usuarios': data.get('usuarios', 0),
-                'media_dia': data.get('media_dia', 0),
-                'pageviews': data.get('pageviews', 0),
-                'sessoes_diarias': sessoes
-            }
-            return jsonify({'success': True, 'data': result})
+            consulta, serializar = DASHBOARD_WIDGETS['acessos_cadu']
+            return jsonify({'success': True, 'data': serializar(consulta(days))})
         except Exception as e:
             current_app.logger.error(f"Erro dashboard acessos: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -8488,17 +8527,8 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
     def api_dashboard_pis_mensal():
         try:
             days = request.args.get('days', 90, type=int)
-            data = db.get_dashboard_pis_por_mes(days)
-            resumo = data.get('resumo') or {}
-            result = {
-                'por_mes': [{'mes': r.get('mes', ''), 'status_nome': r.get('status_nome', ''), 'total': r.get('total', 0), 'valor_liquido': float(r.get('valor_liquido', 0)), 'valor_bruto': float(r.get('valor_bruto', 0))} for r in (data.get('por_mes') or [])],
-                'resumo': {
-                    'total': resumo.get('total', 0),
-                    'valor_total': float(resumo.get('valor_total', 0)),
-                    'valor_bruto': float(resumo.get('valor_bruto', 0))
-                }
-            }
-            return jsonify({'success': True, 'data': result})
+            consulta, serializar = DASHBOARD_WIDGETS['pis_mensal']
+            return jsonify({'success': True, 'data': serializar(consulta(days))})
         except Exception as e:
             current_app.logger.error(f"Erro dashboard PIs: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -8508,18 +8538,8 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
     def api_dashboard_campanhas():
         try:
             days = request.args.get('days', 90, type=int)
-            data = db.get_dashboard_campanhas(days)
-            resumo = data.get('resumo') or {}
-            result = {
-                'por_status': [{'status_nome': r.get('status_nome', ''), 'total': r.get('total', 0), 'valor_plataforma': float(r.get('valor_plataforma', 0)), 'gasto_total': float(r.get('gasto_total', 0)), 'atingido_total': float(r.get('atingido_total', 0))} for r in (data.get('por_status') or [])],
-                'resumo': {
-                    'total_campanhas': resumo.get('total_campanhas', 0),
-                    'faturamento': float(resumo.get('faturamento', 0)),
-                    'gasto': float(resumo.get('gasto', 0)),
-                    'atingido': float(resumo.get('atingido', 0))
-                }
-            }
-            return jsonify({'success': True, 'data': result})
+            consulta, serializar = DASHBOARD_WIDGETS['campanhas']
+            return jsonify({'success': True, 'data': serializar(consulta(days))})
         except Exception as e:
             current_app.logger.error(f"Erro dashboard campanhas: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -8529,14 +8549,8 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
     def api_dashboard_audiencias():
         try:
             days = request.args.get('days', 90, type=int)
-            data = db.get_dashboard_audiencias(days)
-            result = {
-                'top_audiencias': [dict(r) for r in (data.get('top_audiencias') or [])],
-                'top_canais': [dict(r) for r in (data.get('top_canais') or [])],
-                'evolucao': [{'semana': r['semana'].isoformat() if r.get('semana') else None, 'total_views': r.get('total_views', 0)} for r in (data.get('evolucao') or [])],
-                'total_acessos': data.get('total_acessos', 0)
-            }
-            return jsonify({'success': True, 'data': result})
+            consulta, serializar = DASHBOARD_WIDGETS['audiencias']
+            return jsonify({'success': True, 'data': serializar(consulta(days))})
         except Exception as e:
             current_app.logger.error(f"Erro dashboard audiencias: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -8546,18 +8560,8 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
     def api_dashboard_briefings_cliente():
         try:
             days = request.args.get('days', 90, type=int)
-            data = db.get_dashboard_briefings_por_cliente(days)
-            resumo = data.get('resumo') or {}
-            result = {
-                'top_clientes': [dict(r) for r in (data.get('top_clientes') or [])],
-                'resumo': {
-                    'total': resumo.get('total', 0),
-                    'enviados': resumo.get('enviados', 0),
-                    'rascunhos': resumo.get('rascunhos', 0),
-                    'enviados_centralcomm': resumo.get('enviados_centralcomm', 0)
-                }
-            }
-            return jsonify({'success': True, 'data': result})
+            consulta, serializar = DASHBOARD_WIDGETS['briefings_cliente']
+            return jsonify({'success': True, 'data': serializar(consulta(days))})
         except Exception as e:
             current_app.logger.error(f"Erro dashboard briefings: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -8567,19 +8571,8 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
     def api_dashboard_leads():
         try:
             days = request.args.get('days', 90, type=int)
-            data = db.get_dashboard_leads(days)
-            resumo = data.get('resumo') or {}
-            result = {
-                'por_executivo': [dict(r) for r in (data.get('por_executivo') or [])],
-                'por_origem': [dict(r) for r in (data.get('por_origem') or [])],
-                'evolucao': [{'semana': r['semana'].isoformat() if r.get('semana') else None, 'total': r.get('total', 0)} for r in (data.get('evolucao') or [])],
-                'resumo': {
-                    'total': resumo.get('total', 0),
-                    'notificados': resumo.get('notificados', 0),
-                    'pendentes': resumo.get('pendentes', 0)
-                }
-            }
-            return jsonify({'success': True, 'data': result})
+            consulta, serializar = DASHBOARD_WIDGETS['leads']
+            return jsonify({'success': True, 'data': serializar(consulta(days))})
         except Exception as e:
             current_app.logger.error(f"Erro dashboard leads: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -9152,6 +9145,26 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
             return jsonify({'success': False, 'message': str(e)}), 500
 
 
+    @app.route('/api/metricas/semanais/pagina', methods=['GET'])
+    @metricas_comercial_required_api
+    def api_metricas_semanais_pagina():
+        """Todos os widgets da página de métricas em uma chamada"""
+        try:
+            from datetime import datetime
+            mes = request.args.get('mes')
+            executivo_id = request.args.get('executivo_id', type=int)
+            cliente_id = request.args.get('cliente_id', type=int)
+            ano = request.args.get('ano', datetime.now().year, type=int)
+            busca = request.args.get('busca', '').strip() or None
+
+            mes_inicio, mes_fim = _parsear_periodo_mensal(mes)
+
+            return jsonify(montar_pagina_metricas_semanais(mes_inicio, mes_fim, executivo_id, cliente_id, ano, busca))
+        except Exception as e:
+            current_app.logger.error(f"Erro ao montar página de métricas semanais: {e}")
+            return jsonify({'success': False, 'message': str(e)}), 500
+
+
     # ==================== DASHBOARD GERENCIAL - NOVAS APIs ====================
 
     @app.route('/api/metricas/semanais/kpis-base-total', methods=['GET'])
@@ -9294,71 +9307,139 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
                     'message': 'Permissão negada. Apenas administradores podem recategorizar.'
                 }), 403
             
-            # Executar recategorização
-            resumo = db.recategorizar_clientes_abc()
+            # Executar recategorização (a mesma do job clientes.recategorizar_abc)
+            resumo = recategorizar_clientes_abc()
             
             # Registrar auditoria
             registrar_auditoria(
                 acao='UPDATE',
                 modulo='CLIENTES',
-                descricao=f'Recategorização ABC executada: A={resumo["A"]}, B={resumo["B"]}, C={resumo["C"]}',
+                descricao=f'Recategorização ABC executada: A={resumo["A"]}, B={resumo["B"]}, C={resumo["C"]}, alterados={resumo["alterados"]}',
                 dados_novos=resumo
             )
             
             return jsonify({
                 'success': True,
-                'message': f'Recategorização concluída! A: {resumo["A"]}, B: {resumo["B"]}, C: {resumo["C"]}',
+                'message': f'Recategorização concluída! A: {resumo["A"]}, B: {resumo["B"]}, C: {resumo["C"]} ({resumo["alterados"]} alterado(s))',
                 'data': resumo
             })
             
+        except RollupsIndisponiveis as e:
+            return jsonify({'success': False, 'message': str(e)}), 503
         except Exception as e:
             app.logger.error(f"Erro ao recategorizar clientes: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
 
     # ==================== CADU PI ====================
 
+    def _filtros_cadu_pi_lista_da_request():
+        """Filtros de /cadu_pi a partir da query string: (filtros, origem_lista, visao_comercial)."""
+        filtros = {}
+
+        if request.args.get('resp_comercial'):
+            filtros['resp_comercial'] = int(request.args.get('resp_comercial'))
+        if request.args.get('id_cliente'):
+            filtros['id_cliente'] = int(request.args.get('id_cliente'))
+        if request.args.get('id_status_pi'):
+            filtros['id_status_pi'] = int(request.args.get('id_status_pi'))
+        if request.args.get('id_sub_status_pi'):
+            filtros['id_sub_status_pi'] = int(request.args.get('id_sub_status_pi'))
+        if request.args.get('id_agencia'):
+            filtros['id_agencia'] = int(request.args.get('id_agencia'))
+        if request.args.get('mes_ref_comp'):
+            filtros['mes_ref_comp'] = request.args.get('mes_ref_comp')
+        if request.args.get('busca', '').strip():
+            filtros['search'] = request.args.get('busca').strip()
+        if request.args.get('id_pi', '').strip().isdigit():
+            filtros['id_pi'] = int(request.args.get('id_pi').strip())
+
+        origem_lista = request.args.get('origem', '')
+        visao_comercial = request.args.get('visao', '')
+
+        if filtros.get('id_sub_status_pi') == 2 and visao_comercial == 'cancelados':
+            filtros['id_sub_status_pi'] = 6
+
+        if origem_lista == 'nf_emitida':
+            status_nf_emitida = db.obter_status_pi_por_descricao('NF Emitida')
+            if status_nf_emitida:
+                filtros['id_status_pi'] = status_nf_emitida['id']
+            if request.args.get('nf_status'):
+                filtros['nf_status'] = int(request.args.get('nf_status'))
+
+        if origem_lista == 'faturamento':
+            status_faturamento = db.obter_status_pi_por_descricao('Faturamento')
+            if status_faturamento:
+                filtros['id_status_pi'] = status_faturamento['id']
+            if not filtros.get('id_sub_status_pi'):
+                filtros['id_sub_status_pi'] = 4
+
+        return filtros, origem_lista, visao_comercial
+
+    def _totais_rodape_pi_lista(rows):
+        """Soma PIs, campanhas e valores monetários dos PIs já filtrados (lista / NF)."""
+        total_campanhas = 0
+        sum_midia = 0.0
+        sum_liq = 0.0
+        sum_bruto = 0.0
+        for pi in rows or []:
+            try:
+                total_campanhas += int(pi.get('total_campanhas') or 0)
+            except (TypeError, ValueError):
+                pass
+            m = _parse_brl_float(pi.get('valor_plataformas'))
+            if m is not None:
+                sum_midia += m
+            l = _parse_brl_float(pi.get('valor_liquido'))
+            if l is not None:
+                sum_liq += l
+            b = _parse_brl_float(pi.get('valor_bruto'))
+            if b is not None:
+                sum_bruto += b
+        return {
+            'total_pis': len(rows or []),
+            'total_campanhas': total_campanhas,
+            'valor_midia': sum_midia,
+            'valor_liquido': sum_liq,
+            'valor_bruto': sum_bruto,
+        }
+
+    def _anexar_custo_midia_pis(pis):
+        """Custo de mídia agregado das campanhas de cada PI da página (visão Em andamento)."""
+        ids = [p['id_pi'] for p in pis if p.get('id_pi')]
+        agg_map = db.obter_progresso_campanhas_por_pis(ids)
+        for pi in pis:
+            id_pi = pi.get('id_pi')
+            bucket = agg_map.get(id_pi) or {}
+            gasto_total = 0.0
+            previsto_total = 0.0
+            for raw_gasto in bucket.get('gasto_raw') or []:
+                g = _parse_brl_float(raw_gasto)
+                if g is not None:
+                    gasto_total += g
+            for raw_prev in bucket.get('previsto_raw') or []:
+                p = _parse_brl_float(raw_prev)
+                if p is not None:
+                    previsto_total += p
+            pct_midia = round((gasto_total / previsto_total) * 100) if previsto_total > 0 else 0
+            pi['camp_midia_gasto_total'] = gasto_total
+            pi['camp_midia_prev_total'] = previsto_total
+            pi['camp_pct_midia'] = int(pct_midia)
+            pi['campanha_ids'] = bucket.get('campanha_ids') or []
+
+    def _pagina_cadu_pi_lista(filtros, apos=None):
+        """Uma página keyset da lista de PIs: (pis, proximo_cursor)."""
+        limite = db.LISTAGENS_PAGINA
+        pis = db.obter_cadu_pi_lista(filtros, limite=limite, apos=apos) or []
+        if filtros.get('id_sub_status_pi') == 3 and pis:
+            _anexar_custo_midia_pis(pis)
+        return pis, db.proximo_cursor(pis, limite, 'created_at', 'id_pi')
+
     @app.route('/cadu_pi')
     @login_required
     def cadu_pi_lista():
-        """Lista PIs com filtros"""
+        """Lista PIs com filtros (primeira página; as seguintes via /cadu_pi/linhas)"""
         try:
-            filtros = {}
-            user_set_filters = '_f' in request.args or '_restored' in request.args
-
-            if request.args.get('resp_comercial'):
-                filtros['resp_comercial'] = int(request.args.get('resp_comercial'))
-            if request.args.get('id_cliente'):
-                filtros['id_cliente'] = int(request.args.get('id_cliente'))
-            if request.args.get('id_status_pi'):
-                filtros['id_status_pi'] = int(request.args.get('id_status_pi'))
-            if request.args.get('id_sub_status_pi'):
-                filtros['id_sub_status_pi'] = int(request.args.get('id_sub_status_pi'))
-            if request.args.get('id_agencia'):
-                filtros['id_agencia'] = int(request.args.get('id_agencia'))
-            if request.args.get('mes_ref_comp'):
-                filtros['mes_ref_comp'] = request.args.get('mes_ref_comp')
-            if request.args.get('busca', '').strip():
-                filtros['search'] = request.args.get('busca').strip()
-            if request.args.get('id_pi', '').strip().isdigit():
-                filtros['id_pi'] = int(request.args.get('id_pi').strip())
-
-            origem_lista = request.args.get('origem', '')
-            visao_comercial = request.args.get('visao', '')
-
-            if filtros.get('id_sub_status_pi') == 2 and visao_comercial == 'cancelados':
-                filtros['id_sub_status_pi'] = 6
-
-            if origem_lista == 'nf_emitida':
-                status_nf_emitida = db.obter_status_pi_por_descricao('NF Emitida')
-                if status_nf_emitida:
-                    filtros['id_status_pi'] = status_nf_emitida['id']
-
-            if origem_lista == 'faturamento':
-                status_faturamento = db.obter_status_pi_por_descricao('Faturamento')
-                if status_faturamento:
-                    filtros['id_status_pi'] = status_faturamento['id']
-                if not filtros.get('id_sub_status_pi'):
-                    filtros['id_sub_status_pi'] = 4
+            filtros, origem_lista, visao_comercial = _filtros_cadu_pi_lista_da_request()
 
             if filtros.get('id_cliente'):
                 cli_info = db.obter_cliente_por_id(filtros['id_cliente'])
@@ -9369,64 +9450,17 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
             user_id = session.get('user_id')
             user_is_executivo = any(v.get('id_contato_cliente') == user_id for v in (vendedores or []))
 
-            pis = db.obter_cadu_pi_lista(filtros)
-
+            pis, proximo_cursor = _pagina_cadu_pi_lista(filtros)
             nf_status_filtro = request.args.get('nf_status', '')
-            if origem_lista == 'nf_emitida' and nf_status_filtro:
-                nf_status_filtro_int = int(nf_status_filtro)
-                pis = [pi for pi in (pis or []) if pi.get('nf_status') == nf_status_filtro_int]
-
-            def _totais_rodape_pi_lista(rows):
-                """Soma campanhas e valores monetários dos PIs já filtrados (lista / NF)."""
-                total_campanhas = 0
-                sum_midia = 0.0
-                sum_liq = 0.0
-                sum_bruto = 0.0
-                for pi in rows or []:
-                    try:
-                        total_campanhas += int(pi.get('total_campanhas') or 0)
-                    except (TypeError, ValueError):
-                        pass
-                    m = _parse_brl_float(pi.get('valor_plataformas'))
-                    if m is not None:
-                        sum_midia += m
-                    l = _parse_brl_float(pi.get('valor_liquido'))
-                    if l is not None:
-                        sum_liq += l
-                    b = _parse_brl_float(pi.get('valor_bruto'))
-                    if b is not None:
-                        sum_bruto += b
-                return {
-                    'total_campanhas': total_campanhas,
-                    'valor_midia': sum_midia,
-                    'valor_liquido': sum_liq,
-                    'valor_bruto': sum_bruto,
-                }
 
-            pi_footer_totais = _totais_rodape_pi_lista(pis)
-
-            # Custo de mídia agregado das campanhas (visão Em andamento)
-            if filtros.get('id_sub_status_pi') == 3 and pis:
-                ids = [p['id_pi'] for p in pis if p.get('id_pi')]
-                agg_map = db.obter_progresso_campanhas_por_pis(ids)
-                for pi in pis:
-                    id_pi = pi.get('id_pi')
-                    bucket = agg_map.get(id_pi) or {}
-                    gasto_total = 0.0
-                    previsto_total = 0.0
-                    for raw_gasto in bucket.get('gasto_raw') or []:
-                        g = _parse_brl_float(raw_gasto)
-                        if g is not None:
-                            gasto_total += g
-                    for raw_prev in bucket.get('previsto_raw') or []:
-                        p = _parse_brl_float(raw_prev)
-                        if p is not None:
-                            previsto_total += p
-                    pct_midia = round((gasto_total / previsto_total) * 100) if previsto_total > 0 else 0
-                    pi['camp_midia_gasto_total'] = gasto_total
-                    pi['camp_midia_prev_total'] = previsto_total
-                    pi['camp_pct_midia'] = int(pct_midia)
-                    pi['campanha_ids'] = bucket.get('campanha_ids') or []
+            # Rodapé de toda a lista: a própria página quando ela é a única, senão em cache
+            if proximo_cursor:
+                filtros_totais = {k: v for k, v in filtros.items() if k != 'cliente_nome'}
+                pi_footer_totais = db.contagem_em_cache(
+                    'cadu_pi', filtros_totais,
+                    lambda: _totais_rodape_pi_lista(db.obter_cadu_pi_lista_valores(filtros_totais)))
+            else:
+                pi_footer_totais = _totais_rodape_pi_lista(pis)
 
             status_pi = db.obter_status_pi()
             mes_sub = 6 if visao_comercial == 'cancelados' else filtros.get('id_sub_status_pi')
@@ -9434,7 +9468,8 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
             statuses_nf = db.obter_nota_fiscal_status()
 
             return render_template('cadu_pi.html',
-                                   pis=pis or [],
+                                   pis=pis,
+                                   proximo_cursor=proximo_cursor,
                                    status_pi=status_pi,
                                    vendedores=vendedores,
                                    meses_ref=meses_ref,
@@ -9450,18 +9485,39 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
             flash('Erro ao carregar lista de PIs.', 'error')
             return render_template('cadu_pi.html',
                                    pis=[],
+                                   proximo_cursor=None,
                                    status_pi=[],
                                    vendedores=[],
                                    statuses_nf=[],
                                    filtros={},
                                    visao_comercial='',
                                    pi_footer_totais={
+                                       'total_pis': 0,
                                        'total_campanhas': 0,
                                        'valor_midia': 0.0,
                                        'valor_liquido': 0.0,
                                        'valor_bruto': 0.0,
                                    })
 
+    @app.route('/cadu_pi/linhas')
+    @login_required
+    def cadu_pi_lista_linhas():
+        """Página seguinte da lista de PIs (HTML das linhas + cursor)."""
+        try:
+            filtros, origem_lista, visao_comercial = _filtros_cadu_pi_lista_da_request()
+            pis, proximo_cursor = _pagina_cadu_pi_lista(filtros, apos=request.args.get('cursor'))
+            html = render_template('partials/cadu_pi_linhas.html',
+                                   pis=pis,
+                                   filtros=filtros,
+                                   origem_lista=origem_lista,
+                                   visao_comercial=visao_comercial)
+            return jsonify({'success': True, 'html': html, 'proximo_cursor': proximo_cursor})
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except Exception as e:
+            app.logger.error(f"Erro ao listar PIs (página seguinte): {e}", exc_info=True)
+            return jsonify({'success': False, 'message': 'Erro ao carregar PIs.'}), 500
+
     @app.route('/api/cadu_pi/localizar', methods=['GET'])
     @login_required
     def cadu_pi_localizar():
@@ -10130,9 +10186,9 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
     @app.route('/api/cadu_pi/<int:id_pi>/enviar-producao', methods=['POST'])
     @login_required
     def cadu_pi_enviar_producao(id_pi):
-        """Altera status/sub-status do PI para produção e dispara webhooks"""
+        """Altera status/sub-status do PI para produção e agenda os webhooks (job pi.fluxo_producao)"""
         try:
-            from aicentralv2.services.pi_make_webhooks import PiMakeWebhookError, disparar_webhooks_producao_pi
+            from aicentralv2.services.pi_make_webhooks import enfileirar_fluxo_producao
 
             pi = db.obter_cadu_pi_por_id(id_pi)
             if not pi:
@@ -10145,7 +10201,12 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
             if not pi.get('codigo_pi_cc'):
                 return jsonify({'success': False, 'message': 'Preencha o código do PI antes de enviar'}), 400
 
-            webhook_erros = disparar_webhooks_producao_pi(pi, strict=False)
+            job_id = enfileirar_fluxo_producao(
+                id_pi,
+                gerar_pastas=False,
+                atualizar_status_agora=True,
+                created_by=session.get('user_id'),
+            )
             numero = pi.get('codigo_pi_cc', '')
 
             registrar_auditoria(
@@ -10155,19 +10216,55 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
                 registro_id=id_pi,
                 registro_tipo='cadu_pi',
                 dados_anteriores={'id_status_pi': pi.get('id_status_pi'), 'id_sub_status_pi': pi.get('id_sub_status_pi')},
-                dados_novos={'status': 'Campanha em análise', 'sub_status': 'Em aprovação'}
+                dados_novos={'status': 'Campanha em análise', 'sub_status': 'Em aprovação', 'job_id': job_id}
             )
 
-            if webhook_erros:
-                return jsonify({'success': True, 'warning': f'Status alterado, mas {len(webhook_erros)} webhook(s) falharam'})
-            return jsonify({'success': True})
-        except PiMakeWebhookError as wh_err:
-            app.logger.error(f"Erro ao enviar PI para produção: {wh_err}")
-            return jsonify({'success': False, 'message': str(wh_err)}), 500
+            return jsonify({'success': True, 'job_id': job_id})
         except Exception as e:
             app.logger.error(f"Erro ao enviar PI para produção: {e}", exc_info=True)
             return jsonify({'success': False, 'message': str(e)}), 500
 
+    @app.route('/api/cadu_pi/<int:id_pi>/fluxo-producao', methods=['GET'])
+    @login_required
+    def api_cadu_pi_fluxo_producao(id_pi):
+        """Estado por etapa do envio para produção (pastas, status, webhooks)"""
+        from aicentralv2.services.pi_make_webhooks import obter_fluxo_producao
+
+        fluxo = obter_fluxo_producao(id_pi)
+        if not fluxo:
+            return jsonify({'success': False, 'message': 'Nenhum envio para produção registrado'}), 404
+        return jsonify({
+            'success': True,
+            'status': fluxo['status'],
+            'etapas': fluxo.get('etapas') or {},
+            'job_id': fluxo.get('job_id'),
+            'ultimo_erro': fluxo.get('ultimo_erro'),
+            'updated_at': fluxo['updated_at'].isoformat() if fluxo.get('updated_at') else None,
+        })
+
+    @app.route('/api/cadu_pi/fluxos-producao', methods=['GET'])
+    @login_required
+    def api_cadu_pi_fluxos_producao():
+        """Fluxos de produção por status (status=falhou: dead-letter, reprocessar via /api/jobs/<job_id>/reenfileirar)"""
+        from aicentralv2.services.pi_make_webhooks import listar_fluxos_producao
+
+        fluxos = listar_fluxos_producao(request.args.get('status') or None)
+        return jsonify({
+            'success': True,
+            'fluxos': [
+                {
+                    'id_pi': f['id_pi'],
+                    'codigo_pi_cc': f.get('codigo_pi_cc'),
+                    'status': f['status'],
+                    'etapas': f.get('etapas') or {},
+                    'job_id': f.get('job_id'),
+                    'ultimo_erro': f.get('ultimo_erro'),
+                    'updated_at': f['updated_at'].isoformat() if f.get('updated_at') else None,
+                }
+                for f in fluxos
+            ],
+        })
+
     @app.route('/api/cadu_pi/<int:id_pi>/enviar-andamento', methods=['POST'])
     @login_required
     def cadu_pi_enviar_andamento(id_pi):
@@ -11706,12 +11803,21 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
         }
         if request.args.get('resp_comercial'):
             filtros['resp_comercial'] = int(request.args.get('resp_comercial'))
+        if request.args.get('busca', '').strip():
+            filtros['busca'] = request.args.get('busca').strip()
         filtros = {k: v for k, v in filtros.items() if v is not None}
         if 'mes_ref_comp' not in filtros:
             now = dt_cls.now()
             filtros['mes_ref_comp'] = f"{now.month}/{now.strftime('%y')}"
         return filtros
 
+    def _pagina_campanhas_pi_lista(filtros, apos=None):
+        """Uma página keyset do acompanhamento de campanhas: (campanhas, proximo_cursor)."""
+        limite = db.LISTAGENS_PAGINA
+        campanhas_raw = db.obter_campanhas_pi_acompanhamento(filtros, limite=limite, apos=apos) or []
+        campanhas = _anexar_preco_metrica_campanhas(campanhas_raw)
+        return campanhas, db.proximo_cursor(campanhas_raw, limite, 'created_at', 'id_campanha')
+
     def _filtros_campanhas_pi_da_request():
         """Monta filtros da listagem/dashboard de campanhas PI a partir da query string."""
         from datetime import datetime as dt_cls
@@ -11737,15 +11843,6 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
             filtros['mes_ref_comp'] = f"{now.month}/{now.strftime('%y')}"
         return filtros
 
-    def _mes_ref_comp_ordem(m):
-        if not m or '/' not in str(m):
-            return (0, 0)
-        parts = str(m).split('/', 2)
-        try:
-            return (int(parts[1].strip()), int(parts[0].strip()))
-        except (ValueError, IndexError):
-            return (0, 0)
-
     @app.route('/campanhas-pi')
     @login_required
     def campanhas_pi():
@@ -11753,15 +11850,16 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
         try:
             session['campanhas_pi_retorno'] = 'dashboard'
             from datetime import datetime as dt_cls
-            from collections import defaultdict
             import json as json_mod
 
             filtros = _filtros_campanhas_pi_da_request()
 
             vendedores = db.obter_vendedores_centralcomm()
 
-            campanhas_raw = db.obter_campanhas_pi(filtros or None)
-            campanhas = [_anexar_preco_metrica_campanha(c) for c in (campanhas_raw or [])]
+            # Métricas em lote uma vez: anexadas às linhas e reaproveitadas pelo painel
+            campanhas_raw = db.obter_campanhas_pi(filtros or None) or []
+            metricas = calcular_metricas_campanhas(campanhas_raw)
+            campanhas = anexar_preco_metrica_lote(campanhas_raw, metricas=metricas)
             auxiliares = _carregar_auxiliares_campanha()
             try:
                 meses_ref = db.obter_meses_ref_campanha_pi()
@@ -11772,148 +11870,7 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
             if not meses_ref:
                 meses_ref = [filtros['mes_ref_comp']]
 
-            def _parse_currency(raw):
-                v = _parse_brl_float(raw)
-                return float(v) if v is not None else 0.0
-
-            total_campanhas = len(campanhas) if campanhas else 0
-            campanhas_ativas = 0
-            soma_pct_objetivo = 0
-            count_pct_objetivo = 0
-            gasto_total = 0.0
-            previsto_total = 0.0
-            soma_dias = 0
-            count_dias = 0
-            valor_liquido_total = 0.0
-            valor_plataforma_total = 0.0
-            count_liquido = 0
-
-            gasto_por_plataforma = defaultdict(float)
-            gasto_por_executivo = defaultdict(float)
-            clientes_agg = defaultdict(lambda: {'investimento_total': 0.0, 'num_campanhas': 0, 'objetivo_total': 0.0, 'atingido_total': 0.0})
-            objetivo_por_mes = defaultdict(lambda: {'obj': 0, 'ating': 0, 'count': 0})
-            perf_campanhas = []
-
-            for camp in (campanhas or []):
-                if camp.get('status_nome') and camp['status_nome'].lower() in ('ativo', 'ativa', 'em andamento'):
-                    campanhas_ativas += 1
-
-                obj = camp.get('obj_contratados')
-                ating = camp.get('totalizador_atingido')
-                pct_camp = 0
-                obj_f = parse_volume_campanha(obj)
-                ating_f = parse_volume_campanha(ating)
-                if obj_f > 0:
-                    pct_camp = round((ating_f / obj_f) * 100)
-                    soma_pct_objetivo += pct_camp
-                    count_pct_objetivo += 1
-
-                gasto_val = _parse_currency(camp.get('totalizador_gasto'))
-                prev_val = _parse_currency(camp.get('custo_midia_previsto')) or _parse_currency(camp.get('valor_plataforma'))
-                gasto_total += gasto_val
-                previsto_total += prev_val
-
-                if camp.get('periodo_inicio') and camp.get('periodo_fim'):
-                    try:
-                        dias = (camp['periodo_fim'] - camp['periodo_inicio']).days
-                        if dias > 0:
-                            soma_dias += dias
-                            count_dias += 1
-                    except (TypeError, AttributeError):
-                        pass
-
-                vl_pi = 0.0
-                if camp.get('valor_liquido_pi'):
-                    try:
-                        vl_pi = float(camp['valor_liquido_pi'])
-                        valor_liquido_total += vl_pi
-                        count_liquido += 1
-                    except (ValueError, TypeError):
-                        pass
-                valor_plataforma_total += prev_val
-
-                plat_nome = camp.get('plataforma_nome') or 'Sem plataforma'
-                gasto_por_plataforma[plat_nome] += gasto_val
-
-                exec_nome = camp.get('executivo_nome') or 'Sem exec.'
-                gasto_por_executivo[exec_nome] += gasto_val
-
-                cli_nome = camp.get('cliente_nome') or 'Sem cliente'
-                clientes_agg[cli_nome]['investimento_total'] += gasto_val
-                clientes_agg[cli_nome]['num_campanhas'] += 1
-                clientes_agg[cli_nome]['objetivo_total'] += parse_volume_campanha(obj)
-                clientes_agg[cli_nome]['atingido_total'] += parse_volume_campanha(ating)
-
-                mes_key = camp.get('mes_ref_comp') or 'N/A'
-                objetivo_por_mes[mes_key]['obj'] += parse_volume_campanha(obj)
-                objetivo_por_mes[mes_key]['ating'] += parse_volume_campanha(ating)
-                objetivo_por_mes[mes_key]['count'] += 1
-
-                perf_campanhas.append({
-                    'nome': camp.get('nome_campanha', ''),
-                    'pct': pct_camp,
-                    'cliente': camp.get('cliente_nome', ''),
-                })
-
-            perf_campanhas.sort(key=lambda x: x['pct'], reverse=True)
-            perf_top10 = perf_campanhas[:10]
-
-            midia_corte = 0.40
-            midia_max = valor_liquido_total * midia_corte
-            pct_midia = round((valor_plataforma_total / midia_max) * 100, 1) if midia_max > 0 else 0
-
-            kpis = {
-                'total_campanhas': total_campanhas,
-                'campanhas_ativas': campanhas_ativas,
-                'pct_objetivo_medio': round(soma_pct_objetivo / count_pct_objetivo) if count_pct_objetivo > 0 else 0,
-                'gasto_total': gasto_total,
-                'previsto_total': previsto_total,
-                'pct_investimento': round((gasto_total / previsto_total) * 100, 1) if previsto_total > 0 else 0,
-                'tempo_medio_dias': round(soma_dias / count_dias) if count_dias > 0 else 0,
-                'valor_liquido_total': valor_liquido_total,
-                'valor_plataforma_total': valor_plataforma_total,
-                'midia_max': midia_max,
-                'pct_midia': pct_midia,
-                'midia_corte_pct': int(midia_corte * 100),
-            }
-
-            chart_plataformas = {
-                'labels': list(gasto_por_plataforma.keys()),
-                'values': [round(v, 2) for v in gasto_por_plataforma.values()],
-            }
-
-            meses_sorted = sorted(objetivo_por_mes.keys(), key=_mes_ref_comp_ordem)
-            chart_objetivo_mes = {
-                'labels': meses_sorted,
-                'obj': [objetivo_por_mes[m]['obj'] for m in meses_sorted],
-                'ating': [objetivo_por_mes[m]['ating'] for m in meses_sorted],
-            }
-
-            chart_performance = {
-                'labels': [((c.get('nome') or '')[:30]) for c in perf_top10],
-                'values': [c['pct'] for c in perf_top10],
-                'clientes': [c['cliente'] for c in perf_top10],
-            }
-
-            exec_sorted = sorted(gasto_por_executivo.items(), key=lambda x: x[1], reverse=True)
-            chart_executivos = {
-                'labels': [e[0] for e in exec_sorted],
-                'values': [round(e[1], 2) for e in exec_sorted],
-            }
-
-            top_clientes_sorted = sorted(clientes_agg.items(), key=lambda x: x[1]['investimento_total'], reverse=True)[:20]
-            top_clientes = []
-            for pos, (cli_name, data) in enumerate(top_clientes_sorted, 1):
-                pct_obj_medio = round((data['atingido_total'] / data['objetivo_total']) * 100, 1) if data['objetivo_total'] > 0 else 0
-                ticket_medio = round(data['investimento_total'] / data['num_campanhas'], 2) if data['num_campanhas'] > 0 else 0
-                top_clientes.append({
-                    'pos': pos,
-                    'nome': cli_name,
-                    'num_campanhas': data['num_campanhas'],
-                    'investimento_total': round(data['investimento_total'], 2),
-                    'ticket_medio': ticket_medio,
-                    'pct_objetivo_medio': pct_obj_medio,
-                })
+            painel = montar_painel_campanhas_pi(campanhas, metricas)
 
             now = dt_cls.now()
             mes_atual = f"{now.month}/{now.year}"
@@ -11921,14 +11878,14 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
             return render_template('campanhas_pi.html',
                 campanhas=campanhas, **auxiliares,
                 filtros=filtros, meses_ref=meses_ref,
-                kpis=kpis, vendedores=vendedores,
+                kpis=painel['kpis'], vendedores=vendedores,
                 status_ativa_id=_id_status_campanha_ativa(),
                 mes_atual=mes_atual,
-                chart_plataformas=json_mod.dumps(chart_plataformas),
-                chart_objetivo_mes=json_mod.dumps(chart_objetivo_mes),
-                chart_performance=json_mod.dumps(chart_performance),
-                chart_executivos=json_mod.dumps(chart_executivos),
-                top_clientes=top_clientes)
+                chart_plataformas=json_mod.dumps(painel['chart_plataformas']),
+                chart_objetivo_mes=json_mod.dumps(painel['chart_objetivo_mes']),
+                chart_performance=json_mod.dumps(painel['chart_performance']),
+                chart_executivos=json_mod.dumps(painel['chart_executivos']),
+                top_clientes=painel['top_clientes'])
         except Exception as e:
             import traceback
             app.logger.error(f"Erro ao listar campanhas PI: {str(e)}\n{traceback.format_exc()}")
@@ -11989,8 +11946,13 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
 
             vendedores = db.obter_vendedores_centralcomm()
 
-            campanhas_raw = db.obter_campanhas_pi_acompanhamento(filtros)
-            campanhas = [_anexar_preco_metrica_campanha(c) for c in (campanhas_raw or [])]
+            # Diários Geral atualiza todas as campanhas do mês de uma vez: lista inteira
+            if view_diarios:
+                campanhas = _anexar_preco_metrica_campanhas(db.obter_campanhas_pi_acompanhamento(filtros))
+                proximo_cursor = None
+            else:
+                campanhas, proximo_cursor = _pagina_campanhas_pi_lista(filtros)
+            total_campanhas = db.contar_campanhas_pi_acompanhamento(filtros) if proximo_cursor else len(campanhas)
             auxiliares = _carregar_auxiliares_campanha()
             try:
                 meses_ref = db.obter_meses_ref_campanha_pi_acompanhamento()
@@ -12004,13 +11966,31 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
             return render_template('campanhas_pi_lista.html',
                 campanhas=campanhas, **auxiliares,
                 filtros=filtros, meses_ref=meses_ref,
-                vendedores=vendedores, agora=dt_cls.now())
+                vendedores=vendedores, agora=dt_cls.now(),
+                proximo_cursor=proximo_cursor, total_campanhas=total_campanhas)
         except Exception as e:
             import traceback
             app.logger.error(f"Erro ao listar campanhas PI (lista): {str(e)}\n{traceback.format_exc()}")
             flash('Erro ao carregar lista de campanhas PI. Tente de novo ou contate o suporte.', 'error')
             return redirect(url_for('campanhas_pi_lista'))
 
+    @app.route('/campanhas-pi/lista/linhas')
+    @login_required
+    def campanhas_pi_lista_linhas():
+        """Página seguinte do acompanhamento de campanhas (HTML das linhas + cursor)."""
+        from datetime import datetime as dt_cls
+        try:
+            filtros = _filtros_campanhas_pi_lista_da_request()
+            campanhas, proximo_cursor = _pagina_campanhas_pi_lista(filtros, apos=request.args.get('cursor'))
+            html = render_template('partials/campanhas_pi_lista_linhas.html',
+                                   campanhas=campanhas, agora=dt_cls.now())
+            return jsonify({'success': True, 'html': html, 'proximo_cursor': proximo_cursor})
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        except Exception as e:
+            app.logger.error(f"Erro ao listar campanhas PI (página seguinte): {e}", exc_info=True)
+            return jsonify({'success': False, 'message': 'Erro ao carregar campanhas.'}), 500
+
     @app.route('/campanhas-pi/novo', methods=['POST'])
     @login_required
     def campanha_pi_nova():
@@ -13461,60 +13441,13 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
         download_name = f"NF_{nota.get('numero_nota') or id_nota}.pdf"
         return send_file(abs_path, mimetype='application/pdf', as_attachment=True, download_name=download_name)
 
-    def _confirmar_spedy_nota_fiscal(nota, *, atualizar_pi=True):
-        """Consulta Spedy, persiste status e retorna payload de confirmação."""
-        if not nota or not nota.get('spedy_invoice_id'):
-            return {
-                'confirmed': False,
-                'pending': False,
-                'error': 'Nota fiscal sem vínculo Spedy.',
-            }
-
-        spedy = SpedyService()
-        try:
-            invoice = spedy.get_service_invoice(str(nota['spedy_invoice_id']))
-        except SpedyAPIError as exc:
-            return {'confirmed': False, 'pending': True, 'error': str(exc)}
-
-        update = map_spedy_invoice_to_nf_update(invoice)
-        if update:
-            db.atualizar_nota_fiscal(nota['id'], update)
-
-        status = (update.get('spedy_status') or invoice.get('status') or '').lower()
-        confirmed = status == 'authorized'
-        pending = status in SPEDY_PENDING_STATUSES or status in {'', 'processing'}
-
-        if confirmed and atualizar_pi and nota.get('id_pi'):
-            _atualizar_pi_status_nf_emitida(nota['id_pi'])
-            registrar_auditoria(
-                acao='emitir',
-                modulo='faturamento',
-                descricao=f'NFS-e Spedy autorizada - PI {nota.get("id_pi")} NF {update.get("numero_nota")}',
-                registro_id=nota['id'],
-                registro_tipo='nota_fiscal',
-                dados_novos={
-                    'spedy_invoice_id': nota.get('spedy_invoice_id'),
-                    'numero_nota': update.get('numero_nota'),
-                    'spedy_status': status,
-                },
-            )
+    def _estado_spedy_nota_fiscal(nota):
+        """Payload de acompanhamento da emissão lido só do banco (a conclusão é do job/webhook)."""
+        from aicentralv2.services.spedy_nf import estado_spedy_nota_fiscal
 
-        nota_atual = db.obter_nota_fiscal_por_id(nota['id'])
         return {
-            'confirmed': confirmed,
-            'pending': pending and not confirmed,
-            'failed': status in SPEDY_TERMINAL_STATUSES and not confirmed,
-            'spedy_status': status,
-            'spedy_message': update.get('spedy_message') or (invoice.get('processingDetail') or {}).get('message'),
-            'numero_nota': update.get('numero_nota') or (nota_atual or {}).get('numero_nota'),
-            'nota': _serializar_nota_fiscal_resposta(nota_atual),
-            'spedy_invoice': {
-                'id': invoice.get('id'),
-                'number': invoice.get('number'),
-                'status': invoice.get('status'),
-                'environmentType': invoice.get('environmentType'),
-                'amount': invoice.get('amount'),
-            },
+            **estado_spedy_nota_fiscal(nota),
+            'nota': _serializar_nota_fiscal_resposta(nota),
         }
 
     @app.route('/api/cadu_pi/<int:id_pi>/spedy/emitir-teste', methods=['POST'])
@@ -13542,14 +13475,12 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
 
         if nota_alvo and nota_alvo.get('spedy_invoice_id') and (
             (nota_alvo.get('spedy_status') or '').lower() in SPEDY_PENDING_STATUSES
-            or (nota_alvo.get('spedy_status') or '').lower() == 'processing'
         ):
-            confirm = _confirmar_spedy_nota_fiscal(nota_alvo)
             return jsonify({
                 'success': True,
                 'already_pending': True,
                 'nf_id': nota_alvo['id'],
-                **confirm,
+                **_estado_spedy_nota_fiscal(nota_alvo),
             })
 
         if not pi.get('id_cliente'):
@@ -13618,9 +13549,7 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
         if spedy_info:
             db.atualizar_nota_fiscal(nf_id, spedy_info)
 
-        nota = db.obter_nota_fiscal_por_id(nf_id)
-        confirm = _confirmar_spedy_nota_fiscal(nota, atualizar_pi=False)
-
+        # Auditoria antes da conclusão: a autorização é atribuída a quem solicitou
         registrar_auditoria(
             acao='solicitar',
             modulo='faturamento',
@@ -13634,32 +13563,80 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
             },
         )
 
-        if confirm.get('confirmed'):
-            _atualizar_pi_status_nf_emitida(id_pi)
+        # Emissão imediata pode já voltar autorizada/rejeitada no próprio pedido
+        from aicentralv2.services.spedy_nf import agendar_conclusao_spedy, aplicar_invoice_spedy, spedy_status_pendente
+
+        nota = db.obter_nota_fiscal_por_id(nf_id)
+        invoice = ((order.get('invoices') or [None])[0]) or {}
+        if invoice.get('status') and not spedy_status_pendente(invoice.get('status')):
+            aplicar_invoice_spedy(nota, invoice)
+            nota = db.obter_nota_fiscal_por_id(nf_id)
+        elif nota.get('spedy_invoice_id'):
+            try:
+                agendar_conclusao_spedy()
+            except Exception as exc:
+                # A varredura periódica conclui a nota mesmo sem o gatilho
+                current_app.logger.error(f'Erro ao agendar conclusão Spedy da NF {nf_id}: {exc}', exc_info=True)
 
+        estado = _estado_spedy_nota_fiscal(nota)
         return jsonify({
             'success': True,
             'nf_id': nf_id,
             'transaction_id': transaction_id,
-            **confirm,
-        }), 201
+            **estado,
+        }), 202 if estado['pending'] else 201
 
     @app.route('/api/cadu_pi_nota_fiscal/<int:id_nota>/spedy/status', methods=['GET'])
     @login_required
     def api_spedy_status_nota_fiscal(id_nota):
-        """Consulta Spedy e confirma emissão da NFS-e vinculada à nota fiscal."""
+        """Estado da emissão da NFS-e vinculada à nota fiscal (lido do banco)."""
         nota = db.obter_nota_fiscal_por_id(id_nota)
         if not nota:
             return jsonify({'error': 'Nota fiscal não encontrada.'}), 404
         if not nota.get('spedy_invoice_id'):
             return jsonify({'error': 'Nota fiscal sem emissão Spedy em andamento.'}), 400
 
-        result = _confirmar_spedy_nota_fiscal(nota)
+        result = _estado_spedy_nota_fiscal(nota)
         status_code = 200
         if result.get('failed'):
             status_code = 422
         return jsonify(result), status_code
 
+    @app.route('/api/spedy/webhook', methods=['POST'])
+    def api_spedy_webhook():
+        """Recebe da Spedy a mudança de status de NFS-e e conclui a nota fiscal."""
+        import hmac
+        from aicentralv2.services.spedy_nf import agendar_conclusao_spedy, aplicar_invoice_spedy
+
+        esperado = (current_app.config.get('SPEDY_WEBHOOK_SECRET') or '').strip()
+        recebido = (request.headers.get('X-Webhook-Secret') or request.args.get('secret') or '').strip()
+        if not esperado:
+            current_app.logger.warning('SPEDY_WEBHOOK_SECRET não configurado; webhook Spedy bloqueado.')
+            return jsonify({'error': 'Webhook desabilitado.'}), 403
+        if not hmac.compare_digest(recebido, esperado):
+            return jsonify({'error': 'Secret inválido.'}), 401
+
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return jsonify({'error': 'Payload inválido.'}), 400
+        data = payload.get('data') if isinstance(payload.get('data'), dict) else payload
+        # Evento de pedido traz a NFS-e em invoices[]; evento de NFS-e traz ela mesma
+        invoices = data.get('invoices') if isinstance(data.get('invoices'), list) else []
+        invoice = (invoices[0] if invoices else data) or {}
+        invoice_id = invoice.get('id')
+
+        nota = db.obter_nota_fiscal_por_spedy_invoice_id(invoice_id) if invoice_id else None
+        if not nota:
+            return jsonify({'success': True, 'ignored': True}), 200
+
+        if invoice.get('status'):
+            status = aplicar_invoice_spedy(nota, invoice)
+        else:
+            # Notificação sem o corpo da NFS-e: a varredura busca o estado na Spedy
+            agendar_conclusao_spedy(0)
+            status = None
+        return jsonify({'success': True, 'nf_id': nota['id'], 'spedy_status': status}), 200
+
     # ==================== ASSINATURAS / SUBSCRIPTION ====================
 
     @app.route('/assinatura/checkout')
@@ -13757,6 +13734,8 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
                 'telefone': data['telefone'],
             }
 
+            # Fatura e e-mails na mesma transação: o outbox só entrega se a fatura for gravada
+            conn = db.get_db()
             invoice_result = db.criar_invoice_assinatura({
                 'id_cliente': cliente_id,
                 'id_plan': new_plan_id,
@@ -13765,7 +13744,7 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
                 'due_date': due_date,
                 'billing_data': billing_data,
                 'created_by': user_id,
-            })
+            }, conn=conn)
 
             invoice_number = invoice_result['invoice_number']
 
@@ -13783,16 +13762,25 @@ Gere apenas o texto da mensagem, sem marcações markdown."""
                 'telefone': data['telefone'],
             }
 
+            id_invoice = invoice_result['id_invoice']
             try:
-                send_subscription_confirmation_email(data['email_faturamento'], email_data)
+                send_subscription_confirmation_email(
+                    data['email_faturamento'], email_data,
+                    conn=conn, dedup_key=f'assinatura:{id_invoice}:confirmacao'
+                )
             except Exception as e:
                 app.logger.error(f"Erro ao enviar email de confirmação: {e}")
 
             try:
-                send_new_subscription_internal_email(email_data)
+                send_new_subscription_internal_email(
+                    email_data, conn=conn, dedup_key=f'assinatura:{id_invoice}:interno'
+                )
             except Exception as e:
                 app.logger.error(f"Erro ao enviar email interno: {e}")
 
+            conn.commit()
+            executar_jobs_inline_pendentes()
+
             # 5. Registrar auditoria
             registrar_auditoria(
                 acao='CREATE',
@@ -14589,13 +14577,11 @@ Se não encontrar um campo, deixe vazio. Não invente dados.'''
     def api_leads_processar_importacao():
         """Processa texto livre com Gemini para estruturar leads"""
         try:
-            import requests as http_requests
             data = request.get_json(force=True)
             texto_bruto = data.get('texto_bruto', '').strip()
             if not texto_bruto:
                 return jsonify({'success': False, 'message': 'Texto obrigatório'}), 400
 
-            openrouter_key = os.environ.get('OPENROUTER_API_KEY', '')
             system_prompt = '''Você é um processador de dados de leads comerciais. Receba texto livre com informações de empresas e contatos e extraia dados estruturados.
 
 Regras:
@@ -14618,37 +14604,24 @@ Retorne APENAS JSON válido:
     }
 ]'''
 
-            ai_resp = http_requests.post(
-                'https://openrouter.ai/api/v1/chat/completions',
-                headers={
-                    'Authorization': f'Bearer {openrouter_key}',
-                    'HTTP-Referer': 'https://centralcomm.media',
-                    'X-Title': 'CentralComm AI',
-                    'Content-Type': 'application/json',
-                },
-                json={
-                    'model': 'google/gemini-2.5-flash',
-                    'messages': [
-                        {'role': 'system', 'content': system_prompt},
-                        {'role': 'user', 'content': texto_bruto},
-                    ],
-                    'temperature': 0.1,
-                    'max_tokens': 4000,
-                },
-                timeout=120,
-            )
-            ai_resp.raise_for_status()
-            ai_text = ai_resp.json()['choices'][0]['message']['content']
-
             import json as json_mod
-            ai_text_clean = ai_text.strip()
-            if ai_text_clean.startswith('```'):
-                ai_text_clean = ai_text_clean.split('\n', 1)[1] if '\n' in ai_text_clean else ai_text_clean[3:]
-                if ai_text_clean.endswith('```'):
-                    ai_text_clean = ai_text_clean[:-3]
-            leads_parsed = json_mod.loads(ai_text_clean)
 
-            return jsonify({'success': True, 'leads': leads_parsed})
+            def montar_resposta(ai_text):
+                ai_text_clean = ai_text.strip()
+                if ai_text_clean.startswith('```'):
+                    ai_text_clean = ai_text_clean.split('\n', 1)[1] if '\n' in ai_text_clean else ai_text_clean[3:]
+                    if ai_text_clean.endswith('```'):
+                        ai_text_clean = ai_text_clean[:-3]
+                return {'success': True, 'leads': json_mod.loads(ai_text_clean)}
+
+            parametros = dict(max_tokens=4000, temperature=0.1, timeout_leitura=120)
+            if quer_stream(request):
+                return resposta_sse(
+                    stream_openrouter(system_prompt, texto_bruto, **parametros),
+                    montar_resposta,
+                    rotulo='leads.processar_importacao',
+                )
+            return jsonify(montar_resposta(chamar_openrouter(system_prompt, texto_bruto, **parametros)))
         except Exception as e:
             app.logger.error(f"Erro api_leads_processar_importacao: {e}")
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -14731,7 +14704,6 @@ Retorne apenas o texto melhorado, sem explicações.'''
         }
         """
         try:
-            import requests as http_requests
             data = request.get_json(force=True) or {}
             texto = (data.get('texto') or '').strip()
             acao = (data.get('acao') or 'corrigir').strip().lower()
@@ -14806,29 +14778,17 @@ Retorne apenas o texto melhorado, sem explicações.'''
                     f"6. Retorne APENAS o texto ampliado, sem aspas, sem cabeçalhos, sem explicações."
                 )
 
-            openrouter_key = os.environ.get('OPENROUTER_API_KEY', '')
-            ai_resp = http_requests.post(
-                'https://openrouter.ai/api/v1/chat/completions',
-                headers={
-                    'Authorization': f'Bearer {openrouter_key}',
-                    'HTTP-Referer': 'https://centralcomm.media',
-                    'X-Title': 'CentralComm AI',
-                    'Content-Type': 'application/json',
-                },
-                json={
-                    'model': 'google/gemini-2.5-flash',
-                    'messages': [
-                        {'role': 'system', 'content': system_prompt},
-                        {'role': 'user', 'content': texto},
-                    ],
-                    'temperature': 0.2 if acao == 'corrigir' else 0.4,
-                    'max_tokens': 2000,
-                },
-                timeout=60,
-            )
-            ai_resp.raise_for_status()
-            texto_final = ai_resp.json()['choices'][0]['message']['content'].strip()
-            return jsonify({'success': True, 'texto': texto_final, 'acao': acao, 'campo': campo})
+            def montar_resposta(texto_final):
+                return {'success': True, 'texto': texto_final.strip(), 'acao': acao, 'campo': campo}
+
+            parametros = dict(max_tokens=2000, temperature=0.2 if acao == 'corrigir' else 0.4)
+            if quer_stream(request):
+                return resposta_sse(
+                    stream_openrouter(system_prompt, texto, **parametros),
+                    montar_resposta,
+                    rotulo='ia.cotacao_briefing',
+                )
+            return jsonify(montar_resposta(chamar_openrouter(system_prompt, texto, **parametros)))
         except Exception as e:
             app.logger.error(f"Erro api_ia_cotacao_briefing: {e}", exc_info=True)
             return jsonify({'success': False, 'message': str(e)}), 500
@@ -0,0 +1,234 @@
+"""
+=====================================================
+ANALYTICS AGREGADOS
+Contadores do CADU (eventos, pageviews, sessões) pré-agregados
+=====================================================
+
+As métricas do admin (/api/admin/metrics/*) leem tabelas agregadas em vez de varrer
+cadu_analytics_events / cadu_analytics_pageviews / cadu_analytics_sessions:
+
+- analytics_eventos_hora: por dia, hora, event_type e event_category (contagem e
+  soma de metadata.valor_total);
+- analytics_paginas_dia: por dia, page_path e page_type (views, tempo na página e os
+  user_ids distintos do dia, para únicos em qualquer janela);
+- analytics_sessoes_dia: uma linha por dia (v_analytics_sessions_daily materializada)
+  com o bitmap dos usuários ativos (bit n = user_id n); DAU/WAU/MAU são o OR dos
+  bitmaps da janela, então a leitura é O(dias);
+- analytics_usuarios_dia: por dia e usuário (sessões, duração, páginas), base do ranking
+  de engajamento.
+
+O recálculo usa o mecanismo de services/dashboard_rollups.py (fontes com marca d'água,
+sem trigger nas tabelas do CADU): o job 'analytics.atualizar_agregados' refaz de
+(última execução - 1 dia) até hoje a cada ANALYTICS_AGREGADOS_INTERVALO s.
+
+Partições: depois de migrations/partition_cadu_analytics.py, eventos e pageviews são
+particionados por mês; o job diário 'analytics.manter_particoes' cria as partições dos
+próximos ANALYTICS_PARTICOES_FUTURAS meses e, com ANALYTICS_RETENCAO_MESES > 0, remove
+(DROP, sem DELETE) as partições inteiras mais antigas que isso. Os agregados ficam.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from aicentralv2 import db
+from aicentralv2.services.dashboard_rollups import atualizar_rollups, registrar_fonte
+from aicentralv2.services.jobs import PRIORIDADE_BAIXA, job_handler
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_AGREGADOS_INTERVALO = int(os.getenv('ANALYTICS_AGREGADOS_INTERVALO', '120'))
+ANALYTICS_PARTICOES_FUTURAS = int(os.getenv('ANALYTICS_PARTICOES_FUTURAS', '2'))
+# 0 = nunca remove partições
+ANALYTICS_RETENCAO_MESES = int(os.getenv('ANALYTICS_RETENCAO_MESES', '0'))
+
+# Tabela bruta particionada por mês -> coluna da chave de partição
+TABELAS_PARTICIONADAS = {
+    'cadu_analytics_events': 'created_at',
+    'cadu_analytics_pageviews': 'viewed_at',
+}
+
+_SQL_EVENTOS = '''
+    INSERT INTO analytics_eventos_hora (dia, hora, event_type, event_category, total, valor_total)
+    SELECT
+        d.dia,
+        EXTRACT(HOUR FROM e.created_at)::smallint,
+        e.event_type,
+        e.event_category,
+        COUNT(*),
+        COALESCE(SUM(CASE WHEN e.metadata->>'valor_total' ~ '^-?[0-9]+(\\.[0-9]+)?$'
+                          THEN (e.metadata->>'valor_total')::numeric END), 0)
+    FROM unnest(%(dias)s::date[]) AS d(dia)
+    JOIN cadu_analytics_events e ON e.created_at >= d.dia AND e.created_at < d.dia + 1
+    GROUP BY 1, 2, 3, 4
+'''
+
+_SQL_PAGINAS = '''
+    INSERT INTO analytics_paginas_dia (dia, page_path, page_type, views, tempo_total, tempo_amostras, usuarios)
+    SELECT
+        d.dia,
+        p.page_path,
+        COALESCE(p.page_type, '-'),
+        COUNT(*),
+        COALESCE(SUM(p.time_on_page_seconds), 0),
+        COUNT(p.time_on_page_seconds),
+        COALESCE(ARRAY_AGG(DISTINCT p.user_id::integer) FILTER (WHERE p.user_id IS NOT NULL), '{}')
+    FROM unnest(%(dias)s::date[]) AS d(dia)
+    JOIN cadu_analytics_pageviews p ON p.viewed_at >= d.dia AND p.viewed_at < d.dia + 1
+    GROUP BY 1, 2, 3
+'''
+
+# A view continua sendo a definição dos totais diários (inclusive mobile/desktop);
+# o bitmap vem das sessões iniciadas no dia
+_SQL_SESSOES = '''
+    INSERT INTO analytics_sessoes_dia
+        (dia, total_sessions, unique_users, avg_duration, total_pageviews,
+         mobile_sessions, desktop_sessions, usuarios_bitmap)
+    SELECT
+        v.date::date,
+        COALESCE(v.total_sessions, 0),
+        COALESCE(v.unique_users, 0),
+        COALESCE(v.avg_duration, 0),
+        COALESCE(v.total_pageviews, 0),
+        COALESCE(v.mobile_sessions, 0),
+        COALESCE(v.desktop_sessions, 0),
+        (SELECT analytics_bitmap(ARRAY_AGG(DISTINCT s.user_id::integer))
+         FROM cadu_analytics_sessions s
+         WHERE s.started_at >= v.date::date AND s.started_at < v.date::date + 1)
+    FROM v_analytics_sessions_daily v
+    WHERE v.date = ANY(%(dias)s::date[])
+'''
+
+_SQL_USUARIOS = '''
+    INSERT INTO analytics_usuarios_dia
+        (dia, user_id, sessoes, duracao_total, duracao_amostras, paginas, ultima_sessao)
+    SELECT
+        d.dia,
+        s.user_id,
+        COUNT(*),
+        COALESCE(SUM(s.duration_seconds), 0),
+        COUNT(s.duration_seconds),
+        COALESCE(SUM(s.pages_viewed), 0),
+        MAX(s.started_at)
+    FROM unnest(%(dias)s::date[]) AS d(dia)
+    JOIN cadu_analytics_sessions s ON s.started_at >= d.dia AND s.started_at < d.dia + 1
+    GROUP BY 1, 2
+'''
+
+registrar_fonte('analytics_eventos', origem='cadu_analytics_events', rollup='analytics_eventos_hora',
+                sql=_SQL_EVENTOS, marca_dagua=True)
+registrar_fonte('analytics_paginas', origem='cadu_analytics_pageviews', rollup='analytics_paginas_dia',
+                sql=_SQL_PAGINAS, coluna='viewed_at', marca_dagua=True)
+registrar_fonte('analytics_sessoes', origem='cadu_analytics_sessions', rollup='analytics_sessoes_dia',
+                sql=_SQL_SESSOES, coluna='started_at', marca_dagua=True)
+registrar_fonte('analytics_usuarios', origem='cadu_analytics_sessions', rollup='analytics_usuarios_dia',
+                sql=_SQL_USUARIOS, coluna='started_at', marca_dagua=True)
+FONTES_ANALYTICS = ('analytics_eventos', 'analytics_paginas', 'analytics_sessoes', 'analytics_usuarios')
+
+
+def atualizar_agregados_analytics(*, completo: bool = False) -> Dict[str, Dict[str, Any]]:
+    return atualizar_rollups(FONTES_ANALYTICS, completo=completo)
+
+
+# ==================== PARTIÇÕES MENSAIS ====================
+
+def _somar_meses(mes: date, n: int) -> date:
+    indice = mes.year * 12 + mes.month - 1 + n
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def nome_particao(tabela: str, mes: date) -> str:
+    return f'{tabela}_p{mes:%Y%m}'
+
+
+def tabela_particionada(cursor, tabela: str) -> bool:
+    cursor.execute('''
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)
+        ) AS particionada
+    ''', (tabela,))
+    return cursor.fetchone()['particionada']
+
+
+def _particoes(cursor, tabela: str) -> List[Dict[str, Any]]:
+    """Partições da tabela com o limite superior (None = MAXVALUE/DEFAULT)."""
+    cursor.execute('''
+        SELECT c.relname AS nome, pg_get_expr(c.relpartbound, c.oid) AS limites
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    ''', (tabela,))
+    particoes = []
+    for linha in cursor.fetchall():
+        ate = re.search(r"TO \('(\d{4}-\d{2}-\d{2})", linha['limites'] or '')
+        particoes.append({'nome': linha['nome'], 'ate': date.fromisoformat(ate.group(1)) if ate else None})
+    return particoes
+
+
+def garantir_particoes(meses_futuros: int = ANALYTICS_PARTICOES_FUTURAS, hoje: Optional[date] = None) -> List[str]:
+    """Cria as partições do mês corrente e dos próximos meses (tabelas já particionadas)."""
+    conn = db.get_db()
+    inicio = (hoje or date.today()).replace(day=1)
+    criadas: List[str] = []
+    for tabela in TABELAS_PARTICIONADAS:
+        with conn.cursor() as cursor:
+            if not tabela_particionada(cursor, tabela):
+                conn.rollback()
+                continue
+            # A partição legada (criada na migração) cobre tudo até o fim do mês da migração
+            cobertura = max((p['ate'] for p in _particoes(cursor, tabela) if p['ate']), default=None)
+        conn.commit()
+        for n in range(meses_futuros + 1):
+            mes = _somar_meses(inicio, n)
+            if cobertura and mes < cobertura:
+                continue
+            nome = nome_particao(tabela, mes)
+            with conn.cursor() as cursor:
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {nome} PARTITION OF {tabela}
+                    FOR VALUES FROM ('{mes.isoformat()}') TO ('{_somar_meses(mes, 1).isoformat()}')
+                ''')
+            conn.commit()
+            criadas.append(nome)
+    return criadas
+
+
+def remover_particoes_antigas(retencao_meses: int = ANALYTICS_RETENCAO_MESES,
+                              hoje: Optional[date] = None) -> List[str]:
+    """DROP das partições cujo limite superior é anterior à janela de retenção."""
+    if retencao_meses <= 0:
+        return []
+    conn = db.get_db()
+    corte = _somar_meses((hoje or date.today()).replace(day=1), -retencao_meses)
+    removidas: List[str] = []
+    for tabela in TABELAS_PARTICIONADAS:
+        with conn.cursor() as cursor:
+            if not tabela_particionada(cursor, tabela):
+                conn.rollback()
+                continue
+            antigas = [p['nome'] for p in _particoes(cursor, tabela) if p['ate'] and p['ate'] <= corte]
+            for nome in antigas:
+                cursor.execute(f'DROP TABLE {nome}')
+        conn.commit()
+        removidas.extend(antigas)
+    if removidas:
+        logger.info(f"Analytics: partições removidas (retenção {retencao_meses} meses): {', '.join(removidas)}")
+    return removidas
+
+
+@job_handler('analytics.atualizar_agregados', max_tentativas=1, timeout_segundos=1800,
+             intervalo_segundos=ANALYTICS_AGREGADOS_INTERVALO)
+def _job_atualizar_agregados(ctx):
+    """Recalcula os agregados do analytics desde a última execução."""
+    return atualizar_agregados_analytics()
+
+
+@job_handler('analytics.manter_particoes', max_tentativas=3, intervalo_segundos=86400,
+             prioridade=PRIORIDADE_BAIXA)
+def _job_manter_particoes(ctx):
+    """Cria as partições dos próximos meses e aplica a retenção."""
+    return {'criadas': garantir_particoes(), 'removidas': remover_particoes_antigas()}
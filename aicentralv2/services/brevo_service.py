@@ -8,7 +8,11 @@ Serviço de envio de emails via API Brevo
 import requests
 import json
 import logging
+import os
+import threading
+import time
 import unicodedata
+from requests.adapters import HTTPAdapter
 from urllib.parse import quote
 from flask import current_app, render_template
 from typing import Optional, List, Dict, Any, Union
@@ -42,6 +46,43 @@ BREVO_LISTAS_CONTATOS_VENDEDOR: Dict[str, Dict[str, int]] = {
 
 _SEGMENTOS_CONTATO_BREVO = frozenset({"clientes", "leads"})
 
+# Sessão HTTP reaproveitada por processo (keep-alive com a API Brevo)
+_http_lock = threading.Lock()
+_http_session: Optional[requests.Session] = None
+_http_session_pid: Optional[int] = None
+
+
+def brevo_http_session() -> requests.Session:
+    """Sessão `requests` com pool de conexões, recriada após fork (workers Gunicorn)."""
+    global _http_session, _http_session_pid
+    pid = os.getpid()
+    if _http_session is None or _http_session_pid != pid:
+        with _http_lock:
+            if _http_session is None or _http_session_pid != pid:
+                sessao = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                sessao.mount("https://", adapter)
+                _http_session = sessao
+                _http_session_pid = pid
+    return _http_session
+
+
+def brevo_falha_retentavel(status_code: Optional[int]) -> bool:
+    """429 e 5xx (ou falha de rede, status None) valem nova tentativa."""
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+def brevo_retry_after(response: requests.Response) -> Optional[float]:
+    """Segundos até liberar o rate limit (Retry-After ou x-sib-ratelimit-reset)."""
+    for header in ("Retry-After", "x-sib-ratelimit-reset"):
+        valor = response.headers.get(header)
+        if valor:
+            try:
+                return max(float(valor), 0.0)
+            except ValueError:
+                continue
+    return None
+
 
 def mensagem_usuario_falha_envio_brevo(response_text: str, status_code: int = None) -> str:
     """
@@ -243,7 +284,7 @@ class BrevoService:
             payload["attachment"] = attachments
         
         try:
-            response = requests.post(
+            response = brevo_http_session().post(
                 f"{BREVO_API_URL}/smtp/email",
                 headers=self._headers,
                 json=payload,
@@ -281,6 +322,65 @@ class BrevoService:
                 "user_message": mensagem_usuario_falha_envio_brevo(str(e)),
             }
     
+    def enviar_lote_email(
+        self,
+        versoes: List[Dict[str, Any]],
+        subject: str,
+        html_content: str,
+        text_content: str = None,
+        sender: Dict[str, str] = None,
+        attachments: List[Dict] = None
+    ) -> Dict[str, Any]:
+        """
+        Envia o mesmo conteúdo para vários destinatários numa única chamada (messageVersions)
+        
+        Args:
+            versoes: Lista de {"to": [{"email", "name"}], "subject"?, "params"?, "replyTo"?}
+            subject: Assunto base (cada versão pode sobrescrever)
+            html_content: Conteúdo HTML comum a todas as versões
+            text_content: Conteúdo texto plano (opcional)
+            sender: Remetente (opcional, usa padrão da config)
+            attachments: Lista de anexos comuns (opcional)
+        
+        Returns:
+            Dict com messageIds (na ordem das versões) ou error/status_code/retryable
+        """
+        payload = {
+            "sender": sender or self._sender,
+            "subject": subject,
+            "htmlContent": html_content,
+            "messageVersions": versoes
+        }
+        if text_content:
+            payload["textContent"] = text_content
+        if attachments:
+            payload["attachment"] = attachments
+        
+        try:
+            response = brevo_http_session().post(
+                f"{BREVO_API_URL}/smtp/email",
+                headers=self._headers,
+                json=payload,
+                timeout=30
+            )
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Falha de rede no envio em lote Brevo ({len(versoes)} versões): {e}")
+            return {"success": False, "error": str(e), "status_code": None, "retryable": True}
+        
+        if response.status_code in [200, 201]:
+            result = response.json() if response.content else {}
+            ids = result.get("messageIds") or ([result["messageId"]] if result.get("messageId") else [])
+            return {"success": True, "messageIds": ids}
+        
+        logger.error(f"Erro no envio em lote Brevo: {response.status_code} - {response.text[:500]}")
+        return {
+            "success": False,
+            "error": response.text,
+            "status_code": response.status_code,
+            "retryable": brevo_falha_retentavel(response.status_code),
+            "retry_after": brevo_retry_after(response),
+        }
+    
     def enviar_email_com_template(
         self,
         template_name: str,
@@ -288,7 +388,10 @@ class BrevoService:
         to_name: str,
         subject: str,
         params: Dict[str, Any] = None,
-        template_folder: str = "emails/externos"
+        template_folder: str = "emails/externos",
+        via_outbox: bool = False,
+        dedup_key: str = None,
+        conn=None
     ) -> Dict[str, Any]:
         """
         Envia email usando template Flask/Jinja2
@@ -300,9 +403,13 @@ class BrevoService:
             subject: Assunto do email
             params: Parâmetros para o template
             template_folder: Pasta do template (default: emails/externos)
+            via_outbox: Se True, grava em email_outbox e o worker entrega (não bloqueia a request)
+            dedup_key: Chave de deduplicação do outbox (opcional)
+            conn: Conexão da alteração de negócio; o e-mail entra na mesma transação
+                  (o chamador faz o commit). Sem ela, o outbox grava em conexão própria
         
         Returns:
-            Dict com resultado do envio
+            Dict com resultado do envio (ou do enfileiramento, com queued=True)
         """
         try:
             # Renderizar template - passar params como variáveis separadas (minúsculas)
@@ -312,14 +419,6 @@ class BrevoService:
                 # Converter chaves para minúsculas para compatibilidade com Jinja2
                 template_vars = {k.lower(): v for k, v in params.items()}
             html_content = render_template(template_path, **template_vars)
-            
-            return self.enviar_email(
-                to_email=to_email,
-                to_name=to_name,
-                subject=subject,
-                html_content=html_content,
-                params=params
-            )
         except Exception as e:
             logger.error(f"Erro ao renderizar template {template_name}: {e}")
             return {
@@ -327,6 +426,37 @@ class BrevoService:
                 "error": f"Erro no template: {str(e)}",
                 "user_message": "Erro ao montar o conteúdo do e-mail. Contate o suporte se persistir.",
             }
+        
+        if via_outbox:
+            from aicentralv2.services.email_outbox import enfileirar_emails
+            try:
+                ids = enfileirar_emails(
+                    to_email,
+                    subject=subject,
+                    html_content=html_content,
+                    to_name=to_name,
+                    params=params,
+                    sender=self._sender,
+                    dedup_key=dedup_key,
+                    origem=template_name,
+                    conn=conn,
+                )
+                return {"success": True, "queued": True, "outbox_ids": ids}
+            except Exception as e:
+                logger.error(f"Erro ao enfileirar email {template_name}: {e}")
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "user_message": "Não foi possível registrar o e-mail para envio. Tente novamente.",
+                }
+        
+        return self.enviar_email(
+            to_email=to_email,
+            to_name=to_name,
+            subject=subject,
+            html_content=html_content,
+            params=params
+        )
     
     def adicionar_contato(
         self,
@@ -366,7 +496,7 @@ class BrevoService:
             payload["listIds"] = lista_ids
         
         try:
-            response = requests.post(
+            response = brevo_http_session().post(
                 f"{BREVO_API_URL}/contacts",
                 headers=self._headers,
                 json=payload,
@@ -398,7 +528,7 @@ class BrevoService:
         payload = {"emails": [email]}
         
         try:
-            response = requests.post(
+            response = brevo_http_session().post(
                 f"{BREVO_API_URL}/contacts/lists/{lista_id}/contacts/remove",
                 headers=self._headers,
                 json=payload,
@@ -416,6 +546,91 @@ class BrevoService:
             logger.error(f"Erro ao remover contato da lista: {e}")
             return {"success": False, "error": str(e)}
     
+    def _post_com_retry(self, path: str, payload: Dict[str, Any], tentativas: int = 5) -> requests.Response:
+        """POST na API Brevo respeitando 429 (Retry-After) e retentando 5xx/falhas de rede."""
+        espera = 1.0
+        for tentativa in range(1, tentativas + 1):
+            try:
+                response = brevo_http_session().post(
+                    f"{BREVO_API_URL}{path}",
+                    headers=self._headers,
+                    json=payload,
+                    timeout=60
+                )
+            except requests.exceptions.RequestException:
+                if tentativa == tentativas:
+                    raise
+                time.sleep(espera)
+                espera = min(espera * 2, 60)
+                continue
+            if not brevo_falha_retentavel(response.status_code) or tentativa == tentativas:
+                return response
+            pausa = brevo_retry_after(response) if response.status_code == 429 else None
+            logger.warning(f"Brevo {path}: HTTP {response.status_code}, nova tentativa em {pausa or espera:.0f}s")
+            time.sleep(pausa if pausa is not None else espera)
+            espera = min(espera * 2, 60)
+        return response
+    
+    def importar_contatos(
+        self,
+        contatos: List[Dict[str, Any]],
+        lista_ids: List[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Importa/atualiza contatos em lote (POST /contacts/import, processado de forma assíncrona)
+        
+        Args:
+            contatos: Lista de {"email": "...", "attributes": {...}}
+            lista_ids: Listas às quais todos os contatos do lote serão adicionados
+        
+        Returns:
+            Dict com processId em caso de sucesso
+        """
+        payload = {
+            "jsonBody": contatos,
+            "updateExistingContacts": True,
+            "emptyContactsAttributes": False
+        }
+        if lista_ids:
+            payload["listIds"] = lista_ids
+        try:
+            response = self._post_com_retry("/contacts/import", payload)
+            if response.status_code in [200, 201, 202, 204]:
+                result = response.json() if response.content else {}
+                logger.info(f"Brevo: importação de {len(contatos)} contato(s) aceita (processId={result.get('processId')})")
+                return {"success": True, "processId": result.get("processId")}
+            logger.error(f"Erro ao importar contatos: {response.status_code} - {response.text}")
+            return {"success": False, "error": response.text, "status_code": response.status_code}
+        except Exception as e:
+            logger.error(f"Erro ao importar contatos: {e}")
+            return {"success": False, "error": str(e)}
+    
+    def alterar_contatos_da_lista(self, lista_id: int, emails: List[str], remover: bool = False) -> Dict[str, Any]:
+        """
+        Adiciona (ou remove) vários contatos existentes de uma lista numa única chamada
+        
+        Args:
+            lista_id: ID da lista
+            emails: E-mails dos contatos (a API aceita até 150 por chamada)
+            remover: Se True, remove da lista em vez de adicionar
+        
+        Returns:
+            Dict com resultado da operação
+        """
+        acao = "remove" if remover else "add"
+        try:
+            response = self._post_com_retry(f"/contacts/lists/{lista_id}/contacts/{acao}", {"emails": emails})
+            if response.status_code in [200, 201, 204]:
+                return {"success": True}
+            # 400 quando nenhum dos e-mails precisava de alteração (já fora/dentro da lista)
+            if response.status_code == 400 and "already" in response.text.lower():
+                return {"success": True, "sem_alteracao": True}
+            logger.error(f"Erro ao alterar contatos da lista {lista_id} ({acao}): {response.status_code} - {response.text}")
+            return {"success": False, "error": response.text, "status_code": response.status_code}
+        except Exception as e:
+            logger.error(f"Erro ao alterar contatos da lista {lista_id} ({acao}): {e}")
+            return {"success": False, "error": str(e)}
+    
     def atualizar_email_do_contato(
         self,
         email_identificador: str,
@@ -435,7 +650,7 @@ class BrevoService:
         payload = {"attributes": attrs}
         try:
             enc = quote(ident, safe="")
-            response = requests.put(
+            response = brevo_http_session().put(
                 f"{BREVO_API_URL}/contacts/{enc}",
                 headers=self._headers,
                 json=payload,
@@ -638,10 +853,12 @@ def enviar_email_convite(
     cliente_nome: str,
     expires_at: str,
     role_label: str = "Usuário",
-    dias_validade: int = 7
+    dias_validade: int = 7,
+    dedup_key: str = None,
+    conn=None
 ) -> Dict[str, Any]:
     """
-    Envia email de convite para novo usuário
+    Envia email de convite para novo usuário (via outbox)
     
     Args:
         to_email: Email do convidado
@@ -652,6 +869,8 @@ def enviar_email_convite(
         expires_at: Data de expiração formatada
         role_label: Label da função do usuário
         dias_validade: Dias de validade do convite
+        dedup_key: Evita reenvio do mesmo convite (opcional)
+        conn: Conexão da alteração de negócio (e-mail na mesma transação; opcional)
     
     Returns:
         Dict com resultado do envio
@@ -671,22 +890,33 @@ def enviar_email_convite(
         "EXPIRA_EM": expires_at
     }
     
-    # Adicionar contato à lista de convites pendentes
-    service.adicionar_contato(
-        email=to_email,
-        nome=to_name,
-        lista_ids=[LISTA_CONVITES_PENDENTES],
-        atributos={"EMPRESA": cliente_nome, "CONVIDADO_POR": invited_by}
-    )
-    
-    return service.enviar_email_com_template(
+    resultado = service.enviar_email_com_template(
         template_name="convite-usuario.html",
         to_email=to_email,
         to_name=to_name or "Usuário",
         subject=f"Você foi convidado para o Cadu por {invited_by}",
         params=params,
-        template_folder="emails/externos"
+        template_folder="emails/externos",
+        via_outbox=True,
+        dedup_key=dedup_key,
+        conn=conn
     )
+    if not resultado.get("success"):
+        return resultado
+    
+    # Adicionar contato à lista de convites pendentes (no worker, fora da request)
+    from aicentralv2.services.brevo_sync import agendar_contato
+    try:
+        agendar_contato(
+            to_email,
+            nome=to_name,
+            lista_ids=[LISTA_CONVITES_PENDENTES],
+            atributos={"EMPRESA": cliente_nome, "CONVIDADO_POR": invited_by},
+            conn=conn
+        )
+    except Exception as e:
+        logger.error(f"Erro ao agendar contato do convite {to_email}: {e}")
+    return resultado
 
 
 def enviar_email_boas_vindas(
@@ -871,90 +1101,6 @@ def enviar_email_senha_alterada(
     )
 
 
-def enviar_notificacao_interna(
-    to_email: str,
-    to_name: str,
-    titulo: str,
-    mensagem: str,
-    acao_link: str = None,
-    acao_texto: str = None
-) -> Dict[str, Any]:
-    """
-    Envia notificação interna do sistema
-    
-    Args:
-        to_email: Email do destinatário
-        to_name: Nome do destinatário
-        titulo: Título da notificação
-        mensagem: Corpo da mensagem
-        acao_link: Link de ação (opcional)
-        acao_texto: Texto do botão de ação (opcional)
-    
-    Returns:
-        Dict com resultado do envio
-    """
-    service = get_brevo_service()
-    
-    params = {
-        "NOME": to_name,
-        "TITULO": titulo,
-        "MENSAGEM": mensagem,
-        "ACAO_LINK": acao_link or "",
-        "ACAO_TEXTO": acao_texto or "Ver Detalhes"
-    }
-    
-    return service.enviar_email_com_template(
-        template_name="notificacao.html",
-        to_email=to_email,
-        to_name=to_name,
-        subject=titulo,
-        params=params,
-        template_folder="emails/internos"
-    )
-
-
-def enviar_alerta_consumo(
-    to_email: str,
-    to_name: str,
-    percentual: int,
-    plano: str,
-    usado: int,
-    limite: int
-) -> Dict[str, Any]:
-    """
-    Envia alerta de consumo de tokens
-    
-    Args:
-        to_email: Email do usuário
-        to_name: Nome do usuário
-        percentual: Percentual consumido
-        plano: Nome do plano
-        usado: Tokens usados
-        limite: Limite do plano
-    
-    Returns:
-        Dict com resultado do envio
-    """
-    service = get_brevo_service()
-    
-    params = {
-        "NOME": to_name,
-        "PERCENTUAL": percentual,
-        "PLANO": plano,
-        "USADO": usado,
-        "LIMITE": limite
-    }
-    
-    return service.enviar_email_com_template(
-        template_name="alerta_consumo.html",
-        to_email=to_email,
-        to_name=to_name,
-        subject=f"Alerta: {percentual}% do limite de tokens consumido",
-        params=params,
-        template_folder="emails/internos"
-    )
-
-
 # =====================================================
 # FUNÇÕES DE COTAÇÕES
 # =====================================================
@@ -973,7 +1119,9 @@ def enviar_email_cotacao_aprovada(
     link_admin: str = None,
     tem_agencia: bool = False,
     agencia_nome: str = None,
-    agencia_email: str = None
+    agencia_email: str = None,
+    dedup_key: str = None,
+    conn=None
 ) -> Dict[str, Any]:
     """
     Envia email interno de cotação aprovada
@@ -993,6 +1141,8 @@ def enviar_email_cotacao_aprovada(
         tem_agencia: Se True, indica que a cotação tem uma agência vinculada
         agencia_nome: Nome da agência (quando tem_agencia=True)
         agencia_email: Email da agência (quando tem_agencia=True)
+        dedup_key: Evita reenvio do mesmo aviso (opcional)
+        conn: Conexão da alteração de negócio (e-mail na mesma transação; opcional)
     """
     service = get_brevo_service()
     
@@ -1017,7 +1167,10 @@ def enviar_email_cotacao_aprovada(
         to_name=to_name,
         subject=f"✓ Proposta Aprovada - {numero_cotacao}",
         params=params,
-        template_folder="emails/internos"
+        template_folder="emails/internos",
+        via_outbox=True,
+        dedup_key=dedup_key,
+        conn=conn
     )
 
 
@@ -1032,7 +1185,9 @@ def enviar_email_cotacao_rejeitada(
     data_rejeicao: str = None,
     tem_agencia: bool = False,
     agencia_nome: str = None,
-    agencia_email: str = None
+    agencia_email: str = None,
+    dedup_key: str = None,
+    conn=None
 ) -> Dict[str, Any]:
     """
     Envia email interno de cotação rejeitada
@@ -1049,6 +1204,8 @@ def enviar_email_cotacao_rejeitada(
         tem_agencia: Se True, indica que a cotação tem uma agência vinculada
         agencia_nome: Nome da agência (quando tem_agencia=True)
         agencia_email: Email da agência (quando tem_agencia=True)
+        dedup_key: Evita reenvio do mesmo aviso (opcional)
+        conn: Conexão da alteração de negócio (e-mail na mesma transação; opcional)
     """
     service = get_brevo_service()
     
@@ -1070,7 +1227,10 @@ def enviar_email_cotacao_rejeitada(
         to_name=to_name,
         subject=f"✗ Proposta Rejeitada - {numero_cotacao}",
         params=params,
-        template_folder="emails/internos"
+        template_folder="emails/internos",
+        via_outbox=True,
+        dedup_key=dedup_key,
+        conn=conn
     )
 
 
@@ -1082,7 +1242,9 @@ def enviar_email_cotacao_recebida(
     cliente_nome: str,
     valor_total: str,
     link_proposta: str,
-    data_recebimento: str = None
+    data_recebimento: str = None,
+    dedup_key: str = None,
+    conn=None
 ) -> Dict[str, Any]:
     """
     Envia email interno de nova cotação recebida
@@ -1104,7 +1266,10 @@ def enviar_email_cotacao_recebida(
         to_name=to_name,
         subject=f"Nova Proposta - {numero_cotacao}",
         params=params,
-        template_folder="emails/internos"
+        template_folder="emails/internos",
+        via_outbox=True,
+        dedup_key=dedup_key,
+        conn=conn
     )
 
 
@@ -1116,7 +1281,9 @@ def enviar_email_novo_usuario_admin(
     empresa: str,
     role_label: str = None,
     data_cadastro: str = None,
-    link_admin: str = None
+    link_admin: str = None,
+    dedup_key: str = None,
+    conn=None
 ) -> Dict[str, Any]:
     """
     Envia email interno de novo usuário cadastrado (para admin)
@@ -1138,7 +1305,10 @@ def enviar_email_novo_usuario_admin(
         to_name=to_name,
         subject=f"Novo Usuário Cadastrado - {nome_usuario}",
         params=params,
-        template_folder="emails/internos"
+        template_folder="emails/internos",
+        via_outbox=True,
+        dedup_key=dedup_key,
+        conn=conn
     )
 
 
@@ -1164,7 +1334,9 @@ def enviar_email_cotacao_enviada_cliente(
     data_envio: str = None,
     tem_agencia: bool = False,
     agencia_nome: str = None,
-    cliente_nome: str = None
+    cliente_nome: str = None,
+    dedup_key: str = None,
+    conn=None
 ) -> Dict[str, Any]:
     """
     Envia email para cliente ou agência de cotação enviada
@@ -1188,6 +1360,8 @@ def enviar_email_cotacao_enviada_cliente(
         tem_agencia: Se True, indica que o destinatário é uma agência
         agencia_nome: Nome da agência (quando tem_agencia=True)
         cliente_nome: Nome do cliente (usado quando tem agência para informar de qual cliente é a cotação)
+        dedup_key: Evita reenvio do mesmo e-mail (opcional)
+        conn: Conexão da alteração de negócio (e-mail na mesma transação; opcional)
     """
     from datetime import datetime
     
@@ -1222,7 +1396,10 @@ def enviar_email_cotacao_enviada_cliente(
         to_name=to_name,
         subject=f"Sua Proposta - {numero_cotacao}",
         params=params,
-        template_folder="emails/externos"
+        template_folder="emails/externos",
+        via_outbox=True,
+        dedup_key=dedup_key,
+        conn=conn
     )
 
 
@@ -1239,7 +1416,9 @@ def enviar_email_cotacao_aprovada_cliente(
     link_proposta: str = None,
     tem_agencia: bool = False,
     agencia_nome: str = None,
-    cliente_nome: str = None
+    cliente_nome: str = None,
+    dedup_key: str = None,
+    conn=None
 ) -> Dict[str, Any]:
     """
     Envia email para cliente/agência de cotação aprovada
@@ -1258,6 +1437,8 @@ def enviar_email_cotacao_aprovada_cliente(
         tem_agencia: Se True, indica que o destinatário é uma agência
         agencia_nome: Nome da agência (quando tem_agencia=True)
         cliente_nome: Nome do cliente (usado quando tem agência para informar de qual cliente é a cotação)
+        dedup_key: Evita reenvio do mesmo e-mail (opcional)
+        conn: Conexão da alteração de negócio (e-mail na mesma transação; opcional)
     """
     from datetime import datetime
     
@@ -1287,7 +1468,10 @@ def enviar_email_cotacao_aprovada_cliente(
         to_name=to_name,
         subject=f"Proposta Aprovada - {numero_cotacao}",
         params=params,
-        template_folder="emails/externos"
+        template_folder="emails/externos",
+        via_outbox=True,
+        dedup_key=dedup_key,
+        conn=conn
     )
 
 
@@ -1303,7 +1487,9 @@ def enviar_email_cotacao_rejeitada_cliente(
     link_nova_cotacao: str = None,
     tem_agencia: bool = False,
     agencia_nome: str = None,
-    cliente_nome: str = None
+    cliente_nome: str = None,
+    dedup_key: str = None,
+    conn=None
 ) -> Dict[str, Any]:
     """
     Envia email para cliente/agência de cotação rejeitada/cancelada
@@ -1321,6 +1507,8 @@ def enviar_email_cotacao_rejeitada_cliente(
         tem_agencia: Se True, indica que o destinatário é uma agência
         agencia_nome: Nome da agência (quando tem_agencia=True)
         cliente_nome: Nome do cliente (usado quando tem agência para informar de qual cliente é a cotação)
+        dedup_key: Evita reenvio do mesmo e-mail (opcional)
+        conn: Conexão da alteração de negócio (e-mail na mesma transação; opcional)
     """
     from datetime import datetime
     
@@ -1349,5 +1537,8 @@ def enviar_email_cotacao_rejeitada_cliente(
         to_name=to_name,
         subject=f"Atualização da Proposta - {numero_cotacao}",
         params=params,
-        template_folder="emails/externos"
+        template_folder="emails/externos",
+        via_outbox=True,
+        dedup_key=dedup_key,
+        conn=conn
     )
@@ -0,0 +1,259 @@
+"""
+=====================================================
+BREVO SYNC
+Sincronização em lote (por diferença) de contatos com listas do Brevo
+=====================================================
+
+O estado da última sincronização fica em brevo_sync_state (segmento + e-mail ->
+listas e hash dos atributos). A cada execução só o que mudou vai para a API:
+
+- contatos novos ou com atributos alterados: POST /contacts/import, agrupados
+  pelo conjunto de listas de destino (milhares de contatos por chamada);
+- contatos só com lista nova: POST /contacts/lists/{id}/contacts/add (150 por chamada);
+- listas que deixaram de valer (troca de executivo; leads saindo da 21):
+  POST /contacts/lists/{id}/contacts/remove (150 por chamada).
+
+As chamadas rodam em paralelo (BREVO_SYNC_CONCORRENCIA) e BrevoService._post_com_retry
+trata 429/5xx. As mesmas regras de lista de brevo_sincronizar_contato_lista_executivo
+valem aqui (clientes: 21 + executivo; leads: só executivo, sai da 21).
+
+Contatos avulsos (ex.: convite) vão por agendar_contato: o job brevo.adicionar_contato
+chama a API no worker, fora da request.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import psycopg
+
+from aicentralv2.db import get_db, get_db_config
+from aicentralv2.services.brevo_service import (
+    BREVO_LISTAS_CONTATOS_VENDEDOR,
+    LISTA_USUARIOS_ATIVOS,
+    BrevoService,
+    brevo_id_lista_por_nome_executivo,
+    get_brevo_service,
+)
+from aicentralv2.services.jobs import JOBS_INLINE, enfileirar_job, executar_job_por_id, job_handler
+
+logger = logging.getLogger(__name__)
+
+BREVO_SYNC_LOTE_IMPORT = int(os.getenv('BREVO_SYNC_LOTE_IMPORT', '2000'))
+BREVO_SYNC_LOTE_LISTA = 150  # limite da API para add/remove em lista
+BREVO_SYNC_CONCORRENCIA = int(os.getenv('BREVO_SYNC_CONCORRENCIA', '4'))
+
+# Listas que a sincronização controla (só essas podem ser removidas por diferença)
+LISTAS_GERENCIADAS = frozenset(
+    [LISTA_USUARIOS_ATIVOS]
+    + [lista for listas in BREVO_LISTAS_CONTATOS_VENDEDOR.values() for lista in listas.values()]
+)
+
+
+def montar_contato(email: str, nome: Optional[str], segmento: str, nome_executivo: Optional[str],
+                   atributos: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Estado desejado de um contato no Brevo (listas, listas a remover e atributos)."""
+    email = (email or '').strip().lower()
+    if not email:
+        return None
+    seg = (segmento or '').strip().lower()
+    lista_exec = brevo_id_lista_por_nome_executivo(nome_executivo, seg)
+    attrs = {k: v for k, v in (atributos or {}).items() if v not in (None, '')}
+    if nome:
+        attrs['NOME'] = nome
+
+    if seg == 'leads' and lista_exec is not None:
+        listas, remover = [lista_exec], [LISTA_USUARIOS_ATIVOS]
+    else:
+        listas = [LISTA_USUARIOS_ATIVOS]
+        if lista_exec is not None and lista_exec not in listas:
+            listas.append(lista_exec)
+        remover = []
+    return {'email': email, 'listas': sorted(listas), 'remover': remover, 'atributos': attrs}
+
+
+def _hash_atributos(atributos: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(atributos, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _carregar_estado(segmento: str) -> Dict[str, Dict[str, Any]]:
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute(
+            'SELECT email, list_ids, atributos_hash FROM brevo_sync_state WHERE segmento = %s',
+            (segmento,)
+        )
+        return {r['email']: r for r in cursor.fetchall()}
+
+
+def calcular_diff(contatos: Iterable[Dict[str, Any]], estado: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Compara o estado desejado com o último sincronizado.
+
+    Retorna:
+        importar: {tupla de listas: [contatos]} (novos ou com atributos alterados)
+        adicionar: {lista_id: [emails]} (atributos iguais, só lista nova)
+        remover: {lista_id: [emails]}
+        inalterados: quantidade sem nenhuma chamada
+    """
+    importar: Dict[Tuple[int, ...], List[Dict[str, Any]]] = {}
+    adicionar: Dict[int, List[str]] = {}
+    remover: Dict[int, List[str]] = {}
+    inalterados = 0
+
+    for contato in contatos:
+        email = contato['email']
+        anterior = estado.get(email)
+        contato['hash'] = _hash_atributos(contato['atributos'])
+        listas = set(contato['listas'])
+        listas_anteriores = set(anterior['list_ids']) if anterior else set()
+
+        if anterior is None or anterior['atributos_hash'] != contato['hash']:
+            importar.setdefault(tuple(contato['listas']), []).append(contato)
+        else:
+            for lista in sorted(listas - listas_anteriores):
+                adicionar.setdefault(lista, []).append(email)
+
+        # Remoções: listas explícitas do segmento (sempre na 1a vez, depois só se voltou)
+        # + listas gerenciadas que este segmento colocou antes e não valem mais
+        a_remover = (listas_anteriores & LISTAS_GERENCIADAS) - listas
+        if anterior is None:
+            a_remover |= set(contato['remover'])
+        for lista in sorted(a_remover):
+            remover.setdefault(lista, []).append(email)
+
+        if anterior is not None and anterior['atributos_hash'] == contato['hash'] \
+                and listas == listas_anteriores and not a_remover:
+            inalterados += 1
+
+    return {'importar': importar, 'adicionar': adicionar, 'remover': remover, 'inalterados': inalterados}
+
+
+def _lotes(itens: List[Any], tamanho: int) -> Iterable[List[Any]]:
+    for i in range(0, len(itens), tamanho):
+        yield itens[i:i + tamanho]
+
+
+def _salvar_estado(segmento: str, contatos: List[Dict[str, Any]], falhas: set) -> int:
+    linhas = [
+        (segmento, c['email'], c['listas'], c['hash'])
+        for c in contatos if c['email'] not in falhas
+    ]
+    if not linhas:
+        return 0
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.executemany('''
+            INSERT INTO brevo_sync_state (segmento, email, list_ids, atributos_hash, sincronizado_em)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON CONFLICT (segmento, email) DO UPDATE
+               SET list_ids = EXCLUDED.list_ids,
+                   atributos_hash = EXCLUDED.atributos_hash,
+                   sincronizado_em = NOW()
+        ''', linhas)
+    conn.commit()
+    return len(linhas)
+
+
+def sincronizar_contatos(contatos: Iterable[Dict[str, Any]], segmento: str, *,
+                         api_key: Optional[str] = None, completo: bool = False,
+                         dry_run: bool = False, concorrencia: Optional[int] = None) -> Dict[str, Any]:
+    """Aplica no Brevo só a diferença entre `contatos` (de montar_contato) e brevo_sync_state.
+
+    completo=True ignora o estado salvo (reenvia todos, ainda em lote).
+    Precisa de app_context (lê/grava brevo_sync_state).
+    """
+    por_email: Dict[str, Dict[str, Any]] = {}
+    for contato in contatos:
+        if contato and contato['email'] not in por_email:
+            por_email[contato['email']] = contato
+    desejados = list(por_email.values())
+
+    estado = {} if completo else _carregar_estado(segmento)
+    diff = calcular_diff(desejados, estado)
+
+    operacoes = []
+    for listas, grupo in diff['importar'].items():
+        for lote in _lotes(grupo, BREVO_SYNC_LOTE_IMPORT):
+            operacoes.append(('importar', list(listas), lote))
+    for lista, emails in diff['adicionar'].items():
+        for lote in _lotes(emails, BREVO_SYNC_LOTE_LISTA):
+            operacoes.append(('adicionar', lista, lote))
+    for lista, emails in diff['remover'].items():
+        for lote in _lotes(emails, BREVO_SYNC_LOTE_LISTA):
+            operacoes.append(('remover', lista, lote))
+
+    resumo = {
+        'contatos': len(desejados),
+        'importar': sum(len(g) for g in diff['importar'].values()),
+        'adicionar': sum(len(e) for e in diff['adicionar'].values()),
+        'remover': sum(len(e) for e in diff['remover'].values()),
+        'inalterados': diff['inalterados'],
+        'chamadas': len(operacoes),
+        'falhas': 0,
+    }
+    if dry_run or not operacoes:
+        return resumo
+
+    # Chave resolvida aqui: as threads do pool não têm app_context para ler a config
+    service = BrevoService(api_key=api_key or get_brevo_service()._api_key)
+
+    def _executar(op):
+        tipo, alvo, lote = op
+        if tipo == 'importar':
+            corpo = [{'email': c['email'], 'attributes': c['atributos']} for c in lote]
+            res = service.importar_contatos(corpo, lista_ids=alvo)
+            emails = [c['email'] for c in lote]
+        else:
+            res = service.alterar_contatos_da_lista(alvo, lote, remover=(tipo == 'remover'))
+            emails = lote
+        return op, res, emails
+
+    falhas = set()
+    with ThreadPoolExecutor(max_workers=max(1, concorrencia or BREVO_SYNC_CONCORRENCIA)) as pool:
+        for (tipo, alvo, _), res, emails in pool.map(_executar, operacoes):
+            if not res.get('success'):
+                falhas.update(emails)
+                logger.error(f"Brevo sync ({segmento}) {tipo} {alvo}: {res.get('error')}")
+
+    resumo['falhas'] = len(falhas)
+    # Contatos com falha ficam fora do estado e entram de novo na próxima execução
+    _salvar_estado(segmento, desejados, falhas)
+    return resumo
+
+
+# ==================== CONTATO AVULSO ====================
+
+def agendar_contato(email: str, nome: Optional[str] = None, lista_ids: Optional[List[int]] = None,
+                    atributos: Optional[Dict[str, Any]] = None, *, conn=None) -> int:
+    """Agenda adicionar_contato no worker (job brevo.adicionar_contato) e devolve o id do job.
+
+    Com `conn`, o job entra na transação do chamador; sem `conn`, grava numa conexão própria.
+    """
+    payload = {'email': email, 'nome': nome, 'lista_ids': lista_ids or [], 'atributos': atributos or {}}
+    if conn is not None:
+        return enfileirar_job('brevo.adicionar_contato', payload, conn=conn)
+    with psycopg.connect(**get_db_config()) as proprio:
+        job_id = enfileirar_job('brevo.adicionar_contato', payload, conn=proprio)
+        proprio.commit()
+    if JOBS_INLINE:
+        executar_job_por_id(job_id)
+    return job_id
+
+
+@job_handler('brevo.adicionar_contato', max_tentativas=5, backoff_segundos=60)
+def _job_adicionar_contato(ctx):
+    p = ctx.payload
+    res = get_brevo_service().adicionar_contato(
+        email=p['email'],
+        nome=p.get('nome'),
+        atributos=p.get('atributos') or None,
+        lista_ids=p.get('lista_ids') or None,
+    )
+    if not res.get('success'):
+        raise RuntimeError(f"Brevo adicionar_contato {p['email']}: {res.get('error')}")
+    return {'email': p['email']}
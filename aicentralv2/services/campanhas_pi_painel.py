@@ -0,0 +1,201 @@
+"""
+=====================================================
+CAMPANHAS PI — PAINEL
+KPIs e gráficos do dashboard /campanhas-pi em colunas NumPy
+=====================================================
+
+O dashboard agrega as campanhas do filtro em KPIs, gasto por plataforma e por
+executivo, ranking de clientes, objetivo x atingido por mês e performance:
+
+- Gasto, volumes, custo previsto e valor da plataforma vêm das colunas do cálculo em
+  lote (campanha_pi_metrics_lote.calcular_metricas), já convertidas uma vez por
+  campo; a rota passa as mesmas métricas usadas para anexar os preços às linhas.
+- Uma passada pelas linhas monta o restante (status, dias, valor líquido) e os
+  códigos inteiros de cada chave de agrupamento, na ordem em que aparecem.
+- Somas, contagens e médias saem de operações sobre os arrays (np.bincount por
+  grupo); a ordem dos rótulos e os desempates são os mesmos do laço anterior.
+- A conversão de moeda/volume continua a de campanha_pi_metrics (parse_brl_float,
+  volume_qty_campanha), e não a do SQL, para os valores do painel baterem com os
+  das listas e dos e-mails.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from aicentralv2.campanha_pi_metrics_lote import calcular_metricas
+
+STATUS_ATIVOS = ('ativo', 'ativa', 'em andamento')
+MIDIA_CORTE = 0.40
+TOP_CLIENTES = 20
+TOP_PERFORMANCE = 10
+
+
+def _mes_ref_comp_ordem(m):
+    if not m or '/' not in str(m):
+        return (0, 0)
+    parts = str(m).split('/', 2)
+    try:
+        return (int(parts[1].strip()), int(parts[0].strip()))
+    except (ValueError, IndexError):
+        return (0, 0)
+
+
+def _codigo(grupos: Dict[str, int], chave: str) -> int:
+    codigo = grupos.get(chave)
+    if codigo is None:
+        codigo = grupos[chave] = len(grupos)
+    return codigo
+
+
+def _colunas(campanhas: List[Dict[str, Any]], metricas: Dict[str, Any]) -> Dict[str, Any]:
+    """Colunas numéricas (das métricas em lote) e códigos de grupo."""
+    n = len(campanhas)
+    col = metricas['colunas']
+    custo_prev = metricas['custo_midia_previsto']
+    dias = np.zeros(n)
+    liquido = np.zeros(n)
+    ativa = np.zeros(n, dtype=bool)
+    grupos = {'plataforma': {}, 'executivo': {}, 'cliente': {}, 'mes': {}}
+    codigos = {nome: np.zeros(n, dtype=np.int64) for nome in grupos}
+
+    for i, camp in enumerate(campanhas):
+        status = camp.get('status_nome')
+        ativa[i] = bool(status) and status.lower() in STATUS_ATIVOS
+
+        inicio, fim = camp.get('periodo_inicio'), camp.get('periodo_fim')
+        if inicio and fim:
+            try:
+                dias[i] = (fim - inicio).days
+            except (TypeError, AttributeError):
+                pass
+
+        if camp.get('valor_liquido_pi'):
+            try:
+                liquido[i] = float(camp['valor_liquido_pi'])
+            except (ValueError, TypeError):
+                pass
+
+        codigos['plataforma'][i] = _codigo(grupos['plataforma'], camp.get('plataforma_nome') or 'Sem plataforma')
+        codigos['executivo'][i] = _codigo(grupos['executivo'], camp.get('executivo_nome') or 'Sem exec.')
+        codigos['cliente'][i] = _codigo(grupos['cliente'], camp.get('cliente_nome') or 'Sem cliente')
+        codigos['mes'][i] = _codigo(grupos['mes'], camp.get('mes_ref_comp') or 'N/A')
+
+    return {
+        'obj': np.nan_to_num(col['obj_contratados'], nan=0.0),
+        'ating': np.nan_to_num(col['totalizador_atingido'], nan=0.0),
+        'gasto': np.nan_to_num(col['totalizador_gasto'], nan=0.0),
+        # custo previsto; sem ele, valor_plataforma
+        'previsto': np.where(np.isnan(custo_prev), np.nan_to_num(col['valor_plataforma'], nan=0.0), custo_prev),
+        'dias': dias, 'liquido': liquido, 'ativa': ativa,
+        'codigos': codigos,
+        'rotulos': {nome: list(g) for nome, g in grupos.items()},
+    }
+
+
+def _somar_por(codigos: np.ndarray, rotulos: List[str], valores: np.ndarray = None) -> np.ndarray:
+    return np.bincount(codigos, weights=valores, minlength=len(rotulos))
+
+
+def _pct_arredondado(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    """round(num / den * 100) onde den > 0, senão 0 (arredondamento do round do Python)."""
+    pct = np.zeros(num.shape)
+    ok = den > 0
+    pct[ok] = np.rint((num[ok] / den[ok]) * 100)
+    return pct
+
+
+def montar_painel(campanhas: Iterable[Dict[str, Any]],
+                  metricas: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """KPIs e dados dos gráficos do dashboard.
+
+    metricas: resultado de calcular_metricas para as mesmas linhas (calculado aqui se omitido).
+    """
+    campanhas = list(campanhas or [])
+    col = _colunas(campanhas, metricas if metricas is not None else calcular_metricas(campanhas))
+    obj, ating, gasto, previsto = col['obj'], col['ating'], col['gasto'], col['previsto']
+    codigos, rotulos = col['codigos'], col['rotulos']
+
+    pct_camp = _pct_arredondado(ating, obj)
+    com_obj = obj > 0
+    com_dias = col['dias'] > 0
+
+    gasto_total = float(gasto.sum())
+    previsto_total = float(previsto.sum())
+    valor_liquido_total = float(col['liquido'].sum())
+    valor_plataforma_total = previsto_total
+    midia_max = valor_liquido_total * MIDIA_CORTE
+
+    kpis = {
+        'total_campanhas': len(campanhas),
+        'campanhas_ativas': int(col['ativa'].sum()),
+        'pct_objetivo_medio': round(float(pct_camp[com_obj].sum()) / int(com_obj.sum())) if com_obj.any() else 0,
+        'gasto_total': gasto_total,
+        'previsto_total': previsto_total,
+        'pct_investimento': round((gasto_total / previsto_total) * 100, 1) if previsto_total > 0 else 0,
+        'tempo_medio_dias': round(float(col['dias'][com_dias].sum()) / int(com_dias.sum())) if com_dias.any() else 0,
+        'valor_liquido_total': valor_liquido_total,
+        'valor_plataforma_total': valor_plataforma_total,
+        'midia_max': midia_max,
+        'pct_midia': round((valor_plataforma_total / midia_max) * 100, 1) if midia_max > 0 else 0,
+        'midia_corte_pct': int(MIDIA_CORTE * 100),
+    }
+
+    gasto_plataforma = _somar_por(codigos['plataforma'], rotulos['plataforma'], gasto)
+    chart_plataformas = {
+        'labels': rotulos['plataforma'],
+        'values': [round(float(v), 2) for v in gasto_plataforma],
+    }
+
+    gasto_executivo = _somar_por(codigos['executivo'], rotulos['executivo'], gasto)
+    exec_sorted = sorted(zip(rotulos['executivo'], gasto_executivo.tolist()), key=lambda x: x[1], reverse=True)
+    chart_executivos = {
+        'labels': [e[0] for e in exec_sorted],
+        'values': [round(e[1], 2) for e in exec_sorted],
+    }
+
+    obj_mes = _somar_por(codigos['mes'], rotulos['mes'], obj)
+    ating_mes = _somar_por(codigos['mes'], rotulos['mes'], ating)
+    ordem_mes = sorted(range(len(rotulos['mes'])), key=lambda k: _mes_ref_comp_ordem(rotulos['mes'][k]))
+    chart_objetivo_mes = {
+        'labels': [rotulos['mes'][k] for k in ordem_mes],
+        'obj': [float(obj_mes[k]) for k in ordem_mes],
+        'ating': [float(ating_mes[k]) for k in ordem_mes],
+    }
+
+    top_perf = np.argsort(-pct_camp, kind='stable')[:TOP_PERFORMANCE]
+    chart_performance = {
+        'labels': [((campanhas[i].get('nome_campanha', '') or '')[:30]) for i in top_perf],
+        'values': [int(pct_camp[i]) for i in top_perf],
+        'clientes': [campanhas[i].get('cliente_nome', '') for i in top_perf],
+    }
+
+    cli_cod = codigos['cliente']
+    cli_invest = _somar_por(cli_cod, rotulos['cliente'], gasto)
+    cli_num = _somar_por(cli_cod, rotulos['cliente'])
+    cli_obj = _somar_por(cli_cod, rotulos['cliente'], obj)
+    cli_ating = _somar_por(cli_cod, rotulos['cliente'], ating)
+    top_cli = np.argsort(-cli_invest, kind='stable')[:TOP_CLIENTES]
+    top_clientes = []
+    for pos, k in enumerate(top_cli, 1):
+        invest, num = float(cli_invest[k]), int(cli_num[k])
+        objetivo, atingido = float(cli_obj[k]), float(cli_ating[k])
+        top_clientes.append({
+            'pos': pos,
+            'nome': rotulos['cliente'][k],
+            'num_campanhas': num,
+            'investimento_total': round(invest, 2),
+            'ticket_medio': round(invest / num, 2) if num > 0 else 0,
+            'pct_objetivo_medio': round((atingido / objetivo) * 100, 1) if objetivo > 0 else 0,
+        })
+
+    return {
+        'kpis': kpis,
+        'chart_plataformas': chart_plataformas,
+        'chart_objetivo_mes': chart_objetivo_mes,
+        'chart_performance': chart_performance,
+        'chart_executivos': chart_executivos,
+        'top_clientes': top_clientes,
+    }
@@ -0,0 +1,237 @@
+"""
+=====================================================
+CLIENTE MÉTRICAS
+Métricas por cliente mantidas incrementalmente para as listagens
+=====================================================
+
+A listagem de clientes (db.obter_clientes_paginado) e a carteira do CRM
+(crm/routes.api_clientes) leem cliente_metricas, uma linha por cliente, em vez de
+agregar cotações, briefings, contatos e atividades a cada carregamento:
+
+- Contadores do mês (mes = mês de referência): cotações, aprovadas, valor aprovado,
+  briefings e briefings aceitos. Linha de mês anterior é lida como zero
+  (db._metrica_mes), então a virada do mês não exige recálculo geral.
+- Contatos (total e ativos), atividades pendentes e a agência principal.
+- Marcação: triggers por statement nas tabelas de origem (db.CLIENTE_METRICAS_TABELAS)
+  gravam os clientes afetados em cliente_metricas_pendencias.
+- Recálculo: o job 'clientes.atualizar_metricas' (a cada CLIENTE_METRICAS_INTERVALO s)
+  consome as pendências em lotes de CLIENTE_METRICAS_LOTE clientes; as listagens
+  aplicam um lote antes de ler, para refletir a escrita que acabou de acontecer.
+- Primeira execução (tabela vazia) ou completo=True: recalcula todos os clientes.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional
+
+from aicentralv2 import db
+from aicentralv2.services.jobs import job_handler
+
+logger = logging.getLogger(__name__)
+
+CLIENTE_METRICAS_INTERVALO = int(os.getenv('CLIENTE_METRICAS_INTERVALO', '60'))
+CLIENTE_METRICAS_LOTE = int(os.getenv('CLIENTE_METRICAS_LOTE', '500'))
+
+_LOCK = 'cliente_metricas'
+
+# Tabelas do CRM criadas por migração; sem elas o contador correspondente fica zerado
+_SQL_ATIVIDADES = '''
+    SELECT sa.cliente_id AS id_cliente, COUNT(*) AS pendentes
+    FROM sales_atividades sa
+    JOIN alvo a ON a.id_cliente = sa.cliente_id
+    WHERE sa.status = 'pendente'
+    GROUP BY sa.cliente_id
+'''
+_SQL_PRINCIPAL = '''
+    SELECT DISTINCT ON (ca.id_cliente) ca.id_cliente, ca.id_agencia_cliente
+    FROM tbl_cliente_agencia ca
+    JOIN alvo a ON a.id_cliente = ca.id_cliente
+    WHERE ca.is_principal = TRUE
+    ORDER BY ca.id_cliente, ca.id
+'''
+
+_SQL_RECALCULAR = '''
+    WITH alvo AS (
+        SELECT cli.id_cliente FROM tbl_cliente cli
+        WHERE %(todos)s OR cli.id_cliente = ANY(%(ids)s::int[])
+    ),
+    cotacoes AS (
+        SELECT
+            c.client_id AS id_cliente,
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE c.status = 'Aprovada') AS aprovadas,
+            COALESCE(SUM(c.valor_total_proposta) FILTER (WHERE c.status = 'Aprovada'), 0) AS valor_aprovado
+        FROM cadu_cotacoes c
+        JOIN alvo a ON a.id_cliente = c.client_id
+        WHERE c.created_at >= DATE_TRUNC('month', CURRENT_DATE)
+          AND c.deleted_at IS NULL
+        GROUP BY c.client_id
+    ),
+    briefings AS (
+        SELECT
+            b.id_cliente,
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE b.status IN ('accepted', 'aprovado', 'aceito')) AS aceitos
+        FROM cadu_briefings b
+        JOIN alvo a ON a.id_cliente = b.id_cliente
+        WHERE b.created_at >= DATE_TRUNC('month', CURRENT_DATE)
+          AND b.deleted_at IS NULL
+        GROUP BY b.id_cliente
+    ),
+    contatos AS (
+        SELECT
+            cont.pk_id_tbl_cliente AS id_cliente,
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE cont.status = true) AS ativos
+        FROM tbl_contato_cliente cont
+        JOIN alvo a ON a.id_cliente = cont.pk_id_tbl_cliente
+        GROUP BY cont.pk_id_tbl_cliente
+    ),
+    atividades AS ({atividades}),
+    principal AS ({principal})
+    INSERT INTO cliente_metricas
+        (id_cliente, mes, cotacoes_mes, cotacoes_aprovadas_mes, valor_aprovado_mes,
+         briefings_mes, briefings_aceitos_mes, total_contatos, contatos_ativos,
+         atividades_pendentes, agencia_principal_id, atualizado_em)
+    SELECT
+        a.id_cliente,
+        DATE_TRUNC('month', CURRENT_DATE)::date,
+        COALESCE(cot.total, 0),
+        COALESCE(cot.aprovadas, 0),
+        COALESCE(cot.valor_aprovado, 0),
+        COALESCE(b.total, 0),
+        COALESCE(b.aceitos, 0),
+        COALESCE(cont.total, 0),
+        COALESCE(cont.ativos, 0),
+        COALESCE(atv.pendentes, 0),
+        p.id_agencia_cliente,
+        CURRENT_TIMESTAMP
+    FROM alvo a
+    LEFT JOIN cotacoes cot ON cot.id_cliente = a.id_cliente
+    LEFT JOIN briefings b ON b.id_cliente = a.id_cliente
+    LEFT JOIN contatos cont ON cont.id_cliente = a.id_cliente
+    LEFT JOIN atividades atv ON atv.id_cliente = a.id_cliente
+    LEFT JOIN principal p ON p.id_cliente = a.id_cliente
+    ON CONFLICT (id_cliente) DO UPDATE SET
+        mes = EXCLUDED.mes,
+        cotacoes_mes = EXCLUDED.cotacoes_mes,
+        cotacoes_aprovadas_mes = EXCLUDED.cotacoes_aprovadas_mes,
+        valor_aprovado_mes = EXCLUDED.valor_aprovado_mes,
+        briefings_mes = EXCLUDED.briefings_mes,
+        briefings_aceitos_mes = EXCLUDED.briefings_aceitos_mes,
+        total_contatos = EXCLUDED.total_contatos,
+        contatos_ativos = EXCLUDED.contatos_ativos,
+        atividades_pendentes = EXCLUDED.atividades_pendentes,
+        agencia_principal_id = EXCLUDED.agencia_principal_id,
+        atualizado_em = EXCLUDED.atualizado_em
+'''
+
+
+def _recalcular(cursor, ids: Optional[Iterable[int]] = None) -> None:
+    """Recalcula os clientes em ids (None = todos)."""
+    cursor.execute('''
+        SELECT to_regclass('sales_atividades') IS NOT NULL AS atividades,
+               to_regclass('tbl_cliente_agencia') IS NOT NULL AS principal
+    ''')
+    existe = cursor.fetchone()
+    sql = _SQL_RECALCULAR.format(
+        atividades=_SQL_ATIVIDADES if existe['atividades'] else
+        'SELECT NULL::integer AS id_cliente, 0 AS pendentes WHERE FALSE',
+        principal=_SQL_PRINCIPAL if existe['principal'] else
+        'SELECT NULL::integer AS id_cliente, NULL::integer AS id_agencia_cliente WHERE FALSE',
+    )
+    cursor.execute(sql, {'todos': ids is None, 'ids': list(ids or [])})
+
+
+def _consumir_lote(conn, lote: int) -> int:
+    """Recalcula um lote de clientes pendentes; devolve quantos foram recalculados.
+
+    SKIP LOCKED: pendência ainda travada por uma escrita sem commit fica para o próximo
+    lote, e a listagem não espera o job (nem o job espera a listagem).
+    """
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            DELETE FROM cliente_metricas_pendencias
+            WHERE id_cliente IN (
+                SELECT id_cliente FROM cliente_metricas_pendencias
+                ORDER BY marcado_em
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id_cliente
+        ''', (lote,))
+        ids = [r['id_cliente'] for r in cursor.fetchall()]
+        if ids:
+            _recalcular(cursor, ids)
+    conn.commit()
+    return len(ids)
+
+
+def _inicializada(conn) -> bool:
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM cliente_metricas) AS inicializada')
+        inicializada = cursor.fetchone()['inicializada']
+    conn.commit()
+    return inicializada
+
+
+def atualizar_cliente_metricas(*, completo: bool = False,
+                               lote: int = CLIENTE_METRICAS_LOTE) -> Dict[str, Any]:
+    """Recalcula os clientes pendentes (ou todos, com completo=True / tabela vazia)."""
+    conn = db.get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s)) AS ok', (_LOCK,))
+        if not cursor.fetchone()['ok']:
+            conn.rollback()
+            return {'ignorado': 'atualização em andamento'}
+    conn.commit()
+
+    try:
+        backfill = completo or not _inicializada(conn)
+        if backfill:
+            with conn.cursor() as cursor:
+                # Marcas anteriores ficam cobertas pelo recálculo geral
+                cursor.execute('DELETE FROM cliente_metricas_pendencias')
+                _recalcular(cursor)
+                cursor.execute('''
+                    DELETE FROM cliente_metricas m
+                    WHERE NOT EXISTS (SELECT 1 FROM tbl_cliente cli WHERE cli.id_cliente = m.id_cliente)
+                ''')
+            conn.commit()
+
+        clientes = 0
+        while True:
+            n = _consumir_lote(conn, lote)
+            if not n:
+                break
+            clientes += n
+        if clientes:
+            logger.info(f"Métricas de clientes: {clientes} cliente(s) recalculado(s)")
+        return {'clientes': clientes, 'backfill': backfill}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', (_LOCK,))
+        conn.commit()
+
+
+def aplicar_pendencias() -> None:
+    """Um lote de pendências antes de uma listagem (o backfill fica com o job)."""
+    conn = db.get_db()
+    try:
+        if _inicializada(conn):
+            _consumir_lote(conn, CLIENTE_METRICAS_LOTE)
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"Métricas de clientes: pendências não aplicadas ({e}); lendo o que já está gravado")
+
+
+@job_handler('clientes.atualizar_metricas', max_tentativas=1, timeout_segundos=1800,
+             intervalo_segundos=CLIENTE_METRICAS_INTERVALO)
+def _job_atualizar_metricas(ctx):
+    """Recalcula os clientes marcados desde a última execução."""
+    return atualizar_cliente_metricas()
@@ -0,0 +1,75 @@
+"""
+=====================================================
+CLIENTES ABC
+Recategorização ABC agendada a partir dos rollups por cliente
+=====================================================
+
+A categoria de tbl_cliente.categoria_abc (A: aprovações >= R$200k no mês; B: com
+cotação ou briefing no mês; C: sem movimento) é recalculada pelo job
+'clientes.recategorizar_abc' a cada CLIENTES_ABC_INTERVALO s e pelo botão do admin
+(/admin/clientes/recategorizar), ambos via recategorizar().
+
+- Métricas do mês: dashboard_rollup_cotacao_dia e dashboard_rollup_briefing_dia
+  (services/dashboard_rollups.py), já mantidos por dia e cliente pelas triggers de
+  cadu_cotacoes e cadu_briefings (briefings ligados por id_cliente, não pelo nome).
+  As pendências dessas fontes são aplicadas antes do cálculo.
+- Só os clientes cuja categoria muda recebem UPDATE.
+- Enquanto um dos rollups não terminou o primeiro backfill a recategorização não
+  roda (RollupsIndisponiveis): com o rollup vazio todo cliente cairia para C. O
+  backfill fica com o job dashboard.atualizar_rollups, nunca com a request do botão.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, List
+
+from aicentralv2 import db
+from aicentralv2.services.dashboard_rollups import atualizar_rollups
+from aicentralv2.services.jobs import job_handler
+
+logger = logging.getLogger(__name__)
+
+CLIENTES_ABC_INTERVALO = int(os.getenv('CLIENTES_ABC_INTERVALO', '3600'))
+
+FONTES_ABC = ('cotacao', 'briefing')
+
+
+class RollupsIndisponiveis(Exception):
+    """Os rollups de cotações/briefings ainda não completaram o primeiro backfill."""
+
+
+def _fontes_prontas() -> List[str]:
+    """Fontes com o primeiro backfill concluído (as demais ficam com o job de rollups)."""
+    conn = db.get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            SELECT fonte FROM dashboard_rollup_estado
+            WHERE fonte = ANY(%s) AND atualizado_em IS NOT NULL
+        ''', (list(FONTES_ABC),))
+        prontas = [r['fonte'] for r in cursor.fetchall()]
+    conn.commit()
+    return prontas
+
+
+def recategorizar() -> Dict[str, Any]:
+    """Aplica as pendências dos rollups e recategoriza os clientes cuja categoria mudou."""
+    prontas = _fontes_prontas()
+    if len(prontas) < len(FONTES_ABC):
+        raise RollupsIndisponiveis('Rollups de cotações/briefings ainda em carga inicial; tente novamente em instantes')
+    for fonte, resultado in atualizar_rollups(prontas).items():
+        if 'erro' in resultado:
+            logger.warning(f"Clientes ABC: rollup '{fonte}' não atualizado ({resultado['erro']})")
+
+    resumo = db.recategorizar_clientes_abc()
+    if resumo.get('alterados'):
+        logger.info(f"Clientes ABC: {resumo['alterados']} cliente(s) mudaram de categoria")
+    return resumo
+
+
+@job_handler('clientes.recategorizar_abc', max_tentativas=3, backoff_segundos=300,
+             intervalo_segundos=CLIENTES_ABC_INTERVALO)
+def _job_recategorizar(ctx):
+    """Recategorização ABC periódica."""
+    return recategorizar()
@@ -0,0 +1,274 @@
+"""
+=====================================================
+DASHBOARD INÍCIO
+Todos os widgets da home em uma única chamada
+=====================================================
+
+GET /api/dashboard/inicio?days=N calcula os nove widgets (get_dashboard_*) e devolve
+um JSON com {success, data, ms} por widget, no mesmo formato das rotas individuais
+(/api/dashboard/<widget>, mantidas).
+
+- Um único snapshot: a conexão da request abre uma transação REPEATABLE READ READ ONLY
+  e exporta o snapshot (pg_export_snapshot); as conexões auxiliares importam esse
+  snapshot (SET TRANSACTION SNAPSHOT), então todos os widgets enxergam o mesmo
+  estado do banco, como se fosse uma transação só.
+- Concorrência: os widgets são divididos entre DASHBOARD_INICIO_CONEXOES conexões
+  auxiliares, cada uma numa thread com app context próprio (get_db() de cada thread
+  devolve a conexão dela). Com 1 conexão (ou se algo falhar ao abrir as auxiliares)
+  tudo roda em sequência na transação da request.
+- Falha de um widget não derruba os demais: cada widget roda num SAVEPOINT e o erro
+  volta ao savepoint (a transação, e com ela o snapshot, continua a mesma) e o widget
+  volta com success=False. As consultas get_dashboard_* propagam o erro em vez de
+  devolver dados vazios.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg
+from flask import current_app, g
+from psycopg import IsolationLevel, sql
+
+from aicentralv2 import db
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_INICIO_CONEXOES = int(os.getenv('DASHBOARD_INICIO_CONEXOES', '3'))
+
+
+def _iso(valor):
+    return valor.isoformat() if valor else None
+
+
+# ==================== SERIALIZAÇÃO (compartilhada com as rotas individuais) ====================
+
+def serializar_carteira_clientes(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'por_executivo': [dict(r) for r in (data.get('por_executivo') or [])],
+        'por_executivo_perfil': [dict(r) for r in (data.get('por_executivo_perfil') or [])],
+        'por_executivo_clientes': [dict(r) for r in (data.get('por_executivo_clientes') or [])],
+        'por_executivo_agencias': [dict(r) for r in (data.get('por_executivo_agencias') or [])],
+        'resumo': dict(data.get('resumo') or {}),
+        'classificacoes': data.get('classificacoes') or []
+    }
+
+
+def serializar_cotacoes_status(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'por_status': [dict(r) for r in (data.get('por_status') or [])],
+        'evolucao': [{'semana': _iso(r.get('semana')), 'status_nome': r.get('status_nome', ''), 'total': r.get('total', 0)} for r in (data.get('evolucao') or [])],
+        'total': data.get('total', 0)
+    }
+
+
+def serializar_active_users_metrics(data: Dict[str, Any]) -> Dict[str, Any]:
+    return data
+
+
+def serializar_acessos_cadu(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'sessoes': data.get('sessoes', 0),
+        'usuarios': data.get('usuarios', 0),
+        'media_dia': data.get('media_dia', 0),
+        'pageviews': data.get('pageviews', 0),
+        'sessoes_diarias': [
+            {
+                'date': _iso(s.get('date')),
+                'total_sessions': s.get('total_sessions', 0),
+                'unique_users': s.get('unique_users', 0)
+            }
+            for s in (data.get('sessoes_diarias') or [])
+        ]
+    }
+
+
+def serializar_pis_mensal(data: Dict[str, Any]) -> Dict[str, Any]:
+    resumo = data.get('resumo') or {}
+    return {
+        'por_mes': [{'mes': r.get('mes', ''), 'status_nome': r.get('status_nome', ''), 'total': r.get('total', 0), 'valor_liquido': float(r.get('valor_liquido', 0)), 'valor_bruto': float(r.get('valor_bruto', 0))} for r in (data.get('por_mes') or [])],
+        'resumo': {
+            'total': resumo.get('total', 0),
+            'valor_total': float(resumo.get('valor_total', 0)),
+            'valor_bruto': float(resumo.get('valor_bruto', 0))
+        }
+    }
+
+
+def serializar_campanhas(data: Dict[str, Any]) -> Dict[str, Any]:
+    resumo = data.get('resumo') or {}
+    return {
+        'por_status': [{'status_nome': r.get('status_nome', ''), 'total': r.get('total', 0), 'valor_plataforma': float(r.get('valor_plataforma', 0)), 'gasto_total': float(r.get('gasto_total', 0)), 'atingido_total': float(r.get('atingido_total', 0))} for r in (data.get('por_status') or [])],
+        'resumo': {
+            'total_campanhas': resumo.get('total_campanhas', 0),
+            'faturamento': float(resumo.get('faturamento', 0)),
+            'gasto': float(resumo.get('gasto', 0)),
+            'atingido': float(resumo.get('atingido', 0))
+        }
+    }
+
+
+def serializar_audiencias(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'top_audiencias': [dict(r) for r in (data.get('top_audiencias') or [])],
+        'top_canais': [dict(r) for r in (data.get('top_canais') or [])],
+        'evolucao': [{'semana': _iso(r.get('semana')), 'total_views': r.get('total_views', 0)} for r in (data.get('evolucao') or [])],
+        'total_acessos': data.get('total_acessos', 0)
+    }
+
+
+def serializar_briefings_cliente(data: Dict[str, Any]) -> Dict[str, Any]:
+    resumo = data.get('resumo') or {}
+    return {
+        'top_clientes': [dict(r) for r in (data.get('top_clientes') or [])],
+        'resumo': {
+            'total': resumo.get('total', 0),
+            'enviados': resumo.get('enviados', 0),
+            'rascunhos': resumo.get('rascunhos', 0),
+            'enviados_centralcomm': resumo.get('enviados_centralcomm', 0)
+        }
+    }
+
+
+def serializar_leads(data: Dict[str, Any]) -> Dict[str, Any]:
+    resumo = data.get('resumo') or {}
+    return {
+        'por_executivo': [dict(r) for r in (data.get('por_executivo') or [])],
+        'por_origem': [dict(r) for r in (data.get('por_origem') or [])],
+        'evolucao': [{'semana': _iso(r.get('semana')), 'total': r.get('total', 0)} for r in (data.get('evolucao') or [])],
+        'resumo': {
+            'total': resumo.get('total', 0),
+            'notificados': resumo.get('notificados', 0),
+            'pendentes': resumo.get('pendentes', 0)
+        }
+    }
+
+
+# nome -> (consulta(days), serialização). Os mais pesados primeiro: a divisão entre
+# conexões é round-robin nessa ordem.
+WIDGETS: Dict[str, Tuple[Callable[[int], Dict[str, Any]], Callable[[Dict[str, Any]], Dict[str, Any]]]] = {
+    'carteira_clientes': (db.get_dashboard_carteira_clientes, serializar_carteira_clientes),
+    'campanhas': (db.get_dashboard_campanhas, serializar_campanhas),
+    'pis_mensal': (db.get_dashboard_pis_por_mes, serializar_pis_mensal),
+    'audiencias': (db.get_dashboard_audiencias, serializar_audiencias),
+    'leads': (db.get_dashboard_leads, serializar_leads),
+    'cotacoes_status': (db.get_dashboard_cotacoes_status, serializar_cotacoes_status),
+    'acessos_cadu': (db.get_dashboard_acessos_cadu, serializar_acessos_cadu),
+    'briefings_cliente': (db.get_dashboard_briefings_por_cliente, serializar_briefings_cliente),
+    'active_users_metrics': (lambda days: db.get_dashboard_active_users_metrics(), serializar_active_users_metrics),
+}
+
+
+def _calcular_widget(nome: str, days: int) -> Dict[str, Any]:
+    """Um widget dentro de um SAVEPOINT da transação do snapshot (rollback só até ele)."""
+    consulta, serializar = WIDGETS[nome]
+    inicio = time.perf_counter()
+    conn = db.get_db()
+    try:
+        conn.execute('SAVEPOINT dashboard_widget')
+        resultado = {'success': True, 'data': serializar(consulta(days))}
+        conn.execute('RELEASE SAVEPOINT dashboard_widget')
+    except Exception as e:
+        logger.error(f"Erro no widget {nome} do dashboard: {e}", exc_info=True)
+        try:
+            conn.execute('ROLLBACK TO SAVEPOINT dashboard_widget')
+        except Exception as erro_savepoint:
+            logger.warning(f"Dashboard: savepoint do widget {nome} não restaurado ({erro_savepoint})")
+        resultado = {'success': False, 'message': str(e)}
+    resultado['ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+    return resultado
+
+
+def _conectar_no_snapshot(snapshot_id: str) -> psycopg.Connection:
+    conn = psycopg.connect(**db.get_db_config())
+    try:
+        conn.isolation_level = IsolationLevel.REPEATABLE_READ
+        conn.read_only = True
+        conn.execute(sql.SQL('SET TRANSACTION SNAPSHOT {}').format(sql.Literal(snapshot_id)))
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def _rodar_grupo(app, snapshot_id: str, nomes: List[str], days: int,
+                 resultados: Dict[str, Dict[str, Any]], pendentes: List[str], pronto: threading.Event) -> None:
+    """Thread auxiliar: importa o snapshot e calcula seus widgets na própria conexão."""
+    with app.app_context():
+        try:
+            g.db = _conectar_no_snapshot(snapshot_id)
+        except Exception as e:
+            logger.warning(f"Dashboard: conexão auxiliar indisponível ({e}); widgets voltam para a request")
+            pendentes.extend(nomes)
+            pronto.set()
+            return
+        pronto.set()
+        for nome in nomes:
+            resultados[nome] = _calcular_widget(nome, days)
+
+
+def calcular_dashboard_inicio(days: int, conexoes: Optional[int] = None) -> Dict[str, Any]:
+    """Calcula todos os widgets da home sob um único snapshot."""
+    inicio = time.perf_counter()
+    conexoes = DASHBOARD_INICIO_CONEXOES if conexoes is None else conexoes
+    nomes = list(WIDGETS)
+    resultados: Dict[str, Dict[str, Any]] = {}
+    pendentes: List[str] = []
+    paralelo = False
+
+    conn = db.get_db()
+    conn.rollback()
+    conn.isolation_level = IsolationLevel.REPEATABLE_READ
+    conn.read_only = True
+    try:
+        snapshot_id = None
+        if conexoes > 1:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT pg_export_snapshot() AS snapshot')
+                    snapshot_id = cursor.fetchone()['snapshot']
+            except Exception as e:
+                logger.warning(f"Dashboard: pg_export_snapshot indisponível ({e}); calculando em sequência")
+                conn.rollback()
+
+        if snapshot_id:
+            app = current_app._get_current_object()
+            grupos = [nomes[i::conexoes] for i in range(min(conexoes, len(nomes)))]
+            threads = []
+            for grupo in grupos:
+                pronto = threading.Event()
+                t = threading.Thread(
+                    target=_rodar_grupo,
+                    args=(app, snapshot_id, grupo, days, resultados, pendentes, pronto),
+                    name='dashboard-inicio',
+                    daemon=True,
+                )
+                t.start()
+                threads.append((t, pronto))
+            # A transação que exportou o snapshot fica aberta (e intocada) até todas importarem
+            for _, pronto in threads:
+                pronto.wait()
+            for t, _ in threads:
+                t.join()
+            paralelo = len(pendentes) < len(nomes)
+        else:
+            pendentes = nomes
+
+        for nome in pendentes:
+            resultados[nome] = _calcular_widget(nome, days)
+    finally:
+        conn.rollback()
+        conn.isolation_level = None
+        conn.read_only = None
+
+    return {
+        'success': True,
+        'days': days,
+        'paralelo': paralelo,
+        'widgets': {nome: resultados[nome] for nome in nomes},
+        'ms': round((time.perf_counter() - inicio) * 1000, 1),
+    }
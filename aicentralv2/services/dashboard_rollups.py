@@ -0,0 +1,304 @@
+"""
+=====================================================
+DASHBOARD ROLLUPS
+Agregados diários das métricas da home com atualização incremental
+=====================================================
+
+Os widgets de PIs, campanhas, cotações, leads, briefings e audiências (db.get_dashboard_*)
+leem as tabelas dashboard_rollup_<fonte>_dia (uma linha por dia e combinação de
+dimensões: status, executivo, plataforma, cliente...) em vez de reagregar as tabelas de
+origem a cada carregamento. O custo da leitura depende da janela pedida, não do histórico.
+
+- Marcação: triggers por statement nas tabelas de origem (db.ROLLUP_DASHBOARD_TABELAS)
+  gravam em dashboard_rollup_pendencias os dias afetados (created_at::date, antes e
+  depois de um UPDATE).
+- Recálculo: o job 'dashboard.atualizar_rollups' (a cada DASHBOARD_ROLLUPS_INTERVALO s)
+  consome as pendências em lotes de DASHBOARD_ROLLUPS_LOTE_DIAS dias; cada dia é apagado
+  e reinserido inteiro na mesma transação, então a leitura nunca vê um dia pela metade.
+- Audiências: cadu_analytics_events não tem trigger (só recebe INSERT, em volume alto);
+  a marca d'água é a data da última execução: recalcula de (última execução - 1 dia) a hoje.
+- Primeira execução de uma fonte (sem linha em dashboard_rollup_estado) ou --completo:
+  marca todos os dias com dados, e o backfill segue o mesmo caminho incremental.
+- Nomes (status, executivo, cliente, audiência) são resolvidos na leitura: renomear um
+  status não exige recálculo.
+- Outras fontes (services/analytics_agregados.py) usam o mesmo mecanismo via
+  registrar_fonte, com job próprio.
+- `flask dashboard-rollups [--completo] [--fonte X]` roda a atualização na hora.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, Iterable
+
+from aicentralv2 import db
+from aicentralv2.services.jobs import job_handler
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_ROLLUPS_INTERVALO = int(os.getenv('DASHBOARD_ROLLUPS_INTERVALO', '60'))
+DASHBOARD_ROLLUPS_LOTE_DIAS = int(os.getenv('DASHBOARD_ROLLUPS_LOTE_DIAS', '31'))
+
+FONTE_AUDIENCIA = 'audiencia'
+_LOCK_PREFIXO = 'dashboard_rollup:'
+
+# fonte -> definição (ver registrar_fonte); o módulo de analytics registra as dele
+FONTES: Dict[str, Dict[str, Any]] = {}
+
+
+def registrar_fonte(fonte: str, *, origem: str, rollup: str, sql: str, coluna: str = 'created_at',
+                    filtro: str = '', marca_dagua: bool = False) -> None:
+    """Registra uma fonte de rollup.
+
+    origem/coluna: tabela e coluna de tempo dos dados brutos; filtro: condição extra
+    (AND ...) das linhas que entram no rollup; rollup: tabela com coluna `dia`;
+    sql: INSERT ... SELECT que recalcula os dias em %(dias)s. marca_dagua=True: a
+    origem não tem trigger e cada execução recalcula de (última execução - 1 dia) a hoje.
+    """
+    FONTES[fonte] = {
+        'origem': origem,
+        'coluna': coluna,
+        'filtro': filtro,
+        'rollup': rollup,
+        'sql': sql,
+        'marca_dagua': marca_dagua,
+    }
+
+
+_MES_REF_FALLBACK = "(EXTRACT(MONTH FROM p.created_at)::int || '/' || TO_CHAR(p.created_at, 'YY'))"
+
+# INSERT ... SELECT de cada fonte para os dias em %(dias)s (o DELETE dos dias vem antes)
+_SQL_DASHBOARD = {
+    'pi': f'''
+        INSERT INTO dashboard_rollup_pi_dia
+            (dia, mes_ref, id_status_pi, id_resp_comercial, id_cliente, total, valor_liquido, valor_bruto)
+        SELECT
+            d.dia,
+            COALESCE(p.mes_ref_comp, {_MES_REF_FALLBACK}),
+            p.id_status_pi,
+            p.id_resp_comercial,
+            p.id_cliente,
+            COUNT(*),
+            COALESCE(SUM({db._parse_varchar_to_numeric('p.vr_liquido_pi')}), 0),
+            COALESCE(SUM({db._parse_varchar_to_numeric('p.vr_bruto_pi')}), 0)
+        FROM unnest(%(dias)s::date[]) AS d(dia)
+        JOIN cadu_pi p ON p.created_at >= d.dia AND p.created_at < d.dia + 1
+        GROUP BY 1, 2, 3, 4, 5
+    ''',
+    'campanha': f'''
+        INSERT INTO dashboard_rollup_campanha_dia
+            (dia, id_status, id_plataforma, id_cliente, total, valor_plataforma, gasto_total, atingido_total)
+        SELECT
+            d.dia,
+            c.id_status,
+            c.id_plataforma,
+            c.id_cliente,
+            COUNT(*),
+            COALESCE(SUM({db._parse_varchar_to_numeric('c.valor_plataforma')}), 0),
+            COALESCE(SUM({db._parse_varchar_to_numeric('c.totalizador_gasto')}), 0),
+            COALESCE(SUM({db._parse_varchar_to_numeric('c.totalizador_atingido')}), 0)
+        FROM unnest(%(dias)s::date[]) AS d(dia)
+        JOIN cadu_pi_campanha c ON c.created_at >= d.dia AND c.created_at < d.dia + 1
+        GROUP BY 1, 2, 3, 4
+    ''',
+    'cotacao': '''
+        INSERT INTO dashboard_rollup_cotacao_dia
+            (dia, status, responsavel_comercial, client_id, total, valor_total)
+        SELECT
+            d.dia,
+            COALESCE(c.status, 'Sem Status'),
+            c.responsavel_comercial,
+            c.client_id,
+            COUNT(*),
+            COALESCE(SUM(c.valor_total_proposta), 0)
+        FROM unnest(%(dias)s::date[]) AS d(dia)
+        JOIN cadu_cotacoes c ON c.created_at >= d.dia AND c.created_at < d.dia + 1
+        WHERE c.deleted_at IS NULL
+        GROUP BY 1, 2, 3, 4
+    ''',
+    'lead': '''
+        INSERT INTO dashboard_rollup_lead_dia (dia, id_executivo, fonte, total)
+        SELECT
+            d.dia,
+            l.id_executivo,
+            COALESCE(l.fonte, 'N/A'),
+            COUNT(*)
+        FROM unnest(%(dias)s::date[]) AS d(dia)
+        JOIN cadu_leads l ON l.created_at >= d.dia AND l.created_at < d.dia + 1
+        GROUP BY 1, 2, 3
+    ''',
+    'briefing': '''
+        INSERT INTO dashboard_rollup_briefing_dia (dia, id_cliente, status, enviado_para_centralcomm, total)
+        SELECT
+            d.dia,
+            b.id_cliente,
+            b.status,
+            COALESCE(b.enviado_para_centralcomm, FALSE),
+            COUNT(*)
+        FROM unnest(%(dias)s::date[]) AS d(dia)
+        JOIN cadu_briefings b ON b.created_at >= d.dia AND b.created_at < d.dia + 1
+        WHERE b.deleted_at IS NULL
+        GROUP BY 1, 2, 3, 4
+    ''',
+    FONTE_AUDIENCIA: '''
+        INSERT INTO dashboard_rollup_audiencia_dia (dia, audiencia_id, audiencia_nome, views, usuarios)
+        SELECT
+            d.dia,
+            CASE WHEN e.metadata->>'audiencia_id' ~ '^[0-9]{1,9}$'
+                 THEN (e.metadata->>'audiencia_id')::int END,
+            e.metadata->>'audiencia_nome',
+            COUNT(*),
+            COALESCE(ARRAY_AGG(DISTINCT e.user_id::text) FILTER (WHERE e.user_id IS NOT NULL), '{}')
+        FROM unnest(%(dias)s::date[]) AS d(dia)
+        JOIN cadu_analytics_events e
+          ON e.event_type = 'audiencia_viewed'
+         AND e.created_at >= d.dia AND e.created_at < d.dia + 1
+        GROUP BY 1, 2, 3
+    ''',
+}
+
+
+for _fonte, _sql in _SQL_DASHBOARD.items():
+    if _fonte == FONTE_AUDIENCIA:
+        registrar_fonte(_fonte, origem='cadu_analytics_events', rollup='dashboard_rollup_audiencia_dia',
+                        sql=_sql, filtro="AND event_type = 'audiencia_viewed'", marca_dagua=True)
+    else:
+        registrar_fonte(_fonte, origem=db.ROLLUP_DASHBOARD_TABELAS[_fonte],
+                        rollup=f'dashboard_rollup_{_fonte}_dia', sql=_sql)
+FONTES_DASHBOARD = tuple(_SQL_DASHBOARD)
+
+
+def _marcar_historico(cursor, fonte: str) -> None:
+    """Marca para recálculo todos os dias com dados na origem.
+
+    Fontes com trigger também remarcam os dias que já estão no rollup (dias cujas linhas
+    sumiram da origem são zerados). Nas de marca d'água a origem pode ter retenção
+    (partições antigas removidas), então o rollup desses dias é preservado.
+    """
+    definicao = FONTES[fonte]
+    dias_rollup = '' if definicao['marca_dagua'] else f"SELECT %(fonte)s, dia FROM {definicao['rollup']} UNION"
+    cursor.execute(f'''
+        INSERT INTO dashboard_rollup_pendencias (fonte, dia)
+        {dias_rollup}
+        SELECT %(fonte)s, {definicao['coluna']}::date FROM {definicao['origem']}
+        WHERE {definicao['coluna']} IS NOT NULL {definicao['filtro']}
+        ON CONFLICT (fonte, dia) DO NOTHING
+    ''', {'fonte': fonte})
+    cursor.execute('''
+        INSERT INTO dashboard_rollup_estado (fonte) VALUES (%s)
+        ON CONFLICT (fonte) DO UPDATE SET inicializado_em = CURRENT_TIMESTAMP
+    ''', (fonte,))
+
+
+def _marcar_desde_marca_dagua(cursor, fonte: str) -> None:
+    cursor.execute('''
+        INSERT INTO dashboard_rollup_pendencias (fonte, dia)
+        SELECT %s, g::date
+        FROM generate_series(
+            COALESCE((SELECT atualizado_em::date FROM dashboard_rollup_estado WHERE fonte = %s), CURRENT_DATE) - 1,
+            CURRENT_DATE,
+            INTERVAL '1 day'
+        ) AS g
+        ON CONFLICT (fonte, dia) DO NOTHING
+    ''', (fonte, fonte))
+
+
+def _recalcular_pendentes(conn, fonte: str, lote_dias: int) -> int:
+    """Consome as pendências da fonte em lotes; devolve quantos dias foram recalculados."""
+    total = 0
+    while True:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                DELETE FROM dashboard_rollup_pendencias
+                WHERE fonte = %s AND dia IN (
+                    SELECT dia FROM dashboard_rollup_pendencias
+                    WHERE fonte = %s
+                    ORDER BY dia
+                    LIMIT %s
+                    FOR UPDATE
+                )
+                RETURNING dia
+            ''', (fonte, fonte, lote_dias))
+            dias = [r['dia'] for r in cursor.fetchall()]
+            if not dias:
+                conn.commit()
+                return total
+            cursor.execute(f"DELETE FROM {FONTES[fonte]['rollup']} WHERE dia = ANY(%s)", (dias,))
+            cursor.execute(FONTES[fonte]['sql'], {'dias': dias})
+            cursor.execute('''
+                UPDATE dashboard_rollup_estado
+                SET dias_recalculados = dias_recalculados + %s
+                WHERE fonte = %s
+            ''', (len(dias), fonte))
+        conn.commit()
+        total += len(dias)
+
+
+def atualizar_rollup(fonte: str, *, completo: bool = False,
+                     lote_dias: int = DASHBOARD_ROLLUPS_LOTE_DIAS) -> Dict[str, Any]:
+    """Recalcula os dias pendentes de uma fonte (ou todo o histórico, com completo=True)."""
+    conn = db.get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL AS existe', (FONTES[fonte]['origem'],))
+        if not cursor.fetchone()['existe']:
+            conn.rollback()
+            return {'ignorado': 'tabela de origem ausente'}
+        # Lock de sessão: vale para todos os lotes, não só para uma transação
+        cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s)) AS ok', (_LOCK_PREFIXO + fonte,))
+        if not cursor.fetchone()['ok']:
+            conn.rollback()
+            return {'ignorado': 'atualização em andamento'}
+    conn.commit()
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM dashboard_rollup_estado WHERE fonte = %s', (fonte,))
+            inicializado = cursor.fetchone() is not None
+            if completo or not inicializado:
+                _marcar_historico(cursor, fonte)
+            elif FONTES[fonte]['marca_dagua']:
+                _marcar_desde_marca_dagua(cursor, fonte)
+        conn.commit()
+
+        dias = _recalcular_pendentes(conn, fonte, lote_dias)
+
+        with conn.cursor() as cursor:
+            cursor.execute(
+                'UPDATE dashboard_rollup_estado SET atualizado_em = CURRENT_TIMESTAMP WHERE fonte = %s',
+                (fonte,),
+            )
+        conn.commit()
+        if dias:
+            logger.info(f"Rollup '{fonte}': {dias} dia(s) recalculado(s)")
+        return {'dias': dias, 'backfill': completo or not inicializado}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', (_LOCK_PREFIXO + fonte,))
+        conn.commit()
+
+
+def atualizar_rollups(fontes: Iterable[str], *, completo: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Atualiza os rollups das fontes pedidas; a falha de uma não impede as demais."""
+    resultado: Dict[str, Dict[str, Any]] = {}
+    for fonte in fontes:
+        try:
+            resultado[fonte] = atualizar_rollup(fonte, completo=completo)
+        except Exception as e:
+            logger.error(f"Erro ao atualizar rollup '{fonte}': {e}", exc_info=True)
+            resultado[fonte] = {'erro': str(e)}
+    return resultado
+
+
+def atualizar_rollups_dashboard(*, completo: bool = False) -> Dict[str, Dict[str, Any]]:
+    return atualizar_rollups(FONTES_DASHBOARD, completo=completo)
+
+
+@job_handler('dashboard.atualizar_rollups', max_tentativas=1, timeout_segundos=1800,
+             intervalo_segundos=DASHBOARD_ROLLUPS_INTERVALO)
+def _job_atualizar_rollups(ctx):
+    """Recalcula os dias marcados desde a última execução."""
+    return atualizar_rollups_dashboard()
@@ -0,0 +1,296 @@
+"""
+=====================================================
+EMAIL OUTBOX
+E-mails transacionais gravados em email_outbox e entregues pelo worker
+=====================================================
+
+Com `conn`, o INSERT entra na transação do chamador (dentro de um SAVEPOINT:
+uma falha ao gravar o e-mail não aborta a alteração de negócio) e o e-mail só
+existe se o chamador fizer o commit. Sem `conn`, grava numa conexão própria e
+faz commit, sem tocar na transação aberta da request (g.db). Com JOBS_INLINE, o
+chamador que passou `conn` roda a entrega com executar_jobs_inline_pendentes()
+depois do commit. A entrega acontece no job 'email.entregar_outbox':
+
+- reivindica lotes com FOR UPDATE SKIP LOCKED (vários workers não duplicam);
+- agrupa linhas com o mesmo conteúdo (remetente + HTML + texto + anexos) e
+  envia cada grupo numa chamada Brevo com messageVersions;
+- 429/5xx/rede voltam para 'pendente' com backoff exponencial; erro 4xx num
+  lote é reenviado linha a linha para isolar o destinatário inválido;
+- status por linha: pendente -> enviando -> enviado | falhou (com message_id/erro).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import psycopg
+from psycopg.types.json import Json
+
+from aicentralv2.db import get_db, get_db_config
+from aicentralv2.services.brevo_service import get_brevo_service
+from aicentralv2.services.jobs import JOBS_INLINE, enfileirar_job, executar_job_por_id, job_handler
+
+logger = logging.getLogger(__name__)
+
+EMAIL_PENDENTE = 'pendente'
+EMAIL_ENVIANDO = 'enviando'
+EMAIL_ENVIADO = 'enviado'
+EMAIL_FALHOU = 'falhou'
+
+EMAIL_OUTBOX_LOTE = int(os.getenv('EMAIL_OUTBOX_LOTE', '200'))
+EMAIL_OUTBOX_VERSOES_POR_REQUISICAO = int(os.getenv('EMAIL_OUTBOX_VERSOES_POR_REQUISICAO', '50'))
+EMAIL_OUTBOX_MAX_TENTATIVAS = int(os.getenv('EMAIL_OUTBOX_MAX_TENTATIVAS', '6'))
+_BACKOFF_BASE_SEGUNDOS = 30
+_BACKOFF_MAX_SEGUNDOS = 3600
+# 'enviando' além disso = worker morreu no meio do envio
+_ENVIANDO_TIMEOUT_SEGUNDOS = 900
+# Janela para agrupar gatilhos de entrega: no máximo um job por janela
+_JANELA_GATILHO_SEGUNDOS = 5
+
+
+def _hash_conteudo(sender, html_content, text_content, attachments) -> str:
+    bruto = json.dumps([sender, html_content, text_content, attachments], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+
+
+def _gravar_emails(conn, destinatarios: List[str], dados: Dict[str, Any],
+                   dedup_key: Optional[str]) -> Tuple[List[int], int]:
+    """INSERTs em email_outbox + job de entrega na conexão dada (sem commit); devolve (ids, job_id)."""
+    ids = []
+    with conn.cursor() as cursor:
+        for email in destinatarios:
+            chave = dedup_key
+            if dedup_key and len(destinatarios) > 1:
+                chave = f'{dedup_key}:{email.lower()}'
+            cursor.execute('''
+                INSERT INTO email_outbox
+                    (dedup_key, to_email, to_name, subject, html_content, text_content,
+                     sender, reply_to, params, attachments, conteudo_hash, origem)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (dedup_key) WHERE dedup_key IS NOT NULL DO NOTHING
+                RETURNING id
+            ''', (
+                chave,
+                email,
+                dados['to_name'] or email.split('@')[0],
+                dados['subject'],
+                dados['html_content'],
+                dados['text_content'],
+                Json(dados['sender']) if dados['sender'] else None,
+                Json(dados['reply_to']) if dados['reply_to'] else None,
+                Json(dados['params']) if dados['params'] else None,
+                Json(dados['attachments']) if dados['attachments'] else None,
+                dados['conteudo_hash'],
+                dados['origem'],
+            ))
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute('SELECT id FROM email_outbox WHERE dedup_key = %s', (chave,))
+                row = cursor.fetchone()
+            ids.append(row['id'])
+
+    janela = int(time.time() // _JANELA_GATILHO_SEGUNDOS)
+    job_id = enfileirar_job('email.entregar_outbox', idempotency_key=f'email:outbox:{janela}', conn=conn)
+    return ids, job_id
+
+
+def enfileirar_emails(to_email: Union[str, List[str]], subject: str, html_content: str, *,
+                      to_name: Optional[str] = None, text_content: Optional[str] = None,
+                      params: Optional[Dict[str, Any]] = None, reply_to: Optional[Dict[str, str]] = None,
+                      sender: Optional[Dict[str, str]] = None, attachments: Optional[List[Dict]] = None,
+                      dedup_key: Optional[str] = None, origem: Optional[str] = None, conn=None) -> List[int]:
+    """Grava um e-mail por destinatário em email_outbox e agenda a entrega.
+
+    dedup_key: com mais de um destinatário vira '<dedup_key>:<email>'. Linhas já
+    existentes com a mesma chave não são duplicadas (devolve o id existente).
+    Com `conn`, entra na transação do chamador (que faz o commit); sem `conn`,
+    usa uma conexão própria e faz commit.
+    """
+    destinatarios = [to_email] if isinstance(to_email, str) else list(to_email or [])
+    destinatarios = [e.strip() for e in destinatarios if e and e.strip()]
+    if not destinatarios:
+        return []
+
+    dados = {
+        'to_name': to_name, 'subject': subject, 'html_content': html_content,
+        'text_content': text_content, 'sender': sender, 'reply_to': reply_to,
+        'params': params, 'attachments': attachments, 'origem': origem,
+        'conteudo_hash': _hash_conteudo(sender, html_content, text_content, attachments),
+    }
+
+    if conn is not None:
+        with conn.cursor() as cursor:
+            cursor.execute('SAVEPOINT email_outbox')
+        try:
+            ids, _ = _gravar_emails(conn, destinatarios, dados, dedup_key)
+        except Exception:
+            with conn.cursor() as cursor:
+                cursor.execute('ROLLBACK TO SAVEPOINT email_outbox')
+            raise
+        with conn.cursor() as cursor:
+            cursor.execute('RELEASE SAVEPOINT email_outbox')
+        return ids
+
+    with psycopg.connect(**get_db_config()) as proprio:
+        ids, job_id = _gravar_emails(proprio, destinatarios, dados, dedup_key)
+        proprio.commit()
+    if JOBS_INLINE:
+        executar_job_por_id(job_id)
+    return ids
+
+
+def obter_status_email(email_id: int) -> Optional[Dict[str, Any]]:
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            SELECT id, to_email, subject, status, tentativas, message_id, ultimo_erro,
+                   created_at, enviado_em, updated_at
+              FROM email_outbox WHERE id = %s
+        ''', (email_id,))
+        return cursor.fetchone()
+
+
+def contar_emails_por_status() -> Dict[str, int]:
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT status, COUNT(*) AS total FROM email_outbox GROUP BY status')
+        return {r['status']: r['total'] for r in cursor.fetchall()}
+
+
+# ==================== ENTREGA ====================
+
+def _reivindicar_lote(conn, limite: int) -> List[Dict[str, Any]]:
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE email_outbox
+               SET status = %s, updated_at = NOW()
+             WHERE status = %s AND updated_at < NOW() - make_interval(secs => %s)
+        ''', (EMAIL_PENDENTE, EMAIL_ENVIANDO, _ENVIANDO_TIMEOUT_SEGUNDOS))
+        cursor.execute('''
+            UPDATE email_outbox
+               SET status = %s, tentativas = tentativas + 1, updated_at = NOW()
+             WHERE id IN (
+                    SELECT id FROM email_outbox
+                     WHERE status = %s AND proxima_tentativa_em <= NOW()
+                     ORDER BY id
+                     LIMIT %s
+                     FOR UPDATE SKIP LOCKED
+             )
+            RETURNING *
+        ''', (EMAIL_ENVIANDO, EMAIL_PENDENTE, limite))
+        linhas = cursor.fetchall()
+    conn.commit()
+    return sorted(linhas, key=lambda r: r['id'])
+
+
+def _marcar_enviados(conn, linhas: List[Dict[str, Any]], message_ids: List[str]) -> None:
+    with conn.cursor() as cursor:
+        for n, linha in enumerate(linhas):
+            cursor.execute('''
+                UPDATE email_outbox
+                   SET status = %s, message_id = %s, ultimo_erro = NULL,
+                       enviado_em = NOW(), updated_at = NOW()
+                 WHERE id = %s
+            ''', (EMAIL_ENVIADO, message_ids[n] if n < len(message_ids) else None, linha['id']))
+    conn.commit()
+
+
+def _marcar_falha(conn, linhas: List[Dict[str, Any]], erro: str, retentavel: bool,
+                  retry_after: Optional[float] = None) -> None:
+    with conn.cursor() as cursor:
+        for linha in linhas:
+            definitivo = not retentavel or linha['tentativas'] >= EMAIL_OUTBOX_MAX_TENTATIVAS
+            espera = min(_BACKOFF_BASE_SEGUNDOS * (2 ** (linha['tentativas'] - 1)), _BACKOFF_MAX_SEGUNDOS)
+            if retry_after is not None:
+                espera = max(espera, retry_after)
+            cursor.execute('''
+                UPDATE email_outbox
+                   SET status = %s, ultimo_erro = %s,
+                       proxima_tentativa_em = NOW() + make_interval(secs => %s), updated_at = NOW()
+                 WHERE id = %s
+            ''', (EMAIL_FALHOU if definitivo else EMAIL_PENDENTE, (erro or '')[:4000],
+                  0.0 if definitivo else float(espera), linha['id']))
+    conn.commit()
+
+
+def _versao(linha: Dict[str, Any]) -> Dict[str, Any]:
+    versao = {
+        'to': [{'email': linha['to_email'], 'name': linha['to_name'] or linha['to_email']}],
+        'subject': linha['subject'],
+    }
+    if linha.get('params'):
+        versao['params'] = linha['params']
+    if linha.get('reply_to'):
+        versao['replyTo'] = linha['reply_to']
+    return versao
+
+
+def _enviar_grupo(conn, service, linhas: List[Dict[str, Any]]) -> Dict[str, int]:
+    base = linhas[0]
+    resultado = service.enviar_lote_email(
+        versoes=[_versao(linha) for linha in linhas],
+        subject=base['subject'],
+        html_content=base['html_content'],
+        text_content=base['text_content'],
+        sender=base['sender'],
+        attachments=base['attachments'],
+    )
+    if resultado.get('success'):
+        _marcar_enviados(conn, linhas, resultado.get('messageIds') or [])
+        return {'enviados': len(linhas), 'falhas': 0}
+
+    if not resultado.get('retryable') and len(linhas) > 1:
+        # Um destinatário inválido derruba a chamada inteira: isola reenviando um a um
+        totais = {'enviados': 0, 'falhas': 0}
+        for linha in linhas:
+            parcial = _enviar_grupo(conn, service, [linha])
+            totais['enviados'] += parcial['enviados']
+            totais['falhas'] += parcial['falhas']
+        return totais
+
+    _marcar_falha(conn, linhas, str(resultado.get('error')), bool(resultado.get('retryable')),
+                  resultado.get('retry_after'))
+    return {'enviados': 0, 'falhas': len(linhas)}
+
+
+def entregar_pendentes(limite: int = EMAIL_OUTBOX_LOTE) -> Dict[str, int]:
+    """Reivindica até `limite` e-mails e entrega agrupando por conteúdo."""
+    conn = get_db()
+    linhas = _reivindicar_lote(conn, limite)
+    totais = {'reivindicados': len(linhas), 'enviados': 0, 'falhas': 0}
+    if not linhas:
+        return totais
+
+    grupos: Dict[str, List[Dict[str, Any]]] = {}
+    for linha in linhas:
+        grupos.setdefault(linha['conteudo_hash'], []).append(linha)
+
+    service = get_brevo_service()
+    for grupo in grupos.values():
+        for i in range(0, len(grupo), EMAIL_OUTBOX_VERSOES_POR_REQUISICAO):
+            parcial = _enviar_grupo(conn, service, grupo[i:i + EMAIL_OUTBOX_VERSOES_POR_REQUISICAO])
+            totais['enviados'] += parcial['enviados']
+            totais['falhas'] += parcial['falhas']
+    logger.info(
+        f"Outbox de e-mail: {totais['enviados']} enviado(s), {totais['falhas']} falha(s) "
+        f"em {len(grupos)} grupo(s)"
+    )
+    return totais
+
+
+@job_handler('email.entregar_outbox', max_tentativas=1, fila='email', timeout_segundos=600,
+             intervalo_segundos=60)
+def _job_entregar_outbox(ctx):
+    """Esvazia o outbox (também roda a cada minuto para as retentativas agendadas)."""
+    totais = {'reivindicados': 0, 'enviados': 0, 'falhas': 0}
+    while True:
+        parcial = entregar_pendentes()
+        for chave in totais:
+            totais[chave] += parcial[chave]
+        if parcial['reivindicados'] < EMAIL_OUTBOX_LOTE:
+            return totais
@@ -1,116 +1,214 @@
 import os
 import json
 import logging
-import requests
+import re
+import threading
+import time
+from psycopg.types.json import Json
 from ...db import get_db
-from aicentralv2.config import PINECONE_CONFIG
+from ..jobs import JobErroPermanente, enfileirar_job, job_handler
+from aicentralv2.config import PINECONE_CONFIG, INTELLIGENCE_VECTOR_CONFIG
 
 # Logger do módulo
 logger = logging.getLogger(__name__)
 
-logger = logging.getLogger(__name__)
+EMBEDDING_MODEL_NAME = os.getenv('INTELLIGENCE_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+
+# Pipeline de ingestão: chunks são codificados em lotes e enviados ao índice em lotes maiores.
+EMBEDDING_BATCH_SIZE = int(os.getenv('INTELLIGENCE_EMBEDDING_BATCH_SIZE', '64'))
+UPSERT_BATCH_SIZE = int(os.getenv('INTELLIGENCE_UPSERT_BATCH_SIZE', '200'))
+# Intervalo mínimo entre gravações de progresso (o progresso final é sempre gravado).
+PROGRESS_MIN_INTERVAL_SECONDS = 2.0
+# Uploads aguardando o worker (fora de /tmp: o serviço web usa PrivateTmp no systemd).
+UPLOAD_DIR = os.getenv(
+    'INTELLIGENCE_UPLOAD_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+                 'uploads', 'intelligence'),
+)
+# Leitura de arquivos texto em blocos (mantém memória limitada na extração).
+_TEXT_READ_BLOCK = 64 * 1024
+
+_FIM_SENTENCA_RE = re.compile(r'[.!?…]["\')\]]*\s+')
+_ESPACO_RE = re.compile(r'\s')
+
+# Após uma falha de inicialização, aguarda este intervalo antes de tentar de novo
+# (evita pagar import/handshake a cada request quando a lib está ausente).
+_RETRY_INIT_SECONDS = 300
+
+# Singletons por processo: o modelo (centenas de MB) e o cliente Pinecone são
+# carregados uma única vez por worker. O PID é guardado para recarregar após
+# fork (torch/sockets não devem ser herdados do processo pai).
+_resources_lock = threading.Lock()
+_resources = {
+    'pid': None,
+    'embedding_model': None,
+    'embedding_model_falha_em': None,
+    'pinecone_index': None,
+    'pinecone_falha_em': None,
+    'vector_store': None,
+}
+
+
+def _resources_do_processo():
+    """Retorna o dicionário de recursos, descartando o que foi herdado de outro PID."""
+    pid = os.getpid()
+    if _resources['pid'] != pid:
+        _resources.update({
+            'pid': pid,
+            'embedding_model': None,
+            'embedding_model_falha_em': None,
+            'pinecone_index': None,
+            'pinecone_falha_em': None,
+            'vector_store': None,
+        })
+    return _resources
+
+
+def _pode_tentar(falha_em):
+    return falha_em is None or (time.monotonic() - falha_em) >= _RETRY_INIT_SECONDS
+
+
+def get_embedding_model():
+    """Modelo SentenceTransformer compartilhado pelo processo (lazy, thread-safe).
+
+    Retorna None se sentence-transformers não estiver disponível.
+    """
+    res = _resources_do_processo()
+    if res['embedding_model'] is not None or not _pode_tentar(res['embedding_model_falha_em']):
+        return res['embedding_model']
+    with _resources_lock:
+        res = _resources_do_processo()
+        if res['embedding_model'] is None and _pode_tentar(res['embedding_model_falha_em']):
+            try:
+                from sentence_transformers import SentenceTransformer  # type: ignore
+                inicio = time.monotonic()
+                res['embedding_model'] = SentenceTransformer(EMBEDDING_MODEL_NAME)
+                res['embedding_model_falha_em'] = None
+                logger.info(
+                    "Modelo de embeddings %s carregado em %.1fs (pid=%s)",
+                    EMBEDDING_MODEL_NAME, time.monotonic() - inicio, res['pid'],
+                )
+            except Exception as e:
+                res['embedding_model_falha_em'] = time.monotonic()
+                logger.warning(f"SentenceTransformer indisponível: {e}")
+    return res['embedding_model']
+
+
+def get_pinecone_index():
+    """Cliente do índice Pinecone compartilhado pelo processo (lazy, thread-safe).
+
+    Retorna None se o Pinecone não puder ser inicializado.
+    """
+    res = _resources_do_processo()
+    if res['pinecone_index'] is not None or not _pode_tentar(res['pinecone_falha_em']):
+        return res['pinecone_index']
+    with _resources_lock:
+        res = _resources_do_processo()
+        if res['pinecone_index'] is None and _pode_tentar(res['pinecone_falha_em']):
+            try:
+                import pinecone  # type: ignore
+                pinecone.init(
+                    api_key=PINECONE_CONFIG.get('api_key'),
+                    environment=PINECONE_CONFIG.get('environment'),
+                    host=PINECONE_CONFIG.get('host')
+                )
+                res['pinecone_index'] = pinecone.Index(PINECONE_CONFIG.get('index_name'))
+                res['pinecone_falha_em'] = None
+            except Exception as e:
+                res['pinecone_falha_em'] = time.monotonic()
+                logger.warning(f"Pinecone não inicializado: {e}")
+    return res['pinecone_index']
+
+
+def get_vector_store():
+    """Índice vetorial do backend configurado em INTELLIGENCE_VECTOR_CONFIG['backend'].
+
+    'pinecone' devolve o cliente Pinecone; 'local'/'memory' devolvem o índice NumPy
+    (services/intelligence/vector_store.py), com a mesma interface upsert/delete/query.
+    """
+    backend = INTELLIGENCE_VECTOR_CONFIG.get('backend') or 'pinecone'
+    if backend == 'pinecone':
+        return get_pinecone_index()
+    res = _resources_do_processo()
+    if res['vector_store'] is None:
+        with _resources_lock:
+            res = _resources_do_processo()
+            if res['vector_store'] is None:
+                from .vector_store import criar_vector_store
+                res['vector_store'] = criar_vector_store(
+                    backend,
+                    dimension=int(PINECONE_CONFIG.get('dimension') or 512),
+                    index_mode=INTELLIGENCE_VECTOR_CONFIG.get('index_mode') or 'auto',
+                    ann_min_rows=INTELLIGENCE_VECTOR_CONFIG.get('ann_min_rows') or 50000,
+                    ivf_nprobe=INTELLIGENCE_VECTOR_CONFIG.get('ivf_nprobe') or 8,
+                )
+    return res['vector_store']
+
+
+def preload_intelligence_resources():
+    """Carrega modelo e índice antecipadamente (ex.: no post_worker_init do gunicorn).
+
+    Assim o primeiro upload do worker não paga o tempo de carga do modelo.
+    """
+    model = get_embedding_model()
+    index = get_vector_store()
+    return {'embedding_model': model is not None, 'vector_index': index is not None}
+
 
 class IntelligenceService:
     def __init__(self):
-        """Inicializa dependências de forma preguiçosa (lazy) para evitar erros de import no startup.
+        """Usa os recursos compartilhados do processo (ver get_embedding_model/get_pinecone_index).
 
         As bibliotecas pesadas (pinecone, sentence-transformers, numpy, PyPDF2) são importadas
-        apenas quando necessárias. Assim a aplicação sobe mesmo em ambientes sem essas libs.
+        apenas quando necessárias e o modelo é carregado uma única vez por processo, então
+        instanciar o serviço por request é barato.
         """
-        self._pinecone = None
         self._pinecone_cfg = PINECONE_CONFIG
-        self.index = None
-        self.embedding_model = None
-
-        # Tenta inicializar Pinecone
-        try:
-            import pinecone  # type: ignore
-            pinecone.init(
-                api_key=self._pinecone_cfg.get('api_key'),
-                environment=self._pinecone_cfg.get('environment'),
-                host=self._pinecone_cfg.get('host')
-            )
-            self._pinecone = pinecone
-            self.index = pinecone.Index(self._pinecone_cfg.get('index_name'))
-        except Exception as e:
-            logger.warning(f"Pinecone não inicializado: {e}")
-
-        # Tenta inicializar o modelo de embeddings
-        try:
-            from sentence_transformers import SentenceTransformer  # type: ignore
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        except Exception as e:
-            logger.warning(f"SentenceTransformer indisponível: {e}")
+        self.index = get_vector_store()
+        self.embedding_model = get_embedding_model()
 
-    def process_document(self, file_path, title, requires_cadu_format=False):
+    def process_document(self, file_path, title, requires_cadu_format=False, progress_callback=None):
         """
         Processa um documento e envia para o Pinecone.
+
+        progress_callback (opcional) recebe o mesmo dict de progresso gravado em
+        intelligence_documents.metadata.processing_stats, em intervalos grossos.
         """
+        document_id = create_document(file_path, title, requires_cadu_format)
+        return self.process_existing_document(
+            document_id, file_path, title, requires_cadu_format, progress_callback
+        )
+
+    def process_existing_document(self, document_id, file_path, title, requires_cadu_format=False,
+                                  progress_callback=None):
+        """Processa um documento já registrado em intelligence_documents (usado pelo job)."""
         db = get_db()
         cursor = db.cursor()
-        
-        # Criar registro do documento
-        cursor.execute("""
-            INSERT INTO intelligence_documents 
-                (title, document_type, requires_cadu_format, status, metadata)
-            VALUES (%s, %s, %s, 'processing', %s)
-            RETURNING id
-        """, (
-            title,
-            os.path.splitext(file_path)[1][1:],
-            requires_cadu_format,
-            {'source': 'upload'}
-        ))
-        
-        document_id = cursor.fetchone()[0]
+        cursor.execute(
+            "UPDATE intelligence_documents SET status = 'processing' WHERE id = %s",
+            (document_id,)
+        )
         db.commit()
         
         try:
-            # Extrair texto do documento
-            if file_path.endswith('.pdf'):
-                text = self._extract_text_from_pdf(file_path)
-            else:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
-            
-            # Se não precisa do formato CADU, processar com Gemini
-            if not requires_cadu_format:
-                text = self._process_with_gemini(text)
-            
             # Verifica dependências críticas antes de prosseguir
             if self.index is None:
-                raise RuntimeError("Pinecone não está configurado nesta instância.")
+                raise RuntimeError("Índice vetorial (Pinecone ou local) não está configurado nesta instância.")
             if self.embedding_model is None:
                 raise RuntimeError("Modelo de embeddings (sentence-transformers) não está disponível.")
 
-            # Dividir em chunks
-            chunks = self._create_chunks(text)
-            
-            # Processar e enviar chunks para Pinecone
-            pinecone_ids = []
-            for i, chunk in enumerate(chunks):
-                # Criar embedding (implemente a função conforme necessário)
-                embedding = self._create_embedding(chunk)
-                
-                # Gerar ID único para o chunk
-                chunk_id = f"doc_{document_id}_chunk_{i}"
-                
-                # Inserir no Pinecone
-                self.index.upsert([(chunk_id, embedding, {
-                    'document_id': document_id,
-                    'chunk_number': i,
-                    'text': chunk,
-                    'title': title
-                })])
-                
-                pinecone_ids.append(chunk_id)
-                
-                # Atualizar status
-                self._update_processing_status(document_id, {
-                    'status': 'processing',
-                    'chunks_processed': i + 1,
-                    'total_chunks': len(chunks)
-                })
+            # Texto extraído página a página; as partes são guardadas só para processed_text
+            partes_texto = []
+            segmentos = _registrar_partes(self._iter_document_text(file_path), partes_texto)
+
+            if requires_cadu_format:
+                # Streaming: páginas -> chunks -> embeddings/upserts em lote, sem montar o texto antes
+                pinecone_ids = self._ingest_chunks(document_id, title, iter_chunks(segmentos), progress_callback)
+                text = ''.join(partes_texto)
+            else:
+                # O FAQ do Gemini precisa do documento inteiro
+                text = self._process_with_gemini(''.join(segmentos))
+                pinecone_ids = self._ingest_chunks(document_id, title, iter_chunks([text]), progress_callback)
             
             # Finalizar processamento
             cursor.execute("""
@@ -130,6 +228,7 @@ class IntelligenceService:
             }
             
         except Exception as e:
+            db.rollback()
             cursor.execute("""
                 UPDATE intelligence_documents
                 SET status = 'error',
@@ -144,17 +243,41 @@ class IntelligenceService:
             db.commit()
             raise
 
+    def _iter_document_text(self, file_path):
+        """Gera o texto do documento em partes (páginas do PDF ou blocos do arquivo texto)."""
+        if file_path.endswith('.pdf'):
+            yield from self._iter_pdf_pages(file_path)
+            return
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for bloco in iter(lambda: f.read(_TEXT_READ_BLOCK), ''):
+                yield bloco
+
+    def _iter_pdf_pages(self, file_path):
+        """Gera o texto de cada página do PDF com PyMuPDF (PyPDF2 como alternativa)."""
+        try:
+            import fitz  # PyMuPDF
+        except Exception:
+            fitz = None
+
+        if fitz is None:
+            try:
+                from PyPDF2 import PdfReader  # type: ignore
+            except Exception as e:
+                raise RuntimeError(f"Dependência PyMuPDF/PyPDF2 indisponível: {e}")
+            for page in PdfReader(file_path).pages:
+                yield (page.extract_text() or '') + "\n"
+            return
+
+        doc = fitz.open(file_path)
+        try:
+            for page in doc:
+                yield page.get_text('text') + "\n"
+        finally:
+            doc.close()
+
     def _extract_text_from_pdf(self, file_path):
         """Extrai texto de um arquivo PDF"""
-        try:
-            from PyPDF2 import PdfReader  # type: ignore
-        except Exception as e:
-            raise RuntimeError(f"Dependência PyPDF2 indisponível: {e}")
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        return ''.join(self._iter_pdf_pages(file_path))
 
     def _process_with_gemini(self, text):
         """Processa o texto com Gemini para criar FAQ"""
@@ -171,68 +294,268 @@ class IntelligenceService:
 
     def _create_chunks(self, text, chunk_size=1000, overlap=100):
         """Divide o texto em chunks com sobreposição"""
-        chunks = []
-        start = 0
-        text_length = len(text)
-        
-        while start < text_length:
-            end = start + chunk_size
-            
-            if end > text_length:
-                end = text_length
-            else:
-                # Procura o próximo espaço em branco para não cortar palavras
-                while end < text_length and text[end] not in [' ', '\n']:
-                    end += 1
-            
-            chunk = text[start:end]
-            chunks.append(chunk)
-            
-            start = end - overlap
-            
-        return chunks
+        return list(iter_chunks([text], chunk_size=chunk_size, overlap=overlap))
 
-    def _create_embedding(self, text):
+    def _ingest_chunks(self, document_id, title, chunks, progress_callback=None):
+        """Pipeline de ingestão: embeddings em lote -> upserts em lote -> progresso.
+
+        Retorna a lista de IDs gravados no Pinecone, na ordem dos chunks.
         """
-        Cria embedding para um texto usando o modelo all-MiniLM-L6-v2.
-        Este modelo produz embeddings de 384 dimensões que são então mapeados para 512
-        através de padding com zeros para compatibilidade com o Pinecone.
+        total_chunks = len(chunks) if hasattr(chunks, '__len__') else None
+        pinecone_ids = []
+        pendentes = []
+        ultimo_progresso = 0.0
+        chunk_number = 0
+
+        for lote in _lotes(chunks, EMBEDDING_BATCH_SIZE):
+            embeddings = self._create_embeddings(lote).tolist()
+            for chunk, embedding in zip(lote, embeddings):
+                chunk_id = f"doc_{document_id}_chunk_{chunk_number}"
+                pendentes.append((chunk_id, embedding, {
+                    'document_id': document_id,
+                    'chunk_number': chunk_number,
+                    'text': chunk,
+                    'title': title
+                }))
+                pinecone_ids.append(chunk_id)
+                chunk_number += 1
+
+            if len(pendentes) >= UPSERT_BATCH_SIZE:
+                self.index.upsert(vectors=pendentes)
+                pendentes = []
+
+            agora = time.monotonic()
+            if agora - ultimo_progresso >= PROGRESS_MIN_INTERVAL_SECONDS:
+                ultimo_progresso = agora
+                self._report_progress(document_id, {
+                    'status': 'processing',
+                    'chunks_processed': chunk_number,
+                    'total_chunks': total_chunks
+                }, progress_callback)
+
+        if pendentes:
+            self.index.upsert(vectors=pendentes)
+
+        self._report_progress(document_id, {
+            'status': 'processing',
+            'chunks_processed': chunk_number,
+            'total_chunks': chunk_number
+        }, progress_callback)
+        return pinecone_ids
+
+    def _create_embeddings(self, texts):
+        """
+        Cria embeddings para uma lista de textos numa única chamada ao modelo.
+
+        O modelo all-MiniLM-L6-v2 produz vetores de 384 dimensões (já normalizados aqui);
+        o padding com zeros até a dimensão do índice (512) é feito de uma vez na matriz.
+        Retorna np.ndarray float32 de forma (len(texts), dimensão do índice).
         """
         if self.embedding_model is None:
             raise RuntimeError("Modelo de embeddings indisponível. Instale sentence-transformers.")
-        # Criar embedding base
-        embedding = self.embedding_model.encode(text)
-
-        # Padding para 512 dimensões
         try:
             import numpy as np  # type: ignore
         except Exception as e:
             raise RuntimeError(f"Dependência numpy indisponível: {e}")
-        padded_embedding = np.zeros(512, dtype=float)
-        # Garante que comprimento não exceda 512
-        end = min(384, len(embedding))
-        padded_embedding[:end] = embedding[:end]
-        return padded_embedding.tolist()
+
+        dimensao = int(self._pinecone_cfg.get('dimension') or 512)
+        embeddings = self.embedding_model.encode(
+            list(texts),
+            batch_size=EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        if embeddings.shape[1] >= dimensao:
+            return np.ascontiguousarray(embeddings[:, :dimensao])
+        return np.pad(embeddings, ((0, 0), (0, dimensao - embeddings.shape[1])))
+
+    def _create_embedding(self, text):
+        """Cria o embedding (padded para a dimensão do índice) de um único texto."""
+        return self._create_embeddings([text])[0].tolist()
+
+    def _report_progress(self, document_id, status_data, progress_callback=None):
+        """Repassa o progresso ao chamador (se houver) e grava no documento."""
+        if progress_callback is not None:
+            try:
+                progress_callback(dict(status_data))
+            except Exception as e:
+                logger.warning(f"progress_callback falhou para documento {document_id}: {e}")
+        self._update_processing_status(document_id, status_data)
 
     def _update_processing_status(self, document_id, status_data):
-        """Atualiza o status do processamento"""
+        """Grava o progresso em intelligence_documents.metadata.processing_stats (sem HTTP)."""
+        db = get_db()
         try:
-            # Webhook local
-            requests.post('http://localhost:5000/api/v1/intelligence/status', json={
-                'document_id': document_id,
-                **status_data
-            })
-        except:
-            pass # Falha silenciosa do webhook local
+            with db.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE intelligence_documents
+                    SET metadata = jsonb_set(
+                        COALESCE(metadata, '{}'::jsonb),
+                        '{processing_stats}',
+                        %s::jsonb
+                    )
+                    WHERE id = %s
+                """, (json.dumps(status_data), document_id))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Falha ao gravar progresso do documento {document_id}: {e}")
+
+
+def _lotes(iteravel, tamanho):
+    """Agrupa um iterável (lista ou gerador) em listas de até `tamanho` itens."""
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _registrar_partes(segmentos, partes):
+    """Repassa os segmentos adiante, guardando cada um em `partes`."""
+    for segmento in segmentos:
+        partes.append(segmento)
+        yield segmento
+
+
+def _ponto_de_corte(buffer, inicio, chunk_size, min_size):
+    """Posição (absoluta em buffer) onde encerrar o chunk iniciado em `inicio`.
+
+    Preferência: fim de frase entre min_size e chunk_size; depois último espaço nessa
+    janela; sem separador na janela, corta em chunk_size (nenhum chunk passa do tamanho).
+    """
+    limite = inicio + chunk_size
+    ultimo = None
+    for m in _FIM_SENTENCA_RE.finditer(buffer, inicio + min_size, limite):
+        ultimo = m
+    if ultimo is not None:
+        return ultimo.end()
+    espaco = max(buffer.rfind(' ', inicio + min_size, limite), buffer.rfind('\n', inicio + min_size, limite))
+    if espaco != -1:
+        return espaco + 1
+    return limite
+
+
+def iter_chunks(segmentos, chunk_size=1000, overlap=100):
+    """Gera chunks de ~chunk_size caracteres, com sobreposição, a partir de segmentos de texto.
+
+    Consome os segmentos (ex.: páginas) sob demanda e corta preferencialmente em fim de
+    frase, mantendo em memória apenas o texto ainda não emitido. Tempo linear no tamanho
+    do documento.
+    """
+    min_size = max(1, chunk_size // 2)
+    overlap = min(overlap, min_size - 1) if min_size > 1 else 0
+    buffer = ''
+    emitido_ate = 0  # posição em buffer até onde o texto já saiu em algum chunk
+
+    for segmento in segmentos:
+        if not segmento:
+            continue
+        buffer += segmento
+        inicio = 0
+        while len(buffer) - inicio >= chunk_size:
+            corte = _ponto_de_corte(buffer, inicio, chunk_size, min_size)
+            chunk = buffer[inicio:corte].strip()
+            if chunk:
+                yield chunk
+            emitido_ate = corte
+            proximo = max(inicio + 1, corte - overlap)
+            espaco = _ESPACO_RE.search(buffer, proximo, corte)
+            inicio = espaco.end() if espaco is not None else proximo
+        buffer = buffer[inicio:]
+        emitido_ate = max(0, emitido_ate - inicio)
+
+    if buffer[emitido_ate:].strip():
+        yield buffer.strip()
+
+
+_service_lock = threading.Lock()
+_service = None
+
+
+def get_intelligence_service():
+    """Instância de IntelligenceService reaproveitada entre requests do mesmo processo."""
+    global _service
+    service = _service
+    if service is None or service.index is None or service.embedding_model is None:
+        with _service_lock:
+            service = IntelligenceService()
+            _service = service
+    return service
+
+
+def create_document(file_path, title, requires_cadu_format=False):
+    """Cria o registro do documento (status 'processing') e devolve o id."""
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute("""
+        INSERT INTO intelligence_documents 
+            (title, document_type, requires_cadu_format, status, metadata)
+        VALUES (%s, %s, %s, 'processing', %s)
+        RETURNING id
+    """, (
+        title,
+        os.path.splitext(file_path)[1][1:],
+        requires_cadu_format,
+        Json({'source': 'upload'})
+    ))
+    document_id = cursor.fetchone()['id']
+    db.commit()
+    return document_id
+
 
 def process_document(file_path, title, requires_cadu_format=False):
     """Função auxiliar para processar documento"""
-    service = IntelligenceService()
+    service = get_intelligence_service()
     return service.process_document(file_path, title, requires_cadu_format)
 
+
+def enqueue_document(file_path, title, requires_cadu_format=False, created_by=None):
+    """Registra o documento e enfileira a ingestão no worker de jobs.
+
+    O arquivo em file_path passa a pertencer ao job, que o remove ao terminar.
+    """
+    document_id = create_document(file_path, title, requires_cadu_format)
+    job_id = enfileirar_job('intelligence.processar_documento', {
+        'document_id': document_id,
+        'file_path': file_path,
+        'title': title,
+        'requires_cadu_format': bool(requires_cadu_format),
+    }, idempotency_key=f'intelligence:documento:{document_id}', created_by=created_by)
+    return {'id': document_id, 'job_id': job_id}
+
+
+@job_handler('intelligence.processar_documento', max_tentativas=3, backoff_segundos=60, timeout_segundos=3600)
+def _job_processar_documento(ctx):
+    payload = ctx.payload
+    file_path = payload['file_path']
+    if not os.path.exists(file_path):
+        raise JobErroPermanente(f"Arquivo do upload não encontrado: {file_path}")
+    concluido = False
+    try:
+        result = get_intelligence_service().process_existing_document(
+            payload['document_id'],
+            file_path,
+            payload.get('title'),
+            payload.get('requires_cadu_format', False),
+            progress_callback=ctx.progresso,
+        )
+        concluido = True
+        return {'document_id': result['id'], 'chunks': len(result['pinecone_ids'])}
+    finally:
+        if (concluido or ctx.ultima_tentativa) and os.path.exists(file_path):
+            os.remove(file_path)
+
 def delete_document(document_id, delete_from='both'):
     """Função auxiliar para deletar documento"""
-    service = IntelligenceService()
+    service = get_intelligence_service()
     
     db = get_db()
     cursor = db.cursor()
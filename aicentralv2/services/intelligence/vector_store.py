@@ -0,0 +1,399 @@
+"""
+Índice vetorial local da Inteligência (alternativa ao Pinecone).
+
+Expõe a mesma superfície usada do cliente Pinecone (upsert/delete/query/
+describe_index_stats), para que IntelligenceService.index funcione com qualquer backend:
+
+- NumpyVectorIndex: índice só em memória (testes, benchmarks, CI offline).
+- LocalVectorStore: persiste os vetores em intelligence_chunks.embedding_f32 (BYTEA,
+  float32) e responde consultas com o NumpyVectorIndex carregado do banco.
+
+Busca exata: produto escalar vetorizado (vetores normalizados → cosseno) + argpartition.
+Busca aproximada (opcional): IVF — k-means sobre os vetores, consulta só as `nprobe`
+listas mais próximas. Seleção via INTELLIGENCE_VECTOR_CONFIG (ver config.py).
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_MODES = ('exact', 'ivf', 'auto')
+
+
+def _normalizar_linhas(matrix: np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(matrix, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matrix / normas
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Posições dos k maiores scores, em ordem decrescente."""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= scores.size:
+        return np.argsort(-scores, kind='stable')
+    parte = np.argpartition(-scores, k - 1)[:k]
+    return parte[np.argsort(-scores[parte], kind='stable')]
+
+
+class _IVF:
+    """Índice IVF simples (k-means esférico) sobre uma matriz de vetores normalizados."""
+
+    def __init__(self, matrix: np.ndarray, n_lists: int, n_probe: int, iteracoes: int = 10, seed: int = 0):
+        n = matrix.shape[0]
+        rng = np.random.default_rng(seed)
+        n_lists = max(1, min(n_lists, n))
+        amostra = matrix[rng.choice(n, size=min(n, n_lists * 64), replace=False)]
+        centroides = amostra[rng.choice(amostra.shape[0], size=n_lists, replace=False)].copy()
+
+        for _ in range(iteracoes):
+            atribuicao = np.argmax(amostra @ centroides.T, axis=1)
+            somas = np.zeros_like(centroides)
+            np.add.at(somas, atribuicao, amostra)
+            contagem = np.bincount(atribuicao, minlength=n_lists)
+            vazias = contagem == 0
+            somas[vazias] = centroides[vazias]
+            centroides = _normalizar_linhas(somas)
+
+        # Atribuição final em blocos para limitar memória (n × n_lists)
+        atribuicao = np.empty(n, dtype=np.int64)
+        for inicio in range(0, n, 65536):
+            bloco = matrix[inicio:inicio + 65536]
+            atribuicao[inicio:inicio + bloco.shape[0]] = np.argmax(bloco @ centroides.T, axis=1)
+
+        self.centroides = centroides
+        self.n_probe = max(1, min(n_probe, n_lists))
+        self.ordem = np.argsort(atribuicao, kind='stable')
+        self.offsets = np.searchsorted(atribuicao[self.ordem], np.arange(n_lists + 1))
+
+    def candidatos(self, q: np.ndarray) -> np.ndarray:
+        sondas = _top_k(self.centroides @ q, self.n_probe)
+        return np.concatenate([self.ordem[self.offsets[p]:self.offsets[p + 1]] for p in sondas])
+
+
+class NumpyVectorIndex:
+    """Índice vetorial em memória com a interface do cliente Pinecone usada pelo app."""
+
+    def __init__(self, dimension: int = 512, index_mode: str = 'auto', ann_min_rows: int = 50000,
+                 ivf_nprobe: int = 8):
+        if index_mode not in INDEX_MODES:
+            raise ValueError(f"index_mode inválido: {index_mode!r} (use {', '.join(INDEX_MODES)})")
+        self.dimension = int(dimension)
+        self.index_mode = index_mode
+        self.ann_min_rows = int(ann_min_rows)
+        self.ivf_nprobe = int(ivf_nprobe)
+        self._lock = threading.RLock()
+        self._limpar()
+
+    def _limpar(self):
+        self._ids: List[str] = []
+        self._posicao: Dict[str, int] = {}
+        self._matrix = np.empty((0, self.dimension), dtype=np.float32)
+        self._metadata: List[Dict[str, Any]] = []
+        self._document_ids = np.empty(0, dtype=np.int64)
+        self._ivf: Optional[_IVF] = None
+
+    # ---------------- escrita ----------------
+
+    def _preparar_vetores(self, vectors: Iterable[Any]) -> Tuple[List[str], np.ndarray, List[Dict[str, Any]]]:
+        ids, valores, metas = [], [], []
+        for item in vectors:
+            if isinstance(item, dict):
+                vid, vals, meta = item['id'], item['values'], item.get('metadata')
+            else:
+                vid, vals = item[0], item[1]
+                meta = item[2] if len(item) > 2 else None
+            ids.append(str(vid))
+            valores.append(vals)
+            metas.append(dict(meta or {}))
+        matrix = np.asarray(valores, dtype=np.float32).reshape(len(ids), -1) if ids else \
+            np.empty((0, self.dimension), dtype=np.float32)
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"Dimensão {matrix.shape[1]} difere da do índice ({self.dimension}).")
+        return ids, _normalizar_linhas(matrix), metas
+
+    def _carregar_arrays(self, ids: List[str], matrix: np.ndarray, metas: List[Dict[str, Any]]):
+        """Substitui todo o conteúdo (usado pelo LocalVectorStore ao ler do banco)."""
+        with self._lock:
+            self._limpar()
+            self._anexar(ids, _normalizar_linhas(matrix.astype(np.float32, copy=False)), metas)
+
+    def _anexar(self, ids, matrix, metas):
+        base = len(self._ids)
+        self._ids.extend(ids)
+        self._posicao.update({vid: base + i for i, vid in enumerate(ids)})
+        self._matrix = np.vstack([self._matrix, matrix]) if base else np.ascontiguousarray(matrix)
+        self._metadata.extend(metas)
+        doc_ids = np.fromiter((int(m.get('document_id') or -1) for m in metas), dtype=np.int64, count=len(metas))
+        self._document_ids = np.concatenate([self._document_ids, doc_ids])
+        self._ivf = None
+
+    def upsert(self, vectors=None, **kwargs):
+        ids, matrix, metas = self._preparar_vetores(vectors or [])
+        with self._lock:
+            self._remover([vid for vid in ids if vid in self._posicao])
+            self._anexar(ids, matrix, metas)
+        return {'upserted_count': len(ids)}
+
+    def _remover(self, ids: Sequence[str]):
+        if not ids:
+            return
+        remover = {self._posicao[vid] for vid in ids if vid in self._posicao}
+        if not remover:
+            return
+        manter = np.ones(len(self._ids), dtype=bool)
+        manter[list(remover)] = False
+        self._ids = [vid for vid, ok in zip(self._ids, manter) if ok]
+        self._metadata = [m for m, ok in zip(self._metadata, manter) if ok]
+        self._matrix = self._matrix[manter]
+        self._document_ids = self._document_ids[manter]
+        self._posicao = {vid: i for i, vid in enumerate(self._ids)}
+        self._ivf = None
+
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        with self._lock:
+            if delete_all:
+                self._limpar()
+            else:
+                self._remover([str(i) for i in (ids or [])])
+        return {}
+
+    # ---------------- leitura ----------------
+
+    def _usar_ivf(self) -> bool:
+        if self.index_mode == 'exact':
+            return False
+        if self.index_mode == 'ivf':
+            return len(self._ids) > 1
+        return len(self._ids) >= self.ann_min_rows
+
+    def _garantir_ivf(self) -> _IVF:
+        if self._ivf is None:
+            n = len(self._ids)
+            self._ivf = _IVF(self._matrix, n_lists=int(np.sqrt(n)) or 1, n_probe=self.ivf_nprobe)
+        return self._ivf
+
+    def query(self, vector=None, top_k: int = 10, include_metadata: bool = True, include_values: bool = False,
+              filter: Optional[Dict[str, Any]] = None, **kwargs):
+        """Top-k por similaridade de cosseno. `filter` aceita apenas document_id ({'$eq'}/{'$in'} ou valor)."""
+        q = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if q.shape[0] != self.dimension:
+            raise ValueError(f"Dimensão {q.shape[0]} difere da do índice ({self.dimension}).")
+        norma = float(np.linalg.norm(q))
+        if norma:
+            q = q / norma
+
+        with self._lock:
+            if not self._ids:
+                return {'matches': []}
+            candidatos = self._garantir_ivf().candidatos(q) if self._usar_ivf() else None
+            mascara = self._mascara_filtro(filter)
+            if candidatos is None:
+                scores = self._matrix @ q
+                if mascara is not None:
+                    scores = np.where(mascara, scores, -np.inf)
+                posicoes = _top_k(scores, int(top_k))
+                posicoes = posicoes[np.isfinite(scores[posicoes])]
+                escolhidos, valores_score = posicoes, scores[posicoes]
+            else:
+                if mascara is not None:
+                    candidatos = candidatos[mascara[candidatos]]
+                scores = self._matrix[candidatos] @ q
+                ordem = _top_k(scores, int(top_k))
+                escolhidos, valores_score = candidatos[ordem], scores[ordem]
+
+            matches = []
+            for pos, score in zip(escolhidos.tolist(), valores_score.tolist()):
+                match = {'id': self._ids[pos], 'score': float(score)}
+                if include_metadata:
+                    match['metadata'] = dict(self._metadata[pos])
+                if include_values:
+                    match['values'] = self._matrix[pos].tolist()
+                matches.append(match)
+            return {'matches': matches}
+
+    def _mascara_filtro(self, filtro: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not filtro:
+            return None
+        desconhecidos = set(filtro) - {'document_id'}
+        if desconhecidos:
+            raise ValueError(f"Filtro não suportado no índice local: {sorted(desconhecidos)}")
+        cond = filtro['document_id']
+        if isinstance(cond, dict):
+            if '$in' in cond:
+                return np.isin(self._document_ids, np.asarray(list(cond['$in']), dtype=np.int64))
+            cond = cond.get('$eq')
+        return self._document_ids == int(cond)
+
+    def describe_index_stats(self, **kwargs):
+        return {'dimension': self.dimension, 'total_vector_count': len(self._ids)}
+
+
+class LocalVectorStore(NumpyVectorIndex):
+    """Índice local persistido em intelligence_chunks (coluna embedding_f32 BYTEA, float32).
+
+    O conteúdo é carregado do banco para a memória do processo e recarregado quando
+    outro processo altera a tabela (assinatura COUNT/MAX(id) dos vetores).
+    """
+
+    def __init__(self, dimension: int = 512, index_mode: str = 'auto', ann_min_rows: int = 50000,
+                 ivf_nprobe: int = 8):
+        super().__init__(dimension, index_mode, ann_min_rows, ivf_nprobe)
+        self._assinatura = None
+        self._schema_ok = False
+
+    def _conn(self):
+        from aicentralv2.db import get_db
+        return get_db()
+
+    def _garantir_schema(self, conn):
+        """Migração idempotente das colunas usadas pelo índice local."""
+        if self._schema_ok:
+            return
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_name = 'intelligence_chunks' AND column_name = 'embedding_f32'
+                    ) THEN
+                        ALTER TABLE intelligence_chunks ADD COLUMN embedding_f32 BYTEA;
+                    END IF;
+                    IF NOT EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_name = 'intelligence_chunks' AND column_name = 'chunk_number'
+                    ) THEN
+                        ALTER TABLE intelligence_chunks ADD COLUMN chunk_number INTEGER;
+                    END IF;
+                END $$;
+            ''')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_intelligence_chunks_pinecone_id ON intelligence_chunks(pinecone_id)'
+            )
+        conn.commit()
+        self._schema_ok = True
+
+    def _assinatura_banco(self, cursor):
+        cursor.execute('''
+            SELECT COUNT(*) AS total, COALESCE(MAX(id), 0) AS max_id
+            FROM intelligence_chunks
+            WHERE embedding_f32 IS NOT NULL
+        ''')
+        row = cursor.fetchone()
+        return (row['total'], row['max_id'])
+
+    def _sincronizar(self):
+        conn = self._conn()
+        self._garantir_schema(conn)
+        with conn.cursor() as cursor:
+            assinatura = self._assinatura_banco(cursor)
+            if assinatura == self._assinatura:
+                return
+            cursor.execute('''
+                SELECT pinecone_id, document_id, chunk_number, chunk_text, metadata, embedding_f32
+                FROM intelligence_chunks
+                WHERE embedding_f32 IS NOT NULL
+                ORDER BY id
+            ''')
+            rows = cursor.fetchall()
+        buffer = b''.join(bytes(r['embedding_f32']) for r in rows)
+        matrix = np.frombuffer(buffer, dtype=np.float32).reshape(len(rows), self.dimension) if rows else \
+            np.empty((0, self.dimension), dtype=np.float32)
+        metas = []
+        for r in rows:
+            meta = dict(r['metadata'] or {})
+            meta.setdefault('document_id', r['document_id'])
+            meta.setdefault('chunk_number', r['chunk_number'])
+            meta.setdefault('text', r['chunk_text'])
+            metas.append(meta)
+        self._carregar_arrays([r['pinecone_id'] for r in rows], matrix, metas)
+        self._assinatura = assinatura
+        logger.info("Índice vetorial local carregado: %s vetores", len(rows))
+
+    def upsert(self, vectors=None, **kwargs):
+        from psycopg.types.json import Json
+
+        ids, matrix, metas = self._preparar_vetores(vectors or [])
+        if not ids:
+            return {'upserted_count': 0}
+        conn = self._conn()
+        self._garantir_schema(conn)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM intelligence_chunks WHERE pinecone_id = ANY(%s)', (ids,))
+                cursor.executemany('''
+                    INSERT INTO intelligence_chunks
+                        (document_id, chunk_number, chunk_text, pinecone_id, metadata, embedding_f32)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                ''', [
+                    (
+                        meta.get('document_id'),
+                        meta.get('chunk_number'),
+                        meta.get('text') or '',
+                        vid,
+                        Json({k: v for k, v in meta.items() if k != 'text'}),
+                        matrix[i].tobytes(),
+                    )
+                    for i, (vid, meta) in enumerate(zip(ids, metas))
+                ])
+                assinatura = self._assinatura_banco(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        with self._lock:
+            estava_sincronizado = self._assinatura is not None
+            super().upsert(vectors=list(zip(ids, matrix, metas)))
+            # Só aproveita a cópia em memória se ela já refletia o banco antes da escrita
+            self._assinatura = assinatura if estava_sincronizado else None
+        return {'upserted_count': len(ids)}
+
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        conn = self._conn()
+        self._garantir_schema(conn)
+        try:
+            with conn.cursor() as cursor:
+                if delete_all:
+                    cursor.execute('UPDATE intelligence_chunks SET embedding_f32 = NULL')
+                else:
+                    cursor.execute(
+                        'DELETE FROM intelligence_chunks WHERE pinecone_id = ANY(%s)',
+                        ([str(i) for i in (ids or [])],),
+                    )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        with self._lock:
+            super().delete(ids=ids, delete_all=delete_all)
+            self._assinatura = None
+        return {}
+
+    def query(self, vector=None, top_k: int = 10, include_metadata: bool = True, include_values: bool = False,
+              filter: Optional[Dict[str, Any]] = None, **kwargs):
+        with self._lock:
+            self._sincronizar()
+            return super().query(vector=vector, top_k=top_k, include_metadata=include_metadata,
+                                 include_values=include_values, filter=filter)
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            self._sincronizar()
+            return super().describe_index_stats()
+
+
+def criar_vector_store(backend: str, dimension: int = 512, index_mode: str = 'auto',
+                       ann_min_rows: int = 50000, ivf_nprobe: int = 8):
+    """Cria o índice local ('local' → intelligence_chunks; 'memory' → só em memória)."""
+    kwargs = dict(dimension=dimension, index_mode=index_mode, ann_min_rows=ann_min_rows, ivf_nprobe=ivf_nprobe)
+    if backend == 'local':
+        return LocalVectorStore(**kwargs)
+    if backend == 'memory':
+        return NumpyVectorIndex(**kwargs)
+    raise ValueError(f"Backend vetorial local desconhecido: {backend!r}")
@@ -0,0 +1,516 @@
+"""
+Fila de jobs em segundo plano sobre PostgreSQL (tabela cadu_jobs, criada em db.init_db).
+
+Requests enfileiram o trabalho lento com enfileirar_job() e respondem na hora; o worker
+(worker.py, na raiz do projeto) reivindica jobs com SELECT ... FOR UPDATE SKIP LOCKED e
+executa o handler registrado para o tipo.
+
+    @job_handler('intelligence.processar_documento', max_tentativas=3)
+    def _processar_documento(ctx):
+        ctx.progresso({'etapa': 'embeddings'})
+        return {'chunks': 42}
+
+    job_id = enfileirar_job('intelligence.processar_documento', {'document_id': 1},
+                            idempotency_key='intelligence:doc:1')
+
+- Prioridade: menor número executa primeiro (PRIORIDADE_ALTA/NORMAL/BAIXA).
+- Retentativas: backoff exponencial com jitter até max_tentativas; depois o job fica em
+  'falhou' (dead letter), visível em /api/jobs?status=falhou e reenfileirável.
+- Idempotência: idempotency_key única; enfileirar de novo devolve o job existente.
+- Jobs periódicos: job_handler(..., intervalo_segundos=N) é enfileirado pelo worker a cada N s.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import psycopg
+from flask import g, has_app_context
+from psycopg.types.json import Json
+
+from aicentralv2.db import get_db, get_db_config
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDENTE = 'pendente'
+JOB_EXECUTANDO = 'executando'
+JOB_CONCLUIDO = 'concluido'
+JOB_FALHOU = 'falhou'
+JOB_CANCELADO = 'cancelado'
+
+PRIORIDADE_ALTA = 10
+PRIORIDADE_NORMAL = 100
+PRIORIDADE_BAIXA = 200
+
+FILA_PADRAO = 'default'
+NOTIFY_CHANNEL = 'cadu_jobs'
+
+_BACKOFF_MAX_SEGUNDOS = 3600
+_MAX_ERRO_LEN = 4000
+
+# Módulos que registram handlers com @job_handler; o worker importa todos ao iniciar.
+HANDLER_MODULES = (
+    'aicentralv2.services.intelligence.service',
+    'aicentralv2.services.email_outbox',
+    'aicentralv2.services.brevo_sync',
+    'aicentralv2.services.pi_make_webhooks',
+    'aicentralv2.services.spedy_nf',
+    'aicentralv2.services.webhook_dispatcher',
+    'aicentralv2.services.wasender_inbox',
+    'aicentralv2.services.wasender_outbox',
+    'aicentralv2.services.dashboard_rollups',
+    'aicentralv2.services.analytics_agregados',
+    'aicentralv2.services.metricas_semanais',
+    'aicentralv2.services.clientes_abc',
+    'aicentralv2.services.cliente_metricas',
+)
+
+# Em desenvolvimento (sem worker rodando), JOBS_INLINE=1 executa o job na própria request.
+JOBS_INLINE = os.getenv('JOBS_INLINE', 'False').lower() in ('true', '1', 'yes')
+
+
+class JobErroPermanente(Exception):
+    """Falha que não adianta retentar: o job vai direto para 'falhou'."""
+
+
+class JobAdiado(Exception):
+    """Reagenda o job para daqui a `segundos` sem contar como tentativa (ex.: aguardando terceiro)."""
+
+    def __init__(self, segundos: float, motivo: str = ''):
+        super().__init__(motivo or f'adiado por {segundos}s')
+        self.segundos = segundos
+
+
+class JobTipo:
+    """Configuração de um tipo de job registrado."""
+
+    def __init__(self, nome: str, handler: Callable[['JobContext'], Any], max_tentativas: int,
+                 backoff_segundos: float, fila: str, timeout_segundos: int,
+                 intervalo_segundos: Optional[int], prioridade: int):
+        self.nome = nome
+        self.handler = handler
+        self.max_tentativas = max_tentativas
+        self.backoff_segundos = backoff_segundos
+        self.fila = fila
+        self.timeout_segundos = timeout_segundos
+        self.intervalo_segundos = intervalo_segundos
+        self.prioridade = prioridade
+
+
+_HANDLERS: Dict[str, JobTipo] = {}
+
+
+def job_handler(nome: str, *, max_tentativas: int = 5, backoff_segundos: float = 30,
+                fila: str = FILA_PADRAO, timeout_segundos: int = 900,
+                intervalo_segundos: Optional[int] = None, prioridade: int = PRIORIDADE_NORMAL):
+    """Registra `func(ctx)` como handler do tipo `nome`.
+
+    timeout_segundos: após esse tempo em 'executando' sem sinal de vida (início ou último
+    ctx.progresso) o job é considerado órfão (worker morto) e volta para a fila. intervalo_segundos: torna o job periódico (agendado pelo worker).
+    """
+    def decorator(func):
+        _HANDLERS[nome] = JobTipo(nome, func, max_tentativas, backoff_segundos, fila,
+                                  timeout_segundos, intervalo_segundos, prioridade)
+        return func
+    return decorator
+
+
+def obter_tipo_job(nome: str) -> Optional[JobTipo]:
+    return _HANDLERS.get(nome)
+
+
+def carregar_handlers(modulos: Iterable[str] = HANDLER_MODULES) -> Dict[str, JobTipo]:
+    """Importa os módulos que registram handlers (idempotente)."""
+    import importlib
+
+    for modulo in modulos:
+        importlib.import_module(modulo)
+    return dict(_HANDLERS)
+
+
+class JobContext:
+    """Contexto entregue ao handler: payload, tentativa atual e gravação de progresso."""
+
+    def __init__(self, job: Dict[str, Any], worker_id: str):
+        self.job = job
+        self.id = job['id']
+        self.tipo = job['tipo']
+        self.payload = job.get('payload') or {}
+        self.tentativa = job.get('tentativas') or 1
+        self.max_tentativas = job.get('max_tentativas') or 1
+        self.worker_id = worker_id
+
+    @property
+    def ultima_tentativa(self) -> bool:
+        return self.tentativa >= self.max_tentativas
+
+    def progresso(self, dados: Dict[str, Any]) -> None:
+        """Grava o progresso em conexão própria (não confirma a transação do handler).
+
+        Também renova bloqueado_em: handlers longos que reportam progresso não são
+        tomados como órfãos enquanto ainda rodam.
+        """
+        atualizar_progresso_job(self.id, dados, worker_id=self.worker_id)
+
+
+# ==================== ENFILEIRAMENTO ====================
+
+def enfileirar_job(tipo: str, payload: Optional[Dict[str, Any]] = None, *,
+                   prioridade: Optional[int] = None, idempotency_key: Optional[str] = None,
+                   atraso_segundos: float = 0, max_tentativas: Optional[int] = None,
+                   fila: Optional[str] = None, created_by: Optional[int] = None, conn=None) -> int:
+    """Enfileira um job e devolve seu id (ou o id do job existente com a mesma idempotency_key).
+
+    Com `conn`, o job entra na transação do chamador (que faz o commit) — útil para gravar o
+    job junto com a alteração de negócio; com JOBS_INLINE, o chamador executa o job com
+    executar_jobs_inline_pendentes() depois do commit. Sem `conn`, usa get_db() e faz commit.
+    """
+    registro = _HANDLERS.get(tipo)
+    proprio_commit = conn is None
+    conn = conn or get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO cadu_jobs
+                (tipo, payload, prioridade, idempotency_key, executar_em, max_tentativas, fila, created_by)
+            VALUES (%s, %s, %s, %s, NOW() + make_interval(secs => %s), %s, %s, %s)
+            ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+            RETURNING id
+        ''', (
+            tipo,
+            Json(payload or {}),
+            prioridade if prioridade is not None else (registro.prioridade if registro else PRIORIDADE_NORMAL),
+            idempotency_key,
+            float(atraso_segundos or 0),
+            max_tentativas or (registro.max_tentativas if registro else 5),
+            fila or (registro.fila if registro else FILA_PADRAO),
+            created_by,
+        ))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute('SELECT id FROM cadu_jobs WHERE idempotency_key = %s', (idempotency_key,))
+            row = cursor.fetchone()
+        else:
+            cursor.execute('SELECT pg_notify(%s, %s)', (NOTIFY_CHANNEL, tipo))
+    job_id = row['id']
+    if proprio_commit:
+        conn.commit()
+        if JOBS_INLINE:
+            executar_job_por_id(job_id)
+    elif JOBS_INLINE and has_app_context():
+        # Ainda não confirmado: só pode rodar depois do commit do chamador
+        g.setdefault('jobs_inline_pendentes', []).append(job_id)
+    return job_id
+
+
+def executar_jobs_inline_pendentes() -> None:
+    """Com JOBS_INLINE, executa os jobs enfileirados com `conn` nesta request.
+
+    Chamar depois do commit do chamador; fora do modo inline não faz nada (o worker entrega).
+    Jobs de uma transação desfeita não existem mais e são ignorados por executar_job_por_id.
+    """
+    if not JOBS_INLINE or not has_app_context():
+        return
+    for job_id in g.pop('jobs_inline_pendentes', []):
+        executar_job_por_id(job_id)
+
+
+def obter_job(job_id: int) -> Optional[Dict[str, Any]]:
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT * FROM cadu_jobs WHERE id = %s', (job_id,))
+        return cursor.fetchone()
+
+
+def listar_jobs(status: Optional[str] = None, tipo: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    where, params = [], []
+    if status:
+        where.append('status = %s')
+        params.append(status)
+    if tipo:
+        where.append('tipo = %s')
+        params.append(tipo)
+    sql = 'SELECT * FROM cadu_jobs'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY updated_at DESC, id DESC LIMIT %s'
+    params.append(limit)
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def contar_jobs_por_status() -> Dict[str, int]:
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT status, COUNT(*) AS total FROM cadu_jobs GROUP BY status')
+        return {r['status']: r['total'] for r in cursor.fetchall()}
+
+
+def reenfileirar_job(job_id: int) -> bool:
+    """Devolve à fila um job 'falhou'/'cancelado' (zera tentativas)."""
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE cadu_jobs
+               SET status = %s, tentativas = 0, executar_em = NOW(), ultimo_erro = NULL,
+                   bloqueado_por = NULL, bloqueado_em = NULL, updated_at = NOW()
+             WHERE id = %s AND status IN (%s, %s)
+         RETURNING tipo
+        ''', (JOB_PENDENTE, job_id, JOB_FALHOU, JOB_CANCELADO))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute('SELECT pg_notify(%s, %s)', (NOTIFY_CHANNEL, row['tipo']))
+    conn.commit()
+    return row is not None
+
+
+def cancelar_job(job_id: int) -> bool:
+    """Cancela um job ainda pendente."""
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE cadu_jobs SET status = %s, updated_at = NOW()
+             WHERE id = %s AND status = %s
+        ''', (JOB_CANCELADO, job_id, JOB_PENDENTE))
+        ok = cursor.rowcount > 0
+    conn.commit()
+    return ok
+
+
+def atualizar_progresso_job(job_id: int, dados: Dict[str, Any], worker_id: Optional[str] = None) -> None:
+    """Grava o progresso; com worker_id, renova bloqueado_em se o job ainda for desse worker."""
+    try:
+        with psycopg.connect(**get_db_config(), autocommit=True) as conn:
+            conn.execute('''
+                UPDATE cadu_jobs
+                   SET progresso = %s, updated_at = NOW(),
+                       bloqueado_em = CASE WHEN status = %s AND bloqueado_por = %s
+                                           THEN NOW() ELSE bloqueado_em END
+                 WHERE id = %s
+            ''', (Json(dados), JOB_EXECUTANDO, worker_id, job_id))
+    except Exception as e:
+        logger.warning(f"Falha ao gravar progresso do job {job_id}: {e}")
+
+
+# ==================== EXECUÇÃO ====================
+
+def _backoff(tipo: Optional[JobTipo], tentativa: int) -> float:
+    base = tipo.backoff_segundos if tipo else 30
+    atraso = min(_BACKOFF_MAX_SEGUNDOS, base * (2 ** max(0, tentativa - 1)))
+    return atraso * random.uniform(0.8, 1.2)
+
+
+def _reivindicar(cursor, worker_id: str, filas: Optional[List[str]], job_id: Optional[int] = None):
+    filtro = 'id = %s' if job_id is not None else 'executar_em <= NOW()'
+    params: List[Any] = [JOB_EXECUTANDO, worker_id, JOB_PENDENTE]
+    if job_id is not None:
+        params.append(job_id)
+    sql_filas = ''
+    if filas:
+        sql_filas = 'AND fila = ANY(%s)'
+        params.append(list(filas))
+    cursor.execute(f'''
+        UPDATE cadu_jobs j
+           SET status = %s, tentativas = j.tentativas + 1, bloqueado_por = %s,
+               bloqueado_em = NOW(), iniciado_em = COALESCE(j.iniciado_em, NOW()), updated_at = NOW()
+         WHERE j.id = (
+            SELECT id FROM cadu_jobs
+             WHERE status = %s AND {filtro} {sql_filas}
+             ORDER BY prioridade, executar_em, id
+             LIMIT 1
+             FOR UPDATE SKIP LOCKED
+         )
+        RETURNING j.*
+    ''', params)
+    return cursor.fetchone()
+
+
+def _finalizar(conn, job: Dict[str, Any], tipo: Optional[JobTipo], resultado: Any = None,
+               erro: Optional[BaseException] = None) -> str:
+    with conn.cursor() as cursor:
+        if erro is None:
+            cursor.execute('''
+                UPDATE cadu_jobs
+                   SET status = %s, resultado = %s, ultimo_erro = NULL, bloqueado_por = NULL,
+                       concluido_em = NOW(), updated_at = NOW()
+                 WHERE id = %s
+            ''', (JOB_CONCLUIDO, Json(resultado) if resultado is not None else None, job['id']))
+            status = JOB_CONCLUIDO
+        elif isinstance(erro, JobAdiado):
+            cursor.execute('''
+                UPDATE cadu_jobs
+                   SET status = %s, tentativas = GREATEST(tentativas - 1, 0), bloqueado_por = NULL,
+                       executar_em = NOW() + make_interval(secs => %s), updated_at = NOW()
+                 WHERE id = %s
+            ''', (JOB_PENDENTE, float(erro.segundos), job['id']))
+            status = JOB_PENDENTE
+        else:
+            detalhe = ''.join(traceback.format_exception(type(erro), erro, erro.__traceback__))[-_MAX_ERRO_LEN:]
+            definitivo = isinstance(erro, JobErroPermanente) or job['tentativas'] >= job['max_tentativas']
+            status = JOB_FALHOU if definitivo else JOB_PENDENTE
+            cursor.execute('''
+                UPDATE cadu_jobs
+                   SET status = %s, ultimo_erro = %s, bloqueado_por = NULL,
+                       executar_em = NOW() + make_interval(secs => %s), updated_at = NOW()
+                 WHERE id = %s
+            ''', (status, detalhe, 0.0 if definitivo else _backoff(tipo, job['tentativas']), job['id']))
+    conn.commit()
+    return status
+
+
+def _executar(job: Dict[str, Any], worker_id: str) -> str:
+    tipo = _HANDLERS.get(job['tipo'])
+    conn = get_db()
+    if tipo is None:
+        return _finalizar(conn, job, None, erro=JobErroPermanente(f"Nenhum handler registrado para '{job['tipo']}'"))
+
+    inicio = time.monotonic()
+    try:
+        resultado = tipo.handler(JobContext(job, worker_id))
+    except BaseException as e:  # noqa: B902 - registra e decide retentativa
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        status = _finalizar(conn, job, tipo, erro=e)
+        if not isinstance(e, JobAdiado):
+            logger.warning(f"Job {job['id']} ({job['tipo']}) tentativa {job['tentativas']} falhou -> {status}: {e}")
+        if not isinstance(e, Exception):
+            raise
+        return status
+    status = _finalizar(conn, job, tipo, resultado=resultado)
+    logger.info(f"Job {job['id']} ({job['tipo']}) concluído em {time.monotonic() - inicio:.1f}s")
+    return status
+
+
+def executar_proximo_job(worker_id: str, filas: Optional[List[str]] = None) -> bool:
+    """Reivindica e executa um job. Retorna False se não havia job disponível."""
+    conn = get_db()
+    with conn.cursor() as cursor:
+        job = _reivindicar(cursor, worker_id, filas)
+    conn.commit()
+    if job is None:
+        return False
+    _executar(job, worker_id)
+    return True
+
+
+def executar_job_por_id(job_id: int, worker_id: Optional[str] = None) -> Optional[str]:
+    """Executa imediatamente um job pendente específico (modo JOBS_INLINE / testes)."""
+    worker_id = worker_id or f'inline:{socket.gethostname()}:{os.getpid()}'
+    conn = get_db()
+    with conn.cursor() as cursor:
+        job = _reivindicar(cursor, worker_id, None, job_id=job_id)
+    conn.commit()
+    if job is None:
+        return None
+    return _executar(job, worker_id)
+
+
+def recuperar_jobs_orfaos() -> int:
+    """Devolve à fila jobs presos em 'executando' além do timeout do tipo (worker morreu).
+
+    A idade conta a partir de bloqueado_em, renovado a cada ctx.progresso do handler.
+    """
+    timeouts = {nome: t.timeout_segundos for nome, t in _HANDLERS.items()}
+    padrao = 900
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE cadu_jobs
+               SET status = CASE WHEN tentativas >= max_tentativas THEN %s ELSE %s END,
+                   ultimo_erro = 'Execução interrompida (worker encerrado ou timeout)',
+                   bloqueado_por = NULL, updated_at = NOW()
+             WHERE status = %s
+               AND bloqueado_em < NOW() - make_interval(secs => COALESCE((%s::jsonb ->> tipo)::float, %s))
+        ''', (JOB_FALHOU, JOB_PENDENTE, JOB_EXECUTANDO, Json(timeouts), padrao))
+        total = cursor.rowcount
+    conn.commit()
+    if total:
+        logger.warning(f"{total} job(s) órfão(s) devolvidos à fila")
+    return total
+
+
+def agendar_jobs_periodicos() -> int:
+    """Enfileira os jobs periódicos do intervalo atual (idempotente entre workers)."""
+    agora = time.time()
+    total = 0
+    for nome, tipo in _HANDLERS.items():
+        if not tipo.intervalo_segundos:
+            continue
+        janela = int(agora // tipo.intervalo_segundos)
+        enfileirar_job(nome, {'janela': janela}, idempotency_key=f'periodico:{nome}:{janela}')
+        total += 1
+    return total
+
+
+@job_handler('jobs.limpar_concluidos', max_tentativas=1, intervalo_segundos=86400, prioridade=PRIORIDADE_BAIXA)
+def _limpar_jobs_concluidos(ctx):
+    """Remove jobs concluídos/cancelados antigos (JOBS_RETENCAO_DIAS, padrão 14)."""
+    dias = int(os.getenv('JOBS_RETENCAO_DIAS', '14'))
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            DELETE FROM cadu_jobs
+             WHERE status IN (%s, %s) AND updated_at < NOW() - make_interval(days => %s)
+        ''', (JOB_CONCLUIDO, JOB_CANCELADO, dias))
+        removidos = cursor.rowcount
+    conn.commit()
+    return {'removidos': removidos}
+
+
+def run_worker(app, filas: Optional[List[str]] = None, worker_id: Optional[str] = None,
+               poll_interval: float = 2.0, stop_event: Optional[threading.Event] = None) -> None:
+    """Laço do worker: executa jobs enquanto houver e espera NOTIFY/poll quando a fila esvazia.
+
+    Cada job roda no seu próprio app_context (conexão get_db() nova, fechada no teardown).
+    """
+    stop_event = stop_event or threading.Event()
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    carregar_handlers()
+    proxima_manutencao = 0.0
+    listen_conn = None
+    try:
+        listen_conn = psycopg.connect(**get_db_config(), autocommit=True)
+        listen_conn.execute(f'LISTEN {NOTIFY_CHANNEL}')
+    except Exception as e:
+        logger.warning(f"LISTEN indisponível, usando apenas polling: {e}")
+        listen_conn = None
+
+    logger.info(f"Worker {worker_id} iniciado (filas={filas or 'todas'}, handlers={sorted(_HANDLERS)})")
+    try:
+        while not stop_event.is_set():
+            executou = False
+            try:
+                with app.app_context():
+                    if time.monotonic() >= proxima_manutencao:
+                        recuperar_jobs_orfaos()
+                        agendar_jobs_periodicos()
+                        proxima_manutencao = time.monotonic() + 30
+                    executou = executar_proximo_job(worker_id, filas)
+            except Exception as e:
+                logger.error(f"Erro no laço do worker {worker_id}: {e}")
+                stop_event.wait(poll_interval)
+                continue
+            if executou:
+                continue
+            if listen_conn is not None:
+                try:
+                    for _ in listen_conn.notifies(timeout=poll_interval, stop_after=1):
+                        pass
+                    continue
+                except Exception as e:
+                    logger.warning(f"LISTEN interrompido, voltando ao polling: {e}")
+                    listen_conn = None
+            stop_event.wait(poll_interval)
+    finally:
+        if listen_conn is not None:
+            listen_conn.close()
+        logger.info(f"Worker {worker_id} encerrado")
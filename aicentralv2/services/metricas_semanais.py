@@ -0,0 +1,173 @@
+"""
+=====================================================
+MÉTRICAS SEMANAIS
+Fatos do comercial por semana, executivo e cliente + payload único da página
+=====================================================
+
+/metricas/semanais (e as rotas /api/metricas/semanais/*) leem metricas_semanais_fatos
+em vez de varrer cadu_cotacoes a cada widget:
+
+- Uma linha por (dia de criação, semana, executivo, cliente, status) com contagem,
+  valor, cotações com envio/aprovação e as somas em dias até envio, de negociação e
+  do ciclo. KPIs, funil, estágios, evolução, status, ranking de executivos e o
+  comparativo entre semanas saem da mesma tabela, num só passe por dia de origem.
+- Recálculo: fonte 'semanal' do mecanismo de services/dashboard_rollups.py. Triggers
+  em cadu_cotacoes marcam os dias alterados; o job 'metricas_semanais.atualizar_fatos'
+  recalcula só esses dias. Semanas fechadas ficam gravadas e não são reprocessadas;
+  na prática só a semana corrente é recalculada, além de algum dia antigo cuja cotação
+  mudou (aprovação tardia, exclusão), para a semana não perder o resultado final.
+- PIs (funil e grade anual) vêm de dashboard_rollup_pi_dia, o rollup da home.
+- GET /api/metricas/semanais/pagina devolve todos os widgets de uma vez
+  ({widget: {success, data, ms}}), depois de aplicar as pendências das fontes já
+  inicializadas. Leads e as listas detalhadas continuam consultando as tabelas.
+- `flask dashboard-rollups --fonte semanal [--completo]` faz o backfill na hora.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from psycopg import pq
+
+from aicentralv2 import db
+from aicentralv2.services.dashboard_rollups import atualizar_rollup, atualizar_rollups, registrar_fonte
+from aicentralv2.services.jobs import job_handler
+
+logger = logging.getLogger(__name__)
+
+METRICAS_SEMANAIS_INTERVALO = int(os.getenv('METRICAS_SEMANAIS_INTERVALO', '60'))
+
+FONTE_SEMANAL = 'semanal'
+
+_SQL_FATOS = '''
+    INSERT INTO metricas_semanais_fatos
+        (dia, semana, responsavel_comercial, client_id, status, cotacoes, valor_total,
+         com_envio, com_aprovacao, com_envio_aprovacao, dias_ate_envio, dias_negociacao, dias_ciclo)
+    SELECT
+        d.dia,
+        date_trunc('week', d.dia)::date,
+        c.responsavel_comercial,
+        c.client_id,
+        c.status,
+        COUNT(*),
+        COALESCE(SUM(c.valor_total_proposta), 0),
+        COUNT(c.proposta_enviada_em),
+        COUNT(c.aprovada_em),
+        COUNT(*) FILTER (WHERE c.proposta_enviada_em IS NOT NULL AND c.aprovada_em IS NOT NULL),
+        COALESCE(SUM(EXTRACT(EPOCH FROM (c.proposta_enviada_em - c.created_at)) / 86400), 0),
+        COALESCE(SUM(EXTRACT(EPOCH FROM (c.aprovada_em - c.proposta_enviada_em)) / 86400), 0),
+        COALESCE(SUM(EXTRACT(EPOCH FROM (c.aprovada_em - c.created_at)) / 86400), 0)
+    FROM unnest(%(dias)s::date[]) AS d(dia)
+    JOIN cadu_cotacoes c ON c.created_at >= d.dia AND c.created_at < d.dia + 1
+    WHERE c.deleted_at IS NULL
+    GROUP BY 1, 2, 3, 4, 5
+'''
+
+registrar_fonte(FONTE_SEMANAL, origem=db.ROLLUP_METRICAS_SEMANAIS_TABELAS[FONTE_SEMANAL],
+                rollup='metricas_semanais_fatos', sql=_SQL_FATOS)
+
+# Fontes lidas pela página: fatos das cotações e rollup de PIs da home
+FONTES_PAGINA = (FONTE_SEMANAL, 'pi')
+
+
+def atualizar_fatos_semanais(*, completo: bool = False) -> Dict[str, Dict[str, Any]]:
+    return atualizar_rollups((FONTE_SEMANAL,), completo=completo)
+
+
+def _aplicar_pendencias(fontes: Iterable[str]) -> None:
+    """Recalcula os dias pendentes das fontes já inicializadas (o backfill fica com o job)."""
+    conn = db.get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT fonte FROM dashboard_rollup_estado WHERE fonte = ANY(%s)', (list(fontes),))
+        inicializadas = [r['fonte'] for r in cursor.fetchall()]
+    conn.commit()
+    for fonte in inicializadas:
+        try:
+            atualizar_rollup(fonte)
+        except Exception as e:
+            logger.warning(f"Métricas semanais: pendências de '{fonte}' não aplicadas ({e}); lendo o que já está gravado")
+
+
+# ==================== PAYLOAD DA PÁGINA ====================
+
+def _json(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, dict):
+        return {k: _json(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_json(v) for v in valor]
+    return valor
+
+
+def _kpis(mes_inicio, mes_fim, executivo_id, cliente_id):
+    kpis = db.obter_kpis_semanais(mes_inicio, mes_fim, executivo_id, cliente_id)
+    if isinstance(kpis, dict):
+        kpis['novos_clientes'] = db.obter_novos_clientes_periodo(mes_inicio, mes_fim, executivo_id)
+        kpis['novos_contatos'] = db.obter_novos_contatos_periodo(mes_inicio, mes_fim, executivo_id)
+        kpis['leads_total'] = db.obter_leads_count(mes_inicio, mes_fim, executivo_id)
+    return kpis
+
+
+def _widgets(mes_inicio: date, mes_fim: date, executivo_id: Optional[int], cliente_id: Optional[int],
+             ano: int, busca: Optional[str]) -> Dict[str, Callable[[], Any]]:
+    """Mesmos dados das rotas individuais, na ordem em que a página renderiza."""
+    return {
+        'base_total': db.obter_kpis_base_total,
+        'kpis': lambda: _kpis(mes_inicio, mes_fim, executivo_id, cliente_id),
+        'funil_comercial': lambda: db.obter_funil_comercial(mes_inicio, mes_fim, executivo_id),
+        'leads_por_fonte': lambda: db.obter_leads_por_fonte(mes_inicio, mes_fim, executivo_id),
+        'evolucao_diaria': lambda: db.obter_evolucao_diaria_semana(mes_inicio, mes_fim, executivo_id, cliente_id),
+        'distribuicao_status': lambda: db.obter_distribuicao_status_semana(mes_inicio, mes_fim, executivo_id, cliente_id),
+        'por_executivo': lambda: db.obter_cotacoes_por_executivo_semana(mes_inicio, mes_fim, executivo_id, cliente_id),
+        'estagios_cotacoes': lambda: db.obter_estagios_cotacoes(mes_inicio, mes_fim, executivo_id),
+        'top_cotacoes_aprovadas': lambda: db.obter_top_cotacoes_aprovadas(mes_inicio, mes_fim, executivo_id),
+        'leads_por_executivo': lambda: db.obter_leads_por_executivo(mes_inicio, mes_fim),
+        'leads_detalhado': lambda: db.obter_leads_detalhado(mes_inicio, mes_fim, executivo_id),
+        'pis_por_executivo_anual': lambda: db.obter_pis_por_executivo_anual(ano),
+        'cotacoes': lambda: db.obter_cotacoes_detalhadas_semana(mes_inicio, mes_fim, executivo_id, cliente_id, busca),
+    }
+
+
+def montar_pagina(mes_inicio: date, mes_fim: date, executivo_id: Optional[int] = None,
+                  cliente_id: Optional[int] = None, ano: Optional[int] = None,
+                  busca: Optional[str] = None) -> Dict[str, Any]:
+    """Payload completo de /metricas/semanais: {widget: {success, data, ms}}."""
+    inicio = time.perf_counter()
+    _aplicar_pendencias(FONTES_PAGINA)
+
+    conn = db.get_db()
+    widgets: Dict[str, Dict[str, Any]] = {}
+    for nome, consulta in _widgets(mes_inicio, mes_fim, executivo_id, cliente_id,
+                                   ano or date.today().year, busca).items():
+        t0 = time.perf_counter()
+        try:
+            widgets[nome] = {'success': True, 'data': _json(consulta())}
+        except Exception as e:
+            logger.error(f"Erro no widget {nome} das métricas semanais: {e}", exc_info=True)
+            widgets[nome] = {'success': False, 'message': str(e)}
+        # As consultas do db engolem o erro; sem rollback a transação abortada derrubaria as seguintes
+        if conn.info.transaction_status == pq.TransactionStatus.INERROR:
+            conn.rollback()
+        widgets[nome]['ms'] = round((time.perf_counter() - t0) * 1000, 1)
+
+    return {
+        'success': True,
+        'periodo': {'inicio': mes_inicio.isoformat(), 'fim': mes_fim.isoformat()},
+        'widgets': widgets,
+        'ms': round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
+
+@job_handler('metricas_semanais.atualizar_fatos', max_tentativas=1, timeout_segundos=1800,
+             intervalo_segundos=METRICAS_SEMANAIS_INTERVALO)
+def _job_atualizar_fatos(ctx):
+    """Recalcula os dias de cotações marcados desde a última execução."""
+    return atualizar_fatos_semanais()
@@ -0,0 +1,194 @@
+"""
+=====================================================
+OPENROUTER CHAT
+Completions de texto (com ou sem streaming) e resposta SSE
+=====================================================
+
+Cliente único das rotas de texto da IA (CRM, leads, briefing de cotação):
+
+- sessão `requests` com pool de conexões por processo (recriada após fork);
+- chamar_openrouter: completion inteira, como antes;
+- stream_openrouter: gerador com os pedaços de texto à medida que chegam
+  (stream=True da OpenRouter). Fechar o gerador fecha a conexão, o que cancela a
+  geração no provedor;
+- resposta_sse: Response text/event-stream que repassa os pedaços ('token'), termina
+  com 'fim' (o mesmo JSON da rota sem streaming) ou 'erro'. Se o navegador cancelar
+  (AbortController / aba fechada), o servidor de aplicação fecha o gerador e a
+  chamada à OpenRouter é abortada.
+
+As rotas só fazem streaming quando o cliente pede (Accept: text/event-stream ou
+?stream=1); sem isso respondem JSON como sempre.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import requests
+from flask import Response
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_URL = 'https://openrouter.ai/api/v1/chat/completions'
+MODELO_TEXTO_PADRAO = 'google/gemini-2.5-flash'
+# Conexão; leitura é o tempo máximo sem receber nada (no streaming, entre pedaços)
+OPENROUTER_TIMEOUT_CONEXAO = 10
+OPENROUTER_TIMEOUT_LEITURA = int(os.getenv('OPENROUTER_TIMEOUT_LEITURA', '60'))
+
+_http_session: Optional[requests.Session] = None
+_http_session_pid: Optional[int] = None
+_http_lock = threading.Lock()
+
+
+def openrouter_http_session() -> requests.Session:
+    """Sessão `requests` com pool de conexões, recriada após fork."""
+    global _http_session, _http_session_pid
+    pid = os.getpid()
+    if _http_session is None or _http_session_pid != pid:
+        with _http_lock:
+            if _http_session is None or _http_session_pid != pid:
+                sessao = requests.Session()
+                sessao.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=16))
+                _http_session = sessao
+                _http_session_pid = pid
+    return _http_session
+
+
+def _mensagens(system_prompt: str, user_content: str) -> List[Dict[str, str]]:
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': user_content},
+    ]
+
+
+def _post(system_prompt: str, user_content: str, *, modelo: str, max_tokens: int,
+          temperature: float, titulo: str, stream: bool, timeout_leitura: Optional[int]) -> requests.Response:
+    api_key = os.getenv('OPENROUTER_API_KEY')
+    if not api_key:
+        raise ValueError('OPENROUTER_API_KEY não configurada')
+    payload: Dict[str, Any] = {
+        'model': modelo,
+        'messages': _mensagens(system_prompt, user_content),
+        'max_tokens': max_tokens,
+        'temperature': temperature,
+    }
+    if stream:
+        payload['stream'] = True
+    resp = openrouter_http_session().post(
+        OPENROUTER_URL,
+        headers={
+            'Authorization': f'Bearer {api_key}',
+            'HTTP-Referer': 'https://centralcomm.media',
+            'X-Title': titulo,
+            'Content-Type': 'application/json',
+        },
+        json=payload,
+        stream=stream,
+        timeout=(OPENROUTER_TIMEOUT_CONEXAO, timeout_leitura or OPENROUTER_TIMEOUT_LEITURA),
+    )
+    if resp.status_code >= 400:
+        try:
+            resp.raise_for_status()
+        finally:
+            resp.close()
+    return resp
+
+
+def chamar_openrouter(system_prompt: str, user_content: str, *, modelo: str = MODELO_TEXTO_PADRAO,
+                      max_tokens: int = 1000, temperature: float = 0.7, titulo: str = 'CentralComm AI',
+                      timeout_leitura: Optional[int] = None) -> str:
+    """Completion inteira (sem streaming); devolve o texto da resposta."""
+    resp = _post(system_prompt, user_content, modelo=modelo, max_tokens=max_tokens,
+                 temperature=temperature, titulo=titulo, stream=False, timeout_leitura=timeout_leitura)
+    return resp.json()['choices'][0]['message']['content']
+
+
+def stream_openrouter(system_prompt: str, user_content: str, *, modelo: str = MODELO_TEXTO_PADRAO,
+                      max_tokens: int = 1000, temperature: float = 0.7, titulo: str = 'CentralComm AI',
+                      timeout_leitura: Optional[int] = None) -> Iterator[str]:
+    """Gera os pedaços de texto da completion conforme chegam.
+
+    Gera '' nos comentários de keep-alive da OpenRouter (": OPENROUTER PROCESSING"),
+    para quem repassa o stream poder escrever algo enquanto o modelo não responde.
+    """
+    resp = _post(system_prompt, user_content, modelo=modelo, max_tokens=max_tokens,
+                 temperature=temperature, titulo=titulo, stream=True, timeout_leitura=timeout_leitura)
+    try:
+        for linha in resp.iter_lines(decode_unicode=False):
+            if not linha:
+                continue
+            if linha.startswith(b':'):
+                yield ''
+                continue
+            if not linha.startswith(b'data:'):
+                continue
+            dado = linha[5:].strip()
+            if dado == b'[DONE]':
+                break
+            evento = json.loads(dado)
+            if evento.get('error'):
+                erro = evento['error']
+                raise RuntimeError(erro.get('message') if isinstance(erro, dict) else str(erro))
+            for escolha in evento.get('choices') or []:
+                pedaco = (escolha.get('delta') or {}).get('content')
+                if pedaco:
+                    yield pedaco
+    finally:
+        # Antes do fim do corpo isso derruba a conexão: a OpenRouter interrompe a geração
+        resp.close()
+
+
+def quer_stream(req) -> bool:
+    """O cliente pediu SSE (Accept: text/event-stream ou ?stream=1)?"""
+    if (req.args.get('stream') or '').lower() in ('1', 'true'):
+        return True
+    return 'text/event-stream' in (req.headers.get('Accept') or '')
+
+
+def _evento(nome: str, dados: Dict[str, Any]) -> str:
+    return f'event: {nome}\ndata: {json.dumps(dados, ensure_ascii=False, default=str)}\n\n'
+
+
+def resposta_sse(pedacos: Iterator[str], concluir: Callable[[str], Dict[str, Any]], *,
+                 rotulo: str = 'openrouter') -> Response:
+    """Repassa `pedacos` como SSE e fecha com `concluir(texto_completo)` no evento 'fim'.
+
+    O gerador não usa request/session/g: o contexto da request (e a conexão com o banco)
+    é liberado antes do streaming começar.
+    """
+    def gerar():
+        partes: List[str] = []
+        yield ': inicio\n\n'
+        try:
+            for pedaco in pedacos:
+                if not pedaco:
+                    yield ': aguardando\n\n'
+                    continue
+                partes.append(pedaco)
+                yield _evento('token', {'texto': pedaco})
+            yield _evento('fim', concluir(''.join(partes)))
+        except GeneratorExit:
+            logger.info(f'Stream {rotulo} cancelado pelo cliente')
+            raise
+        except Exception as e:
+            logger.error(f'Erro no stream {rotulo}: {e}', exc_info=True)
+            yield _evento('erro', {'success': False, 'error': str(e), 'message': str(e)})
+        finally:
+            close = getattr(pedacos, 'close', None)
+            if close:
+                close()
+
+    return Response(
+        gerar(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # nginx: não segurar o corpo em buffer
+            'X-Accel-Buffering': 'no',
+        },
+    )
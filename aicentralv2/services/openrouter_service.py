@@ -3,8 +3,16 @@ Serviço OpenRouter para processamento de texto com Gemini
 """
 import os
 import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
 
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 if not OPENROUTER_API_KEY:
@@ -12,6 +20,14 @@ if not OPENROUTER_API_KEY:
 
 OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 
+# Processamento de textos longos (process_large_text)
+SEGMENT_CONCURRENCY = int(os.getenv('OPENROUTER_SEGMENT_CONCURRENCY', '4'))
+SEGMENT_MAX_RETRIES = int(os.getenv('OPENROUTER_SEGMENT_MAX_RETRIES', '3'))
+SEGMENT_BACKOFF_SECONDS = 2.0
+# Orçamento de tokens por documento (entrada estimada + saída máxima); 0 = sem limite
+SEGMENT_TOKEN_BUDGET = int(os.getenv('OPENROUTER_SEGMENT_TOKEN_BUDGET', '400000'))
+_SEGMENT_CACHE_MAX = 256
+
 # Prompt otimizado para transformar texto em FAQ estruturado
 ANALYSIS_PROMPT = {
     "system": """Você é um especialista em análise e estruturação de documentos corporativos.
@@ -102,32 +118,71 @@ def process_text_with_gemini(text: str) -> Dict[str, Any]:
         }
         
     except requests.exceptions.RequestException as e:
+        status = getattr(getattr(e, 'response', None), 'status_code', None)
         return {
             'success': False,
             'error': str(e),
+            # Timeout/conexão, 429 e 5xx valem nova tentativa; demais 4xx não
+            'retryable': status is None or status == 429 or status >= 500,
             'processed_text': text,  # Retorna texto original em caso de erro
             'metadata': {
                 'error_details': str(e)
             }
         }
 
-# Função auxiliar para processar textos muito longos em chunks
-def process_large_text(text: str, max_chunk_size: int = 8000) -> str:
-    """
-    Processa textos longos dividindo em chunks e mantendo contexto.
-    
-    Args:
-        text: Texto completo
-        max_chunk_size: Tamanho máximo de cada chunk
-        
-    Returns:
-        Texto processado completo
-    """
-    if len(text) <= max_chunk_size:
-        result = process_text_with_gemini(text)
-        return result['processed_text'] if result['success'] else text
-    
-    # Dividir em chunks preservando parágrafos
+# Cache em memória (por processo) de segmentos já processados, indexado pelo hash do prompt
+_segment_cache: "OrderedDict[str, str]" = OrderedDict()
+_segment_cache_lock = threading.Lock()
+
+
+def _segment_cache_key(text: str) -> str:
+    base = f"{ANALYSIS_PROMPT['system']}\x00{ANALYSIS_PROMPT['max_tokens']}\x00{text}"
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+
+def _segment_cache_get(key: str) -> Optional[str]:
+    with _segment_cache_lock:
+        value = _segment_cache.get(key)
+        if value is not None:
+            _segment_cache.move_to_end(key)
+        return value
+
+
+def _segment_cache_put(key: str, value: str) -> None:
+    with _segment_cache_lock:
+        _segment_cache[key] = value
+        _segment_cache.move_to_end(key)
+        while len(_segment_cache) > _SEGMENT_CACHE_MAX:
+            _segment_cache.popitem(last=False)
+
+
+def _estimate_tokens(text: str) -> int:
+    """Estimativa grosseira (~4 caracteres por token)."""
+    return len(text) // 4 + 1
+
+
+class _TokenBudget:
+    """Orçamento de tokens compartilhado entre os segmentos de um documento."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> bool:
+        with self._lock:
+            if self.limit and self.used + tokens > self.limit:
+                return False
+            self.used += tokens
+            return True
+
+    def adjust(self, reserved: int, actual: int) -> None:
+        with self._lock:
+            self.used += actual - reserved
+
+
+def _split_segments(text: str, max_chunk_size: int) -> List[str]:
+    """Divide o texto em segmentos de até max_chunk_size, preservando parágrafos."""
     chunks = []
     current_chunk = []
     current_size = 0
@@ -144,18 +199,88 @@ def process_large_text(text: str, max_chunk_size: int = 8000) -> str:
     
     if current_chunk:
         chunks.append('\n\n'.join(current_chunk))
+    return chunks
+
+
+def _process_segment(text: str, budget: _TokenBudget, max_retries: int) -> str:
+    """Processa um segmento com cache, orçamento de tokens e retentativas com backoff.
+
+    Em caso de falha definitiva ou orçamento esgotado, devolve o texto original.
+    """
+    key = _segment_cache_key(text)
+    cached = _segment_cache_get(key)
+    if cached is not None:
+        return cached
+
+    reserved = _estimate_tokens(text) + ANALYSIS_PROMPT['max_tokens']
+    if not budget.reserve(reserved):
+        logger.warning("Orçamento de tokens esgotado; segmento mantido sem processamento.")
+        return text
+
+    result = None
+    attempts = 0
+    for attempt in range(max_retries + 1):
+        attempts += 1
+        result = process_text_with_gemini(text)
+        if result['success'] or not result.get('retryable', True) or attempt == max_retries:
+            break
+        time.sleep(SEGMENT_BACKOFF_SECONDS * (2 ** attempt))
+
+    usage = (result.get('metadata') or {}).get('usage') or {}
+    budget.adjust(reserved, int(usage.get('total_tokens') or (reserved if result['success'] else 0)))
+
+    if not result['success']:
+        logger.warning(f"Segmento não processado após {attempts} tentativa(s): {result.get('error')}")
+        return text
+    _segment_cache_put(key, result['processed_text'])
+    return result['processed_text']
+
+
+# Função auxiliar para processar textos muito longos em chunks
+def process_large_text(
+    text: str,
+    max_chunk_size: int = 8000,
+    max_workers: Optional[int] = None,
+    token_budget: Optional[int] = None,
+) -> str:
+    """
+    Processa textos longos dividindo em chunks e mantendo contexto.
+
+    Os segmentos são independentes e processados em paralelo (no máximo
+    max_workers chamadas simultâneas), mantendo a ordem original no resultado.
     
-    # Processar cada chunk
-    processed_chunks = []
-    for i, chunk in enumerate(chunks):
-        context = f"Este é o segmento {i+1} de {len(chunks)} do documento. "
-        chunk_with_context = context + chunk
+    Args:
+        text: Texto completo
+        max_chunk_size: Tamanho máximo de cada chunk
+        max_workers: Chamadas simultâneas ao OpenRouter (padrão: OPENROUTER_SEGMENT_CONCURRENCY)
+        token_budget: Limite de tokens para o documento (padrão: OPENROUTER_SEGMENT_TOKEN_BUDGET)
         
-        result = process_text_with_gemini(chunk_with_context)
-        if result['success']:
-            processed_chunks.append(result['processed_text'])
-        else:
-            processed_chunks.append(chunk)
+    Returns:
+        Texto processado completo
+    """
+    budget = _TokenBudget(SEGMENT_TOKEN_BUDGET if token_budget is None else token_budget)
+
+    if len(text) <= max_chunk_size:
+        return _process_segment(text, budget, SEGMENT_MAX_RETRIES)
+    
+    chunks = _split_segments(text, max_chunk_size)
+    segments = [
+        f"Este é o segmento {i+1} de {len(chunks)} do documento. " + chunk
+        for i, chunk in enumerate(chunks)
+    ]
+
+    workers = max(1, min(max_workers or SEGMENT_CONCURRENCY, len(segments)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='openrouter-seg') as executor:
+        processed = list(executor.map(
+            lambda seg: _process_segment(seg, budget, SEGMENT_MAX_RETRIES),
+            segments,
+        ))
+
+    # Segmentos não processados voltam sem o prefixo de contexto
+    processed_chunks = [
+        chunk if result == segment else result
+        for chunk, segment, result in zip(chunks, segments, processed)
+    ]
     
     # Combinar resultados
-    return "\n\n# Próxima Seção\n\n".join(processed_chunks)
\ No newline at end of file
+    return "\n\n# Próxima Seção\n\n".join(processed_chunks)
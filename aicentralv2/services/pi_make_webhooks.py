@@ -12,6 +12,7 @@ import requests
 from flask import current_app
 
 from aicentralv2 import db
+from aicentralv2.services.jobs import JOBS_INLINE, JobErroPermanente, enfileirar_job, executar_job_por_id, job_handler
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,10 @@ class PiMakeWebhookError(Exception):
     """Falha ao comunicar com webhook Make do PI."""
 
 
+class PiMakeWebhookTransitorio(PiMakeWebhookError):
+    """Falha de rede/HTTP/banco: o job do fluxo de produção tenta de novo."""
+
+
 def _is_dev() -> bool:
     try:
         return bool(current_app.config.get('DEBUG', False))
@@ -156,7 +161,7 @@ def gerar_pastas_drive_pi(pi: dict, *, strict: bool = False) -> dict[str, str]:
         resp.raise_for_status()
     except requests.RequestException as exc:
         logger.error('Erro webhook MAKE_WEBHOOK_GDRIVE: %s', exc)
-        raise PiMakeWebhookError(f'Erro ao comunicar com webhook de pastas: {exc}') from exc
+        raise PiMakeWebhookTransitorio(f'Erro ao comunicar com webhook de pastas: {exc}') from exc
 
     partes = resp.text.strip().split('*****')
     if len(partes) < 4:
@@ -165,7 +170,7 @@ def gerar_pastas_drive_pi(pi: dict, *, strict: bool = False) -> dict[str, str]:
             len(partes),
             resp.text[:200],
         )
-        raise PiMakeWebhookError('Resposta do webhook de pastas com formato inesperado')
+        raise PiMakeWebhookTransitorio('Resposta do webhook de pastas com formato inesperado')
 
     princ, financ, pecas, arq_ass = partes[0], partes[1], partes[2], partes[3]
     db.atualizar_cadu_pi_gdrive(id_pi, princ, financ, pecas, arq_ass)
@@ -195,7 +200,78 @@ def _atualizar_status_pi_producao(id_pi: int) -> None:
             conn.commit()
     except Exception as exc:
         conn.rollback()
-        raise PiMakeWebhookError(f'Erro ao atualizar status do PI: {exc}') from exc
+        raise PiMakeWebhookTransitorio(f'Erro ao atualizar status do PI: {exc}') from exc
+
+
+def _params_webhook_configuracao(pi: dict, is_dev: bool) -> dict:
+    tem_agencia = bool(pi.get('id_agencia'))
+    return {
+        'testeparam': 'yes' if is_dev else 'no',
+        'codPI': pi.get('codigo_pi_cc') or '',
+        'razaosccliente': pi.get('cliente_razao_social') or '',
+        'nomefcliente': pi.get('cliente_nome') or '',
+        'razaoscagencia': pi.get('agencia_razao_social') or '',
+        'nomefagencia': pi.get('agencia_nome') or '',
+        'pastagoogleprinc': pi.get('googled_pi_princ') or '',
+        'valorliquidopi': valor_liquido_pi_webhook(pi),
+        'emailresponsavelpi': pi.get('resp_comercial_email') or '',
+        'mesref': _fmt_data_curta(pi.get('mes_ref')),
+        'datainicio': _fmt_data_curta(pi.get('periodo_inicio')),
+        'datafim': _fmt_data_curta(pi.get('periodo_fim')),
+        'pastagooglepecas': pi.get('googled_pi_pecas') or '',
+        'instrucoesoperacao': (pi.get('observacoes_operacao') or '').strip() or 'Sem instruções',
+        'instrucoesfinanceiro': (pi.get('observacoes_financeiro') or '').strip() or 'Sem instruções',
+        'nomerespPI': pi.get('resp_comercial_nome') or '',
+        'titulo': pi.get('titulo_pi') or '',
+        'pi_tem_agencia': 'sim' if tem_agencia else 'não',
+    }
+
+
+def _params_webhook_invites(pi: dict, is_dev: bool) -> dict:
+    periodo_inicio = pi.get('periodo_inicio')
+    dt_inicio = _parse_periodo_inicio(pi)
+    return {
+        'testeparam': 'yes' if is_dev else 'no',
+        'dteveinicio': _fmt_data_invite(periodo_inicio),
+        'nomerespcc': pi.get('resp_comercial_nome') or '',
+        'emailrespcc': pi.get('resp_comercial_email') or '',
+        'codPI': pi.get('codigo_pi_cc') or '',
+        'dteven5dias': _fmt_data_invite(dt_inicio + timedelta(days=5)) if dt_inicio else '',
+        'tituloPI': pi.get('titulo_pi') or '',
+        'dtevenfim': _fmt_data_invite(pi.get('periodo_fim')),
+    }
+
+
+# Webhooks de produção: etapa -> (variável de ambiente, montagem dos parâmetros)
+WEBHOOKS_PRODUCAO = (
+    ('webhook_configuracao', 'MAKE_WEBHOOK_PI_CONFIGURACAO', _params_webhook_configuracao),
+    ('webhook_invites', 'MAKE_WEBHOOK_PI_INVITES', _params_webhook_invites),
+)
+
+
+def _disparar_webhook_producao(etapa: str, env_var: str, params: dict) -> bool:
+    """Dispara o webhook da etapa; False (sem disparo) quando a variável não está configurada.
+
+    4xx (exceto 408/429) levanta PiMakeWebhookError: o Make recusou a chamada e repetir
+    não resolve. Rede, 408/429 e 5xx levantam PiMakeWebhookTransitorio.
+    """
+    url = os.getenv(env_var)
+    if not url:
+        logger.warning('Webhook %s não configurado (%s); etapa ignorada', etapa, env_var)
+        return False
+    nome = env_var.replace('MAKE_WEBHOOK_', '')
+    try:
+        resp = requests.get(url, params=params, timeout=30)
+    except requests.RequestException as exc:
+        logger.error('Erro webhook %s: %s', env_var, exc)
+        raise PiMakeWebhookTransitorio(f'Erro webhook {nome}: {exc}') from exc
+    if 400 <= resp.status_code < 500 and resp.status_code not in (408, 429):
+        logger.error('Webhook %s recusado: HTTP %s %s', env_var, resp.status_code, resp.text[:500])
+        raise PiMakeWebhookError(f'Webhook {nome} recusado (HTTP {resp.status_code})')
+    if resp.status_code >= 400:
+        logger.error('Erro webhook %s: HTTP %s', env_var, resp.status_code)
+        raise PiMakeWebhookTransitorio(f'Erro webhook {nome}: HTTP {resp.status_code}')
+    return True
 
 
 def disparar_webhooks_producao_pi(pi: dict, *, strict: bool = False) -> list[str]:
@@ -209,96 +285,211 @@ def disparar_webhooks_producao_pi(pi: dict, *, strict: bool = False) -> list[str
     if not id_pi:
         raise PiMakeWebhookError('PI sem id_pi')
 
-    numero = pi.get('codigo_pi_cc') or ''
     is_dev = _is_dev()
-    dt_inicio = _parse_periodo_inicio(pi)
-    periodo_inicio = pi.get('periodo_inicio')
-    tem_agencia = bool(pi.get('id_agencia'))
     webhook_erros: list[str] = []
 
     _atualizar_status_pi_producao(id_pi)
 
-    pi_atual = db.obter_cadu_pi_por_id(id_pi)
-    if pi_atual:
-        pi = pi_atual
-
-    url_config = os.getenv('MAKE_WEBHOOK_PI_CONFIGURACAO')
-    if url_config:
-        params_config = {
-            'testeparam': 'yes' if is_dev else 'no',
-            'codPI': numero,
-            'razaosccliente': pi.get('cliente_razao_social') or '',
-            'nomefcliente': pi.get('cliente_nome') or '',
-            'razaoscagencia': pi.get('agencia_razao_social') or '',
-            'nomefagencia': pi.get('agencia_nome') or '',
-            'pastagoogleprinc': pi.get('googled_pi_princ') or '',
-            'valorliquidopi': valor_liquido_pi_webhook(pi),
-            'emailresponsavelpi': pi.get('resp_comercial_email') or '',
-            'mesref': _fmt_data_curta(pi.get('mes_ref')),
-            'datainicio': _fmt_data_curta(pi.get('periodo_inicio')),
-            'datafim': _fmt_data_curta(pi.get('periodo_fim')),
-            'pastagooglepecas': pi.get('googled_pi_pecas') or '',
-            'instrucoesoperacao': (pi.get('observacoes_operacao') or '').strip() or 'Sem instruções',
-            'instrucoesfinanceiro': (pi.get('observacoes_financeiro') or '').strip() or 'Sem instruções',
-            'nomerespPI': pi.get('resp_comercial_nome') or '',
-            'titulo': pi.get('titulo_pi') or '',
-            'pi_tem_agencia': 'sim' if tem_agencia else 'não',
-        }
-        try:
-            resp = requests.get(url_config, params=params_config, timeout=30)
-            resp.raise_for_status()
-        except Exception as exc:
-            logger.error('Erro webhook PI_CONFIGURACAO: %s', exc)
+    for etapa, env_var, montar_params in WEBHOOKS_PRODUCAO:
+        if not os.getenv(env_var):
             if strict:
-                raise PiMakeWebhookError(f'Erro webhook PI_CONFIGURACAO: {exc}') from exc
-            webhook_erros.append(str(exc))
-    elif strict:
-        raise PiMakeWebhookError('Webhook não configurado (MAKE_WEBHOOK_PI_CONFIGURACAO)')
-
-    url_invites = os.getenv('MAKE_WEBHOOK_PI_INVITES')
-    if url_invites:
-        params_invites = {
-            'testeparam': 'yes' if is_dev else 'no',
-            'dteveinicio': _fmt_data_invite(periodo_inicio),
-            'nomerespcc': pi.get('resp_comercial_nome') or '',
-            'emailrespcc': pi.get('resp_comercial_email') or '',
-            'codPI': numero,
-            'dteven5dias': _fmt_data_invite(dt_inicio + timedelta(days=5)) if dt_inicio else '',
-            'tituloPI': pi.get('titulo_pi') or '',
-            'dtevenfim': _fmt_data_invite(pi.get('periodo_fim')),
-        }
+                raise PiMakeWebhookError(f'Webhook não configurado ({env_var})')
+            continue
         try:
-            resp = requests.get(url_invites, params=params_invites, timeout=30)
-            resp.raise_for_status()
-        except Exception as exc:
-            logger.error('Erro webhook PI_INVITES: %s', exc)
+            _disparar_webhook_producao(etapa, env_var, montar_params(pi, is_dev))
+        except PiMakeWebhookError as exc:
             if strict:
-                raise PiMakeWebhookError(f'Erro webhook PI_INVITES: {exc}') from exc
+                raise
             webhook_erros.append(str(exc))
-    elif strict:
-        raise PiMakeWebhookError('Webhook não configurado (MAKE_WEBHOOK_PI_INVITES)')
 
     return webhook_erros
 
 
 def executar_fluxo_producao_completo(id_pi: int) -> None:
     """
-    Fluxo completo: pastas Drive (se necessário) + webhooks de produção.
-    Levanta PiMakeWebhookError em qualquer falha (uso na aprovação cotação teste).
+    Fluxo completo síncrono: pastas Drive (se necessário) + webhooks de produção.
+    Levanta PiMakeWebhookError em qualquer falha. As rotas usam enfileirar_fluxo_producao.
+    """
+    executar_fluxo_producao(id_pi, gerar_pastas=True)
+
+
+# ==================== FLUXO DE PRODUÇÃO EM SEGUNDO PLANO ====================
+#
+# cadu_pi_fluxo_producao guarda o estado de cada etapa (pastas, status_pi e cada webhook)
+# com o horário em que foi concluída. O job 'pi.fluxo_producao' retoma do ponto em que
+# parou: etapas já concluídas não são repetidas nas retentativas (webhooks não duplicam).
+
+FLUXO_PENDENTE = 'pendente'
+FLUXO_EXECUTANDO = 'executando'
+FLUXO_CONCLUIDO = 'concluido'
+FLUXO_ERRO = 'erro'  # falhou, mas ainda será retentado
+FLUXO_FALHOU = 'falhou'  # esgotou as tentativas (dead-letter)
+
+
+def _registrar_fluxo(id_pi: int, status: str, *, etapa: str | None = None, erro: str | None = None,
+                     job_id: int | None = None, reiniciar_etapas: list[str] | None = None, conn=None) -> None:
+    """Grava status/erro do fluxo e, se informada, a conclusão de `etapa` (não confirma)."""
+    conn = conn or db.get_db()
+    with conn.cursor() as cursor:
+        cursor.execute(
+            '''
+            INSERT INTO cadu_pi_fluxo_producao (id_pi, status, job_id, ultimo_erro, etapas)
+            VALUES (%s, %s, %s, %s,
+                    CASE WHEN %s::text IS NULL THEN '{}'::jsonb
+                         ELSE jsonb_build_object(%s::text, to_char(NOW(), 'YYYY-MM-DD"T"HH24:MI:SS')) END)
+            ON CONFLICT (id_pi) DO UPDATE
+               SET status = EXCLUDED.status,
+                   job_id = COALESCE(EXCLUDED.job_id, cadu_pi_fluxo_producao.job_id),
+                   ultimo_erro = EXCLUDED.ultimo_erro,
+                   etapas = (cadu_pi_fluxo_producao.etapas - %s::text[]) || EXCLUDED.etapas,
+                   updated_at = NOW()
+            ''',
+            (id_pi, status, job_id, erro, etapa, etapa, reiniciar_etapas or []),
+        )
+
+
+def obter_fluxo_producao(id_pi: int) -> dict | None:
+    conn = db.get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT * FROM cadu_pi_fluxo_producao WHERE id_pi = %s', (id_pi,))
+        return cursor.fetchone()
+
+
+def listar_fluxos_producao(status: str | None = None, limit: int = 100) -> list[dict]:
+    """Fluxos por status (status='falhou' = dead-letter), com o código do PI."""
+    conn = db.get_db()
+    with conn.cursor() as cursor:
+        cursor.execute(
+            '''
+            SELECT f.*, p.codigo_pi_cc
+              FROM cadu_pi_fluxo_producao f
+              LEFT JOIN cadu_pi p ON p.id_pi = f.id_pi
+             WHERE (%s::text IS NULL OR f.status = %s)
+             ORDER BY f.updated_at DESC
+             LIMIT %s
+            ''',
+            (status, status, limit),
+        )
+        return cursor.fetchall()
+
+
+def enfileirar_fluxo_producao(id_pi: int, *, gerar_pastas: bool = True, atualizar_status_agora: bool = False,
+                              created_by: int | None = None) -> int:
+    """Agenda o fluxo de produção do PI no worker e devolve o id do job.
+
+    Se já houver um fluxo pendente/em execução para o PI, devolve o job existente.
+    Um novo envio (fluxo anterior concluído ou falho) dispara os webhooks outra vez.
+    atualizar_status_agora: muda o status do PI na própria request (botão Enviar para
+    produção, cuja tela redireciona para a lista filtrada pelo novo sub-status).
+    """
+    conn = db.get_db()
+    with conn.cursor() as cursor:
+        # No primeiro envio a linha ainda não existe e o FOR UPDATE não travaria nada:
+        # cria a linha antes, para que envios concorrentes esperem pelo mesmo lock
+        cursor.execute(
+            'INSERT INTO cadu_pi_fluxo_producao (id_pi, status) VALUES (%s, %s) '
+            'ON CONFLICT (id_pi) DO NOTHING',
+            (id_pi, FLUXO_PENDENTE),
+        )
+        cursor.execute(
+            'SELECT status, job_id FROM cadu_pi_fluxo_producao WHERE id_pi = %s FOR UPDATE',
+            (id_pi,),
+        )
+        atual = cursor.fetchone()
+        if atual['status'] in (FLUXO_PENDENTE, FLUXO_EXECUTANDO, FLUXO_ERRO) and atual['job_id']:
+            conn.commit()
+            return atual['job_id']
+        cursor.execute(
+            'UPDATE cadu_pi_fluxo_producao SET geracao = geracao + 1 WHERE id_pi = %s RETURNING geracao',
+            (id_pi,),
+        )
+        geracao = cursor.fetchone()['geracao']
+
+    if atualizar_status_agora:
+        _atualizar_status_pi_producao(id_pi)
+
+    reiniciar = ['status_pi'] + [etapa for etapa, _, _ in WEBHOOKS_PRODUCAO]
+    _registrar_fluxo(id_pi, FLUXO_PENDENTE, reiniciar_etapas=reiniciar,
+                     etapa='status_pi' if atualizar_status_agora else None, conn=conn)
+    job_id = enfileirar_job(
+        'pi.fluxo_producao',
+        {'id_pi': id_pi, 'gerar_pastas': bool(gerar_pastas)},
+        idempotency_key=f'pi:fluxo:{id_pi}:{geracao}',
+        created_by=created_by,
+        conn=conn,
+    )
+    _registrar_fluxo(id_pi, FLUXO_PENDENTE, job_id=job_id, conn=conn)
+    conn.commit()
+    if JOBS_INLINE:
+        executar_job_por_id(job_id)
+    return job_id
+
+
+def executar_fluxo_producao(id_pi: int, *, gerar_pastas: bool = True) -> dict:
+    """Executa as etapas pendentes do fluxo, gravando cada uma ao concluir.
+
+    Lê o PI uma única vez; os links das pastas recém-criadas entram no mesmo dict.
     """
     pi = db.obter_cadu_pi_por_id(id_pi)
     if not pi:
         raise PiMakeWebhookError('PI não encontrado')
-
     if not pi.get('id_cliente'):
         raise PiMakeWebhookError('PI sem cliente vinculado')
     if not pi.get('codigo_pi_cc'):
         raise PiMakeWebhookError('PI sem código (codigo_pi_cc)')
 
+    fluxo = obter_fluxo_producao(id_pi) or {}
+    etapas = dict(fluxo.get('etapas') or {})
+    conn = db.get_db()
+
     if not pi.get('googled_pi_princ'):
-        gerar_pastas_drive_pi(pi, strict=True)
-        pi = db.obter_cadu_pi_por_id(id_pi)
-        if not pi or not pi.get('googled_pi_princ'):
-            raise PiMakeWebhookError('Pastas do Google Drive não foram persistidas')
+        if not gerar_pastas:
+            raise PiMakeWebhookError('Gere as pastas do Google Drive antes de enviar')
+        pi.update(gerar_pastas_drive_pi(pi, strict=True))
+    if 'pastas' not in etapas:
+        _registrar_fluxo(id_pi, FLUXO_EXECUTANDO, etapa='pastas', conn=conn)
+        conn.commit()
+        etapas['pastas'] = True
+
+    if 'status_pi' not in etapas:
+        _atualizar_status_pi_producao(id_pi)
+        _registrar_fluxo(id_pi, FLUXO_EXECUTANDO, etapa='status_pi', conn=conn)
+        conn.commit()
+        etapas['status_pi'] = True
 
-    disparar_webhooks_producao_pi(pi, strict=True)
+    is_dev = _is_dev()
+    for etapa, env_var, montar_params in WEBHOOKS_PRODUCAO:
+        if etapa in etapas:
+            continue
+        # Sem URL configurada a etapa fica de fora (como no envio legado) e não é
+        # registrada: uma nova execução dispara depois que a variável for definida
+        if not _disparar_webhook_producao(etapa, env_var, montar_params(pi, is_dev)):
+            continue
+        _registrar_fluxo(id_pi, FLUXO_EXECUTANDO, etapa=etapa, conn=conn)
+        conn.commit()
+        etapas[etapa] = True
+
+    return etapas
+
+
+@job_handler('pi.fluxo_producao', max_tentativas=8, backoff_segundos=60, timeout_segundos=600)
+def _job_fluxo_producao(ctx):
+    id_pi = ctx.payload['id_pi']
+    conn = db.get_db()
+    _registrar_fluxo(id_pi, FLUXO_EXECUTANDO, conn=conn)
+    conn.commit()
+    try:
+        etapas = executar_fluxo_producao(id_pi, gerar_pastas=ctx.payload.get('gerar_pastas', True))
+    except Exception as exc:
+        conn.rollback()
+        # Cadastro incompleto / webhook recusado (4xx) não se resolve sozinho
+        permanente = isinstance(exc, PiMakeWebhookError) and not isinstance(exc, PiMakeWebhookTransitorio)
+        status = FLUXO_FALHOU if permanente or ctx.ultima_tentativa else FLUXO_ERRO
+        _registrar_fluxo(id_pi, status, erro=str(exc)[:2000], conn=conn)
+        conn.commit()
+        if permanente:
+            raise JobErroPermanente(str(exc)) from exc
+        raise
+    _registrar_fluxo(id_pi, FLUXO_CONCLUIDO, conn=conn)
+    conn.commit()
+    return {'id_pi': id_pi, 'etapas': sorted(etapas)}
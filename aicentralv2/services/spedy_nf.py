@@ -0,0 +1,183 @@
+"""
+=====================================================
+SPEDY NF
+Conclusão em segundo plano das NFS-e emitidas na Spedy
+=====================================================
+
+A emissão (/api/cadu_pi/<id>/spedy/emitir-teste) só envia o pedido e grava a nota
+com o id da NFS-e; a resposta volta na hora. A conclusão chega por dois caminhos,
+ambos gravando em cadu_pi_nota_fiscal via map_spedy_invoice_to_nf_update:
+
+- webhook da Spedy (POST /api/spedy/webhook) com a NFS-e atualizada;
+- job 'spedy.concluir_notas': uma varredura da listagem da Spedy resolve todas as
+  notas pendentes de uma vez. Depois de cada emissão roda a cada poucos segundos
+  enquanto houver nota recente pendente, e de 5 em 5 minutos para as demais.
+
+A UI consulta apenas o banco (estado_spedy_nota_fiscal).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from aicentralv2 import db
+from aicentralv2.services.jobs import JOBS_INLINE, enfileirar_job, job_handler
+from aicentralv2.services.spedy_service import (
+    SPEDY_PENDING_STATUSES,
+    SPEDY_TERMINAL_STATUSES,
+    SpedyService,
+    map_spedy_invoice_to_nf_update,
+)
+
+logger = logging.getLogger(__name__)
+
+# 'creating' = pedido ainda sem NFS-e; '' = nota gravada antes da primeira resposta
+STATUS_NF_PENDENTES = frozenset(SPEDY_PENDING_STATUSES | {'', 'creating'})
+
+SPEDY_CONCLUIR_INTERVALO_SEGUNDOS = int(os.getenv('SPEDY_CONCLUIR_INTERVALO_SEGUNDOS', '5'))
+# Notas pendentes há mais tempo que isso ficam só com a varredura periódica
+SPEDY_CONCLUIR_JANELA_RAPIDA_MINUTOS = int(os.getenv('SPEDY_CONCLUIR_JANELA_RAPIDA_MINUTOS', '10'))
+SPEDY_CONCLUIR_MAX_PAGINAS = int(os.getenv('SPEDY_CONCLUIR_MAX_PAGINAS', '5'))
+
+
+def spedy_status_pendente(status: Optional[str]) -> bool:
+    return (status or '').lower() in STATUS_NF_PENDENTES
+
+
+def _usuario_solicitante(id_nota: int) -> Optional[int]:
+    """Quem pediu a emissão (auditoria 'solicitar'); o log de auditoria exige usuário."""
+    conn = db.get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            SELECT fk_id_usuario FROM tbl_admin_audit_log
+            WHERE registro_tipo = 'nota_fiscal' AND registro_id = %s AND acao = 'solicitar'
+            ORDER BY id_log DESC LIMIT 1
+        ''', (id_nota,))
+        row = cursor.fetchone()
+    return row['fk_id_usuario'] if row else None
+
+
+def aplicar_invoice_spedy(nota: Dict[str, Any], invoice: Dict[str, Any], *,
+                          atualizar_pi: bool = True) -> str:
+    """Grava o estado da NFS-e na nota; na autorização marca o PI como NF Emitida.
+
+    Retorna o status Spedy (minúsculo). Idempotente: autorização repetida (webhook +
+    varredura) não gera nova auditoria.
+    """
+    ja_autorizada = (nota.get('spedy_status') or '').lower() == 'authorized'
+    update = map_spedy_invoice_to_nf_update(invoice)
+    status = (update.get('spedy_status') or invoice.get('status') or '').lower()
+
+    # Sem mudança de status/mensagem não regrava: updated_at marca a última mudança real
+    inalterada = (
+        spedy_status_pendente(status)
+        and (nota.get('spedy_status') or '').lower() == status
+        and nota.get('spedy_message') == update.get('spedy_message')
+    )
+    if update and not inalterada:
+        db.atualizar_nota_fiscal(nota['id'], update)
+
+    if status != 'authorized' or ja_autorizada or not atualizar_pi or not nota.get('id_pi'):
+        return status
+
+    try:
+        db.atualizar_pi_status_nf_emitida(nota['id_pi'])
+    except Exception as e:
+        logger.error(f"Erro ao atualizar status do PI {nota['id_pi']} após NFS-e Spedy: {e}", exc_info=True)
+
+    usuario_id = _usuario_solicitante(nota['id'])
+    if usuario_id:
+        db.registrar_audit_log(
+            fk_id_usuario=usuario_id,
+            acao='emitir',
+            modulo='faturamento',
+            descricao=f'NFS-e Spedy autorizada - PI {nota.get("id_pi")} NF {update.get("numero_nota")}',
+            registro_id=nota['id'],
+            registro_tipo='nota_fiscal',
+            dados_novos={
+                'spedy_invoice_id': nota.get('spedy_invoice_id'),
+                'numero_nota': update.get('numero_nota'),
+                'spedy_status': status,
+            },
+        )
+    return status
+
+
+def estado_spedy_nota_fiscal(nota: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Situação da emissão a partir do banco (sem chamar a Spedy)."""
+    nota = nota or {}
+    status = (nota.get('spedy_status') or '').lower()
+    confirmed = status == 'authorized'
+    return {
+        'confirmed': confirmed,
+        'pending': not confirmed and spedy_status_pendente(status) and bool(nota.get('spedy_invoice_id')),
+        'failed': status == 'error' or (status in SPEDY_TERMINAL_STATUSES and not confirmed),
+        'spedy_status': status,
+        'spedy_message': nota.get('spedy_message'),
+        'numero_nota': nota.get('numero_nota'),
+    }
+
+
+# ==================== CONCLUSÃO (POLLER) ====================
+
+def agendar_conclusao_spedy(atraso_segundos: float = SPEDY_CONCLUIR_INTERVALO_SEGUNDOS, *, conn=None) -> int:
+    """Agenda uma varredura. Gatilhos na mesma janela de tempo viram um único job."""
+    alvo = time.time() + atraso_segundos
+    janela = int(alvo // max(1, SPEDY_CONCLUIR_INTERVALO_SEGUNDOS))
+    return enfileirar_job(
+        'spedy.concluir_notas',
+        idempotency_key=f'spedy:concluir:{janela}',
+        atraso_segundos=atraso_segundos,
+        conn=conn,
+    )
+
+
+def concluir_notas_spedy_pendentes(limite: int = 200) -> Dict[str, int]:
+    """Uma varredura: consulta na Spedy todas as notas pendentes e grava o resultado."""
+    notas = db.listar_notas_fiscais_spedy_pendentes(
+        STATUS_NF_PENDENTES,
+        recente_minutos=SPEDY_CONCLUIR_JANELA_RAPIDA_MINUTOS,
+        limite=limite,
+    )
+    totais = {'pendentes': len(notas), 'autorizadas': 0, 'falhas': 0, 'sem_retorno': 0, 'recentes': 0}
+    if not notas:
+        return totais
+
+    invoices = SpedyService().get_service_invoices(
+        [n['spedy_invoice_id'] for n in notas],
+        max_pages=SPEDY_CONCLUIR_MAX_PAGINAS,
+    )
+    for resumo in notas:
+        invoice = invoices.get(str(resumo['spedy_invoice_id']))
+        status = None
+        if invoice is None:
+            totais['sem_retorno'] += 1
+        else:
+            nota = db.obter_nota_fiscal_por_id(resumo['id'])
+            status = aplicar_invoice_spedy(nota, invoice)
+            if status == 'authorized':
+                totais['autorizadas'] += 1
+            elif status in SPEDY_TERMINAL_STATUSES:
+                totais['falhas'] += 1
+        if (status is None or spedy_status_pendente(status)) and resumo['recente']:
+            totais['recentes'] += 1
+    return totais
+
+
+@job_handler('spedy.concluir_notas', max_tentativas=3, backoff_segundos=15, timeout_segundos=300,
+             intervalo_segundos=300)
+def _job_concluir_notas(ctx):
+    """Varre as NFS-e pendentes; reagenda em poucos segundos enquanto houver emissão recente."""
+    totais = concluir_notas_spedy_pendentes()
+    # Em modo inline o reagendamento executaria na hora, em recursão
+    if totais['recentes'] and not JOBS_INLINE:
+        agendar_conclusao_spedy()
+    if totais['pendentes']:
+        logger.info(
+            f"Spedy: {totais['pendentes']} nota(s) pendente(s), {totais['autorizadas']} autorizada(s), "
+            f"{totais['falhas']} rejeitada(s), {totais['sem_retorno']} sem retorno"
+        )
+    return totais
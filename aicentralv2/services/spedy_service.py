@@ -6,7 +6,6 @@ from __future__ import annotations
 
 import logging
 import re
-import time
 import uuid
 from datetime import datetime, timezone
 from typing import Any, Dict, Optional
@@ -22,7 +21,7 @@ SPEDY_TERMINAL_STATUSES = frozenset({
     'authorized', 'rejected', 'canceled', 'denied', 'removed', 'disabled',
 })
 SPEDY_PENDING_STATUSES = frozenset({
-    'created', 'enqueued', 'received', 'processing', 'inContingent',
+    'created', 'enqueued', 'received', 'processing', 'incontingent',
 })
 
 _CITY_IBGE: Dict[str, tuple[str, str]] = {
@@ -149,18 +148,47 @@ class SpedyService:
         response = self._request('GET', '/companies', timeout=20)
         return response.json()
 
-    def get_service_invoice(self, invoice_id: str) -> Dict[str, Any]:
+    def list_service_invoices(self, *, page: int = 1, page_size: int = 50) -> Dict[str, Any]:
         response = self._request(
             'GET',
             '/service-invoices',
-            params={'page': 1, 'pageSize': 50},
+            params={'page': page, 'pageSize': page_size},
             timeout=30,
         )
-        data = response.json()
-        for item in data.get('items') or []:
-            if str(item.get('id')) == str(invoice_id):
-                return item
-        raise SpedyAPIError(f'NFS-e Spedy não encontrada: {invoice_id}')
+        return response.json()
+
+    def get_service_invoices(
+        self,
+        invoice_ids,
+        *,
+        page_size: int = 100,
+        max_pages: int = 5,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Busca várias NFS-e numa varredura da listagem (mais recentes primeiro).
+
+        Para de paginar quando todas foram encontradas; ids ausentes não entram no retorno.
+        """
+        faltando = {str(i) for i in invoice_ids if i}
+        encontradas: Dict[str, Dict[str, Any]] = {}
+        for page in range(1, max_pages + 1):
+            if not faltando:
+                break
+            data = self.list_service_invoices(page=page, page_size=page_size)
+            items = data.get('items') or []
+            for item in items:
+                item_id = str(item.get('id'))
+                if item_id in faltando:
+                    encontradas[item_id] = item
+                    faltando.discard(item_id)
+            if len(items) < page_size:
+                break
+        return encontradas
+
+    def get_service_invoice(self, invoice_id: str) -> Dict[str, Any]:
+        item = self.get_service_invoices([invoice_id], page_size=50, max_pages=1).get(str(invoice_id))
+        if item is None:
+            raise SpedyAPIError(f'NFS-e Spedy não encontrada: {invoice_id}')
+        return item
 
     def emit_order(
         self,
@@ -202,22 +230,6 @@ class SpedyService:
         response = self._request('POST', '/orders', json=payload, timeout=self.timeout)
         return response.json()
 
-    def wait_service_invoice(
-        self,
-        invoice_id: str,
-        *,
-        max_attempts: int = 15,
-        interval_seconds: float = 2.0,
-    ) -> Dict[str, Any]:
-        last: Dict[str, Any] = {}
-        for _ in range(max_attempts):
-            last = self.get_service_invoice(invoice_id)
-            status = (last.get('status') or '').lower()
-            if status in SPEDY_TERMINAL_STATUSES:
-                return last
-            time.sleep(interval_seconds)
-        return last
-
 
 def _only_digits(value: str | None, *, max_len: int | None = None) -> str:
     digits = re.sub(r'\D', '', value or '')
@@ -0,0 +1,352 @@
+"""
+=====================================================
+WASENDER INBOX
+Webhook Wasender com confirmação imediata e processamento pelo worker
+=====================================================
+
+O webhook (crm/routes.api_wasender_webhook) valida o secret, grava o evento bruto em
+wasender_webhook_inbox e responde 200; o resto (localizar contato pelo telefone,
+conversa, mensagem, status do provedor, não lidas) roda no job 'wasender.processar_inbox':
+
+- dedup: mensagem recebida com o mesmo provider_message_id entra uma vez só
+  (índice único); reentregas do provedor viram 'duplicado' no próprio INSERT;
+- ordem: eventos do mesmo remetente (chave_ordem) são processados na ordem de
+  chegada; um remetente com evento em andamento ou aguardando retentativa fica
+  fora do lote até ele terminar;
+- lotes: cada reivindicação pega até WASENDER_INBOX_LOTE eventos, com cache de
+  contato/credencial/conversa por lote;
+- falha: backoff até WASENDER_INBOX_MAX_TENTATIVAS, depois 'falhou'.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from psycopg.types.json import Json
+
+from aicentralv2 import db
+from aicentralv2.services.jobs import JOBS_INLINE, enfileirar_job, executar_job_por_id, job_handler
+
+logger = logging.getLogger(__name__)
+
+INBOX_PENDENTE = 'pendente'
+INBOX_PROCESSANDO = 'processando'
+INBOX_PROCESSADO = 'processado'
+INBOX_FALHOU = 'falhou'
+
+EVENTOS_MENSAGEM = ('messages.received', 'messages.upsert')
+EVENTOS_STATUS = ('messages.update', 'message.status', 'messages.status')
+
+WASENDER_INBOX_LOTE = int(os.getenv('WASENDER_INBOX_LOTE', '100'))
+WASENDER_INBOX_MAX_TENTATIVAS = int(os.getenv('WASENDER_INBOX_MAX_TENTATIVAS', '5'))
+WASENDER_INBOX_RETENCAO_DIAS = int(os.getenv('WASENDER_INBOX_RETENCAO_DIAS', '30'))
+_BACKOFF_BASE_SEGUNDOS = 15
+_PROCESSANDO_TIMEOUT_SEGUNDOS = 600
+_JANELA_GATILHO_SEGUNDOS = 2
+# Serializa as reivindicações: sem isso dois workers poderiam pegar eventos
+# do mesmo remetente ao mesmo tempo e inverter a ordem
+_LOCK_REIVINDICACAO = 'wasender_webhook_inbox'
+
+
+# ==================== PAYLOAD ====================
+
+def wasender_message_from_payload(payload):
+    data = payload.get('data') if isinstance(payload, dict) else {}
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if isinstance(messages, list):
+        return messages[0] if messages else None
+    if isinstance(messages, dict):
+        return messages
+    return None
+
+
+def wasender_message_id(payload, message_data=None):
+    message_data = message_data or wasender_message_from_payload(payload) or {}
+    key = message_data.get('key') if isinstance(message_data, dict) else {}
+    for source in (key, message_data, payload.get('data') if isinstance(payload, dict) else {}, payload):
+        if isinstance(source, dict):
+            for k in ('id', 'message_id', 'messageId', 'msgId'):
+                if source.get(k):
+                    return str(source[k])
+    return None
+
+
+def wasender_provider_status(payload):
+    for source in (payload.get('data') if isinstance(payload, dict) else {}, payload):
+        if isinstance(source, dict):
+            for k in ('status', 'message_status', 'messageStatus'):
+                if source.get(k):
+                    return str(source[k])
+    return payload.get('event') if isinstance(payload, dict) else None
+
+
+def wasender_remetente(message_data) -> str:
+    key = (message_data or {}).get('key') or {}
+    sender = key.get('cleanedSenderPn') or key.get('cleanedParticipantPn') or ''
+    if not sender:
+        remote = key.get('remoteJid') or ''
+        if isinstance(remote, str) and '@' in remote:
+            sender = remote.split('@')[0]
+        elif remote:
+            sender = remote
+    return str(sender or '')
+
+
+# ==================== RECEBIMENTO ====================
+
+def registrar_evento_wasender(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Grava o evento bruto na inbox e agenda o processamento (chamado pelo webhook).
+
+    Retorna {'id', 'duplicado'} ou {'ignorado': motivo} para eventos não tratados.
+    """
+    evento = (payload.get('event') or '').strip()
+    if evento and evento not in EVENTOS_MENSAGEM + EVENTOS_STATUS:
+        return {'ignorado': 'event_not_handled'}
+
+    message_data = wasender_message_from_payload(payload)
+    provider_message_id = wasender_message_id(payload, message_data)
+    tipo = 'status' if evento in EVENTOS_STATUS or not message_data else 'mensagem'
+    if tipo == 'status' and not provider_message_id:
+        return {'ignorado': 'no_message'}
+    chave = db.normalizar_telefone_whatsapp(wasender_remetente(message_data))[:64]
+
+    conn = db.get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO wasender_webhook_inbox (evento, tipo, provider_message_id, chave_ordem, payload)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (provider_message_id) WHERE tipo = 'mensagem' AND provider_message_id IS NOT NULL
+            DO NOTHING
+            RETURNING id
+        ''', (evento or None, tipo, provider_message_id, chave, Json(payload)))
+        row = cursor.fetchone()
+    if row is None:
+        conn.commit()
+        return {'id': None, 'duplicado': True}
+
+    janela = int(time.time() // _JANELA_GATILHO_SEGUNDOS)
+    job_id = enfileirar_job('wasender.processar_inbox', idempotency_key=f'wasender:inbox:{janela}', conn=conn)
+    conn.commit()
+    if JOBS_INLINE:
+        executar_job_por_id(job_id)
+    return {'id': row['id'], 'duplicado': False}
+
+
+# ==================== PROCESSAMENTO ====================
+
+def _reivindicar_lote(conn, limite: int) -> List[Dict[str, Any]]:
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (_LOCK_REIVINDICACAO,))
+        cursor.execute('''
+            UPDATE wasender_webhook_inbox
+               SET status = %s, updated_at = NOW()
+             WHERE status = %s AND updated_at < NOW() - make_interval(secs => %s)
+        ''', (INBOX_PENDENTE, INBOX_PROCESSANDO, _PROCESSANDO_TIMEOUT_SEGUNDOS))
+        cursor.execute('''
+            WITH bloqueadas AS (
+                SELECT DISTINCT chave_ordem FROM wasender_webhook_inbox
+                 WHERE status = %(processando)s
+                    OR (status = %(pendente)s AND proxima_tentativa_em > NOW())
+            )
+            UPDATE wasender_webhook_inbox
+               SET status = %(processando)s, tentativas = tentativas + 1, updated_at = NOW()
+             WHERE id IN (
+                    SELECT id FROM wasender_webhook_inbox
+                     WHERE status = %(pendente)s
+                       AND chave_ordem NOT IN (SELECT chave_ordem FROM bloqueadas)
+                     ORDER BY id
+                     LIMIT %(limite)s
+             )
+            RETURNING *
+        ''', {'processando': INBOX_PROCESSANDO, 'pendente': INBOX_PENDENTE, 'limite': limite})
+        linhas = cursor.fetchall()
+    conn.commit()
+    return sorted(linhas, key=lambda r: r['id'])
+
+
+def _finalizar(conn, linha: Dict[str, Any], resultado: Dict[str, Any]) -> None:
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE wasender_webhook_inbox
+               SET status = %s, resultado = %s, ultimo_erro = NULL,
+                   processado_em = NOW(), updated_at = NOW()
+             WHERE id = %s
+        ''', (INBOX_PROCESSADO, Json(resultado), linha['id']))
+    conn.commit()
+
+
+def _marcar_falha(conn, linha: Dict[str, Any], erro: str) -> None:
+    definitivo = linha['tentativas'] >= WASENDER_INBOX_MAX_TENTATIVAS
+    espera = _BACKOFF_BASE_SEGUNDOS * (2 ** (linha['tentativas'] - 1))
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE wasender_webhook_inbox
+               SET status = %s, ultimo_erro = %s,
+                   proxima_tentativa_em = NOW() + make_interval(secs => %s), updated_at = NOW()
+             WHERE id = %s
+        ''', (INBOX_FALHOU if definitivo else INBOX_PENDENTE, (erro or '')[:4000],
+              0.0 if definitivo else float(espera), linha['id']))
+    conn.commit()
+
+
+class _CacheLote:
+    """Consultas repetidas dentro de um lote (mesmo remetente em várias mensagens)."""
+
+    def __init__(self):
+        self.contatos: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.credenciais: Dict[int, Optional[Dict[str, Any]]] = {}
+        self.conversas: Dict[tuple, int] = {}
+
+    def contato(self, sender: str):
+        if sender not in self.contatos:
+            self.contatos[sender] = db.localizar_contato_por_telefone_wasender(sender)
+        return self.contatos[sender]
+
+    def credencial(self, responsavel_id: Optional[int]):
+        if not responsavel_id:
+            return None
+        if responsavel_id not in self.credenciais:
+            self.credenciais[responsavel_id] = db.obter_wasender_credencial_responsavel(responsavel_id)
+        return self.credenciais[responsavel_id]
+
+
+def processar_evento_wasender(payload: Dict[str, Any], cache: Optional[_CacheLote] = None) -> Dict[str, Any]:
+    """Aplica um evento do webhook (mesmas regras de antes da inbox)."""
+    cache = cache or _CacheLote()
+    evento = (payload.get('event') or '').strip()
+    message_data = wasender_message_from_payload(payload)
+    provider_message_id = wasender_message_id(payload, message_data)
+
+    if evento in EVENTOS_STATUS or not message_data:
+        if not provider_message_id:
+            return {'ignored': True, 'reason': 'no_message'}
+        updated = db.atualizar_sales_comunicacao_mensagem_provider(
+            provider_message_id=provider_message_id,
+            provider_status=wasender_provider_status(payload),
+            provider_payload=payload,
+        )
+        return {'updated': updated}
+
+    key = message_data.get('key') or {}
+    if key.get('fromMe') is True:
+        return {'ignored': True, 'reason': 'from_me'}
+
+    sender = wasender_remetente(message_data)
+    texto = (message_data.get('messageBody') or '').strip()
+    if not texto:
+        raw_msg = message_data.get('message') or {}
+        texto = (raw_msg.get('conversation') or '').strip() if isinstance(raw_msg, dict) else ''
+    if not sender or not texto:
+        return {'ignored': True, 'reason': 'missing_sender_or_text'}
+
+    if provider_message_id:
+        ja_existia = db.atualizar_sales_comunicacao_mensagem_provider(
+            provider_message_id=provider_message_id,
+            provider_status='received',
+            provider_payload=payload,
+        )
+        if ja_existia:
+            return {'duplicate': True}
+
+    contato = cache.contato(sender)
+    if not contato or not contato.get('pk_id_tbl_cliente'):
+        return {'ignored': True, 'reason': 'phone_not_registered'}
+
+    cliente_id = contato['pk_id_tbl_cliente']
+    responsavel_id = contato.get('vendas_central_comm')
+    telefone = db.normalizar_telefone_whatsapp(sender)
+    chave_conversa = (cliente_id, contato['id_contato_cliente'], telefone, responsavel_id)
+    conversa_id = cache.conversas.get(chave_conversa)
+    if conversa_id is None:
+        credencial = cache.credencial(responsavel_id)
+        conversa_id = db.criar_sales_comunicacao_conversa(
+            cliente_id,
+            contato_id=contato['id_contato_cliente'],
+            telefone=telefone,
+            canal='whatsapp',
+            created_by=None,
+            responsavel_id=responsavel_id,
+            telefone_remetente=credencial.get('telefone_normalizado') if credencial else None,
+            provider_session_id=credencial.get('wasender_session_id') if credencial else None,
+        )
+        cache.conversas[chave_conversa] = conversa_id
+
+    msg_id = db.criar_sales_comunicacao_mensagem(
+        conversa_id,
+        texto,
+        direcao='inbound',
+        status='recebido',
+        gerado_por_ia=False,
+        created_by=None,
+        provider='wasenderapi',
+        provider_message_id=provider_message_id,
+        provider_status='received',
+        provider_payload=payload,
+    )
+    logger.info(
+        'Wasender inbound salvo: conversa=%s msg=%s contato=%s cliente=%s',
+        conversa_id, msg_id, contato.get('id_contato_cliente'), cliente_id,
+    )
+    return {'id': msg_id, 'conversa_id': conversa_id}
+
+
+def processar_inbox_wasender(limite: int = WASENDER_INBOX_LOTE) -> Dict[str, int]:
+    """Reivindica um lote e processa cada evento na ordem de chegada."""
+    conn = db.get_db()
+    linhas = _reivindicar_lote(conn, limite)
+    totais = {'reivindicados': len(linhas), 'processados': 0, 'falhas': 0}
+    cache = _CacheLote()
+    falhou = set()
+    for linha in linhas:
+        if linha['chave_ordem'] in falhou:
+            # Evento posterior do mesmo remetente espera o anterior ser resolvido
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    UPDATE wasender_webhook_inbox
+                       SET status = %s, tentativas = tentativas - 1, updated_at = NOW()
+                     WHERE id = %s
+                ''', (INBOX_PENDENTE, linha['id']))
+            conn.commit()
+            continue
+        try:
+            resultado = processar_evento_wasender(linha['payload'], cache)
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Erro ao processar evento Wasender {linha['id']}: {e}", exc_info=True)
+            _marcar_falha(conn, linha, str(e))
+            falhou.add(linha['chave_ordem'])
+            totais['falhas'] += 1
+            continue
+        _finalizar(conn, linha, resultado)
+        totais['processados'] += 1
+    return totais
+
+
+def limpar_inbox_processada(dias: int = WASENDER_INBOX_RETENCAO_DIAS) -> int:
+    conn = db.get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            DELETE FROM wasender_webhook_inbox
+             WHERE status = %s AND processado_em < NOW() - make_interval(days => %s)
+        ''', (INBOX_PROCESSADO, dias))
+        removidos = cursor.rowcount
+    conn.commit()
+    return removidos
+
+
+@job_handler('wasender.processar_inbox', max_tentativas=1, fila='wasender', timeout_segundos=600,
+             intervalo_segundos=60)
+def _job_processar_inbox(ctx):
+    """Esvazia a inbox (também roda a cada minuto para retentativas e limpeza)."""
+    totais = {'reivindicados': 0, 'processados': 0, 'falhas': 0}
+    while True:
+        parcial = processar_inbox_wasender()
+        for chave in totais:
+            totais[chave] += parcial[chave]
+        if parcial['reivindicados'] < WASENDER_INBOX_LOTE:
+            break
+    totais['removidos'] = limpar_inbox_processada()
+    return totais
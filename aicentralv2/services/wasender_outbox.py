@@ -0,0 +1,323 @@
+"""
+=====================================================
+WASENDER OUTBOX
+Envio de WhatsApp em fila, por sessão Wasender, com limite de taxa
+=====================================================
+
+A rota do CRM grava a mensagem (status 'na_fila') e uma linha em wasender_outbox e
+responde na hora; o job 'wasender.enviar_fila' entrega:
+
+- partição por sessão (wasender_session_id do responsável): dentro da sessão as
+  mensagens saem em ordem, uma por vez;
+- token bucket por sessão em wasender_rate_limit (WASENDER_MSGS_POR_MINUTO, rajada
+  WASENDER_RAJADA), atômico no banco e compartilhado entre workers; sem token a
+  mensagem é reagendada para quando o balde encher (não conta tentativa);
+- 429 zera o balde e respeita Retry-After; rede/5xx e erros inesperados com
+  backoff até WASENDER_OUTBOX_MAX_TENTATIVAS (depois 'falhou'); outros 4xx
+  falham na hora;
+- o resultado volta por atualizar_sales_comunicacao_mensagem_provider
+  (status 'enviado'/'erro', provider_message_id, provider_status).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from aicentralv2 import db
+from aicentralv2.services.jobs import JOBS_INLINE, enfileirar_job, executar_job_por_id, job_handler
+from aicentralv2.services.wasender_service import WasenderApiError, enviar_mensagem_texto
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PENDENTE = 'pendente'
+OUTBOX_ENVIANDO = 'enviando'
+OUTBOX_ENVIADO = 'enviado'
+OUTBOX_FALHOU = 'falhou'
+
+WASENDER_MSGS_POR_MINUTO = float(os.getenv('WASENDER_MSGS_POR_MINUTO', '12'))
+WASENDER_RAJADA = float(os.getenv('WASENDER_RAJADA', '1'))
+WASENDER_OUTBOX_MAX_TENTATIVAS = int(os.getenv('WASENDER_OUTBOX_MAX_TENTATIVAS', '5'))
+WASENDER_OUTBOX_SESSOES_POR_LOTE = 50
+_BACKOFF_BASE_SEGUNDOS = 30
+_ESPERA_429_SEGUNDOS = 60
+_ENVIANDO_TIMEOUT_SEGUNDOS = 300
+_JANELA_GATILHO_SEGUNDOS = 2
+_LOCK_REIVINDICACAO = 'wasender_outbox'
+
+
+def sessao_envio(credencial: Dict[str, Any]) -> str:
+    """Chave de partição: sessão Wasender (ou o responsável, se não houver sessão)."""
+    return str(credencial.get('wasender_session_id') or f"responsavel:{credencial['responsavel_id']}")
+
+
+def _agendar_envio(atraso_segundos: float = 0, *, conn=None) -> int:
+    alvo = time.time() + atraso_segundos
+    janela = int(alvo // _JANELA_GATILHO_SEGUNDOS)
+    return enfileirar_job(
+        'wasender.enviar_fila',
+        idempotency_key=f'wasender:outbox:{janela}',
+        atraso_segundos=atraso_segundos,
+        conn=conn,
+    )
+
+
+def enfileirar_mensagem_whatsapp(mensagem_id: int, conversa_id: int, credencial: Dict[str, Any],
+                                 destino: str, texto: str) -> int:
+    """Coloca na fila da sessão do responsável uma mensagem já gravada (status 'na_fila')."""
+    conn = db.get_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO wasender_outbox (mensagem_id, conversa_id, responsavel_id, sessao, destino, texto)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id
+            ''', (mensagem_id, conversa_id, credencial['responsavel_id'], sessao_envio(credencial), destino, texto))
+            outbox_id = cursor.fetchone()['id']
+        job_id = _agendar_envio(conn=conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if JOBS_INLINE:
+        executar_job_por_id(job_id)
+    return outbox_id
+
+
+# ==================== LIMITE DE TAXA ====================
+
+def _consumir_token(conn, sessao: str) -> float:
+    """Tenta tirar um token do balde da sessão. Retorna 0 se conseguiu, senão os segundos de espera."""
+    taxa = WASENDER_MSGS_POR_MINUTO / 60.0
+    params = {'sessao': sessao, 'capacidade': max(1.0, WASENDER_RAJADA), 'taxa': taxa}
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO wasender_rate_limit AS r (sessao, tokens, atualizado_em)
+            VALUES (%(sessao)s, %(capacidade)s - 1, clock_timestamp())
+            ON CONFLICT (sessao) DO UPDATE
+               SET tokens = LEAST(%(capacidade)s::float8, r.tokens
+                       + EXTRACT(EPOCH FROM clock_timestamp() - r.atualizado_em)::float8 * %(taxa)s::float8) - 1,
+                   atualizado_em = clock_timestamp()
+             WHERE LEAST(%(capacidade)s::float8, r.tokens
+                       + EXTRACT(EPOCH FROM clock_timestamp() - r.atualizado_em)::float8 * %(taxa)s::float8) >= 1
+            RETURNING tokens
+        ''', params)
+        if cursor.fetchone() is not None:
+            conn.commit()
+            return 0.0
+        cursor.execute('''
+            SELECT GREATEST(0.5, (1 - LEAST(%(capacidade)s::float8, tokens
+                       + EXTRACT(EPOCH FROM clock_timestamp() - atualizado_em)::float8 * %(taxa)s::float8))
+                   / %(taxa)s::float8) AS espera
+              FROM wasender_rate_limit WHERE sessao = %(sessao)s
+        ''', params)
+        espera = cursor.fetchone()['espera']
+    conn.commit()
+    return float(espera)
+
+
+def _esvaziar_balde(conn, sessao: str, segundos: float) -> None:
+    """Após 429: balde negativo = nenhum envio da sessão pelos próximos `segundos`."""
+    taxa = WASENDER_MSGS_POR_MINUTO / 60.0
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE wasender_rate_limit SET tokens = %s, atualizado_em = clock_timestamp()
+             WHERE sessao = %s
+        ''', (-(segundos * taxa), sessao))
+    conn.commit()
+
+
+# ==================== ENTREGA ====================
+
+def _reivindicar_cabecas(conn, limite: int) -> List[Dict[str, Any]]:
+    """A mensagem mais antiga de cada sessão, se estiver liberada e a sessão livre."""
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (_LOCK_REIVINDICACAO,))
+        cursor.execute('''
+            UPDATE wasender_outbox
+               SET status = %s, updated_at = NOW()
+             WHERE status = %s AND updated_at < NOW() - make_interval(secs => %s)
+        ''', (OUTBOX_PENDENTE, OUTBOX_ENVIANDO, _ENVIANDO_TIMEOUT_SEGUNDOS))
+        cursor.execute('''
+            WITH cabecas AS (
+                SELECT DISTINCT ON (sessao) id, sessao, proxima_tentativa_em
+                  FROM wasender_outbox
+                 WHERE status = %(pendente)s
+                 ORDER BY sessao, id
+            )
+            UPDATE wasender_outbox
+               SET status = %(enviando)s, updated_at = NOW()
+             WHERE id IN (
+                    SELECT c.id FROM cabecas c
+                     WHERE c.proxima_tentativa_em <= NOW()
+                       AND NOT EXISTS (
+                            SELECT 1 FROM wasender_outbox e
+                             WHERE e.sessao = c.sessao AND e.status = %(enviando)s
+                       )
+                     ORDER BY c.id
+                     LIMIT %(limite)s
+             )
+            RETURNING *
+        ''', {'pendente': OUTBOX_PENDENTE, 'enviando': OUTBOX_ENVIANDO, 'limite': limite})
+        linhas = cursor.fetchall()
+    conn.commit()
+    return sorted(linhas, key=lambda r: r['id'])
+
+
+def _reagendar(conn, linha: Dict[str, Any], segundos: float, *, erro: Optional[str] = None,
+               contar_tentativa: bool = False) -> None:
+    # Só linhas ainda em 'enviando': uma já finalizada (ex.: enviada) não volta para a fila
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE wasender_outbox
+               SET status = %s, tentativas = tentativas + %s,
+                   ultimo_erro = COALESCE(%s, ultimo_erro),
+                   proxima_tentativa_em = NOW() + make_interval(secs => %s), updated_at = NOW()
+             WHERE id = %s AND status = %s
+        ''', (OUTBOX_PENDENTE, 1 if contar_tentativa else 0, erro, float(segundos), linha['id'],
+              OUTBOX_ENVIANDO))
+    conn.commit()
+
+
+def _finalizar(conn, linha: Dict[str, Any], status: str, erro: Optional[str] = None) -> bool:
+    """Grava o status final; False se a linha já não estava em 'enviando'."""
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE wasender_outbox
+               SET status = %s, tentativas = tentativas + 1, ultimo_erro = %s,
+                   enviado_em = CASE WHEN %s = %s THEN NOW() ELSE enviado_em END, updated_at = NOW()
+             WHERE id = %s AND status = %s
+        ''', (status, erro, status, OUTBOX_ENVIADO, linha['id'], OUTBOX_ENVIANDO))
+        alterada = cursor.rowcount > 0
+    conn.commit()
+    return alterada
+
+
+def _marcar_falha(conn, linha: Dict[str, Any], erro: str) -> None:
+    """Dead letter: linha em 'falhou' e a mensagem do CRM em 'erro'."""
+    if not _finalizar(conn, linha, OUTBOX_FALHOU, erro[:4000]):
+        return
+    db.atualizar_sales_comunicacao_mensagem_provider(
+        mensagem_id=linha['mensagem_id'],
+        provider_status='failed',
+        provider_payload={'error': erro},
+        status='erro',
+    )
+
+
+def _backoff(linha: Dict[str, Any]) -> float:
+    return _BACKOFF_BASE_SEGUNDOS * (2 ** linha['tentativas'])
+
+
+def _enviar(conn, linha: Dict[str, Any], credenciais: Dict[int, Optional[Dict[str, Any]]]) -> str:
+    """Envia uma mensagem reivindicada. Retorna 'enviado', 'adiado' ou 'falhou'."""
+    espera = _consumir_token(conn, linha['sessao'])
+    if espera > 0:
+        _reagendar(conn, linha, espera)
+        return 'adiado'
+
+    responsavel_id = linha['responsavel_id']
+    if responsavel_id not in credenciais:
+        credenciais[responsavel_id] = db.obter_wasender_credencial_responsavel(responsavel_id)
+    credencial = credenciais[responsavel_id]
+
+    try:
+        if not credencial or not credencial.get('wasender_ativo') or not credencial.get('wasender_api_key'):
+            raise WasenderApiError('Responsável comercial sem WasenderAPI ativa.', status_code=400)
+        provider_meta = enviar_mensagem_texto(credencial['wasender_api_key'], linha['destino'], linha['texto'])
+    except WasenderApiError as exc:
+        if exc.status_code == 429:
+            espera = exc.retry_after or _ESPERA_429_SEGUNDOS
+            _esvaziar_balde(conn, linha['sessao'], espera)
+            _reagendar(conn, linha, espera, erro=str(exc))
+            return 'adiado'
+        if exc.retentavel and linha['tentativas'] + 1 < WASENDER_OUTBOX_MAX_TENTATIVAS:
+            _reagendar(conn, linha, _backoff(linha), erro=str(exc), contar_tentativa=True)
+            return 'adiado'
+        _marcar_falha(conn, linha, str(exc))
+        return 'falhou'
+
+    _finalizar(conn, linha, OUTBOX_ENVIADO)
+    db.atualizar_sales_comunicacao_mensagem_provider(
+        mensagem_id=linha['mensagem_id'],
+        provider_message_id=provider_meta.get('provider_message_id'),
+        provider_status=provider_meta.get('provider_status'),
+        provider_payload=provider_meta.get('provider_payload'),
+        status='enviado',
+    )
+    db.atualizar_sales_comunicacao_conversa_wasender(
+        linha['conversa_id'],
+        responsavel_id=responsavel_id,
+        telefone_remetente=credencial.get('telefone_normalizado'),
+        provider_session_id=credencial.get('wasender_session_id'),
+    )
+    return 'enviado'
+
+
+def entregar_fila_whatsapp() -> Dict[str, int]:
+    """Envia enquanto houver sessão com mensagem liberada e token disponível."""
+    conn = db.get_db()
+    totais = {'enviados': 0, 'adiados': 0, 'falhas': 0}
+    credenciais: Dict[int, Optional[Dict[str, Any]]] = {}
+    while True:
+        linhas = _reivindicar_cabecas(conn, WASENDER_OUTBOX_SESSOES_POR_LOTE)
+        if not linhas:
+            break
+        enviados_rodada = 0
+        for linha in linhas:
+            try:
+                resultado = _enviar(conn, linha, credenciais)
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Erro ao enviar WhatsApp da fila {linha['id']}: {e}", exc_info=True)
+                try:
+                    if linha['tentativas'] + 1 < WASENDER_OUTBOX_MAX_TENTATIVAS:
+                        _reagendar(conn, linha, _backoff(linha), erro=str(e), contar_tentativa=True)
+                        resultado = 'adiado'
+                    else:
+                        _marcar_falha(conn, linha, str(e))
+                        resultado = 'falhou'
+                except Exception as e2:
+                    conn.rollback()
+                    logger.error(f"Erro ao registrar falha da fila {linha['id']}: {e2}", exc_info=True)
+                    resultado = 'adiado'
+            if resultado == 'enviado':
+                enviados_rodada += 1
+                totais['enviados'] += 1
+            elif resultado == 'falhou':
+                totais['falhas'] += 1
+            else:
+                totais['adiados'] += 1
+        if not enviados_rodada:
+            break
+    return totais
+
+
+def _segundos_ate_proximo_envio(conn) -> Optional[float]:
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            SELECT GREATEST(0, EXTRACT(EPOCH FROM MIN(proxima_tentativa_em) - NOW()))::float8 AS espera
+              FROM wasender_outbox WHERE status = %s
+        ''', (OUTBOX_PENDENTE,))
+        row = cursor.fetchone()
+    conn.commit()
+    return row['espera'] if row and row['espera'] is not None else None
+
+
+@job_handler('wasender.enviar_fila', max_tentativas=1, fila='wasender', timeout_segundos=600,
+             intervalo_segundos=60)
+def _job_enviar_fila(ctx):
+    """Drena a fila no ritmo das sessões e se reagenda para o próximo envio liberado."""
+    totais = entregar_fila_whatsapp()
+    espera = _segundos_ate_proximo_envio(db.get_db())
+    # Em modo inline o reagendamento executaria na hora, em recursão
+    if espera is not None and espera < 60 and not JOBS_INLINE:
+        _agendar_envio(max(espera, 1))
+    if totais['enviados'] or totais['falhas']:
+        logger.info(
+            f"Fila WhatsApp: {totais['enviados']} enviada(s), {totais['falhas']} falha(s), "
+            f"{totais['adiados']} adiada(s)"
+        )
+    return totais
@@ -1,12 +1,42 @@
 import os
+import threading
 from typing import Any, Dict, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+
+_http_session: Optional[requests.Session] = None
+_http_session_pid: Optional[int] = None
+_http_lock = threading.Lock()
 
 
 class WasenderApiError(Exception):
     """Erro controlado ao comunicar com a WasenderAPI."""
 
+    def __init__(self, message: str, *, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retentavel(self) -> bool:
+        """Rede (sem status), 429 e 5xx valem nova tentativa."""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+def _http() -> requests.Session:
+    """Sessão com pool de conexões, recriada após fork (workers Gunicorn)."""
+    global _http_session, _http_session_pid
+    pid = os.getpid()
+    if _http_session is None or _http_session_pid != pid:
+        with _http_lock:
+            if _http_session is None or _http_session_pid != pid:
+                sessao = requests.Session()
+                sessao.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+                _http_session = sessao
+                _http_session_pid = pid
+    return _http_session
+
 
 def _base_url() -> str:
     return (os.getenv('WASENDER_API_BASE_URL') or 'https://www.wasenderapi.com/api').rstrip('/')
@@ -44,14 +74,14 @@ def _extract_status(payload: Dict[str, Any]) -> str:
 def enviar_mensagem_texto(api_key: str, telefone_destino: str, texto: str, timeout: int = 20) -> Dict[str, Any]:
     """Envia uma mensagem de texto pela WasenderAPI."""
     if not api_key:
-        raise WasenderApiError('API key da WasenderAPI não configurada.')
+        raise WasenderApiError('API key da WasenderAPI não configurada.', status_code=400)
     if not telefone_destino:
-        raise WasenderApiError('Telefone de destino obrigatório.')
+        raise WasenderApiError('Telefone de destino obrigatório.', status_code=400)
     if not texto:
-        raise WasenderApiError('Texto da mensagem obrigatório.')
+        raise WasenderApiError('Texto da mensagem obrigatório.', status_code=400)
 
     try:
-        resp = requests.post(
+        resp = _http().post(
             f'{_base_url()}/send-message',
             headers={
                 'Authorization': f'Bearer {api_key}',
@@ -70,7 +100,17 @@ def enviar_mensagem_texto(api_key: str, telefone_destino: str, texto: str, timeo
 
     if resp.status_code >= 400:
         detail = payload.get('message') or payload.get('error') or resp.text
-        raise WasenderApiError(f'WasenderAPI retornou HTTP {resp.status_code}: {detail}')
+        retry_after = None
+        if resp.status_code == 429:
+            try:
+                retry_after = float(resp.headers.get('Retry-After') or payload.get('retry_after') or 0) or None
+            except (TypeError, ValueError):
+                retry_after = None
+        raise WasenderApiError(
+            f'WasenderAPI retornou HTTP {resp.status_code}: {detail}',
+            status_code=resp.status_code,
+            retry_after=retry_after,
+        )
 
     return {
         'provider': 'wasenderapi',
@@ -0,0 +1,146 @@
+"""
+=====================================================
+WEBHOOK DISPATCHER
+Envio de webhooks de saída (n8n) pela fila de jobs
+=====================================================
+
+Cada envio vira um job 'webhook.enviar' (fila 'webhooks') gravado em cadu_jobs, então
+sobrevive ao reciclo do Gunicorn (max_requests) e a deploys. Quem envia são as
+threads fixas do worker (JOBS_THREADS), com conexões reaproveitadas por processo.
+
+- Backpressure: com WEBHOOK_FILA_MAX envios aguardando, enfileirar_webhook levanta
+  WebhookFilaCheia (a rota responde 429 com Retry-After).
+- 429/5xx/rede: retentativa com backoff do job; outros 4xx: falha definitiva.
+- O destino é um nome de WEBHOOK_DESTINOS: a URL nunca vem do cliente.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from aicentralv2.db import get_db
+from aicentralv2.services.jobs import (
+    JOB_EXECUTANDO,
+    JOB_PENDENTE,
+    JobAdiado,
+    JobErroPermanente,
+    enfileirar_job,
+    job_handler,
+)
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_DESTINOS = {
+    'n8n_proxy': os.getenv(
+        'WEBHOOK_PROXY_N8N_URL',
+        'https://n8n.centralcomm.media/webhook/f8702380-85c1-4a1d-8b6b-1996a9c6d822',
+    ),
+}
+
+WEBHOOK_FILA_MAX = int(os.getenv('WEBHOOK_FILA_MAX', '500'))
+WEBHOOK_TIMEOUT_SEGUNDOS = int(os.getenv('WEBHOOK_TIMEOUT_SEGUNDOS', '60'))
+# Sugestão de espera devolvida ao cliente quando a fila está cheia
+WEBHOOK_RETRY_AFTER_SEGUNDOS = 30
+
+_http_session: Optional[requests.Session] = None
+_http_session_pid: Optional[int] = None
+_http_lock = threading.Lock()
+
+
+class WebhookFilaCheia(Exception):
+    """Fila de webhooks no limite: o chamador deve tentar de novo mais tarde."""
+
+    def __init__(self, pendentes: int):
+        super().__init__(f'Fila de webhooks cheia ({pendentes} aguardando)')
+        self.pendentes = pendentes
+        self.retry_after = WEBHOOK_RETRY_AFTER_SEGUNDOS
+
+
+def webhook_http_session() -> requests.Session:
+    """Sessão `requests` com pool de conexões, recriada após fork."""
+    global _http_session, _http_session_pid
+    pid = os.getpid()
+    if _http_session is None or _http_session_pid != pid:
+        with _http_lock:
+            if _http_session is None or _http_session_pid != pid:
+                sessao = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                sessao.mount('https://', adapter)
+                sessao.mount('http://', adapter)
+                _http_session = sessao
+                _http_session_pid = pid
+    return _http_session
+
+
+def contar_webhooks_aguardando(limite: int = WEBHOOK_FILA_MAX) -> int:
+    """Quantos envios estão pendentes/em execução (contagem para em `limite`)."""
+    conn = get_db()
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            SELECT COUNT(*) AS total FROM (
+                SELECT 1 FROM cadu_jobs
+                 WHERE tipo = 'webhook.enviar' AND status IN (%s, %s)
+                 LIMIT %s
+            ) t
+        ''', (JOB_PENDENTE, JOB_EXECUTANDO, limite))
+        return cursor.fetchone()['total']
+
+
+def enfileirar_webhook(destino: str, payload: Dict[str, Any], *,
+                       created_by: Optional[int] = None) -> int:
+    """Agenda o POST de `payload` para o destino; devolve o id do job."""
+    if destino not in WEBHOOK_DESTINOS:
+        raise ValueError(f'Destino de webhook desconhecido: {destino}')
+    pendentes = contar_webhooks_aguardando()
+    if pendentes >= WEBHOOK_FILA_MAX:
+        raise WebhookFilaCheia(pendentes)
+    return enfileirar_job(
+        'webhook.enviar',
+        {'destino': destino, 'payload': payload},
+        created_by=created_by,
+    )
+
+
+def enviar_webhook(destino: str, payload: Dict[str, Any]) -> int:
+    """POST síncrono para o destino; devolve o status HTTP (usado pelo job)."""
+    url = WEBHOOK_DESTINOS.get(destino)
+    if not url:
+        raise JobErroPermanente(f'Destino de webhook desconhecido: {destino}')
+    try:
+        response = webhook_http_session().post(
+            url,
+            json=payload,
+            headers={'Content-Type': 'application/json'},
+            timeout=WEBHOOK_TIMEOUT_SEGUNDOS,
+        )
+    except requests.RequestException as e:
+        raise RuntimeError(f'Falha de rede no webhook {destino}: {e}') from e
+
+    if response.status_code == 429:
+        try:
+            espera = float(response.headers.get('Retry-After') or 0)
+        except ValueError:
+            espera = 0
+        if espera > 0:
+            raise JobAdiado(espera, f'webhook {destino} limitado (429)')
+        raise RuntimeError(f'Webhook {destino} limitado (429)')
+    if response.status_code >= 500:
+        raise RuntimeError(f'Webhook {destino} HTTP {response.status_code}')
+    if response.status_code >= 400:
+        raise JobErroPermanente(f'Webhook {destino} HTTP {response.status_code}: {response.text[:500]}')
+    return response.status_code
+
+
+@job_handler('webhook.enviar', max_tentativas=5, backoff_segundos=30, fila='webhooks',
+             timeout_segundos=WEBHOOK_TIMEOUT_SEGUNDOS * 3)
+def _job_enviar_webhook(ctx):
+    destino = ctx.payload.get('destino')
+    status = enviar_webhook(destino, ctx.payload.get('payload') or {})
+    logger.info(f'Webhook {destino} enviado (job {ctx.id}): HTTP {status}')
+    return {'status_http': status}
@@ -341,8 +341,20 @@
     return body;
   }
 
+  // Resumo de flags das campanhas de cada PI em root (documento ou linhas de uma página nova)
+  function atualizarResumosFlags(root) {
+    root.querySelectorAll('[data-campanha-ids]').forEach(function (el) {
+      try {
+        const ids = JSON.parse(el.getAttribute('data-campanha-ids') || '[]');
+        const idPi = el.getAttribute('data-pi-id');
+        if (ids.length && idPi) updateFlagSummary(idPi, ids);
+      } catch (err) { /* ignore */ }
+    });
+  }
+
   window.PiListUI = {
     switchTab: switchPiSidebarTab,
+    atualizarResumosFlags: atualizarResumosFlags,
     salvarComplementar: function () {
       if (SOMENTE_LEITURA) return;
       const id = currentPiSidebar && currentPiSidebar.id_pi ? currentPiSidebar.id_pi : currentPiSidebar;
@@ -415,12 +427,6 @@
         switchPiSidebarTab(btn.getAttribute('data-tab'));
       });
     });
-    document.querySelectorAll('[data-campanha-ids]').forEach(function (el) {
-      try {
-        const ids = JSON.parse(el.getAttribute('data-campanha-ids') || '[]');
-        const idPi = el.getAttribute('data-pi-id');
-        if (ids.length && idPi) updateFlagSummary(idPi, ids);
-      } catch (err) { /* ignore */ }
-    });
+    atualizarResumosFlags(document);
   });
 })();
@@ -14,7 +14,7 @@
     let crmConversaSelecionadaId = null;
     let telefoneSelecionado = null;
     let crmChatPollTimer = null;
-    let crmChatLastMsgCount = 0;
+    let crmChatLastMsgAssinatura = '';
     let crmContatoBusca = '';
     let crmChatBusca = '';
     let crmChatTab = 'todas';
@@ -338,7 +338,7 @@
             clearInterval(crmChatPollTimer);
             crmChatPollTimer = null;
         }
-        crmChatLastMsgCount = 0;
+        crmChatLastMsgAssinatura = '';
     }
 
     function iniciarPollingMensagens() {
@@ -1425,12 +1425,18 @@
         $('#btn-sugerir-ia-header')?.addEventListener('click', async () => {
             const btn = $('#btn-sugerir-ia-header');
             btn.classList.add('loading');
+            const sugestoesDiv = $('#ia-sugestoes');
             try {
-                const data = await api('/api/ia/sugerir-objetivos', {
-                    method: 'POST',
-                    body: JSON.stringify({ cliente_id: clienteId })
+                const data = await window.iaStream(BASE + '/api/ia/sugerir-objetivos', { cliente_id: clienteId }, {
+                    chave: 'crm-sugerir-objetivos',
+                    onToken: (_, texto) => {
+                        sugestoesDiv.classList.remove('hidden');
+                        sugestoesDiv.innerHTML = `
+                            <div class="text-xs font-semibold mb-1">Sugestões da IA:</div>
+                            <div class="text-xs whitespace-pre-line opacity-70">${escapeHtml(texto)}</div>
+                        `;
+                    }
                 });
-                const sugestoesDiv = $('#ia-sugestoes');
                 sugestoesDiv.classList.remove('hidden');
                 sugestoesDiv.innerHTML = `
                     <div class="text-xs font-semibold mb-1">Sugestões da IA:</div>
@@ -1454,6 +1460,8 @@
                     carregarObjetivos(clienteId);
                 });
             } catch (e) {
+                if (e.name === 'AbortError') return;
+                sugestoesDiv?.classList.add('hidden');
                 console.error(e);
                 showToast('Erro ao obter sugestões da IA.', 'error');
             } finally {
@@ -1761,17 +1769,21 @@
 
         btn?.classList.add('loading');
         try {
-            const data = await api('/api/ia/gerar-comunicacao', {
-                method: 'POST',
-                body: JSON.stringify({
-                    contato_id: contatoId,
-                    cliente_id: clienteId,
-                    tipo, tamanho, objetivo, produto, canal
-                })
+            const data = await window.iaStream(BASE + '/api/ia/gerar-comunicacao', {
+                contato_id: contatoId,
+                cliente_id: clienteId,
+                tipo, tamanho, objetivo, produto, canal
+            }, {
+                chave: 'crm-gerar-comunicacao',
+                onToken: (_, texto) => {
+                    if (textoEl) textoEl.textContent = texto;
+                    previewEl?.classList.remove('hidden');
+                }
             });
             if (textoEl) textoEl.textContent = data.mensagem;
             previewEl?.classList.remove('hidden');
         } catch (e) {
+            if (e.name === 'AbortError') return;
             console.error(e);
             showToast('Erro ao gerar comunicação.', 'error');
         } finally {
@@ -1960,6 +1972,7 @@
     function metaStatusMsg(m) {
         if (m.direcao !== 'outbound') return '';
         if (m.status === 'erro') return '<span class="crm-msg-status crm-msg-status-erro" title="Falha no envio">!</span>';
+        if (m.status === 'na_fila') return '<span class="crm-msg-status crm-msg-status-fila" title="Na fila de envio">🕓</span>';
         if (m.provider_status === 'read' || m.provider_status === 'READ') {
             return '<span class="crm-msg-status crm-msg-status-read" title="Lida">✓✓</span>';
         }
@@ -2023,8 +2036,10 @@
         try {
             const data = await api(`/api/comunicacao/conversas/${conversaId}/mensagens`);
             const mensagens = data.mensagens || [];
-            if (opts.silent && mensagens.length === crmChatLastMsgCount) return;
-            crmChatLastMsgCount = mensagens.length;
+            // Status também conta: mensagens na fila mudam para enviada/entregue sem nova linha
+            const assinatura = mensagens.map(m => `${m.id}:${m.status || ''}:${m.provider_status || ''}`).join('|');
+            if (opts.silent && assinatura === crmChatLastMsgAssinatura) return;
+            crmChatLastMsgAssinatura = assinatura;
             if (!mensagens.length) {
                 if (!opts.silent) showEmpty(box, 'Nenhuma mensagem nesta conversa.');
                 return;
@@ -2488,18 +2503,23 @@
         }
         const btnGroup = el.parentElement?.querySelector('[data-ia-group]');
         if (btnGroup) btnGroup.classList.add('opacity-50', 'pointer-events-none');
+        const limite = el.maxLength > 0 ? el.maxLength : 4000;
         try {
-            const data = await api('/api/ia/cotacao-briefing', {
-                method: 'POST',
-                body: JSON.stringify({ texto, acao, campo: 'apresentacao_dados' }),
+            // Rota global (fora do prefixo /crm)
+            const data = await window.iaStream('/api/ia/cotacao-briefing', { texto, acao, campo: 'apresentacao_dados' }, {
+                chave: 'crm-cotacao-briefing',
+                onToken: (_, parcial) => { el.value = parcial.slice(0, limite); }
             });
             if (data?.success) {
-                el.value = (data.texto || '').trim().slice(0, el.maxLength || 4000);
+                el.value = (data.texto || '').trim().slice(0, limite);
                 showToast(acao === 'corrigir' ? 'Texto corrigido pela IA.' : 'Texto ampliado pela IA.', 'success');
             } else {
+                el.value = texto;
                 showToast(data?.message || 'Falha na IA.', 'error');
             }
         } catch (e) {
+            if (e.name === 'AbortError') return;
+            el.value = texto;
             console.error('melhorarBriefingCotacaoCRM', e);
             showToast(e.message || 'Falha ao chamar a IA.', 'error');
         } finally {
@@ -0,0 +1,93 @@
+/**
+ * Streaming das rotas de texto da IA (SSE sobre fetch POST).
+ *
+ * window.iaStream(url, body, { onToken, chave }) -> Promise com o JSON do evento 'fim'
+ * (o mesmo que a rota devolve sem streaming). onToken(pedaco, textoAteAgora) é chamado
+ * a cada pedaço. Uma nova chamada com a mesma `chave` cancela a anterior; o cancelamento
+ * fecha a conexão e o servidor aborta a chamada à OpenRouter. window.iaStreamCancelar(chave)
+ * cancela manualmente. Requisições canceladas rejeitam com err.name === 'AbortError'.
+ */
+(function () {
+    'use strict';
+
+    const emAndamento = new Map();
+
+    function cancelar(chave) {
+        const ctrl = emAndamento.get(chave);
+        if (ctrl) {
+            ctrl.abort();
+            emAndamento.delete(chave);
+        }
+    }
+
+    function lerEvento(bloco) {
+        let nome = 'message';
+        const dados = [];
+        for (const linha of bloco.split('\n')) {
+            if (linha.startsWith(':')) continue;
+            if (linha.startsWith('event:')) nome = linha.slice(6).trim();
+            else if (linha.startsWith('data:')) dados.push(linha.slice(5).replace(/^ /, ''));
+        }
+        if (!dados.length) return null;
+        return { nome, dados: JSON.parse(dados.join('\n')) };
+    }
+
+    async function iaStream(url, body, opts = {}) {
+        const chave = opts.chave || url;
+        cancelar(chave);
+        const ctrl = new AbortController();
+        emAndamento.set(chave, ctrl);
+
+        try {
+            const resp = await fetch(url, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+                body: JSON.stringify(body || {}),
+                signal: ctrl.signal,
+            });
+            const tipo = resp.headers.get('Content-Type') || '';
+            if (!resp.ok || !tipo.includes('text/event-stream')) {
+                // Validação (400/404) e erros antes do streaming continuam em JSON
+                const data = await resp.json().catch(() => ({}));
+                const error = new Error(data.error || data.message || `HTTP ${resp.status}`);
+                error.data = data;
+                throw error;
+            }
+
+            const reader = resp.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let texto = '';
+            for (;;) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let fim;
+                while ((fim = buffer.indexOf('\n\n')) !== -1) {
+                    const evento = lerEvento(buffer.slice(0, fim));
+                    buffer = buffer.slice(fim + 2);
+                    if (!evento) continue;
+                    if (evento.nome === 'token') {
+                        texto += evento.dados.texto || '';
+                        if (opts.onToken) opts.onToken(evento.dados.texto || '', texto);
+                    } else if (evento.nome === 'fim') {
+                        return evento.dados;
+                    } else if (evento.nome === 'erro') {
+                        const error = new Error(evento.dados.error || evento.dados.message || 'Falha na IA.');
+                        error.data = evento.dados;
+                        throw error;
+                    }
+                }
+            }
+            throw new Error('Resposta da IA interrompida.');
+        } finally {
+            if (emAndamento.get(chave) === ctrl) emAndamento.delete(chave);
+        }
+    }
+
+    window.iaStream = iaStream;
+    window.iaStreamCancelar = cancelar;
+    window.addEventListener('pagehide', () => {
+        for (const chave of [...emAndamento.keys()]) cancelar(chave);
+    });
+})();
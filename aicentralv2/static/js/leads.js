@@ -2066,25 +2066,33 @@ async function processImport() {
     if (!texto) return showToast('Cole os dados dos leads', 'warning');
     const btn = document.getElementById('btn_processar');
     const spinner = document.getElementById('import_spinner');
+    const progresso = document.getElementById('import_progresso');
     btn.disabled = true;
     spinner.classList.remove('hidden');
     try {
         const tipoLead = document.getElementById('import_tipo').value;
-        const resp = await fetch('/api/leads/processar-importacao', {
-            method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({texto_bruto: texto, tipo_lead: tipoLead}),
+        // Streaming: mostra o avanço enquanto a IA estrutura; fechar o modal cancela
+        const data = await window.iaStream('/api/leads/processar-importacao', {texto_bruto: texto, tipo_lead: tipoLead}, {
+            chave: 'leads-importacao',
+            onToken: (_, parcial) => {
+                const empresas = (parcial.match(/"empresa"\s*:/g) || []).length;
+                progresso.textContent = empresas ? `${empresas} empresa(s) identificada(s)...` : 'Processando...';
+                progresso.classList.remove('hidden');
+            },
         });
-        const data = await resp.json();
         if (!data.success) throw new Error(data.message);
         importParsedLeads = data.leads.map((l, i) => ({...l, _selected: true, _idx: i}));
         renderImportPreview();
         document.getElementById('import_step1').classList.add('hidden');
         document.getElementById('import_step2').classList.remove('hidden');
-    } catch (e) { showToast('Erro ao processar: ' + e.message, 'error'); }
-    finally { btn.disabled = false; spinner.classList.add('hidden'); }
+    } catch (e) {
+        if (e.name !== 'AbortError') showToast('Erro ao processar: ' + e.message, 'error');
+    }
+    finally { btn.disabled = false; spinner.classList.add('hidden'); progresso.classList.add('hidden'); }
 }
 
+document.getElementById('modal_importar')?.addEventListener('close', () => window.iaStreamCancelar('leads-importacao'));
+
 function renderImportPreview() {
     const count = importParsedLeads.filter(l => l._selected).length;
     document.getElementById('import_preview').innerHTML =
@@ -0,0 +1,92 @@
+/**
+ * Paginação keyset — páginas seguintes das listagens (PIs, campanhas, logs)
+ *
+ * A rota de linhas devolve {success, html, proximo_cursor}; o html (linhas <tr>) é
+ * anexado ao tbody e o cursor guardado para a próxima chamada. Sem cursor, a lista
+ * acabou e o botão some. Com o botão visível na tela, a próxima página carrega sozinha.
+ */
+(function (global) {
+  'use strict';
+
+  function iniciar(opcoes) {
+    const tbody = opcoes.tbody;
+    const botao = opcoes.botao;
+    if (!tbody || !botao) return null;
+
+    let cursor = opcoes.cursor || '';
+    let carregando = null;
+    let observer = null;
+
+    function atualizarBotao() {
+      botao.hidden = !cursor;
+      botao.disabled = !!carregando;
+      if (!cursor && observer) observer.disconnect();
+    }
+
+    function montarUrl() {
+      const params = new URLSearchParams(typeof opcoes.params === 'function' ? opcoes.params() : (opcoes.params || ''));
+      params.set('cursor', cursor);
+      return opcoes.url + '?' + params.toString();
+    }
+
+    function carregar() {
+      if (!cursor) return Promise.resolve([]);
+      if (carregando) return carregando;
+      carregando = fetch(montarUrl(), { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+        .then(function (r) { return r.json(); })
+        .then(function (data) {
+          if (!data.success) throw new Error(data.message || 'Erro ao carregar a próxima página');
+          const tpl = document.createElement('template');
+          tpl.innerHTML = data.html || '';
+          const linhas = Array.from(tpl.content.children);
+          tbody.appendChild(tpl.content);
+          cursor = data.proximo_cursor || '';
+          if (typeof opcoes.aoCarregar === 'function') opcoes.aoCarregar(linhas);
+          return linhas;
+        })
+        .catch(function (e) {
+          if (typeof showToast === 'function') showToast(e.message || 'Erro ao carregar a próxima página', 'error');
+          return [];
+        })
+        .finally(function () {
+          carregando = null;
+          atualizarBotao();
+          // Reobservar reavalia a posição: se o botão segue na tela, vem mais uma página
+          if (cursor && observer) {
+            observer.unobserve(botao);
+            observer.observe(botao);
+          }
+        });
+      atualizarBotao();
+      return carregando;
+    }
+
+    // Carrega páginas até encontrar o seletor (ex.: #pi-123 vindo de um redirect)
+    function carregarAte(seletor, maxPaginas) {
+      let restantes = maxPaginas || 20;
+      function tentar() {
+        const el = document.querySelector(seletor);
+        if (el || !cursor || restantes-- <= 0) return Promise.resolve(el);
+        return carregar().then(tentar);
+      }
+      return tentar();
+    }
+
+    botao.addEventListener('click', function () { carregar(); });
+    if ('IntersectionObserver' in global && opcoes.automatico !== false) {
+      observer = new IntersectionObserver(function (entradas) {
+        if (entradas.some(function (e) { return e.isIntersecting; })) carregar();
+      }, { rootMargin: '200px' });
+      observer.observe(botao);
+    }
+    atualizarBotao();
+
+    return {
+      carregar: carregar,
+      carregarAte: carregarAte,
+      temMais: function () { return !!cursor; },
+    };
+  }
+
+  global.PaginacaoKeyset = { iniciar: iniciar };
+})(typeof window !== 'undefined' ? window : this);
@@ -22,6 +22,7 @@ echo ""
 # 1. Parar servico ANTES de tudo
 echo "[1/7] Parando servico..."
 sudo systemctl stop aicentralv2 2>/dev/null || true
+sudo systemctl stop aicentralv2-worker 2>/dev/null || true
 sleep 2
 
 # Garantir que nenhum gunicorn ficou vivo
@@ -81,8 +82,8 @@ cleanup_pip_orphans "$VENV_PIP"
 echo "  > OK"
 
 # 4. Criar diretorios
-mkdir -p aicentralv2/static/uploads/audiencias aicentralv2/static/uploads/cotacoes logs
-chmod 755 aicentralv2/static/uploads/audiencias aicentralv2/static/uploads/cotacoes logs
+mkdir -p aicentralv2/static/uploads/audiencias aicentralv2/static/uploads/cotacoes logs uploads/intelligence
+chmod 755 aicentralv2/static/uploads/audiencias aicentralv2/static/uploads/cotacoes logs uploads/intelligence
 
 # 5. Limpar cache Python
 echo ""
@@ -95,7 +96,9 @@ echo "  > OK"
 echo ""
 echo "[5/8] Atualizando systemd..."
 sudo cp aicentralv2.service /etc/systemd/system/
+sudo cp aicentralv2-worker.service /etc/systemd/system/
 sudo systemctl daemon-reload
+sudo systemctl enable aicentralv2-worker 2>/dev/null || true
 echo "  > OK"
 
 # 7. Nginx — limite de upload (413)
@@ -118,6 +121,14 @@ else
     exit 1
 fi
 
+sudo systemctl start aicentralv2-worker
+if sudo systemctl is-active --quiet aicentralv2-worker; then
+    echo "  > Worker de jobs ativo!"
+else
+    echo "  > AVISO: worker de jobs nao iniciou"
+    sudo journalctl -u aicentralv2-worker -n 30 --no-pager 2>&1 | cat
+fi
+
 # 8. Health check
 echo ""
 echo "[8/8] Health check..."
@@ -6,7 +6,10 @@ bind = "127.0.0.1:8001"
 
 # Workers
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# gthread: streams SSE da IA (crm/ia_routes, briefing, importação de leads) ocupam uma
+# thread, não o worker inteiro
+worker_class = "gthread"
+threads = 4
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 100
@@ -27,3 +30,19 @@ pidfile = "/var/www/aicentralv2/gunicorn.pid"
 
 # Daemon mode - IMPORTANTE: False para systemd
 daemon = False
+
+
+# Pré-carga do modelo de embeddings / Pinecone (Inteligência) em cada worker.
+# Ative com INTELLIGENCE_PRELOAD=1 para que o primeiro upload não pague a carga do modelo.
+def post_worker_init(worker):
+    import os
+
+    if os.getenv('INTELLIGENCE_PRELOAD', 'False').lower() not in ('true', '1', 'yes'):
+        return
+    try:
+        from aicentralv2.services.intelligence.service import preload_intelligence_resources
+
+        status = preload_intelligence_resources()
+        worker.log.info(f"Inteligência pré-carregada: {status}")
+    except Exception as e:
+        worker.log.warning(f"Falha ao pré-carregar Inteligência: {e}")
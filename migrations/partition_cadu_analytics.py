@@ -0,0 +1,177 @@
+"""
+Migração: Particionar cadu_analytics_events e cadu_analytics_pageviews por mês
+Descrição: Converte as tabelas brutas do analytics em tabelas particionadas por RANGE
+mensal (created_at / viewed_at), para que meses antigos possam ser removidos com DROP
+da partição (job analytics.manter_particoes, ANALYTICS_RETENCAO_MESES).
+
+Para cada tabela (idempotente: tabelas já particionadas são ignoradas):
+- a tabela atual vira <tabela>_legado e é anexada como partição FROM (MINVALUE) até o
+  1º dia do mês seguinte (CHECK validado antes, sem bloquear gravações; o ATTACH não
+  precisa varrer a tabela);
+- a nova tabela-mãe copia colunas, defaults, CHECKs, dono e GRANTs; as sequências
+  (serial) passam a pertencer a ela;
+- índices não únicos são recriados na mãe (os do legado são reaproveitados);
+  índices únicos/PK ficam só no legado (na mãe teriam de incluir a chave de partição);
+- views que dependiam da tabela são recriadas apontando para a nova mãe;
+- partições do mês seguinte em diante são criadas já aqui.
+
+Colunas IDENTITY não são suportadas (a migração aborta sem alterar nada).
+Execução: python migrations/partition_cadu_analytics.py
+"""
+
+import os
+import re
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from aicentralv2 import create_app, db
+from aicentralv2.config import DevelopmentConfig, ProductionConfig
+from aicentralv2.services.analytics_agregados import (
+    ANALYTICS_PARTICOES_FUTURAS,
+    TABELAS_PARTICIONADAS,
+    _somar_meses,
+    garantir_particoes,
+    tabela_particionada,
+)
+
+
+def _indices(cur, tabela):
+    cur.execute('''
+        SELECT i.relname AS nome, pg_get_indexdef(i.oid) AS definicao, x.indisunique AS unico
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = to_regclass(%s)
+    ''', (tabela,))
+    return cur.fetchall()
+
+
+def _views_dependentes(cur, tabela):
+    cur.execute('''
+        SELECT DISTINCT v.oid::regclass::text AS nome, v.relkind
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class v ON v.oid = r.ev_class
+        WHERE d.refobjid = to_regclass(%s)
+          AND v.oid <> to_regclass(%s)
+    ''', (tabela, tabela))
+    return cur.fetchall()
+
+
+def _sequencias(cur, tabela):
+    cur.execute('''
+        SELECT a.attname AS coluna, pg_get_serial_sequence(%s, a.attname) AS sequencia
+        FROM pg_attribute a
+        WHERE a.attrelid = to_regclass(%s) AND a.attnum > 0 AND NOT a.attisdropped
+    ''', (tabela, tabela))
+    return [r for r in cur.fetchall() if r['sequencia']]
+
+
+def particionar(conn, tabela, coluna, hoje=None):
+    legado = f'{tabela}_legado'
+    limite = _somar_meses((hoje or date.today()).replace(day=1), 1)
+
+    with conn.cursor() as cur:
+        if tabela_particionada(cur, tabela):
+            print(f'⏭️  {tabela} já é particionada')
+            return
+        cur.execute('''
+            SELECT COUNT(*) AS n FROM pg_attribute
+            WHERE attrelid = to_regclass(%s) AND attidentity <> ''
+        ''', (tabela,))
+        if cur.fetchone()['n']:
+            raise RuntimeError(f'{tabela} tem coluna IDENTITY; converta manualmente')
+
+        # Fora do lock exclusivo: VALIDATE só pega SHARE UPDATE EXCLUSIVE (gravações seguem)
+        restricao = f'{tabela}_particao_legado'
+        cur.execute(f'ALTER TABLE {tabela} DROP CONSTRAINT IF EXISTS {restricao}')
+        cur.execute(f'''
+            ALTER TABLE {tabela} ADD CONSTRAINT {restricao}
+            CHECK ({coluna} IS NOT NULL AND {coluna} < '{limite.isoformat()}') NOT VALID
+        ''')
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute(f'ALTER TABLE {tabela} VALIDATE CONSTRAINT {restricao}')
+    conn.commit()
+
+    with conn.cursor() as cur:
+        cur.execute(f'LOCK TABLE {tabela} IN ACCESS EXCLUSIVE MODE')
+        indices = _indices(cur, tabela)
+        views = _views_dependentes(cur, tabela)
+        sequencias = _sequencias(cur, tabela)
+        cur.execute('''
+            SELECT pg_get_userbyid(relowner) AS dono FROM pg_class WHERE oid = to_regclass(%s)
+        ''', (tabela,))
+        dono = cur.fetchone()['dono']
+        cur.execute('''
+            SELECT grantee, privilege_type FROM information_schema.role_table_grants
+            WHERE table_name = %s AND grantee <> %s
+        ''', (tabela, dono))
+        grants = cur.fetchall()
+
+        cur.execute(f'ALTER TABLE {tabela} RENAME TO {legado}')
+        for indice in indices:
+            cur.execute(f"ALTER INDEX {indice['nome']} RENAME TO {indice['nome'][:56]}_legado")
+
+        cur.execute(f'''
+            CREATE TABLE {tabela} (
+                LIKE {legado} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS
+            ) PARTITION BY RANGE ({coluna})
+        ''')
+        # O CHECK do legado veio junto no LIKE; na mãe ele não faz sentido
+        cur.execute(f'ALTER TABLE {tabela} DROP CONSTRAINT IF EXISTS {restricao}')
+        cur.execute(f'ALTER TABLE {tabela} OWNER TO "{dono}"')
+        for grant in grants:
+            cur.execute(f'GRANT {grant["privilege_type"]} ON {tabela} TO "{grant["grantee"]}"')
+        for seq in sequencias:
+            cur.execute(f"ALTER SEQUENCE {seq['sequencia']} OWNED BY {tabela}.{seq['coluna']}")
+
+        cur.execute(f'''
+            ALTER TABLE {tabela} ATTACH PARTITION {legado}
+            FOR VALUES FROM (MINVALUE) TO ('{limite.isoformat()}')
+        ''')
+
+        for indice in indices:
+            if indice['unico']:
+                print(f"⚠️  índice único {indice['nome']} fica só em {legado}")
+                continue
+            # Mesmo nome e colunas; na mãe ele reaproveita o índice equivalente do legado
+            cur.execute(re.sub(r' ON (ONLY )?\S+ ', f' ON {tabela} ', indice['definicao'], count=1))
+
+        for view in views:
+            if view['relkind'] != 'v':
+                print(f"⚠️  {view['nome']} (materializada) continua lendo {legado}; recrie manualmente")
+                continue
+            cur.execute('SELECT pg_get_viewdef(to_regclass(%s)) AS definicao', (view['nome'],))
+            definicao = re.sub(rf'\b{legado}\b', tabela, cur.fetchone()['definicao'])
+            cur.execute(f"CREATE OR REPLACE VIEW {view['nome']} AS {definicao}")
+    conn.commit()
+    print(f'✅ {tabela} particionada (legado até {limite.isoformat()}, {len(views)} view(s) recriada(s))')
+
+
+def run_migration():
+    env = os.getenv('AICENTRAL_ENV') or os.getenv('FLASK_ENV') or 'development'
+    config_class = ProductionConfig if env.lower() == 'production' else DevelopmentConfig
+    app = create_app(config_class)
+
+    with app.app_context():
+        conn = db.get_db()
+        try:
+            for tabela, coluna in TABELAS_PARTICIONADAS.items():
+                particionar(conn, tabela, coluna)
+            criadas = garantir_particoes(ANALYTICS_PARTICOES_FUTURAS)
+            print(f"✅ Partições mensais: {', '.join(criadas) or 'nenhuma nova'}")
+        except Exception as e:
+            conn.rollback()
+            print(f'❌ Erro ao particionar analytics: {e}')
+            raise
+
+
+if __name__ == '__main__':
+    print('🔧 Iniciando migração: Particionar tabelas de analytics por mês')
+    run_migration()
+    print('✅ Migração concluída!')
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark das métricas de campanhas PI: cálculo por linha x cálculo em lote (sem banco).
+
+Gera campanhas sintéticas com valores R$, volumes e datas em formatos variados, mede
+anexar_preco_metrica_campanha linha a linha e anexar_preco_metrica_lote, reporta
+linhas/s de cada caminho e confere que os resultados são idênticos.
+
+Uso (raiz do repo):
+  python scripts/benchmark_campanha_pi_metrics.py
+  python scripts/benchmark_campanha_pi_metrics.py --linhas 100000 --repeticoes 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from aicentralv2.campanha_pi_metrics import anexar_preco_metrica_campanha  # noqa: E402
+from aicentralv2.campanha_pi_metrics_lote import anexar_preco_metrica_lote  # noqa: E402
+
+OBJETIVOS = ("Alcance", "Visualização", "Cliques", "Conversão", None)
+CAMPANHAS = ("Institucional Display", "Vídeo CPV", "Tráfego CPC", "Awareness", None)
+
+
+def _brl(rnd: random.Random):
+    return rnd.choice((
+        None, "", 0, -50,
+        f"R$ {rnd.randint(1, 999)}.{rnd.randint(0, 999):03d},{rnd.randint(0, 99):02d}",
+        f"{rnd.uniform(1, 1e5):.2f}",
+        rnd.uniform(1, 1e5),
+        "a definir",
+    ))
+
+
+def _volume(rnd: random.Random):
+    return rnd.choice((
+        None, "", 0,
+        f"{rnd.randint(1, 999)}.{rnd.randint(0, 999):03d}",
+        str(rnd.randint(1, 10 ** 7)),
+        rnd.randint(1, 10 ** 7),
+        "n/d",
+    ))
+
+
+def gerar_linhas(n: int, semente: int = 42):
+    rnd = random.Random(semente)
+    base = date(2026, 1, 1)
+    linhas = []
+    for i in range(n):
+        inicio = base + timedelta(days=rnd.randint(-365, 365))
+        fim = inicio + timedelta(days=rnd.randint(-3, 120))
+        linhas.append({
+            "id": i,
+            "nome_campanha": rnd.choice(CAMPANHAS),
+            "objetivo_nome": rnd.choice(OBJETIVOS),
+            "valor_total_plataforma": _brl(rnd),
+            "valor_plataforma": _brl(rnd),
+            "totalizador_gasto": _brl(rnd),
+            "custo_midia_orcado": _brl(rnd),
+            "preco_unitario_orcado": _brl(rnd),
+            "obj_contratados": _volume(rnd),
+            "totalizador_atingido": _volume(rnd),
+            "periodo_inicio": rnd.choice((inicio, inicio.isoformat(), None)),
+            "periodo_fim": rnd.choice((fim, fim.isoformat(), None)),
+        })
+    return linhas
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--linhas", type=int, default=20000)
+    ap.add_argument("--repeticoes", type=int, default=3)
+    args = ap.parse_args()
+
+    linhas = gerar_linhas(args.linhas)
+    hoje = date(2026, 3, 15)
+
+    tempos = {"linha a linha": [], "lote": []}
+    for _ in range(args.repeticoes):
+        t0 = time.perf_counter()
+        escalar = [anexar_preco_metrica_campanha(r, hoje) for r in linhas]
+        tempos["linha a linha"].append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        lote = anexar_preco_metrica_lote(linhas, hoje)
+        tempos["lote"].append(time.perf_counter() - t0)
+
+    for caminho, ts in tempos.items():
+        melhor = min(ts)
+        print(f"{caminho:13s}  {melhor * 1000:8.1f}ms  {args.linhas / melhor:12,.0f} linhas/s")
+    print(f"ganho: {min(tempos['linha a linha']) / min(tempos['lote']):.1f}x")
+
+    divergentes = sum(1 for a, b in zip(escalar, lote) if a != b)
+    print(f"linhas divergentes: {divergentes}")
+    return 1 if divergentes else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
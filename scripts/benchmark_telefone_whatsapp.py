@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark da localização de contato por telefone do WhatsApp (webhook Wasender).
+
+Cria tabelas TEMPORÁRIAS com N contatos em formatos variados ("(31) 99999-8888",
+"+55 31 ...", "031...") e compara a busca antiga (variantes + regexp_replace nas
+colunas livres, sem índice) com a igualdade na coluna gerada *_e164 indexada.
+Não toca nas tabelas reais; precisa só das variáveis DB_* do .env.
+
+Uso (raiz do repo):
+  python scripts/benchmark_telefone_whatsapp.py
+  python scripts/benchmark_telefone_whatsapp.py --contatos 200000 --consultas 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import psycopg  # noqa: E402
+from dotenv import load_dotenv  # noqa: E402
+
+from aicentralv2.db import _sql_telefone_e164, get_db_config, normalizar_telefone_whatsapp  # noqa: E402
+
+SQL_ANTIGO = r'''
+    SELECT id FROM bench_contato
+    WHERE status = TRUE
+      AND (
+            regexp_replace(COALESCE(telefone, ''), '\D', '', 'g') = ANY(%s::text[])
+         OR regexp_replace(COALESCE(telefone_secundario, ''), '\D', '', 'g') = ANY(%s::text[])
+         OR CONCAT('55', regexp_replace(COALESCE(telefone, ''), '\D', '', 'g')) = ANY(%s::text[])
+         OR CONCAT('55', regexp_replace(COALESCE(telefone_secundario, ''), '\D', '', 'g')) = ANY(%s::text[])
+      )
+    ORDER BY id LIMIT 1
+'''
+
+SQL_NOVO = '''
+    SELECT id FROM bench_contato
+    WHERE status = TRUE AND (telefone_e164 = %s OR telefone_secundario_e164 = %s)
+    ORDER BY id LIMIT 1
+'''
+
+
+def _variantes(telefone):
+    normalizado = normalizar_telefone_whatsapp(telefone)
+    variantes = {normalizado}
+    if normalizado.startswith('55') and len(normalizado) > 11:
+        variantes.add(normalizado[2:])
+    return [v for v in variantes if v]
+
+
+def _formatar(rng, ddd, numero):
+    formato = rng.randrange(4)
+    if formato == 0:
+        return f'({ddd}) {numero[:5]}-{numero[5:]}'
+    if formato == 1:
+        return f'+55 {ddd} {numero}'
+    if formato == 2:
+        return f'0{ddd}{numero}'
+    return f'{ddd}{numero}'
+
+
+def main() -> int:
+    load_dotenv(os.path.join(ROOT, '.env'))
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    ap.add_argument('--contatos', type=int, default=50000)
+    ap.add_argument('--consultas', type=int, default=200)
+    args = ap.parse_args()
+
+    rng = random.Random(42)
+    linhas = []
+    for i in range(args.contatos):
+        ddd = str(rng.choice([11, 21, 31, 41, 51, 61, 71, 81]))
+        principal = _formatar(rng, ddd, '9' + ''.join(rng.choices('0123456789', k=8)))
+        secundario = _formatar(rng, ddd, ''.join(rng.choices('0123456789', k=8))) if i % 3 == 0 else None
+        linhas.append((principal, secundario, i % 20 != 0))
+
+    with psycopg.connect(**get_db_config()) as conn, conn.cursor() as cursor:
+        cursor.execute(f'''
+            CREATE TEMP TABLE bench_contato (
+                id SERIAL PRIMARY KEY,
+                telefone TEXT,
+                telefone_secundario TEXT,
+                status BOOLEAN,
+                telefone_e164 TEXT GENERATED ALWAYS AS ({_sql_telefone_e164('telefone')}) STORED,
+                telefone_secundario_e164 TEXT
+                    GENERATED ALWAYS AS ({_sql_telefone_e164('telefone_secundario')}) STORED
+            )
+        ''')
+        t0 = time.perf_counter()
+        with cursor.copy('COPY bench_contato (telefone, telefone_secundario, status) FROM STDIN') as copy:
+            for linha in linhas:
+                copy.write_row(linha)
+        cursor.execute("CREATE INDEX ON bench_contato (telefone_e164) WHERE telefone_e164 <> ''")
+        cursor.execute(
+            "CREATE INDEX ON bench_contato (telefone_secundario_e164) WHERE telefone_secundario_e164 <> ''"
+        )
+        cursor.execute('ANALYZE bench_contato')
+        print(f'{args.contatos} contatos carregados em {time.perf_counter() - t0:.2f}s')
+
+        # Metade dos telefones existe (formato do webhook: só dígitos com 55), metade não
+        consultas = [
+            normalizar_telefone_whatsapp(rng.choice(linhas)[0]) if n % 2 == 0
+            else '55' + ''.join(rng.choices('0123456789', k=11))
+            for n in range(args.consultas)
+        ]
+
+        tempos = {}
+        for nome, sql, params in (
+            ('antigo (variantes)', SQL_ANTIGO, lambda t: (_variantes(t),) * 4),
+            ('novo (*_e164)', SQL_NOVO, lambda t: (t, t)),
+        ):
+            achados = 0
+            t0 = time.perf_counter()
+            for telefone in consultas:
+                cursor.execute(sql, params(telefone))
+                achados += cursor.fetchone() is not None
+            tempos[nome] = (time.perf_counter() - t0) / len(consultas)
+            print(f'{nome:20s} {tempos[nome] * 1000:8.3f} ms/consulta  ({achados} encontrados)')
+
+        cursor.execute('EXPLAIN ' + SQL_NOVO, (consultas[0], consultas[0]))
+        print('\nPlano da busca nova:')
+        for row in cursor.fetchall():
+            print('  ' + row['QUERY PLAN'])
+
+        antigo, novo = tempos['antigo (variantes)'], tempos['novo (*_e164)']
+        if novo > 0:
+            print(f'\nGanho: {antigo / novo:.0f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
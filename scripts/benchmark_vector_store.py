@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark do índice vetorial local da Inteligência (sem Pinecone, sem banco).
+
+Gera vetores aleatórios normalizados, mede upsert e consultas top-k nos modos
+'exact' (força bruta NumPy) e 'ivf' (aproximado) e reporta o recall do IVF.
+
+Uso (raiz do repo):
+  python scripts/benchmark_vector_store.py
+  python scripts/benchmark_vector_store.py --vetores 200000 --consultas 200 --nprobe 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+from aicentralv2.services.intelligence.vector_store import NumpyVectorIndex  # noqa: E402
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--vetores", type=int, default=50000)
+    ap.add_argument("--dimensao", type=int, default=512)
+    ap.add_argument("--consultas", type=int, default=100)
+    ap.add_argument("--top-k", type=int, default=10)
+    ap.add_argument("--nprobe", type=int, default=8)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(42)
+    dados = rng.standard_normal((args.vetores, args.dimensao), dtype=np.float32)
+    consultas = rng.standard_normal((args.consultas, args.dimensao), dtype=np.float32)
+    vetores = [(f"v{i}", dados[i], {"document_id": i % 100}) for i in range(args.vetores)]
+
+    resultados = {}
+    for modo in ("exact", "ivf"):
+        idx = NumpyVectorIndex(dimension=args.dimensao, index_mode=modo, ivf_nprobe=args.nprobe)
+        t0 = time.perf_counter()
+        idx.upsert(vectors=vetores)
+        t_upsert = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        idx.query(vector=consultas[0], top_k=args.top_k)  # inclui construção do IVF
+        t_primeira = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        resultados[modo] = [
+            [m["id"] for m in idx.query(vector=q, top_k=args.top_k, include_metadata=False)["matches"]]
+            for q in consultas
+        ]
+        t_consultas = time.perf_counter() - t0
+        print(
+            f"{modo:5s}  upsert={t_upsert:.2f}s  1a consulta={t_primeira * 1000:.1f}ms  "
+            f"média={t_consultas / args.consultas * 1000:.2f}ms/consulta"
+        )
+
+    acertos = sum(len(set(a) & set(b)) for a, b in zip(resultados["exact"], resultados["ivf"]))
+    print(f"recall@{args.top_k} do IVF: {acertos / (args.consultas * args.top_k):.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,14 +4,15 @@
 Sincroniza no Brevo contatos de clientes cujo cliente está com executivo João, Luísa ou Demétrius
 (vendas_central_comm). Lista 21 + "[Executivo] - Clientes".
 
-- Pode rodar várias vezes: a API Brevo atualiza contato/listas (updateEnabled), sem duplicar por e-mail.
+- Pode rodar várias vezes: brevo_sync_state guarda o último estado enviado e só a diferença
+  vai para a API, em lote (import / add / remove em lista). --completo reenvia tudo.
 - A chave vem de BREVO_API_KEY: variável de ambiente ou linha no .env na raiz do repositório
   (lida direto do arquivo se precisar, com UTF-8 e BOM).
 
 Uso (raiz do repo):
   python scripts/sync_brevo_contatos_clientes_executivos_jld.py
   python scripts/sync_brevo_contatos_clientes_executivos_jld.py --dry-run
-  python scripts/sync_brevo_contatos_clientes_executivos_jld.py --sleep 0.1
+  python scripts/sync_brevo_contatos_clientes_executivos_jld.py --completo
 """
 
 from __future__ import annotations
@@ -20,7 +21,6 @@ import argparse
 import os
 import re
 import sys
-import time
 
 from dotenv import load_dotenv
 
@@ -86,11 +86,16 @@ def main() -> int:
     parser = argparse.ArgumentParser(description="Sincroniza contatos de clientes J/L/D no Brevo.")
     parser.add_argument("--dry-run", action="store_true", help="Só contagem e amostra, sem API.")
     parser.add_argument(
-        "--sleep",
-        type=float,
-        default=0.0,
-        metavar="SEC",
-        help="Pausa entre chamadas (ex.: 0.1).",
+        "--completo",
+        action="store_true",
+        help="Ignora brevo_sync_state e reenvia todos os contatos (ainda em lote).",
+    )
+    parser.add_argument(
+        "--concorrencia",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Chamadas simultâneas à API (padrão: BREVO_SYNC_CONCORRENCIA).",
     )
     args = parser.parse_args()
 
@@ -99,10 +104,8 @@ def main() -> int:
 
     from aicentralv2 import create_app
     from aicentralv2.db import get_db
-    from aicentralv2.services.brevo_service import (
-        brevo_primeiro_nome_normalizado,
-        brevo_sincronizar_contato_lista_executivo,
-    )
+    from aicentralv2.services.brevo_service import brevo_primeiro_nome_normalizado
+    from aicentralv2.services.brevo_sync import montar_contato, sincronizar_contatos
 
     app = create_app()
 
@@ -139,49 +142,37 @@ def main() -> int:
         )
         return 1
 
-    ok = 0
-    fail = 0
-    for i, row in enumerate(alvo, 1):
-        email = (row.get("email") or "").strip().lower()
+    contatos = []
+    for row in alvo:
         nome = (row.get("nome_completo") or "").strip()
-        empresa = (row.get("empresa") or "").strip()
-        exec_nome = (row.get("executivo_nome") or "").strip()
-        ut = row.get("user_type") or "client"
-        tel = (row.get("telefone") or "").strip()
-
-        try:
-            res = brevo_sincronizar_contato_lista_executivo(
-                email=email,
-                nome=nome or None,
-                segmento="clientes",
-                nome_executivo=exec_nome,
-                api_key=brevo_key,
-                atributos={
-                    "NOME": nome,
-                    "EMPRESA": empresa,
-                    "TELEFONE": tel,
-                    "TIPO_USUARIO": ut,
-                },
-            )
-            if res.get("success"):
-                ok += 1
-            else:
-                fail += 1
-                print(
-                    f"FALHA id={row['id_contato_cliente']} email={email}: {res.get('error', res)}"
-                )
-        except Exception as e:
-            fail += 1
-            print(f"ERRO id={row['id_contato_cliente']} email={email}: {e}")
-
-        if args.sleep > 0 and i < len(alvo):
-            time.sleep(args.sleep)
-
-        if i % 50 == 0:
-            print(f"Progresso: {i}/{len(alvo)} (ok={ok}, falha={fail})")
-
-    print(f"Concluído: sucesso={ok}, falha={fail}, total={len(alvo)}")
-    return 0 if fail == 0 else 2
+        contatos.append(montar_contato(
+            email=row.get("email"),
+            nome=nome or None,
+            segmento="clientes",
+            nome_executivo=(row.get("executivo_nome") or "").strip(),
+            atributos={
+                "NOME": nome,
+                "EMPRESA": (row.get("empresa") or "").strip(),
+                "TELEFONE": (row.get("telefone") or "").strip(),
+                "TIPO_USUARIO": row.get("user_type") or "client",
+            },
+        ))
+
+    with app.app_context():
+        resumo = sincronizar_contatos(
+            contatos,
+            "clientes",
+            api_key=brevo_key,
+            completo=args.completo,
+            concorrencia=args.concorrencia,
+        )
+
+    print(
+        f"Diferença: importar={resumo['importar']}, adicionar em lista={resumo['adicionar']}, "
+        f"remover de lista={resumo['remover']}, inalterados={resumo['inalterados']}"
+    )
+    print(f"Concluído: chamadas à API={resumo['chamadas']}, falha={resumo['falhas']}, total={resumo['contatos']}")
+    return 0 if resumo["falhas"] == 0 else 2
 
 
 if __name__ == "__main__":
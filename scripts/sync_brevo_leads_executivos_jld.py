@@ -6,13 +6,14 @@ cuja carteira é João, Luísa ou Demétrius (cadu_leads.id_executivo → nome d
 
 Mesmo fluxo da API: contato na lista "[Executivo] - Leads" e removido da lista 21 (usuários ativos).
 
-- Idempotente: pode rodar várias vezes (updateEnabled no Brevo).
+- Idempotente e por diferença: brevo_sync_state guarda o último estado enviado; só o que
+  mudou vai para a API, em lote (import / add / remove em lista). --completo reenvia tudo.
 - BREVO_API_KEY: variável de ambiente ou linha no .env na raiz (UTF-8/BOM, aspas).
 
 Uso (raiz do repo):
   python scripts/sync_brevo_leads_executivos_jld.py
   python scripts/sync_brevo_leads_executivos_jld.py --dry-run
-  python scripts/sync_brevo_leads_executivos_jld.py --sleep 0.1
+  python scripts/sync_brevo_leads_executivos_jld.py --completo
 """
 
 from __future__ import annotations
@@ -21,7 +22,6 @@ import argparse
 import os
 import re
 import sys
-import time
 
 from dotenv import load_dotenv
 
@@ -107,11 +107,16 @@ def main() -> int:
     parser = argparse.ArgumentParser(description="Sincroniza leads J/L/D no Brevo (segmento Leads).")
     parser.add_argument("--dry-run", action="store_true", help="Só contagem e amostra, sem API.")
     parser.add_argument(
-        "--sleep",
-        type=float,
-        default=0.0,
-        metavar="SEC",
-        help="Pausa entre chamadas (ex.: 0.1).",
+        "--completo",
+        action="store_true",
+        help="Ignora brevo_sync_state e reenvia todos os contatos (ainda em lote).",
+    )
+    parser.add_argument(
+        "--concorrencia",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Chamadas simultâneas à API (padrão: BREVO_SYNC_CONCORRENCIA).",
     )
     args = parser.parse_args()
 
@@ -120,10 +125,8 @@ def main() -> int:
 
     from aicentralv2 import create_app
     from aicentralv2.db import get_db
-    from aicentralv2.services.brevo_service import (
-        brevo_primeiro_nome_normalizado,
-        brevo_sincronizar_contato_lista_executivo,
-    )
+    from aicentralv2.services.brevo_service import brevo_primeiro_nome_normalizado
+    from aicentralv2.services.brevo_sync import montar_contato, sincronizar_contatos
 
     app = create_app()
 
@@ -169,45 +172,36 @@ def main() -> int:
         )
         return 1
 
-    ok = 0
-    fail = 0
-    for i, row in enumerate(alvo, 1):
-        email = (row.get("email") or "").strip().lower()
+    contatos = []
+    for row in alvo:
         nome = (row.get("nome") or "").strip()
-        empresa = (row.get("empresa") or "").strip()
-        exec_nome = (row.get("executivo_nome") or "").strip()
-        tel = (row.get("telefone") or "").strip()
-
-        try:
-            res = brevo_sincronizar_contato_lista_executivo(
-                email=email,
-                nome=nome or None,
-                segmento="leads",
-                nome_executivo=exec_nome,
-                api_key=brevo_key,
-                atributos={
-                    "NOME": nome,
-                    "EMPRESA": empresa,
-                    "TELEFONE": tel,
-                },
-            )
-            if res.get("success"):
-                ok += 1
-            else:
-                fail += 1
-                print(f"FALHA email={email}: {res.get('error', res)}")
-        except Exception as e:
-            fail += 1
-            print(f"ERRO email={email}: {e}")
-
-        if args.sleep > 0 and i < len(alvo):
-            time.sleep(args.sleep)
-
-        if i % 50 == 0:
-            print(f"Progresso: {i}/{len(alvo)} (ok={ok}, falha={fail})")
-
-    print(f"Concluído: sucesso={ok}, falha={fail}, total={len(alvo)}")
-    return 0 if fail == 0 else 2
+        contatos.append(montar_contato(
+            email=row.get("email"),
+            nome=nome or None,
+            segmento="leads",
+            nome_executivo=(row.get("executivo_nome") or "").strip(),
+            atributos={
+                "NOME": nome,
+                "EMPRESA": (row.get("empresa") or "").strip(),
+                "TELEFONE": (row.get("telefone") or "").strip(),
+            },
+        ))
+
+    with app.app_context():
+        resumo = sincronizar_contatos(
+            contatos,
+            "leads",
+            api_key=brevo_key,
+            completo=args.completo,
+            concorrencia=args.concorrencia,
+        )
+
+    print(
+        f"Diferença: importar={resumo['importar']}, adicionar em lista={resumo['adicionar']}, "
+        f"remover de lista={resumo['remover']}, inalterados={resumo['inalterados']}"
+    )
+    print(f"Concluído: chamadas à API={resumo['chamadas']}, falha={resumo['falhas']}, total={resumo['contatos']}")
+    return 0 if resumo["falhas"] == 0 else 2
 
 
 if __name__ == "__main__":
@@ -0,0 +1,70 @@
+"""
+AIcentralv2 - Worker da fila de jobs (cadu_jobs)
+
+Executa fora do Gunicorn as tarefas lentas enfileiradas pelas rotas
+(ingestão da Inteligência, envios em lote, webhooks etc.).
+
+Uso:
+  python worker.py                         # todas as filas, 2 threads
+  python worker.py --filas default,email --threads 4
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+from pathlib import Path
+
+# Adicionar o diretório atual ao path do Python
+sys.path.insert(0, str(Path(__file__).parent))
+
+from aicentralv2 import create_app
+from aicentralv2.config import DevelopmentConfig, ProductionConfig
+from aicentralv2.services.jobs import run_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker da fila de jobs do AIcentralv2')
+    parser.add_argument('--filas', default=os.getenv('JOBS_FILAS', ''),
+                        help='Filas separadas por vírgula (padrão: todas)')
+    parser.add_argument('--threads', type=int, default=int(os.getenv('JOBS_THREADS', '2')))
+    parser.add_argument('--poll', type=float, default=2.0, help='Intervalo de polling em segundos')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s [%(name)s] %(message)s')
+
+    env = os.getenv('AICENTRAL_ENV') or os.getenv('FLASK_ENV') or 'development'
+    config_class = ProductionConfig if env.lower() == 'production' else DevelopmentConfig
+    app = create_app(config_class)
+
+    filas = [f.strip() for f in args.filas.split(',') if f.strip()] or None
+    stop_event = threading.Event()
+
+    def _parar(signum, frame):
+        logging.getLogger(__name__).info(f"Sinal {signum} recebido, encerrando após os jobs em andamento...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _parar)
+    signal.signal(signal.SIGINT, _parar)
+
+    threads = [
+        threading.Thread(
+            target=run_worker,
+            args=(app,),
+            kwargs={'filas': filas, 'poll_interval': args.poll, 'stop_event': stop_event},
+            name=f'jobs-worker-{i}',
+            daemon=True,
+        )
+        for i in range(max(1, args.threads))
+    ]
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(timeout=1.0)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())